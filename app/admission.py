@@ -0,0 +1,262 @@
+"""
+Admission control for the chat endpoints: an adaptive concurrency limit with a bounded priority queue.
+
+At most `limit` requests run the RAG pipeline at once; the rest wait in a queue ordered by class
+(`interactive` before `batch`, FIFO within a class). Load is shed with `Overloaded`, which the API turns
+into `429` + `Retry-After`:
+  - on arrival, when the estimated queue wait (position / limit x mean service time) exceeds the class's
+    maximum wait (`ADMISSION_MAX_QUEUE_WAIT_MS`, `ADMISSION_BATCH_MAX_QUEUE_WAIT_MS`)
+  - when the queue is full (`ADMISSION_MAX_QUEUE`); a queued batch request makes room for an interactive
+    one by being shed itself
+  - when a request has waited its maximum without getting a slot
+
+The limit adapts to the upstreams (gradient-style AIMD):
+  - it drops by 10% (at most once per mean service time) when a request fails with an upstream throttle
+    (429 / exhausted deployment pool) or when short-term latency exceeds
+    `ADMISSION_LATENCY_TOLERANCE` x the long-term average
+  - otherwise it grows by 1/limit per completed request (about +1 per round of requests)
+  - it stays within `ADMISSION_MIN_LIMIT`..`ADMISSION_MAX_LIMIT`
+
+The controller is used from the event loop only, so it needs no locks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import httpx
+import openai
+
+from .openai_router import PoolExhausted
+from .settings import get_settings
+from .telemetry import record_shed, record_stage
+
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_DECREASE_FACTOR = 0.9
+_SHORT_ALPHA = 0.2
+_LONG_ALPHA = 0.02
+
+
+class Overloaded(Exception):
+    """The request was shed; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float, reason: str) -> None:
+        super().__init__(f"overloaded ({reason}); retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _is_throttle(exc: BaseException) -> bool:
+    if isinstance(exc, openai.RateLimitError | PoolExhausted):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in (429, 503)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    cls: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class Permit:
+    """A held slot; `release` is idempotent so streaming responses can call it from several exit paths."""
+
+    def __init__(self, controller: AdmissionController, started: float) -> None:
+        self._controller = controller
+        self._started = started
+        self._released = False
+
+    def release(self, error: BaseException | None = None) -> None:
+        if self._released:
+            return
+        self._released = True
+        throttled = error is not None and _is_throttle(error)
+        self._controller._release(self._controller.clock() - self._started, throttled=throttled)
+
+
+class AdmissionController:
+    """Adaptive concurrency limit + priority queue; see the module docstring."""
+
+    def __init__(
+        self,
+        *,
+        initial_limit: int = 32,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        max_queue: int = 256,
+        max_wait: dict[str, float] | None = None,
+        latency_tolerance: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait or {"interactive": 2.0, "batch": 30.0}
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self.in_flight = 0
+        self.shed: dict[tuple[str, str], int] = {}
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._short_latency: float | None = None
+        self._long_latency: float | None = None
+        self._last_decrease = -math.inf
+
+    def queue_depth(self) -> dict[str, int]:
+        depth = dict.fromkeys(PRIORITIES, 0)
+        for waiter in self._queue:
+            depth[waiter.cls] += 1
+        return depth
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until the request `position` places back in the queue (0-based) would get a slot."""
+
+        if self._long_latency is None:
+            return 0.0
+        return (position + 1) / max(1, int(self.limit)) * self._long_latency
+
+    async def acquire(self, cls: str = "interactive") -> Permit:
+        priority = PRIORITIES[cls]
+        if self.in_flight < int(self.limit) and not self._queue:
+            self.in_flight += 1
+            return Permit(self, self.clock())
+
+        position = sum(1 for w in self._queue if w.priority <= priority)
+        wait = self.estimated_wait(position)
+        if wait > self.max_wait[cls]:
+            self._shed(cls, "wait")
+            raise Overloaded(wait, "wait")
+        if len(self._queue) >= self.max_queue:
+            worst = max(self._queue, default=None)
+            if worst is None or worst.priority <= priority:
+                self._shed(cls, "queue_full")
+                raise Overloaded(max(wait, 1.0), "queue_full")
+            self._remove(worst)
+            self._shed(worst.cls, "evicted")
+            worst.future.set_exception(Overloaded(self.estimated_wait(len(self._queue)), "evicted"))
+
+        waiter = _Waiter(priority, next(self._seq), cls, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        enqueued = self.clock()
+        try:
+            # shield: a timeout must not cancel a future that `_drain` may complete at the same moment.
+            async with asyncio.timeout(self.max_wait[cls]):
+                await asyncio.shield(waiter.future)
+        except TimeoutError:
+            if not _granted(waiter):
+                self._abandon(waiter)
+                self._shed(cls, "timeout")
+                raise Overloaded(self.estimated_wait(position), "timeout") from None
+        except asyncio.CancelledError:
+            if _granted(waiter):
+                # The slot was handed over just as the caller went away: give it to the next waiter.
+                self._release(None, throttled=False)
+            else:
+                self._abandon(waiter)
+            raise
+        record_stage("queue", self.clock() - enqueued)
+        return Permit(self, self.clock())
+
+    @asynccontextmanager
+    async def admit(self, cls: str = "interactive") -> AsyncIterator[None]:
+        permit = await self.acquire(cls)
+        try:
+            yield
+        except BaseException as exc:
+            permit.release(exc)
+            raise
+        permit.release()
+
+    def _shed(self, cls: str, reason: str) -> None:
+        self.shed[(cls, reason)] = self.shed.get((cls, reason), 0) + 1
+        record_shed(cls, reason)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter in self._queue:
+            self._remove(waiter)
+        if not waiter.future.done():
+            waiter.future.cancel()
+
+    def _release(self, latency: float | None, *, throttled: bool) -> None:
+        self.in_flight -= 1
+        if latency is not None:
+            self._adapt(latency, throttled=throttled)
+        self._drain()
+
+    def _adapt(self, latency: float, *, throttled: bool) -> None:
+        if self._long_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += _SHORT_ALPHA * (latency - self._short_latency)
+            self._long_latency += _LONG_ALPHA * (latency - self._long_latency)
+
+        congested = throttled or self._short_latency > self.latency_tolerance * self._long_latency
+        now = self.clock()
+        if congested:
+            # One decrease per service time: requests already in flight report the same congestion.
+            if now - self._last_decrease >= self._long_latency:
+                self.limit = max(self.min_limit, self.limit * _DECREASE_FACTOR)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _drain(self) -> None:
+        while self._queue and self.in_flight < int(self.limit):
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+
+def _granted(waiter: _Waiter) -> bool:
+    return waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None
+
+
+@lru_cache
+def get_admission_controller() -> AdmissionController | None:
+    """Process-wide admission controller, or None unless `ADMISSION_CONTROL_ENABLED`."""
+
+    settings = get_settings()
+    if not settings.admission_control_enabled:
+        return None
+    return AdmissionController(
+        initial_limit=settings.admission_initial_limit,
+        min_limit=settings.admission_min_limit,
+        max_limit=settings.admission_max_limit,
+        max_queue=settings.admission_max_queue,
+        max_wait={
+            "interactive": settings.admission_max_queue_wait_ms / 1000,
+            "batch": settings.admission_batch_max_queue_wait_ms / 1000,
+        },
+        latency_tolerance=settings.admission_latency_tolerance,
+    )
+
+
+@asynccontextmanager
+async def admission_slot(cls: str = "interactive") -> AsyncIterator[None]:
+    """`AdmissionController.admit` on the process-wide controller; a no-op when admission control is off."""
+
+    controller = get_admission_controller()
+    if controller is None:
+        yield
+        return
+    async with controller.admit(cls):
+        yield
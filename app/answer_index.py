@@ -0,0 +1,623 @@
+"""
+Precomputed answers for the most frequent questions (`python -m app.answer_index build questions.txt`).
+
+A few hundred questions account for most of the traffic. Their answers are computed ahead of time through the
+regular pipeline (`aanswer_question`) and stored in a small on-disk index that `/chat` consults first, so
+those requests cost a binary search instead of a retrieval and a completion:
+  - exact match: the normalized question (`app.cache.normalize_question`) is binary searched in the sorted keys
+  - neighbor match: otherwise, when the index stores question embeddings (built with
+    AZURE_OPENAI_EMBED_DEPLOYMENT), the request's question is embedded and the nearest stored question above
+    `ANSWER_INDEX_SEMANTIC_THRESHOLD` is served; a miss then costs one (cached) embedding call
+Only standalone (no session), unfiltered requests are served, and only with the `top_k`, Search scope and chat
+deployment the index was built with. Served entries carry citations, not the chunk content.
+
+The questions come from a file (`load_questions`): plain text with one question per line, ranked by how often
+each normalized question occurs (a raw export of the asked questions from the logs works as is, and so does an
+already ranked list), or JSON lines with `question` and an optional `count`.
+
+Freshness: the index records a fingerprint of every cited parent document (`app.rag.afetch_parent_versions`).
+After each `kb-indexer` run that changed documents, `app.indexer_watch` starts `AnswerIndexJob`: it fetches
+the current fingerprints, stops serving the entries that cite a changed or deleted parent, recomputes only
+those and writes the index again. Entries that could not be recomputed stay out of service until a later
+refresh succeeds. After `python -m app.ingest`, which bypasses the indexer, run `python -m app.answer_index
+refresh`. One process refreshes a directory at a time (a `flock` on `.lock`); the others skip.
+
+On-disk format (all arrays little-endian, opened with `np.memmap`, like `app.local_index`):
+  meta.json                  generation, count, dim, scope, top_k, embedding model, stale rows, parent fingerprints
+  keys-<g>.bin / .idx        sorted UTF-8 normalized questions + int64 offsets (binary searched)
+  vectors-<g>.f32            (N, dim) float32 unit question embeddings in key order (none when dim is 0)
+  entries-<g>.bin / .idx     JSON records (question, count, answer, citations) in key order + int64 offsets
+Every write creates generation `<g>` and then replaces `meta.json` atomically, so readers never see a partial
+index; a reader notices a new `meta.json` within `META_CHECK_SECONDS` and switches to it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .admission import admission_slot
+from .cache import CacheStats, normalize_question
+from .clients import aclose_clients
+from .deadline import Deadline, deadline_scope
+from .embeddings import aprefetch_embeddings
+from .federation import search_scope
+from .rag import RetrievedChunk, aanswer_question, aembed_question, afetch_parent_versions
+from .settings import Settings, get_settings
+from .telemetry import note
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process refresh lock.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+META_CHECK_SECONDS = 1.0
+
+
+@dataclass
+class AnswerEntry:
+    """One precomputed answer; `chunks` are the citations (without content)."""
+
+    question: str
+    answer: str
+    chunks: list[RetrievedChunk]
+    count: int = 1
+
+    @property
+    def key(self) -> str:
+        return normalize_question(self.question)
+
+    def parent_ids(self) -> set[str]:
+        return {c.parent_id for c in self.chunks if c.parent_id}
+
+    def to_record(self) -> dict:
+        citations = [
+            {"chunkId": c.chunk_id, "parentId": c.parent_id, "title": c.title, "sourcePath": c.source_path}
+            for c in self.chunks
+        ]
+        return {"question": self.question, "count": self.count, "answer": self.answer, "citations": citations}
+
+    @classmethod
+    def from_record(cls, record: dict) -> AnswerEntry:
+        chunks = [
+            RetrievedChunk(
+                chunk_id=c["chunkId"],
+                parent_id=c["parentId"],
+                title=c["title"],
+                content="",
+                source_path=c["sourcePath"],
+            )
+            for c in record["citations"]
+        ]
+        return cls(question=record["question"], answer=record["answer"], chunks=chunks, count=record["count"])
+
+
+def answer_index_scope(settings: Settings) -> str:
+    """The index (or shard set) and chat deployment answers come from; an index only serves its own scope."""
+
+    return f"{search_scope(settings)}|{settings.azure_openai_chat_deployment}"
+
+
+def load_questions(path: str | Path, *, limit: int | None = None) -> list[tuple[str, int]]:
+    """
+    Ranked `(question, count)` pairs from a file, one per normalized question, most frequent first (ties: first
+    seen first). Plain text counts each line once; `.jsonl`/`.ndjson` records have `question` and `count`.
+    """
+
+    path = Path(path)
+    jsonl = path.suffix in (".jsonl", ".ndjson")
+    ranked: dict[str, list] = {}
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if jsonl:
+                record = json.loads(line)
+                question, count = record["question"], int(record.get("count", 1))
+            else:
+                question, count = line.strip(), 1
+            key = normalize_question(question)
+            if not key:
+                continue
+            ranked.setdefault(key, [question, 0, len(ranked)])[1] += count
+    order = sorted(ranked.values(), key=lambda item: (-item[1], item[2]))
+    return [(question, count) for question, count, _seen in order[:limit]]
+
+
+def _write_blob(path: Path, records: Sequence[bytes]) -> None:
+    path.write_bytes(b"".join(records))
+    np.cumsum([0] + [len(r) for r in records], dtype="<i8").tofile(path.with_suffix(".idx"))
+
+
+def write_answer_index(
+    path: str | Path,
+    entries: Sequence[AnswerEntry],
+    *,
+    scope: str,
+    top_k: int,
+    parents: dict[str, str],
+    vectors: np.ndarray | None = None,
+    embed_model: str | None = None,
+    stale: Iterable[str] = (),
+) -> None:
+    """
+    Write `entries` (and their question embeddings, row for row) as a new generation of the index at `path`.
+
+    Entries whose key is in `stale` are kept but not served. A question that normalizes like an earlier one
+    is dropped. The generation before this one is kept for readers still switching over; older ones are removed.
+    """
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    meta_path = path / "meta.json"
+    generation = json.loads(meta_path.read_text(encoding="utf-8"))["generation"] + 1 if meta_path.exists() else 1
+
+    rows: dict[bytes, int] = {}
+    for i, entry in enumerate(entries):
+        rows.setdefault(entry.key.encode("utf-8"), i)
+    keys = sorted(rows)
+    ordered = [entries[rows[k]] for k in keys]
+    stale_keys = set(stale)
+
+    _write_blob(path / f"keys-{generation}.bin", keys)
+    records = [json.dumps(e.to_record(), ensure_ascii=False).encode("utf-8") for e in ordered]
+    _write_blob(path / f"entries-{generation}.bin", records)
+    dim = 0
+    if vectors is not None and len(entries):
+        vectors = np.asarray(vectors, dtype=np.float32)[[rows[k] for k in keys]]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        dim = vectors.shape[1]
+    (vectors.astype("<f4") if dim else np.zeros(0, "<f4")).tofile(path / f"vectors-{generation}.f32")
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "generation": generation,
+        "count": len(ordered),
+        "dim": dim,
+        "embed_model": embed_model if dim else None,
+        "scope": scope,
+        "top_k": top_k,
+        "built_at": time.time(),
+        "stale": [i for i, e in enumerate(ordered) if e.key in stale_keys],
+        "parents": dict(sorted(parents.items())),
+    }
+    tmp = path / f"meta.json.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp, meta_path)
+
+    for old in path.glob("*-*.*"):
+        prefix, _, rest = old.name.partition("-")
+        gen = rest.split(".")[0]
+        if prefix in ("keys", "entries", "vectors") and gen.isdigit() and int(gen) < generation - 1:
+            old.unlink(missing_ok=True)
+
+
+def _memmap(path: Path, dtype: str, shape: tuple[int, ...] | None = None) -> np.ndarray:
+    # np.memmap refuses zero-length files; an empty index is still valid.
+    if path.stat().st_size == 0:
+        return np.zeros(shape or (0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+@dataclass(frozen=True)
+class _View:
+    """One generation of the index, mapped; lookups read a single view so row ids stay consistent."""
+
+    meta: dict
+    stat: tuple[int, int]
+    keys: np.ndarray
+    key_offsets: np.ndarray
+    vectors: np.ndarray
+    entries: np.ndarray
+    entry_offsets: np.ndarray
+    stale: np.ndarray
+
+    def key(self, i: int) -> bytes:
+        return bytes(self.keys[self.key_offsets[i] : self.key_offsets[i + 1]])
+
+    def entry(self, i: int) -> AnswerEntry:
+        start, end = int(self.entry_offsets[i]), int(self.entry_offsets[i + 1])
+        return AnswerEntry.from_record(json.loads(bytes(self.entries[start:end])))
+
+
+class AnswerIndex:
+    """
+    Read-only view over an answer index directory that follows its newest generation.
+
+    With `missing_ok`, a directory without an index yet is accepted: it serves nothing until one is built there.
+    """
+
+    def __init__(self, path: str | Path, *, missing_ok: bool = False) -> None:
+        self.path = Path(path)
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._view = None if missing_ok and not (self.path / "meta.json").exists() else self._open()
+        self._next_check = time.monotonic() + META_CHECK_SECONDS
+
+    def _open(self) -> _View:
+        meta_path = self.path / "meta.json"
+        stat = meta_path.stat()
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported answer index version: {meta.get('version')}")
+        g, count, dim = meta["generation"], meta["count"], meta["dim"]
+        stale = np.zeros(count, dtype=bool)
+        stale[meta["stale"]] = True
+        return _View(
+            meta=meta,
+            stat=(stat.st_ino, stat.st_mtime_ns),
+            keys=_memmap(self.path / f"keys-{g}.bin", "u1"),
+            key_offsets=_memmap(self.path / f"keys-{g}.idx", "<i8"),
+            vectors=_memmap(self.path / f"vectors-{g}.f32", "<f4", (count, dim)) if dim else np.zeros((count, 0)),
+            entries=_memmap(self.path / f"entries-{g}.bin", "u1"),
+            entry_offsets=_memmap(self.path / f"entries-{g}.idx", "<i8"),
+            stale=stale,
+        )
+
+    def reopen(self) -> None:
+        """Switch to the newest generation now; on failure (e.g. mid-write) keep the current one."""
+
+        try:
+            view = self._open()
+        except (OSError, ValueError, KeyError):
+            logger.warning("answer index %s could not be reopened; keeping generation %s", self.path, self.generation)
+            return
+        if self._view is None:
+            logger.info("answer index %s found (generation %s)", self.path, view.meta["generation"])
+        self._view = view
+
+    def _current(self) -> _View | None:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + META_CHECK_SECONDS
+            try:
+                stat = (self.path / "meta.json").stat()
+            except OSError:
+                return self._view
+            if self._view is None or (stat.st_ino, stat.st_mtime_ns) != self._view.stat:
+                self.reopen()
+        return self._view
+
+    def __len__(self) -> int:
+        return self._view.meta["count"] if self._view is not None else 0
+
+    @property
+    def meta(self) -> dict:
+        view = self._current()
+        return view.meta if view is not None else {}
+
+    @property
+    def generation(self) -> int | None:
+        return self._view.meta["generation"] if self._view is not None else None
+
+    def serves(self, *, scope: str, top_k: int) -> bool:
+        meta = self.meta
+        return bool(meta) and meta["scope"] == scope and meta["top_k"] == top_k
+
+    def find(self, question: str) -> AnswerEntry | None:
+        """Exact lookup of the normalized question; stale entries are not returned."""
+
+        view = self._current()
+        if view is None:
+            return None
+        target = normalize_question(question).encode("utf-8")
+        lo, hi = 0, view.meta["count"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if view.key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < view.meta["count"] and view.key(lo) == target and not view.stale[lo]:
+            return view.entry(lo)
+        return None
+
+    def nearest(self, embedding: np.ndarray, *, threshold: float) -> AnswerEntry | None:
+        """The entry whose question embedding is the most similar to `embedding`, if at least `threshold`."""
+
+        view = self._current()
+        if view is None or not view.meta["dim"]:
+            return None
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        sims = view.vectors @ (vec / norm if norm else vec)
+        sims[view.stale] = -np.inf
+        row = int(np.argmax(sims)) if len(sims) else -1
+        if row < 0 or sims[row] < threshold:
+            return None
+        return view.entry(row)
+
+    def entries(self) -> list[AnswerEntry]:
+        """Every entry, stale ones included, in key order."""
+
+        view = self._current()
+        return [view.entry(i) for i in range(view.meta["count"])] if view is not None else []
+
+    def stale_keys(self) -> set[str]:
+        view = self._current()
+        if view is None:
+            return set()
+        return {view.key(int(i)).decode("utf-8") for i in np.flatnonzero(view.stale)}
+
+    def vectors(self) -> np.ndarray | None:
+        """(N, dim) float32 question embeddings in key order, or None when the index has none."""
+
+        view = self._current()
+        return np.array(view.vectors, dtype=np.float32) if view is not None and view.meta["dim"] else None
+
+    def record(self, value: object | None, *, semantic: bool = False) -> None:
+        with self._lock:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                self.stats.semantic_hits += int(semantic)
+
+
+@lru_cache
+def get_answer_index() -> AnswerIndex | None:
+    """
+    Process-wide answer index when `ANSWER_INDEX_PATH` is set, else None. An index built there after the process
+    started is served once a reader notices it (`META_CHECK_SECONDS`).
+    """
+
+    settings = get_settings()
+    if not settings.answer_index_path:
+        return None
+    index = AnswerIndex(settings.answer_index_path, missing_ok=True)
+    if index.generation is None:
+        logger.warning("ANSWER_INDEX_PATH %s has no answer index yet; build one", settings.answer_index_path)
+    return index
+
+
+async def alookup_answer(*, settings: Settings, question: str, top_k: int) -> tuple[str, list[RetrievedChunk]] | None:
+    """The precomputed `(answer, citations)` for `question`, or None; see the module docstring."""
+
+    index = get_answer_index()
+    if index is None or not index.serves(scope=answer_index_scope(settings), top_k=top_k):
+        return None
+    entry = index.find(question)
+    semantic = False
+    threshold = settings.answer_index_semantic_threshold
+    model = index.meta["embed_model"]
+    if entry is None and threshold > 0 and model is not None and model == settings.azure_openai_embed_deployment:
+        try:
+            embedding = await aembed_question(settings=settings, question=question)
+        except Exception:
+            # The regular pipeline may not need embeddings at all; don't fail the request over the index.
+            logger.warning("answer index embedding failed", exc_info=True)
+        else:
+            entry = index.nearest(embedding, threshold=threshold)
+            semantic = True
+    index.record(entry, semantic=semantic)
+    note("answer_index", "miss" if entry is None else "semantic_hit" if semantic else "hit")
+    return (entry.answer, list(entry.chunks)) if entry is not None else None
+
+
+async def _aprecompute(
+    *, settings: Settings, questions: Sequence[tuple[str, int]], top_k: int
+) -> list[AnswerEntry | None]:
+    """Answer `questions` like /chat/batch does (bounded, batch priority); None where it failed or degraded."""
+
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    async def one(question: str, count: int) -> AnswerEntry | None:
+        async with semaphore:
+            # No time limit, but a deadline collects the degradation reason (e.g. a missing shard).
+            with deadline_scope(Deadline(expires_at=math.inf)) as deadline:
+                try:
+                    async with admission_slot("batch"):
+                        answer, chunks = await aanswer_question(settings=settings, question=question, top_k=top_k)
+                except Exception:
+                    logger.warning("precomputing an answer for %r failed", question, exc_info=True)
+                    return None
+        if deadline.degraded is not None:
+            logger.warning("precomputed answer for %r was degraded (%s); skipped", question, deadline.degraded)
+            return None
+        return AnswerEntry(question=question, answer=answer, chunks=chunks, count=count)
+
+    return list(await asyncio.gather(*(one(q, c) for q, c in questions)))
+
+
+async def _aembed(settings: Settings, questions: Sequence[str]) -> np.ndarray | None:
+    if not settings.azure_openai_embed_deployment or settings.answer_index_semantic_threshold <= 0 or not questions:
+        return None
+    await aprefetch_embeddings(
+        model=settings.azure_openai_embed_deployment, texts=questions, max_batch_size=settings.embedding_batch_max_size
+    )
+    vectors = await asyncio.gather(*(aembed_question(settings=settings, question=q) for q in questions))
+    return np.stack(vectors)
+
+
+async def abuild(*, settings: Settings, path: str | Path, questions: Sequence[tuple[str, int]], top_k: int) -> int:
+    """Precompute answers for the ranked `questions` and write a new index at `path`; returns the entry count."""
+
+    entries = [e for e in await _aprecompute(settings=settings, questions=questions, top_k=top_k) if e is not None]
+    vectors = await _aembed(settings, [e.question for e in entries])
+    parents = await afetch_parent_versions(
+        settings=settings, parent_ids=[p for e in entries for p in e.parent_ids()]
+    )
+    write_answer_index(
+        path,
+        entries,
+        scope=answer_index_scope(settings),
+        top_k=top_k,
+        parents=parents,
+        vectors=vectors,
+        embed_model=settings.azure_openai_embed_deployment if vectors is not None else None,
+    )
+    return len(entries)
+
+
+@contextmanager
+def _refresh_lock(path: Path) -> Iterator[bool]:
+    """Non-blocking exclusive lock on `<path>/.lock`; yields False when another process holds it."""
+
+    if fcntl is None:
+        yield True
+        return
+    with open(path / ".lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def arefresh(*, settings: Settings, path: str | Path) -> int:
+    """
+    Recompute the entries citing a parent document whose fingerprint changed (or that are stale from an earlier
+    failed refresh) and write the index again. Returns the number of entries recomputed (0 when no index has
+    been built at `path` yet).
+    """
+
+    path = Path(path)
+    if not (path / "meta.json").exists():
+        logger.info("no answer index at %s yet; nothing to refresh", path)
+        return 0
+    with _refresh_lock(path) as locked:
+        if not locked:
+            logger.info("answer index %s is being refreshed by another process", path)
+            return 0
+        index = AnswerIndex(path)
+        meta = index.meta
+        if meta["scope"] != answer_index_scope(settings):
+            logger.warning("answer index %s was built for another index or deployment; not refreshed", path)
+            return 0
+        entries = index.entries()
+        stale = index.stale_keys()
+        current = await afetch_parent_versions(settings=settings, parent_ids=list(meta["parents"]))
+        changed = {p for p, version in meta["parents"].items() if current.get(p) != version}
+        affected = [e for e in entries if e.key in stale or e.parent_ids() & changed]
+        if not affected:
+            return 0
+
+        vectors = index.vectors()
+        publish = {
+            "scope": meta["scope"],
+            "top_k": meta["top_k"],
+            "vectors": vectors,
+            "embed_model": meta["embed_model"],
+        }
+        # Take them out of service (in every process reading the directory) while they are recomputed.
+        affected_keys = {e.key for e in affected}
+        write_answer_index(path, entries, parents=meta["parents"], stale=affected_keys, **publish)
+        _reopen_live(path)
+        logger.info("recomputing %d precomputed answers citing %d changed documents", len(affected), len(changed))
+
+        questions = [(e.question, e.count) for e in affected]
+        fresh = {e.key: e for e in await _aprecompute(settings=settings, questions=questions, top_k=meta["top_k"]) if e}
+        merged = [fresh.get(e.key, e) for e in entries]
+        cited = set().union(*(e.parent_ids() for e in merged))
+        if cited - current.keys():
+            current.update(await afetch_parent_versions(settings=settings, parent_ids=list(cited - current.keys())))
+        parents = {p: current[p] for p in cited if p in current}
+        write_answer_index(path, merged, parents=parents, stale=affected_keys - fresh.keys(), **publish)
+        _reopen_live(path)
+        return len(fresh)
+
+
+def _reopen_live(path: Path) -> None:
+    index = get_answer_index()
+    if index is not None and index.path.resolve() == path.resolve():
+        index.reopen()
+
+
+class AnswerIndexJob:
+    """Runs `arefresh` in the background after indexer runs; a run arriving meanwhile triggers one more pass."""
+
+    def __init__(self) -> None:
+        self.running = False
+        self.last_recomputed: int | None = None
+        self._again = False
+        self._task: asyncio.Task | None = None
+
+    async def run(self, settings: Settings) -> None:
+        self.running = True
+        try:
+            while True:
+                self._again = False
+                try:
+                    self.last_recomputed = await arefresh(settings=settings, path=settings.answer_index_path)
+                except Exception:
+                    logger.warning("answer index refresh failed", exc_info=True)
+                if not self._again:
+                    break
+        finally:
+            self.running = False
+
+    def start(self, settings: Settings) -> asyncio.Task:
+        if self._task is not None and not self._task.done():
+            self._again = True
+            return self._task
+        self._task = asyncio.create_task(self.run(settings), name="answer-index-refresh")
+        return self._task
+
+    def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+
+@lru_cache
+def get_answer_index_job() -> AnswerIndexJob:
+    """Process-wide refresh job (started by `app.indexer_watch`)."""
+
+    return AnswerIndexJob()
+
+
+async def _run_cli(args: argparse.Namespace, settings: Settings) -> int:
+    try:
+        if args.command == "build":
+            questions = load_questions(args.questions, limit=args.limit)
+            return await abuild(settings=settings, path=args.path, questions=questions, top_k=args.top_k)
+        return await arefresh(settings=settings, path=args.path)
+    finally:
+        await aclose_clients()
+
+
+def main(argv: Iterable[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.answer_index", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="precompute answers for the most frequent questions in a file")
+    build.add_argument("questions", type=Path, help="one question per line, or JSONL with question/count")
+    build.add_argument("--limit", type=int, default=500, help="number of most frequent questions to keep")
+    build.add_argument("--top-k", type=int, default=5, help="top_k of the /chat requests to serve")
+    refresh = sub.add_parser("refresh", help="recompute the entries citing documents that changed")
+    for command in (build, refresh):
+        command.add_argument("--path", type=Path, help="index directory (default: ANSWER_INDEX_PATH)")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    settings = get_settings()
+    args.path = args.path or settings.answer_index_path
+    if not args.path:
+        parser.error("--path or ANSWER_INDEX_PATH is required")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    count = asyncio.run(_run_cli(args, settings))
+    print(f"{'Precomputed' if args.command == 'build' else 'Recomputed'} {count} answers in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+In-process caches for the RAG pipeline.
+
+Building blocks:
+  - `CacheBackend`: the small get/set/clear protocol every cache tier is written against, so the
+    storage can be swapped without touching the callers
+  - `LRUCache`: thread-safe in-memory backend with LRU eviction, TTL expiry and an entry/byte bound
+  - `make_backend`: the configured backend for a cache, `LRUCache` or (`CACHE_BACKEND=sqlite`) the
+    cross-process `app.shared_cache.SQLiteCache` shared by every worker on the host
+  - `AnswerCache`: two-tier cache in front of `answer_question`
+      1) exact tier keyed on the normalized question + `top_k` + filter + deployment/index settings
+      2) optional semantic tier: reuse a cached answer when the question embedding is within a cosine
+         threshold of a cached question's embedding
+  - retrieval cache: `LRUCache` of `retrieve_chunks` results keyed on the Search query body
+
+Caches are process-wide singletons built from settings (like the clients in `app.clients`). Call
+`invalidate_caches()` after the index content changes (e.g. an indexer run) to drop everything;
+`app.indexer_watch` does this automatically when it sees a new `kb-indexer` run.
+
+Every key embeds the current index generation, which `invalidate_caches()` bumps. A request that
+started before an invalidation therefore stores its (possibly stale) result under a key nobody reads.
+With `CACHE_BACKEND=sqlite` the generation is stored in the shared database, so all workers agree on it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Protocol
+
+import numpy as np
+
+from .federation import search_scope
+from .filters import SearchFilter, odata_filter
+from .settings import Settings, get_settings
+
+if TYPE_CHECKING:
+    from .rag import RetrievedChunk
+    from .shared_cache import SharedGeneration
+
+
+@dataclass
+class CacheStats:
+    """Counters exposed for observability; `semantic_hits` is a subset of `hits`."""
+
+    hits: int = 0
+    misses: int = 0
+    semantic_hits: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "semantic_hits": self.semantic_hits,
+            "evictions": self.evictions,
+        }
+
+
+class CacheBackend(Protocol):
+    """Minimal storage interface shared by all cache tiers; `blocking` backends do I/O (see `aget`)."""
+
+    stats: CacheStats
+    blocking: bool
+
+    def __len__(self) -> int: ...
+
+    def get(self, key: str) -> Any | None: ...
+
+    def set(self, key: str, value: Any) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+
+    Memory is bounded by `max_entries` and, when `weigh` is given, by `max_bytes` (the sum of
+    `weigh(value)` over live entries). Expired entries are dropped lazily on access.
+    """
+
+    blocking = False
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+        max_bytes: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._weigh = weigh or (lambda _value: 0)
+        self._clock = clock
+        self._data: OrderedDict[str, tuple[float | None, int, Any]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats.misses += 1
+                return None
+            expires_at, _size, value = item
+            if expires_at is not None and expires_at <= self._clock():
+                self._drop(key)
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        size = self._weigh(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Larger than the whole budget: caching it would just flush everything else.
+            return
+        expires_at = self._clock() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        _expires_at, size, _value = self._data.pop(key)
+        self._bytes -= size
+
+
+def make_backend(
+    namespace: str,
+    *,
+    max_entries: int,
+    ttl_seconds: float | None = None,
+    max_bytes: int | None = None,
+    weigh: Callable[[Any], int] | None = None,
+) -> CacheBackend:
+    """
+    Storage for the cache called `namespace`, as selected by `CACHE_BACKEND`.
+
+    The shared backend weighs entries by their serialized size, so `weigh` only applies in memory.
+    """
+
+    settings = get_settings()
+    if settings.cache_backend == "sqlite":
+        from .shared_cache import SQLiteCache
+
+        return SQLiteCache(
+            path=settings.cache_sqlite_path,
+            namespace=namespace,
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+        )
+    return LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes, weigh=weigh)
+
+
+async def aget(backend: CacheBackend, key: str) -> Any | None:
+    """`backend.get` for async callers: in a worker thread when the backend does I/O, so the event loop is free."""
+
+    if backend.blocking:
+        return await asyncio.to_thread(backend.get, key)
+    return backend.get(key)
+
+
+async def aset(backend: CacheBackend, key: str, value: Any) -> None:
+    """`backend.set` for async callers; see `aget`."""
+
+    if backend.blocking:
+        await asyncio.to_thread(backend.set, key, value)
+    else:
+        backend.set(key, value)
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form used for cache keys: NFKC, casefolded, collapsed whitespace, no trailing punctuation."""
+
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _WS_RE.sub(" ", text).strip()
+    return text.rstrip("?!. ")
+
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+@lru_cache
+def get_shared_generation() -> SharedGeneration | None:
+    """The generation stored in the shared database with `CACHE_BACKEND=sqlite`, else None (in-process)."""
+
+    settings = get_settings()
+    if settings.cache_backend != "sqlite":
+        return None
+    from .shared_cache import SharedGeneration
+
+    return SharedGeneration(path=settings.cache_sqlite_path)
+
+
+def index_generation() -> int:
+    """Monotonic counter bumped on every invalidation; part of every cache key."""
+
+    shared = get_shared_generation()
+    return shared.get() if shared is not None else _generation
+
+
+async def arefresh_generation() -> None:
+    """
+    Re-read an expired shared generation in a worker thread; async callers await this before building keys,
+    so `index_generation` answers from memory instead of querying the database on the event loop.
+    """
+
+    shared = get_shared_generation()
+    if shared is not None and not shared.fresh():
+        await asyncio.to_thread(shared.get)
+
+
+def _filter_key(search_filter: SearchFilter | None) -> str:
+    return (odata_filter(search_filter) if search_filter is not None else None) or ""
+
+
+def answer_cache_scope(*, settings: Settings, top_k: int, search_filter: SearchFilter | None = None) -> str:
+    """Everything besides the question that changes the answer; part of every answer cache key."""
+
+    return "|".join(
+        [
+            str(index_generation()),
+            search_scope(settings),
+            settings.azure_openai_chat_deployment,
+            str(top_k),
+            _filter_key(search_filter),
+        ]
+    )
+
+
+def retrieval_cache_key(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> str:
+    """Key for a `retrieve_chunks` result: everything that goes into the Search query body."""
+
+    if settings.use_search_vectorizer:
+        vectorizer = f"search:{settings.azure_search_vectorizer}"
+    else:
+        vectorizer = f"app:{settings.azure_openai_embed_deployment}"
+    return "|".join(
+        [
+            str(index_generation()),
+            search_scope(settings),
+            settings.azure_search_vector_field,
+            vectorizer,
+            str(top_k),
+            _filter_key(search_filter),
+            normalize_question(question),
+        ]
+    )
+
+
+class SemanticIndex:
+    """
+    Fixed-capacity ring buffer of normalized float32 question embeddings.
+
+    Memory is `capacity * dim * 4` bytes regardless of traffic; the oldest rows are overwritten first.
+    Lookups are a single matrix-vector product restricted to rows of the same scope.
+    """
+
+    def __init__(self, *, capacity: int, threshold: float) -> None:
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vectors: np.ndarray | None = None
+        self._keys: list[str | None] = [None] * capacity
+        self._scopes = np.full(capacity, -1, dtype=np.int32)
+        self._scope_ids: dict[str, int] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, *, scope: str, key: str, embedding: np.ndarray) -> None:
+        vec = _unit(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            row = self._next
+            self._vectors[row] = vec
+            self._keys[row] = key
+            self._scopes[row] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._next = (row + 1) % self.capacity
+
+    def nearest(self, *, scope: str, embedding: np.ndarray) -> str | None:
+        """Return the cache key of the most similar question in `scope`, if above the threshold."""
+
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if self._vectors is None or scope_id is None:
+                return None
+            sims = self._vectors @ _unit(embedding)
+            sims[self._scopes != scope_id] = -np.inf
+            row = int(np.argmax(sims))
+            if sims[row] < self.threshold:
+                return None
+            return self._keys[row]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._keys = [None] * self.capacity
+            self._scopes.fill(-1)
+            self._scope_ids.clear()
+            self._next = 0
+
+
+def _unit(embedding: np.ndarray) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _answer_size(value: tuple[str, list[RetrievedChunk]]) -> int:
+    answer, chunks = value
+    return len(answer) + sum(len(c.content) for c in chunks)
+
+
+@dataclass
+class AnswerLookup:
+    """Result of `AnswerCache.lookup`: the cached value (None on miss) and the embedding computed, if any."""
+
+    value: tuple[str, list[RetrievedChunk]] | None
+    embedding: np.ndarray | None = None
+
+
+class AnswerCache:
+    """
+    Two-tier cache for `(answer, chunks)` results.
+
+    The exact tier is always on. The semantic tier is enabled by passing `semantic_threshold`; callers
+    then supply an embedding function to `lookup` and the resulting embedding to `set`.
+    """
+
+    def __init__(
+        self,
+        *,
+        backend: CacheBackend,
+        semantic_threshold: float | None = None,
+        semantic_capacity: int = 1024,
+    ) -> None:
+        self.backend = backend
+        self.semantic = (
+            SemanticIndex(capacity=semantic_capacity, threshold=semantic_threshold)
+            if semantic_threshold is not None
+            else None
+        )
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*, scope: str, question: str) -> str:
+        return f"{scope}|{normalize_question(question)}"
+
+    def lookup(self, *, scope: str, question: str, embed: Callable[[], Sequence[float]] | None = None) -> AnswerLookup:
+        """
+        Exact tier first; on a miss, consult the semantic tier using `embed()`.
+
+        `embed` is only called when the semantic tier is enabled and the exact tier missed. The
+        embedding is returned so the caller can pass it back to `set` without recomputing it.
+        """
+
+        value = self.backend.get(self.key(scope=scope, question=question))
+        embedding = None
+        if value is None and self.semantic is not None and embed is not None:
+            embedding = np.asarray(embed(), dtype=np.float32)
+            value = self._get_similar(scope=scope, embedding=embedding)
+            self._record(value, semantic=value is not None)
+        else:
+            self._record(value)
+        return AnswerLookup(value=value, embedding=embedding)
+
+    async def alookup(
+        self, *, scope: str, question: str, aembed: Callable[[], Awaitable[Sequence[float]]] | None = None
+    ) -> AnswerLookup:
+        """Async variant of `lookup` for an awaitable embedding function."""
+
+        value = await aget(self.backend, self.key(scope=scope, question=question))
+        embedding = None
+        if value is None and self.semantic is not None and aembed is not None:
+            embedding = np.asarray(await aembed(), dtype=np.float32)
+            near_key = self.semantic.nearest(scope=scope, embedding=embedding)
+            value = await aget(self.backend, near_key) if near_key is not None else None
+            self._record(value, semantic=value is not None)
+        else:
+            self._record(value)
+        return AnswerLookup(value=value, embedding=embedding)
+
+    def _get_similar(self, *, scope: str, embedding: np.ndarray) -> tuple[str, list[RetrievedChunk]] | None:
+        assert self.semantic is not None
+        near_key = self.semantic.nearest(scope=scope, embedding=embedding)
+        return self.backend.get(near_key) if near_key is not None else None
+
+    def _record(self, value: object | None, *, semantic: bool = False) -> None:
+        with self._lock:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                self.stats.semantic_hits += int(semantic)
+
+    def set(
+        self,
+        *,
+        scope: str,
+        question: str,
+        value: tuple[str, list[RetrievedChunk]],
+        embedding: np.ndarray | None = None,
+    ) -> None:
+        key = self.key(scope=scope, question=question)
+        self.backend.set(key, value)
+        if self.semantic is not None and embedding is not None:
+            self.semantic.add(scope=scope, key=key, embedding=embedding)
+
+    async def aset(
+        self,
+        *,
+        scope: str,
+        question: str,
+        value: tuple[str, list[RetrievedChunk]],
+        embedding: np.ndarray | None = None,
+    ) -> None:
+        """Async variant of `set`."""
+
+        key = self.key(scope=scope, question=question)
+        await aset(self.backend, key, value)
+        if self.semantic is not None and embedding is not None:
+            self.semantic.add(scope=scope, key=key, embedding=embedding)
+
+    def invalidate(self) -> None:
+        self.backend.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+
+
+@lru_cache
+def get_answer_cache() -> AnswerCache | None:
+    """Process-wide answer cache, or None when `ANSWER_CACHE_ENABLED` is off."""
+
+    settings = get_settings()
+    if not settings.answer_cache_enabled:
+        return None
+    backend = make_backend(
+        "answer",
+        max_entries=settings.answer_cache_max_entries,
+        ttl_seconds=settings.answer_cache_ttl_seconds,
+        max_bytes=settings.answer_cache_max_bytes,
+        weigh=_answer_size,
+    )
+    return AnswerCache(
+        backend=backend,
+        semantic_threshold=settings.answer_cache_semantic_threshold,
+        semantic_capacity=settings.answer_cache_max_entries,
+    )
+
+
+def _chunks_size(chunks: list[RetrievedChunk]) -> int:
+    return sum(len(c.content) for c in chunks)
+
+
+@lru_cache
+def get_retrieval_cache() -> CacheBackend | None:
+    """Process-wide `retrieve_chunks` result cache, or None when `RETRIEVAL_CACHE_ENABLED` is off."""
+
+    settings = get_settings()
+    if not settings.retrieval_cache_enabled:
+        return None
+    return make_backend(
+        "retrieval",
+        max_entries=settings.retrieval_cache_max_entries,
+        ttl_seconds=settings.retrieval_cache_ttl_seconds,
+        max_bytes=settings.retrieval_cache_max_bytes,
+        weigh=_chunks_size,
+    )
+
+
+def invalidate_caches() -> None:
+    """Drop every cached answer and retrieval result; call after the index content changes."""
+
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    shared = get_shared_generation()
+    if shared is not None:
+        shared.bump()
+
+    answers = get_answer_cache()
+    if answers is not None:
+        answers.invalidate()
+    retrievals = get_retrieval_cache()
+    if retrievals is not None:
+        retrievals.clear()
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """Hit/miss counters for every enabled cache (and the precomputed answer index), keyed by cache name."""
+
+    stats: dict[str, dict[str, int]] = {}
+    cache = get_answer_cache()
+    if cache is not None:
+        stats["answer"] = {
+            **cache.stats.as_dict(),
+            "evictions": cache.backend.stats.evictions,
+            "entries": len(cache.backend),
+        }
+    retrievals = get_retrieval_cache()
+    if retrievals is not None:
+        stats["retrieval"] = {**retrievals.stats.as_dict(), "entries": len(retrievals)}
+    # Imported here: app.answer_index is built on this module.
+    from .answer_index import get_answer_index
+
+    answers = get_answer_index()
+    if answers is not None:
+        stats["answer_index"] = {**answers.stats.as_dict(), "entries": len(answers)}
+    return stats
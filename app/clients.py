@@ -3,36 +3,351 @@ Thin wrappers for clients used by the app.
 
 We cache clients to:
   - reuse connection pools (httpx)
-  - avoid rebuilding auth plumbing (Azure OpenAI)
+  - avoid rebuilding auth plumbing (Azure OpenAI, one Azure AD credential per process)
+
+Each client has a sync and an async flavor. The async ones back the FastAPI endpoints so a slow
+upstream call does not park a threadpool worker; the sync ones stay for scripts and tests.
+
+Connection pooling (settings `HTTP_*`, see `app.settings`):
+  - one httpx client per flavor, with settings-driven pool limits, keep-alive expiry and timeouts, and
+    HTTP/2 when the `h2` package is installed, so concurrent Search queries share a few multiplexed
+    connections instead of opening one each
+  - the OpenAI clients are built on the same httpx client (`http_client=`), so Search and OpenAI traffic
+    share one pool and one pool limit instead of each OpenAI client keeping its own
+  - `RetryTransport` retries idempotent requests (GETs, Search queries; never chat completions, which the
+    OpenAI SDK and the deployment router retry themselves) after connection errors and 429/502/503/504,
+    with exponential backoff and full jitter, honoring `Retry-After` and the request deadline
+  - pool utilization is exported on `/metrics` (`rag_http_pool_*`), retries as `rag_http_retries`
+  - `aclose_clients` closes the pools and the credentials at shutdown
+
+With a deployment pool configured (`AZURE_OPENAI_DEPLOYMENTS`), the OpenAI factories return a router
+over one client per pool member instead (`app.openai_router`).
 """
 
 from __future__ import annotations
 
+import asyncio
+import email.utils
+import importlib.util
+import logging
+import random
+import time
+from dataclasses import dataclass
 from functools import lru_cache
 
 import httpx
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from openai import AzureOpenAI
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.identity.aio import get_bearer_token_provider as get_async_bearer_token_provider
+from openai import DEFAULT_TIMEOUT, AsyncAzureOpenAI, AzureOpenAI
 
+from .deadline import current_deadline
+from .openai_router import AsyncOpenAIRouter, DeploymentPool, OpenAIRouter, get_deployment_pool
 from .settings import Settings, get_settings
+from .telemetry import record_http_retry
+
+
+logger = logging.getLogger(__name__)
+
+_COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def is_idempotent(request: httpx.Request) -> bool:
+    """
+    Safe to send twice: idempotent methods, Search queries (`POST .../docs/search`, a read) and requests
+    sent with `extensions={"idempotent": True}`.
+    """
+
+    if request.extensions.get("idempotent"):
+        return True
+    return request.method in _IDEMPOTENT_METHODS or (
+        request.method == "POST" and request.url.path.endswith("/docs/search")
+    )
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # The HTTP-date form.
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how long to wait between attempts; `backoff` returns None when not to retry."""
+
+    retries: int = 2
+    backoff_base: float = 0.1
+    backoff_max: float = 2.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> RetryPolicy:
+        return cls(
+            retries=settings.http_retries,
+            backoff_base=settings.http_retry_backoff_ms / 1000,
+            backoff_max=settings.http_retry_max_backoff_ms / 1000,
+        )
+
+    def backoff(self, attempt: int, response: httpx.Response | None = None) -> float | None:
+        if attempt >= self.retries:
+            return None
+        # Full jitter: concurrent clients that failed together do not retry together.
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            if retry_after > self.backoff_max:
+                return None
+            delay = max(delay, retry_after)
+        deadline = current_deadline()
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+        return delay
+
+
+class _Retrying:
+    def __init__(self, transport, policy: RetryPolicy, name: str) -> None:
+        self.transport = transport
+        self.policy = policy
+        self.name = name
+
+    def _next_delay(self, request: httpx.Request, attempt: int, outcome) -> float | None:
+        if not is_idempotent(request):
+            return None
+        if isinstance(outcome, httpx.Response):
+            if outcome.status_code not in _RETRY_STATUSES:
+                return None
+            delay, reason = self.policy.backoff(attempt, outcome), str(outcome.status_code)
+        else:
+            delay, reason = self.policy.backoff(attempt), type(outcome).__name__
+        if delay is not None:
+            record_http_retry(self.name, reason)
+        return delay
+
+
+class RetryTransport(_Retrying, httpx.BaseTransport):
+    """Wraps a transport with `policy` retries for idempotent requests (see the module docstring)."""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except _RETRY_ERRORS as exc:
+                delay = self._next_delay(request, attempt, exc)
+                if delay is None:
+                    raise
+            else:
+                delay = self._next_delay(request, attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(_Retrying, httpx.AsyncBaseTransport):
+    """Async `RetryTransport`."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except _RETRY_ERRORS as exc:
+                delay = self._next_delay(request, attempt, exc)
+                if delay is None:
+                    raise
+            else:
+                delay = self._next_delay(request, attempt, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _http2(settings: Settings) -> bool:
+    if not settings.http2_enabled:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but h2 is not installed (pip install httpx[http2]); using HTTP/1.1")
+        return False
+    return True
+
+
+def _transport_options(settings: Settings) -> dict:
+    return {
+        "http2": _http2(settings),
+        "limits": httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+    }
+
+
+def _timeout(settings: Settings) -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.http_timeout_seconds,
+        connect=settings.http_connect_timeout_seconds,
+        pool=settings.http_pool_timeout_seconds,
+    )
 
 
 @lru_cache
 def get_httpx_client() -> httpx.Client:
-    """Shared httpx client (connection pooling, timeouts)."""
+    """Shared httpx client: pooled (HTTP/2 when available), with retries for idempotent requests."""
 
-    return httpx.Client(timeout=httpx.Timeout(30.0))
+    settings = get_settings()
+    transport = RetryTransport(
+        httpx.HTTPTransport(**_transport_options(settings)), RetryPolicy.from_settings(settings), "sync"
+    )
+    return httpx.Client(transport=transport, timeout=_timeout(settings))
 
 
 @lru_cache
-def get_openai_client() -> AzureOpenAI:
+def get_async_httpx_client() -> httpx.AsyncClient:
+    """Shared async httpx client; same pooling/timeouts/retries as `get_httpx_client`."""
+
+    settings = get_settings()
+    transport = AsyncRetryTransport(
+        httpx.AsyncHTTPTransport(**_transport_options(settings)), RetryPolicy.from_settings(settings), "async"
+    )
+    return httpx.AsyncClient(transport=transport, timeout=_timeout(settings))
+
+
+def _pool_stats(client: httpx.Client | httpx.AsyncClient) -> dict[str, int] | None:
+    # httpcore's pool is not public API; report nothing rather than fail if its shape changes.
+    pool = getattr(getattr(getattr(client, "_transport", None), "transport", None), "_pool", None)
+    if pool is None:
+        return None
+    try:
+        connections = pool.connections
+        active = sum(1 for c in connections if not c.is_idle())
+        waiting = sum(1 for r in list(pool._requests) if r.is_queued())
+    except (AttributeError, TypeError):
+        return None
+    return {"active": active, "idle": len(connections) - active, "waiting": waiting}
+
+
+def http_pool_stats() -> dict[str, dict[str, int]]:
+    """Connections (active/idle) and queued requests of the shared clients built so far, by flavor."""
+
+    stats = {}
+    for name, factory in (("sync", get_httpx_client), ("async", get_async_httpx_client)):
+        if factory.cache_info().currsize:
+            client_stats = _pool_stats(factory())
+            if client_stats is not None:
+                stats[name] = client_stats
+    return stats
+
+
+@lru_cache
+def get_credential() -> DefaultAzureCredential:
+    """Process-wide Azure AD credential for the sync OpenAI clients (Managed Identity in production)."""
+
+    return DefaultAzureCredential(exclude_interactive_browser_credential=False)
+
+
+@lru_cache
+def get_async_credential() -> AsyncDefaultAzureCredential:
+    """Async counterpart of `get_credential`."""
+
+    return AsyncDefaultAzureCredential(exclude_interactive_browser_credential=False)
+
+
+async def aclose_clients() -> None:
+    """Close the shared HTTP clients (and so the OpenAI clients built on them) and the credentials; at shutdown."""
+
+    if get_async_httpx_client.cache_info().currsize:
+        await get_async_httpx_client().aclose()
+    if get_httpx_client.cache_info().currsize:
+        get_httpx_client().close()
+    if get_async_credential.cache_info().currsize:
+        await get_async_credential().close()
+    if get_credential.cache_info().currsize:
+        get_credential().close()
+    for factory in (
+        get_openai_client,
+        get_async_openai_client,
+        get_httpx_client,
+        get_async_httpx_client,
+        get_credential,
+        get_async_credential,
+    ):
+        factory.cache_clear()
+
+
+def _member_clients(pool: DeploymentPool, build) -> dict:
+    """One client per pool member; members on the same endpoint and key share it (all share the HTTP pool)."""
+
+    shared: dict[tuple[str, str | None], object] = {}
+    clients = {}
+    for member in pool.members:
+        key = (member.endpoint, member.api_key)
+        if key not in shared:
+            shared[key] = build(endpoint=member.endpoint, api_key=member.api_key)
+        clients[member.name] = shared[key]
+    return clients
+
+
+@lru_cache
+def get_openai_client() -> AzureOpenAI | OpenAIRouter:
     """
     Azure OpenAI client configured for either:
       - API key auth (simplest), or
       - Azure AD auth via DefaultAzureCredential (preferred in production with Managed Identity).
+
+    With `AZURE_OPENAI_DEPLOYMENTS` set, a router over the pool (same `create` calls) instead.
     """
 
     settings: Settings = get_settings()
+    pool = get_deployment_pool()
+    # Shared pool; the SDK's own timeout, not the shorter one of the Search calls.
+    transport = {"http_client": get_httpx_client(), "timeout": DEFAULT_TIMEOUT}
+    if pool is not None:
+        token_provider = None
+
+        def build(*, endpoint: str, api_key: str | None) -> AzureOpenAI:
+            nonlocal token_provider
+            if api_key:
+                return AzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=endpoint,
+                    api_version=settings.azure_openai_api_version,
+                    **transport,
+                    max_retries=0,
+                )
+            if token_provider is None:
+                token_provider = get_bearer_token_provider(get_credential(), _COGNITIVE_SERVICES_SCOPE)
+            return AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=settings.azure_openai_api_version,
+                **transport,
+                azure_ad_token_provider=token_provider,
+                max_retries=0,
+            )
+
+        return OpenAIRouter(
+            pool, _member_clients(pool, build), max_wait=settings.azure_openai_router_max_wait_seconds
+        )
 
     if settings.azure_openai_api_key:
         # API key auth is straightforward and works anywhere, but requires secret distribution.
@@ -40,16 +355,69 @@ def get_openai_client() -> AzureOpenAI:
             api_key=settings.azure_openai_api_key,
             azure_endpoint=settings.azure_openai_endpoint,
             api_version=settings.azure_openai_api_version,
+            **transport,
         )
 
     # Azure AD auth: DefaultAzureCredential tries multiple mechanisms (Managed Identity, CLI login, etc.).
-    token_provider = get_bearer_token_provider(
-        DefaultAzureCredential(exclude_interactive_browser_credential=False),
-        "https://cognitiveservices.azure.com/.default",
-    )
+    token_provider = get_bearer_token_provider(get_credential(), _COGNITIVE_SERVICES_SCOPE)
     return AzureOpenAI(
         azure_endpoint=settings.azure_openai_endpoint,
         api_version=settings.azure_openai_api_version,
+        **transport,
         azure_ad_token_provider=token_provider,
     )
 
+
+@lru_cache
+def get_async_openai_client() -> AsyncAzureOpenAI | AsyncOpenAIRouter:
+    """
+    Async counterpart of `get_openai_client`.
+
+    Uses the `azure.identity.aio` credential so token refreshes do not block the event loop.
+    """
+
+    settings: Settings = get_settings()
+    pool = get_deployment_pool()
+    transport = {"http_client": get_async_httpx_client(), "timeout": DEFAULT_TIMEOUT}
+    if pool is not None:
+        token_provider = None
+
+        def build(*, endpoint: str, api_key: str | None) -> AsyncAzureOpenAI:
+            nonlocal token_provider
+            if api_key:
+                return AsyncAzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=endpoint,
+                    api_version=settings.azure_openai_api_version,
+                    **transport,
+                    max_retries=0,
+                )
+            if token_provider is None:
+                token_provider = get_async_bearer_token_provider(get_async_credential(), _COGNITIVE_SERVICES_SCOPE)
+            return AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=settings.azure_openai_api_version,
+                **transport,
+                azure_ad_token_provider=token_provider,
+                max_retries=0,
+            )
+
+        return AsyncOpenAIRouter(
+            pool, _member_clients(pool, build), max_wait=settings.azure_openai_router_max_wait_seconds
+        )
+
+    if settings.azure_openai_api_key:
+        return AsyncAzureOpenAI(
+            api_key=settings.azure_openai_api_key,
+            azure_endpoint=settings.azure_openai_endpoint,
+            api_version=settings.azure_openai_api_version,
+            **transport,
+        )
+
+    token_provider = get_async_bearer_token_provider(get_async_credential(), _COGNITIVE_SERVICES_SCOPE)
+    return AsyncAzureOpenAI(
+        azure_endpoint=settings.azure_openai_endpoint,
+        api_version=settings.azure_openai_api_version,
+        **transport,
+        azure_ad_token_provider=token_provider,
+    )
@@ -0,0 +1,418 @@
+"""
+Context building between retrieval and prompt assembly.
+
+`search/skillset.json` splits documents into 2000-char pages with a 500-char overlap, so neighbouring
+chunks of the same document repeat a quarter of their text. `ContextPacker.pack`:
+  1) merges adjacent/overlapping chunks of the same `parentId` into one block
+  2) drops near-duplicate blocks (word-shingle Jaccard similarity), keeping the better-ranked one
+  3) optionally (`CONTEXT_COMPRESSION_ENABLED`, given the question) compresses each block to the sentences
+     that matter for the question; see `SentenceCompressor`
+  4) keeps blocks in rank (score) order until the prompt token budget is spent, truncating the last one
+
+The returned list is what gets numbered [1], [2], ... in the prompt and returned as citations, so
+bracket numbers always line up with the citations list.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Protocol
+
+import numpy as np
+
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from .rag import RetrievedChunk
+
+
+logger = logging.getLogger(__name__)
+
+
+class Tokenizer(Protocol):
+    def count(self, text: str) -> int: ...
+
+    def truncate(self, text: str, max_tokens: int) -> str: ...
+
+
+class TiktokenTokenizer:
+    """Exact token counts via `tiktoken` for the configured encoding."""
+
+    def __init__(self, encoding_name: str) -> None:
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode(text, disallowed_special=())
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+class ByteEstimateTokenizer:
+    """
+    Fallback when tiktoken or its encoding file is unavailable (e.g. air-gapped hosts).
+
+    BPE tokens average ~4 bytes of English text; counts are estimates, not bounds.
+    """
+
+    bytes_per_token = 4
+
+    def count(self, text: str) -> int:
+        return -(-len(text.encode("utf-8")) // self.bytes_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text.encode("utf-8")[: max_tokens * self.bytes_per_token].decode("utf-8", errors="ignore")
+
+
+@lru_cache
+def get_tokenizer(encoding_name: str) -> Tokenizer:
+    """Tokenizer for `encoding_name`, falling back to a byte estimate if it cannot be loaded."""
+
+    try:
+        return TiktokenTokenizer(encoding_name)
+    except Exception:
+        logger.warning("tiktoken encoding %s unavailable; estimating token counts", encoding_name, exc_info=True)
+        return ByteEstimateTokenizer()
+
+
+def _overlap(a: str, b: str, min_overlap: int) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if under `min_overlap`)."""
+
+    if len(a) < min_overlap or len(b) < min_overlap:
+        return 0
+    probe = b[:min_overlap]
+    start = a.find(probe)
+    while start != -1:
+        # The first hit is the longest candidate overlap.
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def _merge_text(a: str, b: str, min_overlap: int) -> str | None:
+    """Merge two texts that overlap or contain one another; None if they are not adjacent."""
+
+    if b in a:
+        return a
+    if a in b:
+        return b
+    if k := _overlap(a, b, min_overlap):
+        return a + b[k:]
+    if k := _overlap(b, a, min_overlap):
+        return b + a[k:]
+    return None
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 5) -> set[tuple[str, ...]]:
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+# Words that say nothing about what a question is about.
+_STOPWORDS = frozenset(
+    "a an and are about as at be but by can could do does for from how i if in into is it its me my of on or "
+    "so than that the their them then there these they this those to was we what when where which who why "
+    "will with would you your more tell explain again please".split()
+)
+
+
+def content_words(text: str) -> set[str]:
+    return _content_words(text.casefold())
+
+
+def _content_words(folded: str) -> set[str]:
+    return {w for w in _WORD_RE.findall(folded) if len(w) > 2 and w not in _STOPWORDS}
+
+
+# A sentence ends at . ! ? followed by a space, or at a line break (list items, headings).
+_SENTENCE_END_RE = re.compile(r"[.!?](?=[ \t])|\n")
+# "1." / "2)" on their own are list numbers, not sentences: they stay with the sentence they number.
+_LIST_NUMBER_RE = re.compile(r"\d{1,3}[.)]")
+_ELISION = " … "
+
+
+@lru_cache(maxsize=4096)
+def sentence_spans(text: str) -> tuple[tuple[int, int], ...]:
+    """
+    `(start, end)` offsets of the (whitespace-stripped) sentences in `text`.
+
+    Cached: the same chunks come back for related questions, and splitting is most of the compression cost.
+    """
+
+    spans = []
+    start = 0
+    for m in _SENTENCE_END_RE.finditer(text):
+        newline = m.group() == "\n"
+        end = m.start() if newline else m.end()
+        segment = text[start:end]
+        s, e = start + len(segment) - len(segment.lstrip()), start + len(segment.rstrip())
+        if not newline and e - s <= 4 and _LIST_NUMBER_RE.fullmatch(text, s, e):
+            continue
+        if s < e:
+            spans.append((s, e))
+        start = m.end()
+    segment = text[start:]
+    s, e = start + len(segment) - len(segment.lstrip()), start + len(segment.rstrip())
+    if s < e:
+        spans.append((s, e))
+    return tuple(spans)
+
+
+@dataclass(frozen=True)
+class SentenceCompressor:
+    """
+    Extractive compression: keep only the sentences of each block that matter for the question.
+
+    Sentences are scored by the IDF-weighted share of the question's content words they contain (words
+    compared on their first `stem_chars` characters, a crude stemmer that matches "deployments" with
+    "deployment"). Scoring is one matrix-vector product over all sentences of all blocks; a few
+    milliseconds for `top_k=50` full-size chunks.
+
+    Every block keeps at least its best sentence (so no citation number disappears), and blocks up to
+    `max_chunk_chars` are kept whole. Further sentences are added best first while the block stays within
+    `max_chunk_chars` and the whole context within `max_total_chars` (0: only the packer's token budget).
+    Kept sentences stay in document order; gaps are marked with " … ".
+    """
+
+    max_chunk_chars: int = 600
+    max_total_chars: int = 0
+    stem_chars: int = 5
+
+    def compress(self, chunks: list[RetrievedChunk], question: str) -> list[RetrievedChunk]:
+        # Lowercased like the content searched below: casefolding would turn "Straße" into "strasse", which the
+        # content (not casefolded, so that offsets stay put) never contains.
+        stems = sorted({w[: self.stem_chars] for w in _content_words(question.lower())})
+        if not stems or not chunks:
+            return chunks
+
+        spans: list[tuple[int, int]] = []
+        bounds: list[tuple[int, int]] = []
+        rows: list[int] = []
+        cols: list[int] = []
+        for chunk in chunks:
+            first = len(spans)
+            spans.extend(sentence_spans(chunk.content))
+            bounds.append((first, len(spans)))
+            hits = _find_words(chunk.content.lower(), stems, self.stem_chars)
+            if hits and len(spans) > first:
+                starts = np.array([start for start, _end in spans[first:]])
+                positions = np.array([pos for pos, _col in hits])
+                rows.extend((first + np.searchsorted(starts, positions, side="right") - 1).clip(first).tolist())
+                cols.extend(col for _pos, col in hits)
+        if not spans:
+            return chunks
+
+        matrix = np.zeros((len(spans), len(stems)), dtype=np.float32)
+        matrix[rows, cols] = 1.0
+        # Terms found in many sentences (the topic of the whole result set) tell sentences apart less.
+        idf = np.log((len(spans) + 1) / (matrix.sum(axis=0) + 1)) + 1.0
+        scores = matrix @ idf / idf.sum()
+        lengths = np.array([end - start for start, end in spans])
+
+        keep = np.zeros(len(spans), dtype=bool)
+        used = [0] * len(chunks)
+        owner = np.empty(len(spans), dtype=np.int32)
+        for i, (first, last) in enumerate(bounds):
+            owner[first:last] = i
+            if first == last:
+                continue
+            if len(chunks[i].content) <= self.max_chunk_chars:
+                keep[first:last] = True
+            else:
+                keep[first + int(np.argmax(scores[first:last]))] = True
+            used[i] = int(lengths[first:last][keep[first:last]].sum())
+        total = sum(used)
+
+        for s in np.argsort(-scores, kind="stable"):
+            if scores[s] <= 0:
+                break
+            i = owner[s]
+            if keep[s] or used[i] + lengths[s] > self.max_chunk_chars:
+                continue
+            if self.max_total_chars and total + lengths[s] > self.max_total_chars:
+                continue
+            keep[s] = True
+            used[i] += int(lengths[s])
+            total += int(lengths[s])
+
+        out = []
+        for chunk, (first, last) in zip(chunks, bounds, strict=True):
+            if first == last or keep[first:last].all():
+                out.append(chunk)
+                continue
+            out.append(replace(chunk, content=_join_kept(chunk.content, spans[first:last], keep[first:last])))
+        return out
+
+
+def _find_words(text: str, stems: list[str], stem_chars: int) -> list[tuple[int, int]]:
+    """
+    `(offset, stem index)` of every word of `text` (lowercased) starting with one of `stems`, in no order.
+
+    `str.find` per stem is several times faster than a regex over every word; stems shorter than
+    `stem_chars` are whole words and must match exactly. Offsets only locate the sentence a word is in.
+    """
+
+    hits = []
+    for col, stem in enumerate(stems):
+        exact = len(stem) < stem_chars
+        pos = text.find(stem)
+        while pos != -1:
+            end = pos + len(stem)
+            if (pos == 0 or not text[pos - 1].isalnum()) and not (exact and end < len(text) and text[end].isalnum()):
+                hits.append((pos, col))
+            pos = text.find(stem, end)
+    return hits
+
+
+def _join_kept(text: str, spans: list[tuple[int, int]], keep: np.ndarray) -> str:
+    """Kept sentences in order; consecutive ones keep their original separator, gaps become an elision."""
+
+    parts: list[str] = []
+    run_start: int | None = None
+    prev = -2
+    for j, (start, end) in enumerate(spans):
+        if not keep[j]:
+            continue
+        if j != prev + 1 and run_start is not None:
+            parts.append(text[run_start : spans[prev][1]])
+            run_start = None
+        if run_start is None:
+            run_start = start
+        prev = j
+    parts.append(text[run_start : spans[prev][1]])
+    return _ELISION.join(parts)
+
+
+def format_block(number: int, chunk: RetrievedChunk) -> str:
+    """Prompt text for one context block; bracket numbering enables citations like [1], [2]."""
+
+    title = chunk.title or "Untitled"
+    src = chunk.source_path or chunk.parent_id or "unknown"
+    return f"[{number}] {title}\nSource: {src}\n{chunk.content}"
+
+
+@dataclass
+class _Block:
+    rank: int
+    chunk: RetrievedChunk
+
+
+@dataclass(frozen=True)
+class ContextPacker:
+    """Merge, dedupe and budget retrieved chunks; see the module docstring."""
+
+    token_budget: int
+    merge_overlaps: bool = True
+    dedupe_threshold: float = 0.9
+    min_overlap_chars: int = 50
+    # Don't bother including a truncated tail shorter than this.
+    min_block_tokens: int = 64
+    encoding: str = "o200k_base"
+    # Overrides `encoding` (tests, custom tokenizers); loaded lazily otherwise.
+    tokenizer: Tokenizer | None = None
+    compressor: SentenceCompressor | None = None
+
+    def pack(self, chunks: list[RetrievedChunk], *, question: str | None = None) -> list[RetrievedChunk]:
+        """Merge, dedupe, compress (with a compressor and a `question`) and budget `chunks`."""
+
+        blocks = [_Block(rank=i, chunk=c) for i, c in enumerate(chunks)]
+        if self.merge_overlaps:
+            blocks = self._merge(blocks)
+        blocks = self._dedupe(blocks)
+        if self.compressor is not None and question:
+            compressed = self.compressor.compress([b.chunk for b in blocks], question)
+            blocks = [_Block(rank=b.rank, chunk=c) for b, c in zip(blocks, compressed, strict=True)]
+        return self._fit(blocks)
+
+    def _merge(self, blocks: list[_Block]) -> list[_Block]:
+        merged: list[_Block] = []
+        for block in blocks:
+            if block.chunk.parent_id is None:
+                merged.append(block)
+                continue
+            # A new chunk can bridge two existing blocks, so keep folding until nothing changes.
+            current = block
+            changed = True
+            while changed:
+                changed = False
+                for i, other in enumerate(merged):
+                    if other.chunk.parent_id != current.chunk.parent_id:
+                        continue
+                    text = _merge_text(other.chunk.content, current.chunk.content, self.min_overlap_chars)
+                    if text is None:
+                        continue
+                    best = other if other.rank <= current.rank else current
+                    current = _Block(rank=best.rank, chunk=replace(best.chunk, content=text))
+                    del merged[i]
+                    changed = True
+                    break
+            merged.append(current)
+        return sorted(merged, key=lambda b: b.rank)
+
+    def _dedupe(self, blocks: list[_Block]) -> list[_Block]:
+        kept: list[tuple[_Block, set]] = []
+        for block in blocks:
+            shingles = _shingles(block.chunk.content)
+            if any(
+                len(shingles & other) / max(len(shingles | other), 1) >= self.dedupe_threshold for _b, other in kept
+            ):
+                continue
+            kept.append((block, shingles))
+        return [b for b, _s in kept]
+
+    def _fit(self, blocks: list[_Block]) -> list[RetrievedChunk]:
+        # Cheap exit without tokenizing: a token never covers less than one byte.
+        total_bytes = sum(len(format_block(i, b.chunk).encode("utf-8")) + 2 for i, b in enumerate(blocks, start=1))
+        if total_bytes <= self.token_budget:
+            return [b.chunk for b in blocks]
+
+        tokenizer = self.tokenizer or get_tokenizer(self.encoding)
+        remaining = self.token_budget
+        packed: list[RetrievedChunk] = []
+        for block in blocks:
+            c = block.chunk
+            # +2 for the blank line separating blocks.
+            header_tokens = tokenizer.count(format_block(len(packed) + 1, replace(c, content=""))) + 2
+            content_tokens = tokenizer.count(c.content)
+            if header_tokens + content_tokens <= remaining:
+                packed.append(c)
+                remaining -= header_tokens + content_tokens
+                continue
+            room = remaining - header_tokens
+            if room >= self.min_block_tokens:
+                packed.append(replace(c, content=tokenizer.truncate(c.content, room)))
+            break
+        return packed
+
+
+@lru_cache
+def get_context_packer() -> ContextPacker:
+    """Process-wide packer configured from settings."""
+
+    settings = get_settings()
+    return ContextPacker(
+        token_budget=settings.context_token_budget,
+        merge_overlaps=settings.context_merge_overlaps,
+        dedupe_threshold=settings.context_dedupe_threshold,
+        encoding=settings.context_tokenizer,
+        compressor=(
+            SentenceCompressor(
+                max_chunk_chars=settings.context_compression_chunk_chars,
+                max_total_chars=settings.context_compression_total_chars,
+            )
+            if settings.context_compression_enabled
+            else None
+        ),
+    )
@@ -0,0 +1,121 @@
+"""
+Per-request deadlines.
+
+The chat endpoints accept a time budget: `timeout_ms` in the body, else an `X-Request-Timeout-Ms` header,
+else `REQUEST_TIMEOUT_MS`. The endpoint opens `deadline_scope(...)` and the RAG code reads the deadline
+with `current_deadline()`, so no timeout has to be threaded through every signature (same pattern as
+the request timings in `app.telemetry`).
+
+The async answer path splits the budget across its stages:
+  - retrieval (embedding + Search) may use `DEADLINE_RETRIEVAL_SHARE` of what is left when it starts;
+    missing that raises `DeadlineExceeded`, as there is nothing to return yet (the API answers 504)
+  - generation gets the rest; with less than `DEADLINE_FULL_CONTEXT_MS` left, the context token budget
+    shrinks proportionally (a shorter prompt is faster to process): `degraded="truncated_context"`
+  - if generation cannot finish in time, the citations are returned without an answer:
+    `degraded="citations_only"`
+
+Degraded answers are never cached.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TypeVar
+
+from .settings import get_settings
+
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before anything useful could be returned."""
+
+
+@dataclass
+class Deadline:
+    expires_at: float
+    retrieval_share: float = 1.0
+    full_context_seconds: float = 0.0
+    # Set by the answer path when it had to cut corners; read back by the endpoint.
+    degraded: str | None = None
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def retrieval_budget(self) -> float:
+        return self.remaining() * self.retrieval_share
+
+    def context_fraction(self) -> float:
+        """Share of the context token budget that still fits the time left (1.0: no truncation)."""
+
+        if self.full_context_seconds <= 0:
+            return 1.0
+        return min(1.0, self.remaining() / self.full_context_seconds)
+
+
+@dataclass(frozen=True)
+class DeadlinePolicy:
+    default_timeout_seconds: float | None = None
+    retrieval_share: float = 0.3
+    full_context_seconds: float = 4.0
+
+    def start(self, timeout_ms: float | None = None) -> Deadline | None:
+        """Deadline for a request asking for `timeout_ms` (None: the default, which may be no deadline)."""
+
+        seconds = timeout_ms / 1000 if timeout_ms is not None else self.default_timeout_seconds
+        if seconds is None:
+            return None
+        return Deadline(
+            expires_at=time.monotonic() + seconds,
+            retrieval_share=self.retrieval_share,
+            full_context_seconds=self.full_context_seconds,
+        )
+
+
+@lru_cache
+def get_deadline_policy() -> DeadlinePolicy:
+    """Process-wide deadline defaults from settings."""
+
+    settings = get_settings()
+    return DeadlinePolicy(
+        default_timeout_seconds=settings.request_timeout_ms / 1000 if settings.request_timeout_ms else None,
+        retrieval_share=settings.deadline_retrieval_share,
+        full_context_seconds=settings.deadline_full_context_ms / 1000,
+    )
+
+
+_current: ContextVar[Deadline | None] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Make `deadline` the current one for the enclosed block (and tasks started from it)."""
+
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+async def within(seconds: float | None, aw: Awaitable[T]) -> T:
+    """Await `aw`, raising `TimeoutError` after `seconds` (None: no limit)."""
+
+    if seconds is None:
+        return await aw
+    async with asyncio.timeout(seconds):
+        return await aw
@@ -0,0 +1,154 @@
+"""
+Query embedding helpers for the in-app embedding mode (`USE_SEARCH_VECTORIZER=false`).
+
+Two optimizations sit between the RAG code and `embeddings.create`:
+  - `get_embedding_cache()`: bounded LRU of query embeddings stored as read-only float32 arrays
+    (6 KiB per 1536-dim vector instead of ~50 KiB for a list of Python floats)
+  - `AsyncEmbeddingBatcher`: collects concurrent requests for a few milliseconds and sends them as a
+    single `embeddings.create(input=[...])` call, which cuts RPS against the deployment quota
+
+Float32 is also what Search stores for `Collection(Edm.Single)`, so nothing is lost by the conversion.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Sequence
+from functools import lru_cache
+
+import numpy as np
+
+from .cache import CacheBackend, aget, aset, make_backend, normalize_question
+from .clients import get_async_openai_client
+from .settings import get_settings
+
+
+def as_float32(vector: Sequence[float] | np.ndarray) -> np.ndarray:
+    """Contiguous, read-only float32 copy of an embedding (safe to share between cache readers)."""
+
+    arr = np.ascontiguousarray(vector, dtype=np.float32)
+    arr.setflags(write=False)
+    return arr
+
+
+def embedding_cache_key(*, model: str, text: str) -> str:
+    return f"{model}|{normalize_question(text)}"
+
+
+@lru_cache
+def get_embedding_cache() -> CacheBackend | None:
+    """Process-wide query embedding cache, or None when `EMBEDDING_CACHE_MAX_ENTRIES=0`."""
+
+    settings = get_settings()
+    if settings.embedding_cache_max_entries == 0:
+        return None
+    return make_backend("embedding", max_entries=settings.embedding_cache_max_entries, weigh=lambda v: v.nbytes)
+
+
+async def _create_embeddings(model: str, texts: list[str]) -> list[np.ndarray]:
+    oai = get_async_openai_client()
+    resp = await oai.embeddings.create(model=model, input=texts)
+    # The API tags each item with its input position; don't rely on response order.
+    return [as_float32(d.embedding) for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+async def aprefetch_embeddings(*, model: str, texts: Sequence[str], max_batch_size: int) -> int:
+    """
+    Warm the embedding cache for `texts` using as few `embeddings.create` calls as possible.
+
+    Used by bulk callers that know all their questions upfront. Returns the number of texts embedded.
+    """
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return 0
+    # Dedupe on the cache key, so texts that only differ in case/whitespace are embedded once.
+    by_key: dict[str, str] = {}
+    for text in texts:
+        by_key.setdefault(embedding_cache_key(model=model, text=text), text)
+    missing = [(key, text) for key, text in by_key.items() if await aget(cache, key) is None]
+    for start in range(0, len(missing), max_batch_size):
+        part = missing[start : start + max_batch_size]
+        vectors = await _create_embeddings(model, [text for _key, text in part])
+        for (key, _text), vector in zip(part, vectors, strict=True):
+            await aset(cache, key, vector)
+    return len(missing)
+
+
+class AsyncEmbeddingBatcher:
+    """
+    Micro-batcher for embedding requests.
+
+    The first request for a model opens a batch and arms a `window_seconds` timer; the batch is sent
+    when the timer fires or `max_batch_size` distinct texts are queued. Identical texts in a batch are
+    sent once. Failures propagate to every waiter of the batch; a cancelled waiter does not affect the
+    others.
+    """
+
+    def __init__(
+        self,
+        *,
+        window_seconds: float,
+        max_batch_size: int,
+        create: Callable[[str, list[str]], Awaitable[list[np.ndarray]]] = _create_embeddings,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._create = create
+        self._pending: dict[str, dict[str, list[asyncio.Future]]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._in_flight: set[asyncio.Task] = set()
+        self.batches_sent = 0
+
+    async def embed(self, *, model: str, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        batch = self._pending.setdefault(model, {})
+        batch.setdefault(text, []).append(fut)
+
+        if len(batch) >= self.max_batch_size:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = loop.call_later(self.window_seconds, self._flush, model)
+        return await fut
+
+    def _flush(self, model: str) -> None:
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(model, batch))
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, model: str, batch: dict[str, list[asyncio.Future]]) -> None:
+        texts = list(batch)
+        self.batches_sent += 1
+        try:
+            vectors = await self._create(model, texts)
+        except Exception as exc:
+            for futures in batch.values():
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_exception(exc)
+            return
+        for text, vector in zip(texts, vectors, strict=True):
+            for fut in batch[text]:
+                if not fut.done():
+                    fut.set_result(vector)
+
+
+@lru_cache
+def get_embedding_batcher() -> AsyncEmbeddingBatcher | None:
+    """Process-wide embedding micro-batcher, or None when `EMBEDDING_BATCH_WINDOW_MS=0`."""
+
+    settings = get_settings()
+    if settings.embedding_batch_window_ms <= 0:
+        return None
+    return AsyncEmbeddingBatcher(
+        window_seconds=settings.embedding_batch_window_ms / 1000,
+        max_batch_size=settings.embedding_batch_max_size,
+    )
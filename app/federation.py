@@ -0,0 +1,229 @@
+"""
+Federated retrieval across several Search indexes.
+
+With `AZURE_SEARCH_SHARDS` set, one query goes to every listed index (one `kb-index`-shaped index per
+product line, possibly on different Search services) at the same time, instead of the single
+`AZURE_SEARCH_INDEX`:
+  - fan-out: the same query body is sent to all shards concurrently (asyncio tasks on the async path, a
+    thread pool on the sync one), so the request takes as long as the slowest shard, not the sum
+  - per-shard timeouts: a shard that has not answered within its timeout (`SEARCH_SHARD_TIMEOUT_MS`, or
+    the shard's `timeout_ms`) is dropped and the merge goes ahead without it; so is a shard that fails.
+    Only when every shard is missing does the query fail (`ShardsUnavailable`)
+  - merge: reciprocal-rank fusion (`SEARCH_MERGE=rrf`, the default) sums `weight / (k + rank)` over the
+    shards a chunk appears in. Ranks are comparable across indexes where raw scores are not: BM25 scores
+    depend on each index's term statistics. `SEARCH_MERGE=score` instead min-max normalizes each shard's
+    scores (the semantic reranker score when present) and sums them, weighted
+  - results are deduplicated by `chunkId` (a chunk found in several shards counts once, with the summed
+    score) and trimmed to `top_k`; each merged chunk's `score` is its fused score
+
+Results that are missing a shard come back as `PartialResults`: they are not cached, and answers built
+from them report `degraded="partial_results"`. Federated calls are not hedged (`app.hedging`); the
+per-shard timeout bounds their latency instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Literal
+from urllib.parse import urlparse
+
+from .settings import Settings, get_settings
+from .telemetry import note, record_shard_call
+
+if TYPE_CHECKING:
+    from .rag import RetrievedChunk
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShardsUnavailable(RuntimeError):
+    """Every shard of a federated query failed or timed out."""
+
+
+class PartialResults(list):
+    """Merged results with some shards missing; `dropped` names them."""
+
+    def __init__(self, chunks=(), dropped: Sequence[str] = ()) -> None:
+        super().__init__(chunks)
+        self.dropped = tuple(dropped)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """One resolved member of the federation."""
+
+    name: str
+    url: str
+    api_key: str
+    weight: float = 1.0
+    timeout: float = 2.0
+
+    def headers(self) -> dict[str, str]:
+        return {"Content-Type": "application/json", "api-key": self.api_key}
+
+
+def _fuse(
+    result_lists: Sequence[Sequence[RetrievedChunk]], scores: Sequence[Sequence[float]], top_k: int
+) -> list[RetrievedChunk]:
+    fused: dict[str, float] = {}
+    first: dict[str, RetrievedChunk] = {}
+    for results, list_scores in zip(result_lists, scores):
+        for chunk, score in zip(results, list_scores):
+            fused[chunk.chunk_id] = fused.get(chunk.chunk_id, 0.0) + score
+            first.setdefault(chunk.chunk_id, chunk)
+    # Stable sort: ties keep the order in which chunks were first seen (shard order, then rank).
+    ranked = sorted(fused, key=fused.__getitem__, reverse=True)[:top_k]
+    return [replace(first[chunk_id], score=fused[chunk_id]) for chunk_id in ranked]
+
+
+def rrf_merge(
+    result_lists: Sequence[Sequence[RetrievedChunk]],
+    *,
+    top_k: int,
+    k: int = 60,
+    weights: Sequence[float] | None = None,
+) -> list[RetrievedChunk]:
+    """Reciprocal-rank fusion of ranked result lists, deduplicated by `chunk_id` and trimmed to `top_k`."""
+
+    weights = weights or [1.0] * len(result_lists)
+    scores = [[w / (k + rank) for rank in range(1, len(results) + 1)] for results, w in zip(result_lists, weights)]
+    return _fuse(result_lists, scores, top_k)
+
+
+def score_merge(
+    result_lists: Sequence[Sequence[RetrievedChunk]],
+    *,
+    top_k: int,
+    weights: Sequence[float] | None = None,
+) -> list[RetrievedChunk]:
+    """Merge by per-list min-max normalized scores (reranker score when present), summed per `chunk_id`."""
+
+    weights = weights or [1.0] * len(result_lists)
+    scores = []
+    for results, w in zip(result_lists, weights):
+        raw = [c.reranker_score if c.reranker_score is not None else (c.score or 0.0) for c in results]
+        lo, hi = (min(raw), max(raw)) if raw else (0.0, 0.0)
+        scores.append([w * ((x - lo) / (hi - lo) if hi > lo else 1.0) for x in raw])
+    return _fuse(result_lists, scores, top_k)
+
+
+class SearchFederation:
+    """Fans a query out to `shards` and merges the answers; see the module docstring."""
+
+    def __init__(self, shards: Sequence[Shard], *, merge: Literal["rrf", "score"] = "rrf", rrf_k: int = 60) -> None:
+        if not shards:
+            raise ValueError("a federation needs at least one shard")
+        self.shards = list(shards)
+        self.merge_mode = merge
+        self.rrf_k = rrf_k
+        self._executor: ThreadPoolExecutor | None = None
+
+    def scope(self) -> str:
+        """Identifies the shard set in cache keys."""
+
+        return ",".join(s.name for s in self.shards)
+
+    def merge(self, result_lists: Sequence[Sequence[RetrievedChunk]], *, top_k: int) -> list[RetrievedChunk]:
+        weights = [s.weight for s in self.shards]
+        if self.merge_mode == "score":
+            return score_merge(result_lists, top_k=top_k, weights=weights)
+        return rrf_merge(result_lists, top_k=top_k, k=self.rrf_k, weights=weights)
+
+    def _collect(self, outcomes: Sequence[list[RetrievedChunk] | BaseException], *, top_k: int) -> list:
+        lists: list[list[RetrievedChunk]] = []
+        dropped: list[str] = []
+        for shard, outcome in zip(self.shards, outcomes):
+            if isinstance(outcome, BaseException):
+                timed_out = isinstance(outcome, TimeoutError)
+                if not timed_out:
+                    logger.warning("search shard %s failed", shard.name, exc_info=outcome)
+                record_shard_call(shard.name, "timeout" if timed_out else "error")
+                dropped.append(shard.name)
+                lists.append([])
+            else:
+                record_shard_call(shard.name, "ok")
+                lists.append(outcome)
+        note("search_shards", f"{len(self.shards) - len(dropped)}/{len(self.shards)}")
+        if len(dropped) == len(self.shards):
+            errors = [o for o in outcomes if not isinstance(o, TimeoutError)]
+            raise ShardsUnavailable(f"no search shard answered ({', '.join(dropped)})") from (
+                errors[0] if errors else outcomes[0]
+            )
+        merged = self.merge(lists, top_k=top_k)
+        return PartialResults(merged, dropped) if dropped else merged
+
+    async def asearch(
+        self, search: Callable[[Shard], Awaitable[list[RetrievedChunk]]], *, top_k: int
+    ) -> list[RetrievedChunk]:
+        """Run `search(shard)` on every shard concurrently and merge what arrives within the shard timeouts."""
+
+        async def one(shard: Shard) -> list[RetrievedChunk]:
+            return await asyncio.wait_for(search(shard), shard.timeout)
+
+        outcomes = await asyncio.gather(*(one(s) for s in self.shards), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+        return self._collect(outcomes, top_k=top_k)
+
+    def search(self, search: Callable[[Shard], list[RetrievedChunk]], *, top_k: int) -> list[RetrievedChunk]:
+        """
+        Sync `asearch` on a thread pool.
+
+        A shard past its timeout is dropped, but its thread runs on until `search` returns; pass the shard
+        timeout to the HTTP call as well so stragglers do not pile up.
+        """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="search-shard")
+        start = time.monotonic()
+        futures = [self._executor.submit(search, s) for s in self.shards]
+        outcomes: list[list[RetrievedChunk] | BaseException] = []
+        for shard, future in zip(self.shards, futures):
+            try:
+                outcomes.append(future.result(timeout=max(0.0, start + shard.timeout - time.monotonic())))
+            except TimeoutError as exc:
+                future.cancel()
+                outcomes.append(exc)
+            except Exception as exc:
+                outcomes.append(exc)
+        return self._collect(outcomes, top_k=top_k)
+
+
+def search_scope(settings: Settings) -> str:
+    """The index (or shard set) queries go to; part of the retrieval and answer cache keys."""
+
+    federation = get_search_federation()
+    if federation is None:
+        return f"{settings.azure_search_endpoint}|{settings.azure_search_index}"
+    return federation.scope()
+
+
+@lru_cache
+def get_search_federation() -> SearchFederation | None:
+    """Process-wide federation built from `AZURE_SEARCH_SHARDS`, or None when it is unset."""
+
+    settings = get_settings()
+    if not settings.azure_search_shards:
+        return None
+    shards = []
+    for config in settings.azure_search_shards:
+        endpoint = (config.endpoint or settings.azure_search_endpoint).rstrip("/")
+        name = config.index if config.endpoint is None else f"{urlparse(endpoint).hostname}/{config.index}"
+        shards.append(
+            Shard(
+                name=name,
+                url=f"{endpoint}/indexes/{config.index}/docs/search?api-version={settings.azure_search_api_version}",
+                api_key=config.api_key or settings.azure_search_api_key,
+                weight=config.weight,
+                timeout=(config.timeout_ms or settings.search_shard_timeout_ms) / 1000,
+            )
+        )
+    return SearchFederation(shards, merge=settings.search_merge, rrf_k=settings.search_rrf_k)
@@ -0,0 +1,105 @@
+"""
+Scoped retrieval: structured filters on the filterable index fields.
+
+A `SearchFilter` restricts a query to part of the index, e.g. one product's documents:
+  - `source_path_prefixes`: `sourcePath` starts with one of these. OData has no `startswith`, so each
+    prefix becomes the range `sourcePath ge 'p' and sourcePath lt 'q'`, where `q` is `p` with its last
+    character incremented; string comparisons in a filter are ordinal, so the range is exactly the prefix
+  - `parent_ids`: `parentId` is one of these, as `search.in(parentId, '...', '<delimiter>')`, which Search
+    evaluates as a hash lookup and which stays cheap for hundreds of values (unlike chained `eq`/`or`)
+
+Conditions on different fields are ANDed, values within one field ORed. Search applies the filter
+before ranking: `filter` restricts the BM25 side and `vectorFilterMode: preFilter` makes the vector
+side search only matching documents, so `top_k` results all come from the scope instead of being cut
+down from a global top-k.
+
+Filters are validated when the request is parsed (bounded sizes, no control characters) and normalized
+(values stripped, deduplicated and sorted), so equivalent filters produce the same OData expression, and
+with it the same cache keys. `odata_filter` memoizes the translation.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+
+MAX_VALUE_CHARS = 1024
+_DELIMITERS = ",|;~^"
+
+
+class SearchFilter(BaseModel):
+    """Restricts retrieval to matching chunks; see the module docstring."""
+
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    source_path_prefixes: tuple[str, ...] = Field(default=(), max_length=32)
+    parent_ids: tuple[str, ...] = Field(default=(), max_length=1000)
+
+    @field_validator("source_path_prefixes", "parent_ids")
+    @classmethod
+    def _normalize(cls, values: tuple[str, ...]) -> tuple[str, ...]:
+        cleaned = set()
+        for value in values:
+            value = value.strip()
+            if not value:
+                raise ValueError("values must not be empty")
+            if len(value) > MAX_VALUE_CHARS:
+                raise ValueError(f"values must be at most {MAX_VALUE_CHARS} characters")
+            if any(ord(ch) < 32 for ch in value):
+                raise ValueError("values must not contain control characters")
+            cleaned.add(value)
+        return tuple(sorted(cleaned))
+
+    def is_empty(self) -> bool:
+        return not self.source_path_prefixes and not self.parent_ids
+
+    def matches(self, doc: dict) -> bool:
+        """Evaluate the filter on a document's fields (the local index backend has no OData engine)."""
+
+        if self.parent_ids and doc.get("parentId") not in self.parent_ids:
+            return False
+        if self.source_path_prefixes:
+            path = doc.get("sourcePath") or ""
+            return any(path.startswith(p) for p in self.source_path_prefixes)
+        return True
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Smallest string greater than every string starting with `prefix` (None: there is none)."""
+
+    while prefix and ord(prefix[-1]) == 0x10FFFF:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _in_clause(field: str, values: tuple[str, ...]) -> str:
+    for delimiter in _DELIMITERS:
+        if not any(delimiter in v for v in values):
+            return f"search.in({field}, {_literal(delimiter.join(values))}, {_literal(delimiter)})"
+    # Every candidate delimiter occurs in some value.
+    return "(" + " or ".join(f"{field} eq {_literal(v)}" for v in values) + ")"
+
+
+@lru_cache(maxsize=1024)
+def odata_filter(search_filter: SearchFilter) -> str | None:
+    """The filter as an OData `$filter` expression for the Search body; None when it restricts nothing."""
+
+    clauses = []
+    if search_filter.parent_ids:
+        clauses.append(_in_clause("parentId", search_filter.parent_ids))
+    if search_filter.source_path_prefixes:
+        ranges = []
+        for prefix in search_filter.source_path_prefixes:
+            upper = _prefix_upper_bound(prefix)
+            lower = f"sourcePath ge {_literal(prefix)}"
+            ranges.append(lower if upper is None else f"({lower} and sourcePath lt {_literal(upper)})")
+        clauses.append(ranges[0] if len(ranges) == 1 else "(" + " or ".join(ranges) + ")")
+    return " and ".join(clauses) or None
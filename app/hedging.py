@@ -0,0 +1,111 @@
+"""
+Hedged Search requests.
+
+Search tail latency is mostly one slow replica or a queued request; the same query sent again usually
+comes back in typical time. `Hedger.run(call)` starts `call()` and, if it has not finished once the p95
+(`SEARCH_HEDGE_PERCENTILE`) of recent Search latencies has passed, starts a duplicate. The first attempt
+to succeed wins and the other is cancelled. A failed attempt only fails the call once no attempt is
+left running.
+
+Hedging only kicks in for the slowest ~5% of calls, so it adds about that much Search traffic. The
+latencies are what callers waited, from the first attempt, including failed and abandoned calls. Until
+`min_samples` latencies have been seen, calls are not hedged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from typing import TypeVar
+
+from .settings import get_settings
+from .telemetry import note, record_hedge
+
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies (seconds)."""
+
+    def __init__(self, *, window: int = 256, min_samples: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Sends a duplicate of a slow call; see the module docstring."""
+
+    def __init__(self, *, percentile: float = 0.95, min_delay: float = 0.0, tracker: LatencyTracker | None = None):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.tracker = tracker or LatencyTracker()
+
+    def delay(self) -> float | None:
+        """Seconds to wait for the first attempt before hedging, or None while there is too little history."""
+
+        p = self.tracker.percentile(self.percentile)
+        return None if p is None else max(p, self.min_delay)
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        delay = self.delay()
+        started: list[asyncio.Task] = []
+
+        def start() -> None:
+            started.append(asyncio.create_task(call()))
+
+        first = time.perf_counter()
+        start()
+        try:
+            pending = set(started)
+            hedged = delay is None
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if hedged else delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    note("search_hedge", "sent")
+                    record_hedge("sent")
+                    start()
+                    pending = {task for task in started if not task.done()}
+                    continue
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        if task is not started[0]:
+                            record_hedge("won")
+                        return task.result()
+                    error = error or task.exception()
+            raise error or asyncio.CancelledError()
+        finally:
+            # What the caller waited, from the first attempt and whatever the outcome (a won hedge, an error, a
+            # cancellation by the request deadline): recording only winners' own latencies would pull the
+            # trigger down and hedge more than the slowest ~5% of calls.
+            self.tracker.add(time.perf_counter() - first)
+            for task in started:
+                task.cancel()
+
+
+@lru_cache
+def get_search_hedger() -> Hedger | None:
+    """Process-wide Search hedger, or None unless `SEARCH_HEDGE_ENABLED`."""
+
+    settings = get_settings()
+    if not settings.search_hedge_enabled:
+        return None
+    return Hedger(percentile=settings.search_hedge_percentile, min_delay=settings.search_hedge_min_delay_ms / 1000)
@@ -0,0 +1,126 @@
+"""
+Background watcher that invalidates caches (and refreshes precomputed answers) when the Search indexer finishes
+a run.
+
+`kb-indexer` runs on a schedule (`search/indexer.json`, `PT1H`) and on demand (`scripts/run-indexer.*`).
+Cached retrievals/answers are only valid for the index content they were computed from, so we poll
+`GET /indexers/{name}/status` and call `app.cache.invalidate_caches()` whenever a new run has
+completed and actually changed documents. With an answer index (`app.answer_index`), the entries citing
+documents that changed are then recomputed in the background.
+
+The watcher is started from the FastAPI lifespan (see `app.main`) when any cache or the answer index refresh
+is enabled.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable
+
+from .answer_index import get_answer_index_job
+from .cache import invalidate_caches
+from .clients import get_async_httpx_client
+from .settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def _run_version(status: dict) -> str | None:
+    """Identify the last *completed* run; None while the first run is still in progress."""
+
+    last = status.get("lastResult") or {}
+    if not last or last.get("status") == "inProgress":
+        return None
+    return last.get("endTime") or last.get("startTime")
+
+
+def _run_changed_documents(status: dict) -> bool:
+    last = status.get("lastResult") or {}
+    # A failed run may still have written some documents; only a clean no-op run is skippable.
+    return bool(last.get("itemsProcessed")) or last.get("status") != "success"
+
+
+class IndexerWatcher:
+    """Polls the indexer status endpoint and calls `on_new_run` once per newly completed run."""
+
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        interval_seconds: float,
+        on_new_run: Callable[[], None] = invalidate_caches,
+    ) -> None:
+        self.settings = settings
+        self.interval_seconds = interval_seconds
+        self.on_new_run = on_new_run
+        self.last_version: str | None = None
+        self._primed = False
+
+    def _status_url(self) -> str:
+        s = self.settings
+        return (
+            f"{s.azure_search_endpoint}/indexers/{s.azure_search_indexer}/status"
+            f"?api-version={s.azure_search_api_version}"
+        )
+
+    async def fetch_status(self) -> dict:
+        http = get_async_httpx_client()
+        resp = await http.get(self._status_url(), headers={"api-key": self.settings.azure_search_api_key})
+        resp.raise_for_status()
+        return resp.json()
+
+    async def poll_once(self) -> bool:
+        """
+        Fetch the status once. Returns True when a new completed run was observed and handled.
+
+        The first poll only records the current run: caches are empty at startup, so there is
+        nothing to invalidate yet.
+        """
+
+        status = await self.fetch_status()
+        version = _run_version(status)
+        if not self._primed:
+            self._primed = True
+            self.last_version = version
+            return False
+        if version is None or version == self.last_version:
+            return False
+
+        self.last_version = version
+        if _run_changed_documents(status):
+            logger.info(
+                "indexer %s completed a run at %s; invalidating caches", self.settings.azure_search_indexer, version
+            )
+            self.on_new_run()
+        return True
+
+    async def run(self) -> None:
+        """Poll forever; errors are logged and retried on the next tick."""
+
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("indexer status poll failed", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+
+def start_indexer_watcher(settings: Settings) -> asyncio.Task | None:
+    """Start the watcher as a background task if polling is configured and it has caches or answers to refresh."""
+
+    caches_enabled = settings.answer_cache_enabled or settings.retrieval_cache_enabled
+    refresh_answers = bool(settings.answer_index_path) and settings.answer_index_refresh_enabled
+    if not (caches_enabled or refresh_answers) or settings.indexer_poll_seconds <= 0:
+        return None
+
+    def on_new_run() -> None:
+        invalidate_caches()
+        if refresh_answers:
+            get_answer_index_job().start(settings)
+
+    watcher = IndexerWatcher(settings=settings, interval_seconds=settings.indexer_poll_seconds, on_new_run=on_new_run)
+    return asyncio.create_task(watcher.run(), name="indexer-watcher")
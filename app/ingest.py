@@ -0,0 +1,477 @@
+"""
+Bulk ingestion straight into the Search index (`python -m app.ingest docs/`).
+
+An alternative to `scripts/upload-docs.*` + the hourly `kb-indexer`: documents are chunked, embedded and
+pushed by this process, so freshness and throughput are under our control.
+
+  - Chunking matches `search/skillset.json` (SplitSkill, pages of 2000 characters with 500 overlap).
+  - Chunk keys are derived from the document and the chunk text, so an unchanged chunk keeps its key even
+    when text around it moves. A state file records the keys per document; a re-ingest only embeds and
+    uploads new chunks and deletes keys that disappeared.
+  - Embeddings are requested in large batches with bounded concurrency; 429/5xx responses are retried
+    after the server's `retry-after` hint (or exponential backoff with jitter).
+  - Documents are pushed to `docs/index` (`mergeOrUpload`/`delete`) in parallel batches; per-item
+    throttling failures in a 207 response are retried.
+
+Use either this command or the indexer for a given index, not both: the indexer's projections generate
+their own chunk keys, so mixing them would duplicate content.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TypeVar
+
+import openai
+
+from .clients import get_async_httpx_client, get_async_openai_client
+from .embeddings import as_float32
+from .openai_router import PoolExhausted
+from .settings import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Keep in sync with the SplitSkill in search/skillset.json.
+MAX_PAGE_LENGTH = 2000
+PAGE_OVERLAP_LENGTH = 500
+
+TEXT_SUFFIXES = {".txt", ".md", ".markdown", ".rst", ".html", ".htm", ".csv", ".json", ".xml", ".yaml", ".yml"}
+STATE_VERSION = 1
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+def split_pages(text: str, *, max_length: int = MAX_PAGE_LENGTH, overlap: int = PAGE_OVERLAP_LENGTH) -> list[str]:
+    """
+    Split `text` into pages of at most `max_length` characters, each starting `overlap` characters
+    before the previous page ended.
+
+    Like SplitSkill's `pages` mode, page ends prefer a sentence boundary, then whitespace, within the
+    second half of the window, so words are not cut in half.
+    """
+
+    text = text.strip()
+    if len(text) <= max_length:
+        return [text] if text else []
+
+    pages: list[str] = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_length, len(text))
+        if end < len(text):
+            window = text[start:end]
+            floor = max_length // 2
+            cut = max(window.rfind(". ", floor), window.rfind("\n", floor))
+            if cut == -1:
+                cut = window.rfind(" ", floor)
+            if cut != -1:
+                end = start + cut + 1
+        page = text[start:end].strip()
+        if page:
+            pages.append(page)
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        # Start the overlap on a word boundary.
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return pages
+
+
+def _sha256(data: bytes | str) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_key(parent_id: str, content: str) -> str:
+    """Search document key for a chunk: stable for identical text within the same document."""
+
+    return _sha256(f"{parent_id}\0{content}")[:48]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    key: str
+    parent_id: str
+    title: str
+    content: str
+    source_path: str
+
+    def to_document(self, vector: list[float]) -> dict:
+        return {
+            "@search.action": "mergeOrUpload",
+            "chunkId": self.key,
+            "parentId": self.parent_id,
+            "title": self.title,
+            "content": self.content,
+            "sourcePath": self.source_path,
+            "contentVector": vector,
+        }
+
+
+def chunk_file(path: Path, *, root: Path, text: str) -> list[Chunk]:
+    rel = path.relative_to(root).as_posix()
+    parent_id = _sha256(rel)[:32]
+    chunks: dict[str, Chunk] = {}
+    for page in split_pages(text):
+        key = chunk_key(parent_id, page)
+        chunks.setdefault(key, Chunk(key=key, parent_id=parent_id, title=path.name, content=page, source_path=rel))
+    return list(chunks.values())
+
+
+def iter_documents(root: Path) -> list[Path]:
+    """Text documents under `root`, skipping dotfiles/dot-directories (including the state file)."""
+
+    return sorted(
+        p
+        for p in root.rglob("*")
+        if p.is_file()
+        and p.suffix.lower() in TEXT_SUFFIXES
+        and not any(part.startswith(".") for part in p.relative_to(root).parts)
+    )
+
+
+@dataclass
+class IngestState:
+    """What has been pushed so far: file hash and chunk keys per document (relative path)."""
+
+    index: str
+    embed_deployment: str
+    files: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, *, index: str, embed_deployment: str) -> IngestState:
+        if not path.exists():
+            return cls(index=index, embed_deployment=embed_deployment)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if (
+            data.get("version") != STATE_VERSION
+            or data.get("index") != index
+            or data.get("embed_deployment") != embed_deployment
+        ):
+            # Different target or embedding model: every chunk has to be re-embedded and re-pushed.
+            logger.warning("ingest state %s does not match the current target; starting fresh", path)
+            return cls(index=index, embed_deployment=embed_deployment)
+        return cls(index=index, embed_deployment=embed_deployment, files=data["files"])
+
+    def save(self, path: Path) -> None:
+        payload = {
+            "version": STATE_VERSION,
+            "index": self.index,
+            "embed_deployment": self.embed_deployment,
+            "files": self.files,
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+@dataclass
+class IngestPlan:
+    upserts: list[Chunk]
+    deletes: list[str]
+    # rel path -> (file hash, chunk keys) to record once its upserts succeeded; None = file removed
+    updates: dict[str, tuple[str, list[str]] | None]
+    unchanged_files: int
+
+
+def plan_ingest(root: Path, state: IngestState) -> IngestPlan:
+    """Diff the docs directory against the state: which chunks to push and which keys to delete."""
+
+    upserts: list[Chunk] = []
+    deletes: list[str] = []
+    updates: dict[str, tuple[str, list[str]] | None] = {}
+    unchanged = 0
+    seen: set[str] = set()
+
+    for path in iter_documents(root):
+        rel = path.relative_to(root).as_posix()
+        seen.add(rel)
+        raw = path.read_bytes()
+        file_hash = _sha256(raw)
+        previous = state.files.get(rel)
+        if previous and previous["sha256"] == file_hash:
+            unchanged += 1
+            continue
+
+        chunks = chunk_file(path, root=root, text=raw.decode("utf-8", errors="replace"))
+        old_keys = set(previous["chunks"]) if previous else set()
+        new_keys = [c.key for c in chunks]
+        upserts.extend(c for c in chunks if c.key not in old_keys)
+        deletes.extend(sorted(old_keys - set(new_keys)))
+        updates[rel] = (file_hash, new_keys)
+
+    for rel, previous in state.files.items():
+        if rel not in seen:
+            deletes.extend(previous["chunks"])
+            updates[rel] = None
+
+    return IngestPlan(upserts=upserts, deletes=deletes, updates=updates, unchanged_files=unchanged)
+
+
+def _retry_delay(attempt: int, retry_after: str | None, *, base: float = 1.0, cap: float = 60.0) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    # Full jitter keeps a fleet of workers from retrying in lockstep.
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+async def _with_retries(
+    call: Callable[[], Awaitable[T]], *, retry_after: Callable[[Exception], str | None | bool], attempts: int
+) -> T:
+    """Run `call`, retrying exceptions for which `retry_after` is not False."""
+
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as exc:
+            hint = retry_after(exc)
+            if hint is False or attempt == attempts - 1:
+                raise
+            delay = _retry_delay(attempt, hint or None)
+            logger.info("retrying after %.1fs (%s)", delay, type(exc).__name__)
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def _openai_retry_after(exc: Exception) -> str | None | bool:
+    if isinstance(exc, openai.APIStatusError) and exc.status_code in RETRYABLE_STATUS:
+        headers = exc.response.headers
+        if ms := headers.get("retry-after-ms"):
+            return str(float(ms) / 1000)
+        return headers.get("retry-after")
+    if isinstance(exc, openai.APIConnectionError | PoolExhausted):
+        return None
+    return False
+
+
+class SearchPushError(Exception):
+    def __init__(self, status_code: int, retry_after: str | None, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _search_retry_after(exc: Exception) -> str | None | bool:
+    if isinstance(exc, SearchPushError) and exc.status_code in RETRYABLE_STATUS:
+        return exc.retry_after
+    return False
+
+
+@dataclass
+class IngestReport:
+    files_unchanged: int = 0
+    chunks_uploaded: int = 0
+    chunks_deleted: int = 0
+    chunks_failed: int = 0
+    embedding_calls: int = 0
+
+
+class Ingestor:
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        embed_batch_size: int = 256,
+        embed_concurrency: int = 4,
+        upload_batch_size: int = 100,
+        upload_concurrency: int = 4,
+        max_attempts: int = 6,
+    ) -> None:
+        self.settings = settings
+        self.embed_batch_size = embed_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.max_attempts = max_attempts
+        self._embed_slots = asyncio.Semaphore(embed_concurrency)
+        self._upload_slots = asyncio.Semaphore(upload_concurrency)
+        self.report = IngestReport()
+
+    def _index_url(self) -> str:
+        s = self.settings
+        return (
+            f"{s.azure_search_endpoint}/indexes/{s.azure_search_index}/docs/index"
+            f"?api-version={s.azure_search_api_version}"
+        )
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        oai = get_async_openai_client()
+
+        async def call():
+            return await oai.embeddings.create(model=self.settings.azure_openai_embed_deployment, input=texts)
+
+        async with self._embed_slots:
+            self.report.embedding_calls += 1
+            resp = await _with_retries(call, retry_after=_openai_retry_after, attempts=self.max_attempts)
+        # Search stores Collection(Edm.Single); float32 round-trips keep the JSON payload short.
+        return [as_float32(d.embedding).tolist() for d in sorted(resp.data, key=lambda d: d.index)]
+
+    async def push(self, documents: list[dict]) -> set[str]:
+        """Send one `docs/index` batch; returns the keys that failed permanently."""
+
+        http = get_async_httpx_client()
+        pending = documents
+        failed: set[str] = set()
+
+        async def call():
+            nonlocal pending
+            resp = await http.post(
+                self._index_url(),
+                headers={"Content-Type": "application/json", "api-key": self.settings.azure_search_api_key},
+                json={"value": pending},
+            )
+            if resp.status_code in RETRYABLE_STATUS:
+                raise SearchPushError(resp.status_code, resp.headers.get("retry-after"), resp.text)
+            resp.raise_for_status()
+            # 207 Multi-Status: retry throttled items, give up on the rest.
+            results = {r["key"]: r for r in resp.json().get("value", [])}
+            retry = []
+            for doc in pending:
+                result = results.get(doc["chunkId"], {})
+                if result.get("status", True):
+                    continue
+                if result.get("statusCode") in RETRYABLE_STATUS:
+                    retry.append(doc)
+                else:
+                    logger.warning("chunk %s rejected: %s", doc["chunkId"], result.get("errorMessage"))
+                    failed.add(doc["chunkId"])
+            if retry:
+                pending = retry
+                raise SearchPushError(503, None, f"{len(retry)} items throttled")
+
+        async with self._upload_slots:
+            try:
+                await _with_retries(call, retry_after=_search_retry_after, attempts=self.max_attempts)
+            except Exception:
+                logger.exception("upload batch failed")
+                failed.update(d["chunkId"] for d in pending)
+        return failed
+
+    async def _embed_and_push(self, chunks: list[Chunk]) -> set[str]:
+        try:
+            vectors = await self.embed([c.content for c in chunks])
+        except Exception:
+            logger.exception("embedding batch failed")
+            return {c.key for c in chunks}
+        docs = [c.to_document(v) for c, v in zip(chunks, vectors, strict=True)]
+        batches = [docs[i : i + self.upload_batch_size] for i in range(0, len(docs), self.upload_batch_size)]
+        failed: set[str] = set()
+        for result in await asyncio.gather(*(self.push(b) for b in batches)):
+            failed |= result
+        return failed
+
+    async def run(self, plan: IngestPlan) -> set[str]:
+        """Execute a plan; returns the chunk keys that could not be uploaded or deleted."""
+
+        batches = [
+            plan.upserts[i : i + self.embed_batch_size] for i in range(0, len(plan.upserts), self.embed_batch_size)
+        ]
+        delete_docs = [{"@search.action": "delete", "chunkId": key} for key in plan.deletes]
+        delete_batches = [
+            delete_docs[i : i + self.upload_batch_size] for i in range(0, len(delete_docs), self.upload_batch_size)
+        ]
+        results = await asyncio.gather(
+            *(self._embed_and_push(b) for b in batches), *(self.push(b) for b in delete_batches)
+        )
+        failed: set[str] = set().union(*results) if results else set()
+
+        self.report.files_unchanged = plan.unchanged_files
+        self.report.chunks_failed = len(failed)
+        self.report.chunks_uploaded = sum(1 for c in plan.upserts if c.key not in failed)
+        self.report.chunks_deleted = sum(1 for k in plan.deletes if k not in failed)
+        return failed
+
+
+def apply_results(state: IngestState, plan: IngestPlan, failed: set[str]) -> None:
+    """Record files whose changes fully landed; files with failures are retried on the next run."""
+
+    for rel, update in plan.updates.items():
+        previous = state.files.get(rel)
+        if update is None:
+            if not failed.intersection(previous["chunks"]):
+                del state.files[rel]
+            continue
+        file_hash, keys = update
+        old_keys = set(previous["chunks"]) if previous else set()
+        if failed.intersection(keys) or failed.intersection(old_keys - set(keys)):
+            continue
+        state.files[rel] = {"sha256": file_hash, "chunks": keys}
+
+
+async def ingest(
+    root: Path,
+    *,
+    settings: Settings,
+    state_path: Path,
+    dry_run: bool = False,
+    **ingestor_options,
+) -> IngestReport:
+    if not settings.azure_openai_embed_deployment:
+        raise ValueError("AZURE_OPENAI_EMBED_DEPLOYMENT is required for ingestion")
+
+    state = IngestState.load(
+        state_path, index=settings.azure_search_index, embed_deployment=settings.azure_openai_embed_deployment
+    )
+    plan = plan_ingest(root, state)
+    logger.info(
+        "%d chunks to upload, %d to delete, %d files unchanged",
+        len(plan.upserts),
+        len(plan.deletes),
+        plan.unchanged_files,
+    )
+    ingestor = Ingestor(settings=settings, **ingestor_options)
+    if dry_run:
+        ingestor.report.files_unchanged = plan.unchanged_files
+        return ingestor.report
+
+    failed = await ingestor.run(plan)
+    apply_results(state, plan, failed)
+    state.save(state_path)
+    return ingestor.report
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description="Chunk, embed and push docs to Search.")
+    parser.add_argument("docs_dir", type=Path)
+    parser.add_argument("--state", type=Path, help="state file (default: <docs_dir>/.ingest-state.json)")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument("--upload-batch-size", type=int, default=100)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    report = asyncio.run(
+        ingest(
+            args.docs_dir,
+            settings=get_settings(),
+            state_path=args.state or args.docs_dir / ".ingest-state.json",
+            dry_run=args.dry_run,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+            upload_batch_size=args.upload_batch_size,
+            upload_concurrency=args.upload_concurrency,
+        )
+    )
+    print(json.dumps(report.__dict__, indent=2))
+    if report.chunks_failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Process lifecycle: startup warmup, readiness, and settings reloads.
+
+Everything the first request would otherwise pay for is done once, when the process starts (`lifespan`
+in `app.main` runs `Warmup.run` as a background task):
+  - components: the settings snapshot and the process-wide factories (caches, context packer with its
+    tokenizer, local and answer indexes, ...) are built
+  - OpenAI: the client is built and `GET /openai/models` is called on every endpoint, which acquires the
+    Azure AD token (Managed Identity) when no API key is set and opens the TLS connection
+  - Search: a one-result query (`search=*`, `top=1`) goes to the index (or every federated shard), which
+    opens a pooled connection and brings the index into the service's caches
+
+The steps run concurrently, each bounded by `WARMUP_TIMEOUT_SECONDS`. Liveness (`GET /healthz`) answers as
+soon as the server runs; readiness (`GET /healthz/ready`) answers 503 until the warmup has finished, so
+Container Apps only routes traffic to warmed replicas. A failed step is logged and reported but does not
+keep the replica out of rotation: when an upstream is down every replica would fail it alike.
+
+`reload` (`POST /settings/reload`) replaces the settings snapshot and drops the components built from it,
+which are rebuilt from the new snapshot on next use; a new warmup run primes them. Components holding
+per-user or in-flight state (sessions, admission control, telemetry) and the HTTP connection pools are
+kept, and so is the indexer watcher started at startup.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any
+
+from . import (
+    admission,
+    answer_index,
+    cache,
+    clients,
+    context,
+    deadline,
+    embeddings,
+    federation,
+    hedging,
+    local_index,
+    openai_router,
+    sessions,
+    singleflight,
+    telemetry,
+)
+from .openai_router import AsyncOpenAIRouter
+from .rag import awarm_search
+from .settings import Settings, get_settings, reload_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    ok: bool
+    ms: float
+    error: str | None = None
+
+
+async def _warm_components(settings: Settings) -> None:
+    def build() -> None:
+        for factory in RELOADABLE_FACTORIES:
+            factory()
+        # The packer loads its tokenizer lazily, on the first request that needs a count.
+        context.get_tokenizer(settings.context_tokenizer)
+
+    # Loading the tokenizer and mapping the local index are CPU/disk work; keep the event loop free.
+    await asyncio.to_thread(build)
+
+
+async def _warm_openai(settings: Settings) -> None:
+    client = clients.get_async_openai_client()
+    members = client.clients.values() if isinstance(client, AsyncOpenAIRouter) else [client]
+    # Pool members on the same endpoint and key share a client.
+    unique = {id(c): c for c in members}.values()
+    await asyncio.gather(*(c.models.list() for c in unique))
+
+
+class Warmup:
+    """Runs the warmup steps and tracks readiness; see the module docstring."""
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.running = False
+        self.seconds: float | None = None
+        self.steps: list[WarmupStep] = []
+        self._task: asyncio.Task | None = None
+
+    def step_functions(self) -> dict[str, Callable[[Settings], Awaitable[None]]]:
+        return {"components": _warm_components, "openai": _warm_openai, "search": awarm_search}
+
+    async def _step(self, name: str, run: Callable[[Settings], Awaitable[None]], settings: Settings) -> WarmupStep:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(run(settings), settings.warmup_timeout_seconds)
+        except Exception as exc:
+            ms = (time.perf_counter() - start) * 1000
+            logger.warning("warmup step %s failed after %.0f ms: %r", name, ms, exc)
+            return WarmupStep(name, False, round(ms, 1), repr(exc))
+        return WarmupStep(name, True, round((time.perf_counter() - start) * 1000, 1))
+
+    async def run(self, settings: Settings) -> None:
+        """Run every step concurrently; the process is ready afterwards, whatever their outcome."""
+
+        self.running = True
+        start = time.perf_counter()
+        try:
+            if settings.warmup_enabled:
+                steps = self.step_functions()
+                self.steps = list(await asyncio.gather(*(self._step(n, f, settings) for n, f in steps.items())))
+            self.seconds = round(time.perf_counter() - start, 3)
+            self.ready = True
+            logger.info("warmup finished in %.3fs", self.seconds)
+        finally:
+            self.running = False
+
+    def start(self, settings: Settings) -> asyncio.Task:
+        """`run` in the background (replacing a run still in progress)."""
+
+        self.stop()
+        self._task = asyncio.create_task(self.run(settings))
+        return self._task
+
+    def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "warming": self.running,
+            "seconds": self.seconds,
+            "steps": [asdict(s) for s in self.steps],
+        }
+
+
+@lru_cache
+def get_warmup() -> Warmup:
+    """Process-wide warmup state (behind GET /healthz/ready)."""
+
+    return Warmup()
+
+
+# Every process-wide `lru_cache` factory, in one place: `reload` clears the reloadable ones, and tests and
+# benchmarks clear all of them to rebuild the app from a new environment. A new factory is added here.
+RELOADABLE_FACTORIES = (
+    clients.get_openai_client,
+    clients.get_async_openai_client,
+    cache.get_answer_cache,
+    cache.get_retrieval_cache,
+    cache.get_shared_generation,
+    embeddings.get_embedding_cache,
+    embeddings.get_embedding_batcher,
+    context.get_context_packer,
+    local_index.get_local_index,
+    answer_index.get_answer_index,
+    singleflight.get_single_flight,
+    openai_router.get_deployment_pool,
+    deadline.get_deadline_policy,
+    hedging.get_search_hedger,
+    federation.get_search_federation,
+)
+# Kept across reloads: per-user or in-flight state, the HTTP connection pools and credentials, and the
+# settings snapshot itself (which `reload_settings` replaces).
+STATEFUL_FACTORIES = (
+    get_settings,
+    clients.get_httpx_client,
+    clients.get_async_httpx_client,
+    clients.get_credential,
+    clients.get_async_credential,
+    telemetry.get_telemetry,
+    admission.get_admission_controller,
+    sessions.get_session_manager,
+    answer_index.get_answer_index_job,
+    get_warmup,
+)
+ALL_FACTORIES = RELOADABLE_FACTORIES + STATEFUL_FACTORIES
+
+
+def reload() -> Settings:
+    """Replace the settings snapshot and drop the components built from it (see the module docstring)."""
+
+    settings = reload_settings()
+    for factory in RELOADABLE_FACTORIES:
+        factory.cache_clear()
+    return settings
@@ -0,0 +1,560 @@
+"""
+Embedded, in-process retrieval backend (no Azure AI Search).
+
+For edge/air-gapped deployments and fast tests, `retrieve_chunks` can query a local index directory
+instead of the Search REST endpoint (set `LOCAL_INDEX_PATH`). Like Search's hybrid query it combines:
+  - cosine vector search over a memory-mapped float32 matrix, or over compact quantized codes with
+    full-precision rescoring (below)
+  - BM25 over a memory-mapped inverted index
+fused with reciprocal-rank fusion (k=60, as Search does). Results are returned in the Search REST
+response shape, so `rag` parses both backends into `RetrievedChunk` the same way. A `SearchFilter`
+(`app.filters`) pre-filters both sides, like `vectorFilterMode: preFilter`. The filterable fields are stored
+as ids into sorted value lists, so a filter's match mask is a few vectorized comparisons over (N,) int32
+columns (a `parentId` lookup, a contiguous id range per `sourcePath` prefix) rather than a pass over the
+documents; masks are kept for the next queries with the same filter.
+
+On-disk format (all arrays little-endian, opened with `np.memmap`; nothing is read eagerly):
+  meta.json                  counts, dimensions, vector dtype, BM25 stats
+  vectors.bin                (N, dim) float32; (N, dim) int8 codes when dtype == "int8"; (N, ceil(dim / 8))
+                             sign bits, packed, when dtype == "binary"
+  scales.f32                 (N,) per-row dequantization scale (int8 only)
+  originals.f32              (N, dim) float32 unit vectors kept for rescoring (quantized dtypes, optional)
+  docs.bin / docs.idx        JSON records (chunkId, parentId, title, content, sourcePath) + int64 offsets
+  doc_len.u32                (N,) BM25 document lengths
+  vocab.bin / vocab.idx      sorted UTF-8 terms + int64 offsets (binary searched, never loaded into a dict)
+  postings.idx               (V + 1,) int64 offsets into the postings arrays
+  postings_docs.i32 / postings_tf.u16
+  parents.bin / parents.idx  sorted UTF-8 distinct parentId values + int64 offsets
+  doc_parent.i32             (N,) position of each document's parentId in parents.bin (-1: none)
+  paths.bin / paths.idx      sorted UTF-8 distinct sourcePath values + int64 offsets
+  doc_path.i32               (N,) position of each document's sourcePath in paths.bin (-1: none)
+
+Quantized vectors: `int8` (symmetric per-row scalar quantization, 4x smaller than float32) or `binary`
+(one sign bit per dimension, 32x smaller, scored by Hamming distance). The scan reads only the codes, so
+they are what must stay in the page cache. With the originals kept (the default), the best
+`oversampling * k` candidates by code score are rescored with their float32 vectors, read row by row from
+the memory map, and the top k of those are returned. This is the local counterpart of Search's vector
+compression with `rescoringOptions`; `compressions_config` generates the matching `index.json` block.
+
+Build one with `LocalIndexWriter` (or `python -m app.local_index build`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Iterable
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .filters import SearchFilter
+from .settings import get_settings
+
+
+FORMAT_VERSION = 3
+# Version 1 indexes (float32/int8, no originals) and version 2 ones (no field columns) are read unchanged;
+# filters on those are evaluated document by document.
+READABLE_VERSIONS = (1, 2, 3)
+VECTOR_DTYPES = ("float32", "int8", "binary")
+RRF_K = 60
+FILTER_MASK_CACHE_SIZE = 64
+DOC_FIELDS = ("chunkId", "parentId", "title", "content", "sourcePath")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens; close to the standard Lucene analyzer Search uses by default."""
+
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def _write_strings(path: Path, values: Iterable[bytes]) -> None:
+    values = list(values)
+    path.write_bytes(b"".join(values))
+    np.cumsum([0] + [len(v) for v in values], dtype="<i8").tofile(path.with_suffix(".idx"))
+
+
+def _bisect(blob: np.ndarray, offsets: np.ndarray, target: bytes) -> int:
+    """Position of the first string in a sorted blob (`_write_strings`) that is not less than `target`."""
+
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if bytes(blob[offsets[mid] : offsets[mid + 1]]) < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _field_column(values: list[str | None], out: Path, column: Path) -> None:
+    """Write the sorted distinct `values` to `out` and each row's position among them to `column`."""
+
+    distinct = sorted({v for v in values if v is not None}, key=lambda v: v.encode("utf-8"))
+    _write_strings(out, (v.encode("utf-8") for v in distinct))
+    ids = {v: i for i, v in enumerate(distinct)}
+    np.fromiter((ids.get(v, -1) for v in values), "<i4", len(values)).tofile(column)
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: returns (codes, scales) with `codes * scale ~= vectors`."""
+
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """One bit per dimension (set when the component is positive), packed 8 per byte: (N, ceil(dim / 8)) uint8."""
+
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _bit_count(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT[x]
+
+
+def compressions_config(
+    index_definition: dict, kind: str, *, oversampling: float = 4.0, rescore: bool = True
+) -> dict:
+    """
+    The `vectorSearch` block of `index_definition` with a `compressions` entry for `kind` (`int8` or
+    `binary`) referenced from every profile.
+
+    With `rescore`, Search keeps the original vectors and rescores `oversampling * k` candidates with
+    them (`preserveOriginals`), like `LocalIndex` does with `originals.f32`.
+    """
+
+    if kind == "int8":
+        compression = {
+            "name": "int8-compression",
+            "kind": "scalarQuantization",
+            "scalarQuantizationParameters": {"quantizedDataType": "int8"},
+        }
+    elif kind == "binary":
+        compression = {"name": "binary-compression", "kind": "binaryQuantization"}
+    else:
+        raise ValueError("kind must be 'int8' or 'binary'")
+    compression["rescoringOptions"] = {
+        "enableRescoring": rescore,
+        "defaultOversampling": oversampling,
+        "rescoreStorageMethod": "preserveOriginals" if rescore else "discardOriginals",
+    }
+    block = copy.deepcopy(index_definition["vectorSearch"])
+    block["compressions"] = [compression]
+    for profile in block.get("profiles", []):
+        profile["compression"] = compression["name"]
+    return block
+
+
+class LocalIndexWriter:
+    """
+    Streaming builder for the on-disk format.
+
+    Vectors and documents are appended to disk as they arrive; only the postings lists are kept in
+    memory until `close()`. Quantized dtypes also keep the float32 originals for rescoring unless
+    `keep_originals=False`.
+    """
+
+    def __init__(self, path: str | Path, *, dim: int, dtype: str = "float32", keep_originals: bool = True) -> None:
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(VECTOR_DTYPES)}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = dtype
+        self.keep_originals = keep_originals and dtype != "float32"
+        self.count = 0
+        self._vectors = open(self.path / "vectors.bin", "wb")
+        self._scales = open(self.path / "scales.f32", "wb") if dtype == "int8" else None
+        self._originals = open(self.path / "originals.f32", "wb") if self.keep_originals else None
+        self._docs = open(self.path / "docs.bin", "wb")
+        self._doc_offsets = [0]
+        self._doc_lens: list[int] = []
+        self._postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self._parents: list[str | None] = []
+        self._paths: list[str | None] = []
+
+    def __enter__(self) -> LocalIndexWriter:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add(self, doc: dict, vector: np.ndarray | list[float]) -> None:
+        vec = _unit_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if vec.shape[1] != self.dim:
+            raise ValueError(f"vector has {vec.shape[1]} dimensions, expected {self.dim}")
+        if self.dtype == "int8":
+            codes, scales = quantize_int8(vec)
+            self._vectors.write(codes.tobytes())
+            self._scales.write(scales.tobytes())
+        elif self.dtype == "binary":
+            self._vectors.write(quantize_binary(vec).tobytes())
+        else:
+            self._vectors.write(vec.astype("<f4").tobytes())
+        if self._originals is not None:
+            self._originals.write(vec.astype("<f4").tobytes())
+
+        record = json.dumps({k: doc.get(k) for k in DOC_FIELDS}, ensure_ascii=False).encode("utf-8")
+        self._docs.write(record)
+        self._doc_offsets.append(self._doc_offsets[-1] + len(record))
+        self._parents.append(doc.get("parentId"))
+        self._paths.append(doc.get("sourcePath"))
+
+        terms = tokenize(f"{doc.get('title') or ''} {doc.get('content') or ''}")
+        self._doc_lens.append(len(terms))
+        for term, tf in Counter(terms).items():
+            self._postings[term].append((self.count, tf))
+        self.count += 1
+
+    def close(self) -> None:
+        if self._vectors.closed:
+            return
+        for f in (self._vectors, self._scales, self._originals, self._docs):
+            if f is not None:
+                f.close()
+        np.asarray(self._doc_offsets, dtype="<i8").tofile(self.path / "docs.idx")
+        np.asarray(self._doc_lens, dtype="<u4").tofile(self.path / "doc_len.u32")
+
+        # Sort by encoded bytes so lookups can binary search the raw vocab blob.
+        terms = sorted(self._postings, key=lambda t: t.encode("utf-8"))
+        _write_strings(self.path / "vocab.bin", (t.encode("utf-8") for t in terms))
+        _field_column(self._parents, self.path / "parents.bin", self.path / "doc_parent.i32")
+        _field_column(self._paths, self.path / "paths.bin", self.path / "doc_path.i32")
+
+        lengths = [len(self._postings[t]) for t in terms]
+        np.cumsum([0] + lengths, dtype="<i8").tofile(self.path / "postings.idx")
+        docs = np.fromiter((d for t in terms for d, _tf in self._postings[t]), dtype="<i4")
+        tfs = np.fromiter((min(tf, 65535) for t in terms for _d, tf in self._postings[t]), dtype="<u2")
+        docs.tofile(self.path / "postings_docs.i32")
+        tfs.tofile(self.path / "postings_tf.u16")
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "originals": self.keep_originals,
+            "avg_doc_len": float(np.mean(self._doc_lens)) if self._doc_lens else 0.0,
+        }
+        (self.path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+
+def _memmap(path: Path, dtype: str, shape: tuple[int, ...] | None = None) -> np.ndarray:
+    # np.memmap refuses zero-length files; an empty index is still valid.
+    if path.stat().st_size == 0:
+        return np.zeros(shape or (0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class LocalIndex:
+    """Read-only view over an index directory; opening it only maps files, so it takes milliseconds."""
+
+    def __init__(self, path: str | Path, *, vector_block_rows: int = 4096, oversampling: float = 4.0) -> None:
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") not in READABLE_VERSIONS:
+            raise ValueError(f"unsupported local index version: {meta.get('version')}")
+        self.count: int = meta["count"]
+        self.dim: int = meta["dim"]
+        self.dtype: str = meta["dtype"]
+        self.avg_doc_len: float = meta["avg_doc_len"] or 1.0
+        self.vector_block_rows = vector_block_rows
+        self.oversampling = oversampling
+
+        if self.dtype == "binary":
+            self._vectors = _memmap(self.path / "vectors.bin", "u1", (self.count, -(-self.dim // 8)))
+        else:
+            vec_dtype = "<i1" if self.dtype == "int8" else "<f4"
+            self._vectors = _memmap(self.path / "vectors.bin", vec_dtype, (self.count, self.dim))
+        self._scales = _memmap(self.path / "scales.f32", "<f4") if self.dtype == "int8" else None
+        self._originals = None
+        if meta.get("originals"):
+            self._originals = _memmap(self.path / "originals.f32", "<f4", (self.count, self.dim))
+        self._docs = _memmap(self.path / "docs.bin", "u1")
+        self._doc_offsets = _memmap(self.path / "docs.idx", "<i8")
+        self._doc_lens = _memmap(self.path / "doc_len.u32", "<u4")
+        self._vocab = _memmap(self.path / "vocab.bin", "u1")
+        self._vocab_offsets = _memmap(self.path / "vocab.idx", "<i8")
+        self._postings_offsets = _memmap(self.path / "postings.idx", "<i8")
+        self._postings_docs = _memmap(self.path / "postings_docs.i32", "<i4")
+        self._postings_tf = _memmap(self.path / "postings_tf.u16", "<u2")
+        self._has_fields = meta["version"] >= 3
+        if self._has_fields:
+            self._parent_values = _memmap(self.path / "parents.bin", "u1")
+            self._parent_offsets = _memmap(self.path / "parents.idx", "<i8")
+            self._doc_parent = _memmap(self.path / "doc_parent.i32", "<i4")
+            self._path_values = _memmap(self.path / "paths.bin", "u1")
+            self._path_offsets = _memmap(self.path / "paths.idx", "<i8")
+            self._doc_path = _memmap(self.path / "doc_path.i32", "<i4")
+        self._masks: OrderedDict[SearchFilter, np.ndarray] = OrderedDict()
+        self._masks_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def vectors(self) -> np.ndarray:
+        """All (N, dim) unit vectors as float32 (the originals, or dequantized int8); reads the whole matrix."""
+
+        if self._originals is not None:
+            return np.array(self._originals, dtype=np.float32)
+        if self.dtype == "binary":
+            raise ValueError("a binary index without originals cannot reproduce its vectors")
+        if self._scales is not None:
+            return self._vectors.astype(np.float32) * self._scales[:, None]
+        return np.array(self._vectors, dtype=np.float32)
+
+    def vector_bytes(self) -> int:
+        """Size of what a vector scan reads: the vectors (or codes) plus int8 scales; originals excluded."""
+
+        return self._vectors.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    def document(self, i: int) -> dict:
+        start, end = int(self._doc_offsets[i]), int(self._doc_offsets[i + 1])
+        return json.loads(bytes(self._docs[start:end]))
+
+    def _term_id(self, term: str) -> int | None:
+        return _lookup(self._vocab, self._vocab_offsets, term)
+
+    def parent_rows(self, parent_ids: Iterable[str]) -> np.ndarray:
+        """Rows of the documents whose `parentId` is one of `parent_ids`, in index order."""
+
+        parent_ids = set(parent_ids)
+        if not self._has_fields:
+            rows = [i for i in range(self.count) if self.document(i).get("parentId") in parent_ids]
+            return np.array(rows, dtype=np.int64)
+        ids = [_lookup(self._parent_values, self._parent_offsets, p) for p in parent_ids]
+        return np.flatnonzero(np.isin(self._doc_parent, [i for i in ids if i is not None]))
+
+    def _compute_mask(self, search_filter: SearchFilter) -> np.ndarray:
+        if not self._has_fields:
+            return np.fromiter((search_filter.matches(self.document(i)) for i in range(self.count)), bool, self.count)
+        mask = np.ones(self.count, dtype=bool)
+        if search_filter.parent_ids:
+            rows = self.parent_rows(search_filter.parent_ids)
+            mask[:] = False
+            mask[rows] = True
+        if search_filter.source_path_prefixes:
+            # The paths starting with a prefix are contiguous in sorted order: one id range per prefix.
+            in_scope = np.zeros(self.count, dtype=bool)
+            for prefix in search_filter.source_path_prefixes:
+                encoded = prefix.encode("utf-8")
+                # No UTF-8 byte is 0xff, so bumping the last byte bounds every string with the prefix.
+                upper = encoded[:-1] + bytes([encoded[-1] + 1])
+                lo = _bisect(self._path_values, self._path_offsets, encoded)
+                hi = _bisect(self._path_values, self._path_offsets, upper)
+                in_scope |= (self._doc_path >= lo) & (self._doc_path < hi)
+            mask &= in_scope
+        return mask
+
+    def filter_mask(self, search_filter: SearchFilter) -> np.ndarray:
+        """Boolean (N,) mask of the documents matching `search_filter` (LRU-cached per filter)."""
+
+        with self._masks_lock:
+            mask = self._masks.get(search_filter)
+            if mask is not None:
+                self._masks.move_to_end(search_filter)
+                return mask
+        mask = self._compute_mask(search_filter)
+        with self._masks_lock:
+            self._masks[search_filter] = mask
+            while len(self._masks) > FILTER_MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def vector_search(
+        self, vector: np.ndarray, k: int, *, allowed: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine top-k, scanning the memmapped vectors (or quantized codes) in blocks. Returns (ids, scores)
+        best first.
+
+        On a quantized index with originals, the best `ceil(k * oversampling)` rows by code score are
+        rescored with their float32 originals; the returned scores are then exact cosines. `allowed` is a
+        boolean (N,) mask; other rows are never returned.
+        """
+
+        q = _unit_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        if q.shape[0] != self.dim:
+            raise ValueError(f"query vector has {q.shape[0]} dimensions, index has {self.dim}")
+        rescore = self._originals is not None
+        shortlist = max(k, math.ceil(k * self.oversampling)) if rescore else k
+        q_bits = quantize_binary(q)[0] if self.dtype == "binary" else None
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, self.vector_block_rows):
+            stop = min(start + self.vector_block_rows, self.count)
+            block = self._vectors[start:stop]
+            if q_bits is not None:
+                # Matching sign bits minus differing ones: a cosine estimate scaled by dim.
+                hamming = _bit_count(block ^ q_bits).sum(axis=1, dtype=np.int32)
+                scores = (self.dim - 2 * hamming).astype(np.float32) / self.dim
+            elif self._scales is not None:
+                scores = (block.astype(np.float32) @ q) * self._scales[start:stop]
+            else:
+                scores = block @ q
+            ids = np.arange(start, stop, dtype=np.int64)
+            if allowed is not None:
+                keep = allowed[start:stop]
+                ids, scores = ids[keep], scores[keep]
+            best_ids, best_scores = _top_k(
+                np.concatenate([best_ids, ids]), np.concatenate([best_scores, scores]), shortlist
+            )
+        if rescore and len(best_ids):
+            # Sorted ids keep the memmap reads sequential.
+            order = np.sort(best_ids)
+            return _top_k(order, self._originals[order] @ q, k)
+        return best_ids, best_scores
+
+    def bm25_search(
+        self, text: str, k: int, *, k1: float = 1.2, b: float = 0.75, allowed: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """BM25 top-k over the inverted index (restricted to `allowed` rows). Returns (ids, scores) best first."""
+
+        ids_parts: list[np.ndarray] = []
+        score_parts: list[np.ndarray] = []
+        for term in set(tokenize(text)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            start, end = int(self._postings_offsets[term_id]), int(self._postings_offsets[term_id + 1])
+            docs = np.asarray(self._postings_docs[start:end], dtype=np.int64)
+            tf = np.asarray(self._postings_tf[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * self._doc_lens[docs] / self.avg_doc_len)
+            ids_parts.append(docs)
+            score_parts.append(idf * tf * (k1 + 1) / (tf + norm))
+        if not ids_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        if allowed is not None:
+            keep = allowed[ids]
+            ids, scores = ids[keep], scores[keep]
+        return _top_k(ids, scores, k)
+
+    def search(
+        self, *, question: str, vector: np.ndarray | None, top_k: int, search_filter: SearchFilter | None = None
+    ) -> dict:
+        """
+        Hybrid query: BM25 + (optional) vector search fused with reciprocal-rank fusion.
+
+        Returns a Search-shaped payload: `{"value": [{<doc fields>, "@search.score": <rrf score>}]}`.
+        """
+
+        candidates = max(top_k, 50)
+        allowed = self.filter_mask(search_filter) if search_filter is not None else None
+        ranked_lists = [self.bm25_search(question, candidates, allowed=allowed)[0]]
+        if vector is not None:
+            ranked_lists.append(self.vector_search(vector, candidates, allowed=allowed)[0])
+
+        fused: dict[int, float] = defaultdict(float)
+        for ids in ranked_lists:
+            for rank, doc_id in enumerate(ids.tolist()):
+                fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+
+        best = sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return {"value": [{**self.document(doc_id), "@search.score": score} for doc_id, score in best]}
+
+
+def _lookup(blob: np.ndarray, offsets: np.ndarray, value: str) -> int | None:
+    """Position of `value` in a sorted blob (`_write_strings`), or None."""
+
+    target = value.encode("utf-8")
+    i = _bisect(blob, offsets, target)
+    if i < len(offsets) - 1 and bytes(blob[offsets[i] : offsets[i + 1]]) == target:
+        return i
+    return None
+
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+@lru_cache
+def get_local_index() -> LocalIndex | None:
+    """The local retrieval backend when `LOCAL_INDEX_PATH` is set; None means use Azure AI Search."""
+
+    settings = get_settings()
+    if not settings.local_index_path:
+        return None
+    return LocalIndex(settings.local_index_path, oversampling=settings.local_index_oversampling)
+
+
+def _build_from_jsonl(source: Path, out: Path, *, dtype: str, vector_field: str, keep_originals: bool = True) -> int:
+    """Build from JSON lines with the index fields plus the vector (e.g. a Search export)."""
+
+    writer: LocalIndexWriter | None = None
+    with source.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            vector = doc.pop(vector_field)
+            if writer is None:
+                writer = LocalIndexWriter(out, dim=len(vector), dtype=dtype, keep_originals=keep_originals)
+            writer.add(doc, vector)
+    if writer is None:
+        raise ValueError(f"no documents in {source}")
+    writer.close()
+    return writer.count
+
+
+def main(argv: Iterable[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.local_index", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build an index directory from a JSONL export")
+    build.add_argument("source", type=Path)
+    build.add_argument("out", type=Path)
+    build.add_argument("--dtype", choices=VECTOR_DTYPES, default="float32")
+    build.add_argument("--no-originals", action="store_true", help="quantized dtypes: do not keep float32 vectors")
+    build.add_argument("--vector-field", default="contentVector")
+    compressions = sub.add_parser("compressions", help="print the index.json vectorSearch block with compression")
+    compressions.add_argument("--kind", choices=["int8", "binary"], required=True)
+    compressions.add_argument("--oversampling", type=float, default=4.0)
+    compressions.add_argument("--no-rescore", action="store_true")
+    compressions.add_argument("--index-json", type=Path, default=Path("search/index.json"))
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    if args.command == "compressions":
+        definition = json.loads(args.index_json.read_text(encoding="utf-8"))
+        block = compressions_config(definition, args.kind, oversampling=args.oversampling, rescore=not args.no_rescore)
+        print(json.dumps({"vectorSearch": block}, indent=2))
+        return
+    count = _build_from_jsonl(
+        args.source, args.out, dtype=args.dtype, vector_field=args.vector_field, keep_originals=not args.no_originals
+    )
+    print(f"Indexed {count} chunks into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
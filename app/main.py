@@ -2,20 +2,102 @@
 FastAPI entrypoint.
 
 Endpoints:
-  - GET /healthz: health check
+  - GET /healthz: liveness check
+  - GET /healthz/ready: readiness check (503 until the startup warmup has finished; see `app.lifecycle`)
   - POST /chat: RAG query (Search retrieval + OpenAI generation)
+  - POST /chat/stream: same query, streamed as Server-Sent Events (citations first, then answer deltas)
+  - POST /chat/batch: many queries with bounded concurrency (JSON in order, or NDJSON as completed)
+  - GET /cache/stats: hit/miss counters of the enabled caches
+  - POST /cache/invalidate: drop cached answers/retrievals (e.g. after an indexer run); requires ADMIN_API_KEY
+  - POST /settings/reload: re-read the environment and rebuild the components built from it; requires ADMIN_API_KEY
+  - GET /metrics: Prometheus metrics (stage latencies, tokens, cache outcomes; see `app.telemetry`)
+
+Every response carries a `Server-Timing` header with the per-stage durations of that request.
+
+The chat endpoints take an optional time budget (`timeout_ms` in the body or an `X-Request-Timeout-Ms`
+header; see `app.deadline`) and return a degraded answer rather than overrun it.
 """
 
 from __future__ import annotations
 
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
+import asyncio
+import json
+import logging
+import math
+import secrets
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, ValidationError
+from starlette.background import BackgroundTask
 
-from .rag import answer_question
+from .admission import Overloaded, admission_slot, get_admission_controller
+from .answer_index import alookup_answer, get_answer_index_job
+from .cache import cache_stats, invalidate_caches, normalize_question
+from .clients import aclose_clients
+from .deadline import DeadlineExceeded, deadline_scope, get_deadline_policy, within
+from .filters import SearchFilter
+from .indexer_watch import start_indexer_watcher
+from .lifecycle import get_warmup, reload
+from .rag import (
+    RetrievedChunk,
+    aanswer_in_session,
+    aanswer_question,
+    aprefetch_query_embeddings,
+    aprepare_session_turn,
+    aretrieve_chunks,
+    astream_answer,
+    pack_for_deadline,
+)
 from .settings import get_settings
+from .telemetry import TelemetryMiddleware, get_telemetry, record_degraded, record_stage, stage
+
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start background tasks (warmup, indexer watcher for cache invalidation and answer index refreshes); on
+    shutdown, stop them and close the shared HTTP clients.
+
+    The warmup runs in the background so liveness probes pass while it does; readiness waits for it.
+    """
+
+    settings = get_settings()
+    warmup = get_warmup()
+    warmup.start(settings)
+    watcher = start_indexer_watcher(settings)
+    yield
+    warmup.stop()
+    get_answer_index_job().stop()
+    if watcher is not None:
+        watcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await watcher
+    await aclose_clients()
+    # Flush buffered spans when tracing is on.
+    get_telemetry().shutdown()
 
 
-app = FastAPI(title="RAG API (Azure AI Search + Azure OpenAI)")
+app = FastAPI(title="RAG API (Azure AI Search + Azure OpenAI)", lifespan=lifespan)
+app.add_middleware(TelemetryMiddleware)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(_request: Request, exc: Overloaded) -> JSONResponse:
+    """Shed by admission control: tell the client when to come back."""
+
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
 
 class ChatRequest(BaseModel):
@@ -23,6 +105,13 @@ class ChatRequest(BaseModel):
 
     question: str = Field(min_length=1)
     top_k: int = Field(default=5, ge=1, le=50)
+    # Time budget for this request; overrides the `X-Request-Timeout-Ms` header and REQUEST_TIMEOUT_MS.
+    timeout_ms: float | None = Field(default=None, gt=0, le=600_000)
+    # Continue a multi-turn session (an id returned by an earlier response, see app.sessions; any other value
+    # starts a new session); omitted: a standalone question.
+    session_id: str | None = Field(default=None, min_length=1, max_length=128)
+    # Restrict retrieval to matching chunks (source path prefixes, parent ids; see app.filters).
+    filter: SearchFilter | None = None
 
 
 class Citation(BaseModel):
@@ -39,29 +128,366 @@ class ChatResponse(BaseModel):
 
     answer: str
     citations: list[Citation]
+    # Only present when the deadline forced a shortcut: "truncated_context" or "citations_only" (empty answer),
+    # or "partial_results" when a federated Search shard did not answer in time.
+    degraded: str | None = None
+    # Only present for session requests: the id to send with the next turn.
+    session_id: str | None = None
+
+
+class ChatBatchRequest(BaseModel):
+    """Request payload for /chat/batch."""
+
+    items: list[ChatRequest] = Field(min_length=1, max_length=1000)
+    # False: one JSON body with results in input order. True: NDJSON, one line per item as it completes.
+    stream: bool = False
+
+
+class ChatBatchItem(BaseModel):
+    """Outcome of one batch item; exactly one of `answer`/`error` is set."""
+
+    index: int
+    answer: str | None = None
+    citations: list[Citation] = Field(default_factory=list)
+    error: str | None = None
+    degraded: str | None = None
+    session_id: str | None = None
+
+
+class ChatBatchResponse(BaseModel):
+    """Response payload for /chat/batch (non-streaming)."""
+
+    results: list[ChatBatchItem]
 
 
 @app.get("/healthz")
 def healthz() -> dict[str, str]:
-    """Kubernetes/App Service friendly health probe."""
+    """Kubernetes/App Service friendly liveness probe."""
 
     return {"status": "ok"}
 
 
+@app.get("/healthz/ready")
+def healthz_ready() -> JSONResponse:
+    """Readiness probe: 200 once the startup warmup has finished, 503 before; the body reports each step."""
+
+    warmup = get_warmup()
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.status())
+
+
+def _citations(chunks: list[RetrievedChunk]) -> list[Citation]:
+    return [
+        Citation(chunk_id=c.chunk_id, title=c.title, source_path=c.source_path, parent_id=c.parent_id) for c in chunks
+    ]
+
+
+_TimeoutHeader = Header(default=None, alias="X-Request-Timeout-Ms", gt=0)
+
+
+def _search_filter(req: ChatRequest) -> SearchFilter | None:
+    return req.filter if req.filter is not None and not req.filter.is_empty() else None
+
+
+async def _precomputed(settings, req: ChatRequest) -> tuple[str, list[RetrievedChunk], None] | None:
+    """The precomputed answer (`app.answer_index`) of a standalone, unfiltered question, if there is one."""
+
+    if req.session_id is not None or _search_filter(req) is not None:
+        return None
+    hit = await alookup_answer(settings=settings, question=req.question, top_k=req.top_k)
+    return None if hit is None else (*hit, None)
+
+
+async def _answer(settings, req: ChatRequest) -> tuple[str, list[RetrievedChunk], str | None]:
+    """Answer, citations and the session id to return (None outside sessions)."""
+
+    search_filter = _search_filter(req)
+    if req.session_id is not None:
+        return await aanswer_in_session(
+            settings=settings,
+            session_id=req.session_id,
+            question=req.question,
+            top_k=req.top_k,
+            search_filter=search_filter,
+        )
+    answer, chunks = await aanswer_question(
+        settings=settings, question=req.question, top_k=req.top_k, search_filter=search_filter
+    )
+    return answer, chunks, None
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest) -> ChatResponse:
+async def chat(req: ChatRequest, timeout_ms: float | None = _TimeoutHeader) -> ChatResponse:
     """
     Main RAG endpoint.
 
     - Loads current settings (env-backed)
+    - Serves a precomputed answer for a frequent question when there is one (`app.answer_index`)
     - Retrieves chunks from Search
     - Calls Azure OpenAI chat completion with retrieved context
+
+    Runs on the event loop end to end (async Search + OpenAI clients), so concurrency is not capped by
+    the threadpool size; admission control (`app.admission`), when enabled, caps it instead.
     """
 
     settings = get_settings()
-    answer, chunks = answer_question(settings=settings, question=req.question, top_k=req.top_k)
-    citations = [
-        Citation(chunk_id=c.chunk_id, title=c.title, source_path=c.source_path, parent_id=c.parent_id) for c in chunks
-    ]
-    return ChatResponse(answer=answer, citations=citations)
+    deadline = get_deadline_policy().start(req.timeout_ms if req.timeout_ms is not None else timeout_ms)
+    # Queueing for a slot counts against the deadline; shedding (`Overloaded`) becomes a 429. Precomputed
+    # answers cost no upstream call, so they don't take a slot.
+    with deadline_scope(deadline):
+        try:
+            result = await _precomputed(settings, req)
+            if result is None:
+                async with admission_slot("interactive"):
+                    result = await _answer(settings, req)
+        except DeadlineExceeded as exc:
+            raise HTTPException(status_code=504, detail=str(exc)) from None
+    answer, chunks, session_id = result
+    degraded = deadline.degraded if deadline is not None else None
+    # Serialize here (instead of letting FastAPI re-validate the model) so the cost shows up as a stage.
+    with stage("serialize"):
+        response = ChatResponse(answer=answer, citations=_citations(chunks), degraded=degraded, session_id=session_id)
+        body = response.model_dump_json(exclude={f for f in ("degraded", "session_id") if getattr(response, f) is None})
+    return Response(content=body, media_type="application/json")
+
+
+async def _run_batch(*, settings, items: list[ChatRequest]) -> AsyncIterator[ChatBatchItem]:
+    """
+    Answer `items` concurrently (bounded by BATCH_MAX_CONCURRENCY), yielding results as they complete.
+
+    Identical questions (after normalization, same `top_k`, filter and session) are answered once and fanned out.
+    Query embeddings are prefetched in batched calls first when the pipeline embeds in-app.
+    """
+
+    groups: dict[tuple[str, int, SearchFilter | None, str | None], list[int]] = {}
+    for i, item in enumerate(items):
+        key = (normalize_question(item.question), item.top_k, _search_filter(item), item.session_id)
+        groups.setdefault(key, []).append(i)
+
+    try:
+        await aprefetch_query_embeddings(settings=settings, questions=[items[ix[0]].question for ix in groups.values()])
+    except Exception:
+        # Best effort: items embed individually (and report their own errors) if this fails.
+        logger.warning("batch embedding prefetch failed", exc_info=True)
+
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    async def run_group(indices: list[int]) -> tuple[list[int], ChatBatchItem]:
+        req = items[indices[0]]
+        async with semaphore:
+            # Each item's budget starts when it gets a slot, not when the batch arrived.
+            deadline = get_deadline_policy().start(req.timeout_ms)
+            with deadline_scope(deadline):
+                try:
+                    result = await _precomputed(settings, req)
+                    if result is None:
+                        # Batch items queue behind interactive requests and may wait longer before being shed.
+                        async with admission_slot("batch"):
+                            result = await _answer(settings, req)
+                except Exception as exc:
+                    logger.warning("batch item failed", exc_info=True)
+                    return indices, ChatBatchItem(index=indices[0], error=f"{type(exc).__name__}: {exc}")
+        answer, chunks, session_id = result
+        return indices, ChatBatchItem(
+            index=indices[0],
+            answer=answer,
+            citations=_citations(chunks),
+            degraded=deadline.degraded if deadline is not None else None,
+            session_id=session_id,
+        )
+
+    tasks = [asyncio.create_task(run_group(indices)) for indices in groups.values()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indices, result = await next_done
+            for i in indices:
+                yield result.model_copy(update={"index": i})
+    finally:
+        # Client went away (streaming) or an unexpected error: don't leave upstream calls running.
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(req: ChatBatchRequest) -> ChatBatchResponse | StreamingResponse:
+    """
+    Batch RAG endpoint for offline jobs (FAQ refresh, evals, triage).
+
+    Per-item failures are reported in that item's `error` field; the batch itself still succeeds.
+    """
+
+    settings = get_settings()
+    results = _run_batch(settings=settings, items=req.items)
+
+    if req.stream:
+
+        async def lines() -> AsyncIterator[str]:
+            async for item in results:
+                yield item.model_dump_json() + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    ordered = sorted([item async for item in results], key=lambda item: item.index)
+    return ChatBatchResponse(results=ordered)
+
+
+def _sse(event: str, data: object) -> str:
+    """Encode one Server-Sent Event frame (JSON payload on a single `data:` line)."""
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, timeout_ms: float | None = _TimeoutHeader) -> StreamingResponse:
+    """
+    Streaming RAG endpoint (Server-Sent Events).
+
+    Event sequence:
+      - `session`: `{"session_id": ...}`, only for session requests (see below)
+      - `citations`: list of citations, sent as soon as retrieval returns
+      - `delta`: `{"text": ...}` for each completion chunk
+      - `error`: `{"detail": ...}` if generation fails after the stream has started
+      - `degraded`: `{"reason": ...}` when the deadline forced a shortcut: `truncated_context` (right
+        after the citations) or `truncated_answer` (generation cut off at the deadline); also
+        `partial_results` when a federated Search shard did not answer (`app.federation`)
+      - `done`: end of stream
+
+    Retrieval failures (including missing the deadline) happen before the response starts and surface as
+    regular HTTP errors. With a `session_id`, the `session` event carries the id to send with the next turn,
+    the citations are the whole session context and the turn is recorded once the answer has streamed completely.
+    """
+
+    settings = get_settings()
+    deadline = get_deadline_policy().start(req.timeout_ms if req.timeout_ms is not None else timeout_ms)
+    # The slot is held until the stream ends, so it is acquired and released by hand.
+    admission = get_admission_controller()
+    permit = await admission.acquire("interactive") if admission is not None else None
+    turn = None
+    try:
+        with deadline_scope(deadline):
+            search_filter = _search_filter(req)
+            if req.session_id is not None:
+                turn = await aprepare_session_turn(
+                    settings=settings,
+                    session_id=req.session_id,
+                    question=req.question,
+                    top_k=req.top_k,
+                    search_filter=search_filter,
+                )
+            if turn is None:
+                retrieved = await within(
+                    deadline.retrieval_budget() if deadline is not None else None,
+                    aretrieve_chunks(
+                        settings=settings, question=req.question, top_k=req.top_k, search_filter=search_filter
+                    ),
+                )
+    except BaseException as exc:
+        if permit is not None:
+            permit.release(exc)
+        if not isinstance(exc, TimeoutError):
+            raise
+        raise HTTPException(status_code=504, detail="retrieval did not finish within the request deadline") from None
+    if turn is not None:
+        # Session turns keep the context already sent (the cached prompt prefix) instead of re-packing.
+        chunks, degraded, prompt = turn.chunks, None, {"messages": turn.messages}
+    else:
+        with stage("pack"):
+            chunks, degraded = pack_for_deadline(retrieved, deadline, question=req.question)
+        prompt = {}
+
+    def release() -> None:
+        if permit is not None:
+            permit.release()
+
+    async def events() -> AsyncIterator[str]:
+        if turn is not None:
+            yield _sse("session", {"session_id": turn.session.id})
+        yield _sse("citations", [c.model_dump() for c in _citations(chunks)])
+        if degraded is not None:
+            record_degraded(degraded)
+            yield _sse("degraded", {"reason": degraded})
+        # Timed by hand: these stages end after the response headers (and `Server-Timing`) went out.
+        start = time.perf_counter()
+        first = True
+        deltas = astream_answer(settings=settings, question=req.question, chunks=chunks, **prompt)
+        parts: list[str] = []
+        try:
+            while True:
+                try:
+                    delta = await within(deadline.remaining() if deadline is not None else None, anext(deltas))
+                except StopAsyncIteration:
+                    if turn is not None:
+                        turn.commit("".join(parts))
+                    break
+                except TimeoutError:
+                    record_degraded("truncated_answer")
+                    yield _sse("degraded", {"reason": "truncated_answer"})
+                    break
+                if first:
+                    record_stage("first_token", time.perf_counter() - start)
+                    first = False
+                parts.append(delta)
+                yield _sse("delta", {"text": delta})
+        except Exception as exc:
+            # Headers are already sent, so the status code cannot change; report in-band instead.
+            logger.exception("chat stream failed")
+            if permit is not None:
+                permit.release(exc)
+            yield _sse("error", {"detail": "generation failed"})
+        finally:
+            release()
+        record_stage("generate", time.perf_counter() - start)
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so deltas reach the client as they are produced.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the stream is never iterated (client gone before the body started).
+        background=BackgroundTask(release),
+    )
+
+
+@app.get("/cache/stats")
+def get_cache_stats() -> dict[str, dict[str, int]]:
+    """Hit/miss/eviction counters and sizes for every enabled cache."""
+
+    return cache_stats()
+
+
+def _require_admin_key(api_key: str | None) -> None:
+    expected = get_settings().admin_api_key
+    if not expected or not api_key or not secrets.compare_digest(api_key, expected):
+        raise HTTPException(status_code=403, detail="invalid admin key")
+
+
+@app.post("/cache/invalidate", status_code=204)
+def post_cache_invalidate(api_key: str | None = Header(default=None, alias="api-key")) -> None:
+    """Drop all cached answers and retrievals. The indexer watcher does this automatically after each run."""
+
+    _require_admin_key(api_key)
+    invalidate_caches()
+
+
+@app.post("/settings/reload", status_code=204)
+async def post_settings_reload(api_key: str | None = Header(default=None, alias="api-key")) -> None:
+    """
+    Take a new settings snapshot from the environment and rebuild the components derived from it, then warm
+    them up in the background. An invalid environment is rejected (422) and the current settings stay.
+    """
+
+    _require_admin_key(api_key)
+    try:
+        settings = reload()
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=f"invalid settings: {exc.error_count()} error(s)") from None
+    get_warmup().start(settings)
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """Prometheus exposition of the default registry; 404 when `METRICS_ENABLED=false`."""
 
+    if not get_telemetry().metrics_enabled:
+        raise HTTPException(status_code=404, detail="metrics disabled")
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
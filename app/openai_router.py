@@ -0,0 +1,359 @@
+"""
+Azure OpenAI deployment pool: least-loaded routing, client-side rate limiting and failover.
+
+With `AZURE_OPENAI_DEPLOYMENTS` set, `get_openai_client()` / `get_async_openai_client()` return an
+`OpenAIRouter` / `AsyncOpenAIRouter` instead of a single client. They expose the part of the client the
+app uses (`chat.completions.create`, `embeddings.create`), so callers do not change; the `model`
+argument is replaced by the chosen member's deployment.
+
+Each member (one endpoint + deployment) has two budgets, tokens and requests per minute, refilled
+continuously from its quota. A call:
+  1. estimates its token cost (prompt characters / 4 + `max_tokens`, or input characters / 4)
+  2. goes to the member with the largest remaining share of both budgets that can admit it
+     (ties: fewest calls in flight, then configuration order) and reserves the cost there
+  3. on success, adopts the service's view of the budget from the `x-ratelimit-remaining-*` headers
+     (other clients may share the deployment), or else refunds the unused estimate from `usage`
+  4. on 429, 5xx or a connection error, puts the member in cooldown (exponential backoff from 1s, or
+     longer when `retry-after` asks for it) and moves on to the next member right away
+
+When no member can admit a call, it waits for the earliest one. A call gives up after
+`AZURE_OPENAI_ROUTER_MAX_WAIT_SECONDS`, failovers included, and re-raises the last upstream error
+(or `PoolExhausted`).
+Member clients are built with `max_retries=0`: retrying is the router's job.
+
+The pool state is shared by the sync and async routers, so both count against the same budgets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import urlparse
+
+import openai
+
+from .settings import OpenAIDeployment, get_settings
+from .telemetry import note, record_upstream_call
+
+
+_CHARS_PER_TOKEN = 4
+# Azure estimates a call's rate-limit cost from `max_tokens`; our calls leave it unset.
+_DEFAULT_COMPLETION_TOKENS = 1024
+_MAX_COOLDOWN_SECONDS = 30.0
+_FAILOVER_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class PoolExhausted(RuntimeError):
+    """No pool member could take the call within `AZURE_OPENAI_ROUTER_MAX_WAIT_SECONDS`."""
+
+
+@dataclass
+class _Budget:
+    """Per-minute budget refilled continuously; `per_minute=None` means unknown (always admits)."""
+
+    per_minute: float | None
+    level: float = 0.0
+    updated: float = 0.0
+
+    def __post_init__(self) -> None:
+        if self.per_minute is not None:
+            self.level = self.per_minute
+
+    def refill(self, now: float) -> None:
+        if self.per_minute is not None:
+            self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait(self, amount: float) -> float:
+        """Seconds until `amount` is available. A call larger than the whole quota waits for a full bucket."""
+
+        if self.per_minute is None:
+            return 0.0
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, amount: float) -> None:
+        if self.per_minute is not None:
+            self.level -= min(amount, self.per_minute)
+
+    def give_back(self, amount: float) -> None:
+        if self.per_minute is not None:
+            self.level = min(self.per_minute, self.level + amount)
+
+    def share(self) -> float:
+        return 1.0 if self.per_minute is None else max(0.0, self.level) / self.per_minute
+
+    def observe(self, *, remaining: float | None, limit: float | None, now: float) -> None:
+        if self.per_minute is None and limit:
+            self.per_minute = limit
+        if remaining is not None and self.per_minute is not None:
+            self.level = min(self.per_minute, remaining)
+            self.updated = now
+
+
+@dataclass
+class PoolMember:
+    name: str
+    kind: str
+    endpoint: str
+    deployment: str
+    api_key: str | None
+    tokens: _Budget
+    requests: _Budget
+    in_flight: int = 0
+    failures: int = 0
+    cooldown_until: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: OpenAIDeployment, *, default_api_key: str | None = None) -> PoolMember:
+        host = urlparse(config.endpoint).netloc or config.endpoint
+        return cls(
+            name=f"{host}/{config.deployment}",
+            kind=config.kind,
+            endpoint=config.endpoint,
+            deployment=config.deployment,
+            api_key=config.api_key or default_api_key,
+            tokens=_Budget(config.tpm),
+            requests=_Budget(config.rpm),
+        )
+
+
+def _header_float(headers: Mapping[str, str] | None, name: str) -> float | None:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _retry_after(headers: Mapping[str, str] | None) -> float | None:
+    if (ms := _header_float(headers, "retry-after-ms")) is not None:
+        return ms / 1000
+    return _header_float(headers, "retry-after")
+
+
+@dataclass
+class DeploymentPool:
+    """Budgets, cooldowns and in-flight counts of the pool members; see the module docstring."""
+
+    members: list[PoolMember]
+    clock: Callable[[], float] = time.monotonic
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def acquire(self, kind: str, cost: int) -> tuple[PoolMember | None, float]:
+        """Reserve `cost` tokens on the best member of `kind`: `(member, 0)`, or `(None, seconds to wait)`."""
+
+        now = self.clock()
+        best, best_score, wait = None, None, math.inf
+        with self._lock:
+            for member in self.members:
+                if member.kind != kind:
+                    continue
+                member.tokens.refill(now)
+                member.requests.refill(now)
+                ready_in = max(member.cooldown_until - now, member.tokens.wait(cost), member.requests.wait(1))
+                if ready_in > 0:
+                    wait = min(wait, ready_in)
+                    continue
+                score = (min(member.tokens.share(), member.requests.share()), -member.in_flight)
+                if best_score is None or score > best_score:
+                    best, best_score = member, score
+            if best is None:
+                return None, wait
+            best.tokens.take(cost)
+            best.requests.take(1)
+            best.in_flight += 1
+        return best, 0.0
+
+    def succeeded(self, member: PoolMember, cost: int, *, headers: Mapping[str, str], used: int | None) -> None:
+        now = self.clock()
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+        with self._lock:
+            member.in_flight -= 1
+            member.failures = 0
+            member.tokens.observe(
+                remaining=remaining_tokens, limit=_header_float(headers, "x-ratelimit-limit-tokens"), now=now
+            )
+            member.requests.observe(
+                remaining=_header_float(headers, "x-ratelimit-remaining-requests"),
+                limit=_header_float(headers, "x-ratelimit-limit-requests"),
+                now=now,
+            )
+            if remaining_tokens is None and used is not None and used < cost:
+                member.tokens.give_back(cost - used)
+
+    def failed(self, member: PoolMember, *, headers: Mapping[str, str] | None) -> None:
+        """The member answered 429/5xx or was unreachable: keep calls away from it for a while."""
+
+        now = self.clock()
+        with self._lock:
+            member.in_flight -= 1
+            member.failures += 1
+            # Exponential backoff, or longer when the service asks for it; a `retry-after: 0` must not send
+            # the next attempt straight back to the member that just failed.
+            cooldown = min(_MAX_COOLDOWN_SECONDS, 2.0 ** (member.failures - 1))
+            cooldown = max(cooldown, _retry_after(headers) or 0.0)
+            member.cooldown_until = max(member.cooldown_until, now + cooldown)
+
+    def cancelled(self, member: PoolMember, cost: int) -> None:
+        """The call failed for a reason unrelated to the member (e.g. a bad request): return the reservation."""
+
+        with self._lock:
+            member.in_flight -= 1
+            member.tokens.give_back(cost)
+            member.requests.give_back(1)
+
+
+def estimate_tokens(kind: str, kwargs: Mapping[str, Any]) -> int:
+    """Rate-limit cost of a call before it is made (the service counts prompt + `max_tokens`)."""
+
+    if kind == "chat":
+        contents = (m.get("content") for m in kwargs.get("messages", ()))
+        chars = sum(len(c) for c in contents if isinstance(c, str))
+        return chars // _CHARS_PER_TOKEN + (kwargs.get("max_tokens") or _DEFAULT_COMPLETION_TOKENS)
+    inputs = kwargs.get("input", "")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return max(1, sum(len(text) for text in inputs) // _CHARS_PER_TOKEN)
+
+
+def _resource(client: Any, kind: str) -> Any:
+    return client.chat.completions if kind == "chat" else client.embeddings
+
+
+def _used_tokens(result: Any) -> int | None:
+    return getattr(getattr(result, "usage", None), "total_tokens", None)
+
+
+class _Endpoint:
+    def __init__(self, call: Callable[[str, dict], Any], kind: str) -> None:
+        self._call = call
+        self._kind = kind
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._call(self._kind, kwargs)
+
+
+class OpenAIRouter:
+    """Sync client facade over the pool (`chat.completions.create`, `embeddings.create`)."""
+
+    def __init__(self, pool: DeploymentPool, clients: Mapping[str, Any], *, max_wait: float) -> None:
+        self.pool = pool
+        self.clients = clients
+        self.max_wait = max_wait
+        self.chat = SimpleNamespace(completions=_Endpoint(self._call, "chat"))
+        self.embeddings = _Endpoint(self._call, "embeddings")
+
+    def _call(self, kind: str, kwargs: dict) -> Any:
+        cost = estimate_tokens(kind, kwargs)
+        deadline = self.pool.clock() + self.max_wait
+        last_error: Exception | None = None
+        while True:
+            member, wait = self.pool.acquire(kind, cost)
+            if member is None:
+                if self.pool.clock() + wait > deadline:
+                    raise last_error or PoolExhausted(f"no {kind} deployment available within {self.max_wait}s")
+                time.sleep(wait)
+                continue
+
+            note("aoai_deployment", member.name)
+            try:
+                raw = _resource(self.clients[member.name], kind).with_raw_response.create(
+                    **{**kwargs, "model": member.deployment}
+                )
+                result = raw.parse()
+            except _FAILOVER_ERRORS as exc:
+                self.pool.failed(member, headers=getattr(getattr(exc, "response", None), "headers", None))
+                record_upstream_call(member.name, "failover")
+                last_error = exc
+                if self.pool.clock() > deadline:
+                    raise
+                continue
+            except BaseException:
+                self.pool.cancelled(member, cost)
+                record_upstream_call(member.name, "error")
+                raise
+            self.pool.succeeded(member, cost, headers=raw.headers, used=_used_tokens(result))
+            record_upstream_call(member.name, "ok")
+            return result
+
+
+class AsyncOpenAIRouter:
+    """Async counterpart of `OpenAIRouter`; waits for budget without blocking the event loop."""
+
+    def __init__(self, pool: DeploymentPool, clients: Mapping[str, Any], *, max_wait: float) -> None:
+        self.pool = pool
+        self.clients = clients
+        self.max_wait = max_wait
+        self.chat = SimpleNamespace(completions=_Endpoint(self._call, "chat"))
+        self.embeddings = _Endpoint(self._call, "embeddings")
+
+    async def _call(self, kind: str, kwargs: dict) -> Any:
+        cost = estimate_tokens(kind, kwargs)
+        deadline = self.pool.clock() + self.max_wait
+        last_error: Exception | None = None
+        while True:
+            member, wait = self.pool.acquire(kind, cost)
+            if member is None:
+                if self.pool.clock() + wait > deadline:
+                    raise last_error or PoolExhausted(f"no {kind} deployment available within {self.max_wait}s")
+                await asyncio.sleep(wait)
+                continue
+
+            note("aoai_deployment", member.name)
+            try:
+                raw = await _resource(self.clients[member.name], kind).with_raw_response.create(
+                    **{**kwargs, "model": member.deployment}
+                )
+                result = raw.parse()
+            except _FAILOVER_ERRORS as exc:
+                self.pool.failed(member, headers=getattr(getattr(exc, "response", None), "headers", None))
+                record_upstream_call(member.name, "failover")
+                last_error = exc
+                if self.pool.clock() > deadline:
+                    raise
+                continue
+            except BaseException:
+                self.pool.cancelled(member, cost)
+                record_upstream_call(member.name, "error")
+                raise
+            self.pool.succeeded(member, cost, headers=raw.headers, used=_used_tokens(result))
+            record_upstream_call(member.name, "ok")
+            return result
+
+
+@lru_cache
+def get_deployment_pool() -> DeploymentPool | None:
+    """
+    Process-wide pool built from `AZURE_OPENAI_DEPLOYMENTS`, or None when it is unset.
+
+    A kind with no configured member gets one from the single-deployment settings
+    (AZURE_OPENAI_ENDPOINT + AZURE_OPENAI_CHAT_DEPLOYMENT / AZURE_OPENAI_EMBED_DEPLOYMENT).
+    """
+
+    settings = get_settings()
+    if not settings.azure_openai_deployments:
+        return None
+
+    configs = list(settings.azure_openai_deployments)
+    kinds = {c.kind for c in configs}
+    if "chat" not in kinds:
+        configs.append(
+            OpenAIDeployment(endpoint=settings.azure_openai_endpoint, deployment=settings.azure_openai_chat_deployment)
+        )
+    if "embeddings" not in kinds and settings.azure_openai_embed_deployment:
+        configs.append(
+            OpenAIDeployment(
+                endpoint=settings.azure_openai_endpoint,
+                deployment=settings.azure_openai_embed_deployment,
+                kind="embeddings",
+            )
+        )
+    return DeploymentPool([PoolMember.from_config(c, default_api_key=settings.azure_openai_api_key) for c in configs])
@@ -2,19 +2,88 @@
 Retrieval-Augmented Generation (RAG) orchestration.
 
 Flow:
-  1) Retrieve relevant chunks from Azure AI Search (hybrid + vector query)
-  2) Build a compact context string
+  1) Retrieve relevant chunks from Azure AI Search (hybrid + vector query), or from the embedded
+     `app.local_index` backend, which answers the same query shape in-process
+  2) Build a compact context string (merge overlapping chunks, dedupe, fit a token budget; see `app.context`)
   3) Ask Azure OpenAI to answer using that context
+
+Every step has a sync entrypoint (`retrieve_chunks`, `answer_question`) for scripts and tests, and an
+async one (`aretrieve_chunks`, `aanswer_question`) used by the API. Both share the request building
+and response parsing helpers below so they cannot drift apart.
+
+`answer_question`/`aanswer_question` consult the answer cache (`app.cache`) first when it is enabled,
+and `retrieve_chunks`/`aretrieve_chunks` the retrieval cache. On a miss, concurrent identical calls are
+coalesced into one upstream execution (`app.singleflight`).
+
+The async answer path honors the request deadline (`app.deadline`): retrieval gets a share of the budget,
+the context shrinks when little time is left, and an answer that cannot finish in time degrades to
+citations only. Search calls can be hedged against slow replicas (`app.hedging`), and a query can fan out
+to several indexes at once (`app.federation`).
+
+`astream_answer` is the streaming flavor of the generation step: it yields completion deltas as they
+arrive so the API can forward them (after the citations) without waiting for the full answer.
+
+`aanswer_in_session` / `aprepare_session_turn` answer follow-ups in a multi-turn session (`app.sessions`),
+reusing the context already sent and keeping the prompt prefix stable for the model's prompt cache.
+
+Stages are timed with `app.telemetry.stage` (metrics, `Server-Timing`, optional spans).
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+import hashlib
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import TypeVar
 
 import httpx
+import numpy as np
 
-from .clients import get_httpx_client, get_openai_client
+from .cache import (
+    AnswerCache,
+    AnswerLookup,
+    aget,
+    answer_cache_scope,
+    arefresh_generation,
+    aset,
+    get_answer_cache,
+    get_retrieval_cache,
+    retrieval_cache_key,
+)
+from .clients import get_async_httpx_client, get_async_openai_client, get_httpx_client, get_openai_client
+from .context import format_block, get_context_packer
+from .deadline import Deadline, DeadlineExceeded, current_deadline, within
+from .embeddings import (
+    aprefetch_embeddings,
+    as_float32,
+    embedding_cache_key,
+    get_embedding_batcher,
+    get_embedding_cache,
+)
+from .federation import PartialResults, Shard, get_search_federation
+from .filters import SearchFilter, odata_filter
+from .hedging import get_search_hedger
+from .local_index import get_local_index
+from .sessions import SessionTurn, get_session_manager
 from .settings import Settings
+from .singleflight import get_single_flight
+from .telemetry import note, record_degraded, record_generation, stage
+
+
+T = TypeVar("T")
+
+# Max `top` of a Search query, and parent ids per `search.in` filter when fingerprinting documents.
+SEARCH_PAGE_SIZE = 1000
+PARENT_FILTER_BATCH = 100
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Use the provided context to answer the user's question.\n"
+    "If the answer is not in the context, say you don't know and ask a follow-up question.\n"
+    "Cite sources by bracket number like [1], [2]."
+)
 
 
 @dataclass(frozen=True)
@@ -39,24 +108,43 @@ def _search_headers(settings: Settings) -> dict[str, str]:
     }
 
 
-def retrieve_chunks(*, settings: Settings, question: str, top_k: int) -> list[RetrievedChunk]:
-    """
-    Query Azure AI Search and return the top retrieved chunks.
+def _search_url(settings: Settings) -> str:
+    return (
+        f"{settings.azure_search_endpoint}/indexes/{settings.azure_search_index}/docs/search"
+        f"?api-version={settings.azure_search_api_version}"
+    )
 
-    This uses:
-      - `search`: lexical (BM25) match on text fields
-      - `vectorQueries`: semantic proximity on the vector field
-    """
 
+def _search_targets(settings: Settings) -> list[tuple[str, dict[str, str]]]:
+    """(search URL, headers) of the index, or of every federated shard."""
+
+    federation = get_search_federation()
+    if federation is not None:
+        return [(shard.url, shard.headers()) for shard in federation.shards]
+    return [(_search_url(settings), _search_headers(settings))]
+
+
+def _check_embed_settings(settings: Settings) -> None:
     if not settings.use_search_vectorizer and not settings.azure_openai_embed_deployment:
         raise ValueError("AZURE_OPENAI_EMBED_DEPLOYMENT is required when USE_SEARCH_VECTORIZER=false")
 
-    http = get_httpx_client()
 
-    url = (
-        f"{settings.azure_search_endpoint}/indexes/{settings.azure_search_index}/docs/search"
-        f"?api-version={settings.azure_search_api_version}"
-    )
+def _search_body(
+    *,
+    settings: Settings,
+    question: str,
+    top_k: int,
+    vector: np.ndarray | None = None,
+    search_filter: SearchFilter | None = None,
+) -> dict:
+    """
+    Build the Search query body.
+
+    This uses:
+      - `search`: lexical (BM25) match on text fields
+      - `vectorQueries`: semantic proximity on the vector field
+      - `filter` + `vectorFilterMode: preFilter` when the query is scoped (`app.filters`)
+    """
 
     body: dict = {
         "top": top_k,
@@ -64,7 +152,7 @@ def retrieve_chunks(*, settings: Settings, question: str, top_k: int) -> list[Re
         "search": question,
     }
 
-    if settings.use_search_vectorizer:
+    if vector is None:
         # Let Search call its configured vectorizer to embed the query text at query-time.
         body["vectorQueries"] = [
             {
@@ -76,18 +164,20 @@ def retrieve_chunks(*, settings: Settings, question: str, top_k: int) -> list[Re
             }
         ]
     else:
-        # Embed in-app and send the raw vector to Search (useful if you don't want Search vectorizers).
-        oai = get_openai_client()
-        emb = oai.embeddings.create(model=settings.azure_openai_embed_deployment, input=question)
-        vector = emb.data[0].embedding
+        # Raw vector embedded in-app (useful if you don't want Search vectorizers).
         body["vectorQueries"] = [
-            {"kind": "vector", "vector": vector, "k": top_k, "fields": settings.azure_search_vector_field}
+            {"kind": "vector", "vector": vector.tolist(), "k": top_k, "fields": settings.azure_search_vector_field}
         ]
 
-    resp = http.post(url, headers=_search_headers(settings), json=body)
-    resp.raise_for_status()
-    payload = resp.json()
+    expression = odata_filter(search_filter) if search_filter is not None else None
+    if expression:
+        # Filter before the vector search, so all k nearest neighbors come from the scope.
+        body["filter"] = expression
+        body["vectorFilterMode"] = "preFilter"
+    return body
+
 
+def _parse_search_results(payload: dict) -> list[RetrievedChunk]:
     results: list[RetrievedChunk] = []
     for doc in payload.get("value", []):
         # The Search response includes both our fields and special @search.* fields.
@@ -105,41 +195,608 @@ def retrieve_chunks(*, settings: Settings, question: str, top_k: int) -> list[Re
     return results
 
 
-def answer_question(*, settings: Settings, question: str, top_k: int) -> tuple[str, list[RetrievedChunk]]:
+def _build_messages(*, question: str, chunks: list[RetrievedChunk]) -> list[dict[str, str]]:
+    context_blocks = [format_block(i, c) for i, c in enumerate(chunks, start=1)]
+    context = "\n\n".join(context_blocks) if context_blocks else "(no matches)"
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Question:\n{question}\n\nContext:\n{context}"},
+    ]
+
+
+def _embed_query(*, settings: Settings, question: str) -> np.ndarray:
+    """Embed the query in-app, going through the embedding cache when enabled."""
+
+    model = settings.azure_openai_embed_deployment
+    cache = get_embedding_cache()
+    key = embedding_cache_key(model=model, text=question)
+    if cache is not None and (cached := cache.get(key)) is not None:
+        note("embedding_cache", "hit")
+        return cached
+
+    with stage("embed"):
+        oai = get_openai_client()
+        emb = oai.embeddings.create(model=model, input=question)
+        vector = as_float32(emb.data[0].embedding)
+    if cache is not None:
+        note("embedding_cache", "miss")
+        cache.set(key, vector)
+    return vector
+
+
+async def _aembed_query(*, settings: Settings, question: str) -> np.ndarray:
+    """Async `_embed_query`; cache misses are coalesced into batched calls when the batcher is enabled."""
+
+    model = settings.azure_openai_embed_deployment
+    cache = get_embedding_cache()
+    key = embedding_cache_key(model=model, text=question)
+    if cache is not None and (cached := await aget(cache, key)) is not None:
+        note("embedding_cache", "hit")
+        return cached
+
+    with stage("embed"):
+        batcher = get_embedding_batcher()
+        if batcher is not None:
+            vector = await batcher.embed(model=model, text=question)
+        else:
+            oai = get_async_openai_client()
+            emb = await oai.embeddings.create(model=model, input=question)
+            vector = as_float32(emb.data[0].embedding)
+    if cache is not None:
+        note("embedding_cache", "miss")
+        await aset(cache, key, vector)
+    return vector
+
+
+async def aembed_question(*, settings: Settings, question: str) -> np.ndarray:
+    """Embed `question` with AZURE_OPENAI_EMBED_DEPLOYMENT (cached and batched like the retrieval query embedding)."""
+
+    return await _aembed_query(settings=settings, question=question)
+
+
+async def aprefetch_query_embeddings(*, settings: Settings, questions: list[str]) -> None:
+    """
+    Embed many questions upfront in batched calls so later `aanswer_question` calls hit the cache.
+
+    No-op unless the pipeline embeds queries in-app (in-app vector mode or the semantic answer cache).
+    """
+
+    if not settings.azure_openai_embed_deployment:
+        return
+    if settings.use_search_vectorizer and not settings.answer_cache_semantic_threshold:
+        return
+    await aprefetch_embeddings(
+        model=settings.azure_openai_embed_deployment,
+        texts=questions,
+        max_batch_size=settings.embedding_batch_max_size,
+    )
+
+
+def _coalesce(key: Callable[[], str], fn: Callable[[], T]) -> T:
+    """Run `fn` through the single-flight coalescer (when enabled) under the key built by `key()`."""
+
+    flight = get_single_flight()
+    if flight is None:
+        return fn()
+    value, shared = flight.do(key(), fn)
+    if shared:
+        note("single_flight", "shared")
+    return value
+
+
+async def _acoalesce(key: Callable[[], str], fn: Callable[[], Awaitable[T]]) -> T:
+    """Async `_coalesce`."""
+
+    flight = get_single_flight()
+    if flight is None:
+        return await fn()
+    value, shared = await flight.ado(key(), fn)
+    if shared:
+        note("single_flight", "shared")
+    return value
+
+
+def _fetch_chunks(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> list[RetrievedChunk]:
+    """Retrieval without caches: embed the query if needed, then query the local index or Search."""
+
+    local = get_local_index()
+    if local is not None:
+        # In-process backend; the query vector (if any) is always embedded in-app.
+        vector = _embed_query(settings=settings, question=question) if settings.azure_openai_embed_deployment else None
+        with stage("search"):
+            payload = local.search(question=question, vector=vector, top_k=top_k, search_filter=search_filter)
+            return _parse_search_results(payload)
+
+    http = get_httpx_client()
+
+    vector = None
+    if not settings.use_search_vectorizer:
+        vector = _embed_query(settings=settings, question=question)
+
+    body = _search_body(settings=settings, question=question, top_k=top_k, vector=vector, search_filter=search_filter)
+    federation = get_search_federation()
+    if federation is not None:
+
+        def search_shard(shard: Shard) -> list[RetrievedChunk]:
+            resp = http.post(shard.url, headers=shard.headers(), json=body, timeout=shard.timeout)
+            resp.raise_for_status()
+            return _parse_search_results(resp.json())
+
+        with stage("search"):
+            return federation.search(search_shard, top_k=top_k)
+
+    with stage("search"):
+        resp = http.post(_search_url(settings), headers=_search_headers(settings), json=body)
+        resp.raise_for_status()
+        return _parse_search_results(resp.json())
+
+
+async def _afetch_chunks(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> list[RetrievedChunk]:
+    """Async `_fetch_chunks`."""
+
+    local = get_local_index()
+    if local is not None:
+        vector = None
+        if settings.azure_openai_embed_deployment:
+            vector = await _aembed_query(settings=settings, question=question)
+        # CPU-bound (NumPy releases the GIL for the heavy parts); keep it off the event loop.
+        with stage("search"):
+            payload = await asyncio.to_thread(
+                local.search, question=question, vector=vector, top_k=top_k, search_filter=search_filter
+            )
+            return _parse_search_results(payload)
+
+    http = get_async_httpx_client()
+
+    vector = None
+    if not settings.use_search_vectorizer:
+        vector = await _aembed_query(settings=settings, question=question)
+
+    body = _search_body(settings=settings, question=question, top_k=top_k, vector=vector, search_filter=search_filter)
+    federation = get_search_federation()
+    if federation is not None:
+
+        async def search_shard(shard: Shard) -> list[RetrievedChunk]:
+            resp = await http.post(shard.url, headers=shard.headers(), json=body)
+            resp.raise_for_status()
+            return _parse_search_results(resp.json())
+
+        with stage("search"):
+            return await federation.asearch(search_shard, top_k=top_k)
+
+    async def search() -> list[RetrievedChunk]:
+        resp = await http.post(_search_url(settings), headers=_search_headers(settings), json=body)
+        resp.raise_for_status()
+        return _parse_search_results(resp.json())
+
+    with stage("search"):
+        hedger = get_search_hedger()
+        return await (hedger.run(search) if hedger is not None else search())
+
+
+def _copy_results(results: Sequence[RetrievedChunk]) -> list[RetrievedChunk]:
+    """A fresh list per caller (results may be shared through the cache or single-flight), kept partial if it was."""
+
+    if isinstance(results, PartialResults):
+        return PartialResults(results, results.dropped)
+    return list(results)
+
+
+def retrieve_chunks(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> list[RetrievedChunk]:
+    """
+    Query Azure AI Search (or the local index when `LOCAL_INDEX_PATH` is set) and return the top chunks.
+
+    Concurrent calls for the same query share one upstream request (`app.singleflight`). With federated
+    Search (`app.federation`), results missing a shard come back as `PartialResults` and are not cached.
+    """
+
+    _check_embed_settings(settings)
+    # Computed once: a result fetched before an invalidation is stored under the generation it was read for.
+    key = retrieval_cache_key(settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+
+    with stage("retrieve"):
+        cache = get_retrieval_cache()
+        if cache is not None:
+            cached = cache.get(key)
+            note("retrieval_cache", "miss" if cached is None else "hit")
+            if cached is not None:
+                return list(cached)
+
+        def fetch() -> Sequence[RetrievedChunk]:
+            results = _fetch_chunks(settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+            if isinstance(results, PartialResults):
+                return results
+            results = tuple(results)
+            if cache is not None:
+                cache.set(key, results)
+            return results
+
+        return _copy_results(_coalesce(lambda: f"retrieve|{key}", fetch))
+
+
+async def aretrieve_chunks(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> list[RetrievedChunk]:
+    """Async variant of `retrieve_chunks`."""
+
+    _check_embed_settings(settings)
+    await arefresh_generation()
+    # Computed once: a result fetched before an invalidation is stored under the generation it was read for.
+    key = retrieval_cache_key(settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+
+    with stage("retrieve"):
+        cache = get_retrieval_cache()
+        if cache is not None:
+            cached = await aget(cache, key)
+            note("retrieval_cache", "miss" if cached is None else "hit")
+            if cached is not None:
+                return list(cached)
+
+        async def fetch() -> Sequence[RetrievedChunk]:
+            results = await _afetch_chunks(
+                settings=settings, question=question, top_k=top_k, search_filter=search_filter
+            )
+            if isinstance(results, PartialResults):
+                return results
+            results = tuple(results)
+            if cache is not None:
+                await aset(cache, key, results)
+            return results
+
+        return _copy_results(await _acoalesce(lambda: f"retrieve|{key}", fetch))
+
+
+async def awarm_search(settings: Settings) -> None:
+    """
+    Send a one-result query (`search=*`) to the index, or to every federated shard, to open pooled
+    connections before the first request (`app.lifecycle`). Nothing to do with a local index.
+    """
+
+    if get_local_index() is not None:
+        return
+    http = get_async_httpx_client()
+    body = {"search": "*", "top": 1, "select": "chunkId"}
+    targets = _search_targets(settings)
+    responses = await asyncio.gather(*(http.post(url, headers=headers, json=body) for url, headers in targets))
+    for resp in responses:
+        resp.raise_for_status()
+
+
+def _parent_version(chunks: list[tuple[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for chunk_id, content in sorted(chunks):
+        digest.update(f"{len(chunk_id)}:{chunk_id}{len(content)}:".encode())
+        digest.update(content.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+async def afetch_parent_versions(*, settings: Settings, parent_ids: Sequence[str]) -> dict[str, str]:
+    """
+    Content fingerprint of each parent document in `parent_ids`: a hash of its chunks' ids and content, so an
+    edited, re-chunked or partly removed document gets a new one. Parents no longer indexed are left out.
+
+    Queries the local index, or the index (every federated shard) with a `parentId` filter, paged by `chunkId`.
+    Used by `app.answer_index` to find the precomputed answers an indexer run made stale.
+    """
+
+    wanted = sorted({p for p in parent_ids if p})
+    chunks: dict[str, list[tuple[str, str]]] = defaultdict(list)
+    local = get_local_index()
+    if local is not None:
+
+        def read() -> None:
+            for i in local.parent_rows(wanted).tolist():
+                doc = local.document(i)
+                chunks[doc["parentId"]].append((doc.get("chunkId") or "", doc.get("content") or ""))
+
+        # Decoding the documents is CPU work; keep the event loop (and the requests in flight) free.
+        await asyncio.to_thread(read)
+        return {parent: _parent_version(c) for parent, c in chunks.items()}
+
+    http = get_async_httpx_client()
+    targets = _search_targets(settings)
+    for start in range(0, len(wanted), PARENT_FILTER_BATCH):
+        expression = odata_filter(SearchFilter(parent_ids=wanted[start : start + PARENT_FILTER_BATCH]))
+        for url, headers in targets:
+            skip = 0
+            while True:
+                body = {
+                    "search": "*",
+                    "filter": expression,
+                    "select": "chunkId,parentId,content",
+                    "orderby": "chunkId",
+                    "top": SEARCH_PAGE_SIZE,
+                    "skip": skip,
+                }
+                resp = await http.post(url, headers=headers, json=body)
+                resp.raise_for_status()
+                docs = resp.json().get("value", [])
+                for doc in docs:
+                    chunks[doc["parentId"]].append((doc.get("chunkId") or "", doc.get("content") or ""))
+                if len(docs) < SEARCH_PAGE_SIZE:
+                    break
+                skip += len(docs)
+    return {parent: _parent_version(c) for parent, c in chunks.items()}
+
+
+def _answer_cache_outcome(lookup: AnswerLookup) -> str:
+    if lookup.value is None:
+        return "miss"
+    # The embedding is only computed when the exact tier missed.
+    return "semantic_hit" if lookup.embedding is not None else "hit"
+
+
+def _answer_flight_key(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> str:
+    scope = answer_cache_scope(settings=settings, top_k=top_k, search_filter=search_filter)
+    return f"answer|{AnswerCache.key(scope=scope, question=question)}"
+
+
+def _generate(*, settings: Settings, question: str, chunks: list[RetrievedChunk]) -> str:
+    messages = _build_messages(question=question, chunks=chunks)
+    with stage("generate"):
+        oai = get_openai_client()
+        completion = oai.chat.completions.create(
+            model=settings.azure_openai_chat_deployment,
+            messages=messages,
+            temperature=0.2,
+        )
+    record_generation(messages=messages, chunks=len(chunks), usage=getattr(completion, "usage", None))
+    return completion.choices[0].message.content or ""
+
+
+async def _agenerate(
+    *, settings: Settings, question: str, chunks: list[RetrievedChunk], messages: list[dict[str, str]] | None = None
+) -> str:
+    messages = messages or _build_messages(question=question, chunks=chunks)
+    with stage("generate"):
+        oai = get_async_openai_client()
+        completion = await oai.chat.completions.create(
+            model=settings.azure_openai_chat_deployment,
+            messages=messages,
+            temperature=0.2,
+        )
+    record_generation(messages=messages, chunks=len(chunks), usage=getattr(completion, "usage", None))
+    return completion.choices[0].message.content or ""
+
+
+def answer_question(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> tuple[str, list[RetrievedChunk]]:
     """
     End-to-end RAG call: retrieve chunks, build context, generate answer.
 
+    Concurrent calls for the same (normalized) question share one retrieval + generation (`app.singleflight`).
+
     Returns:
-      (answer_text, retrieved_chunks)
+      (answer_text, context_chunks): the packed chunks, numbered [1], [2], ... in the prompt
     """
 
-    chunks = retrieve_chunks(settings=settings, question=question, top_k=top_k)
+    cache = get_answer_cache()
+    if cache is not None:
+        scope = answer_cache_scope(settings=settings, top_k=top_k, search_filter=search_filter)
+        embed = None
+        if settings.azure_openai_embed_deployment:
+            embed = partial(_embed_query, settings=settings, question=question)
+        lookup = cache.lookup(scope=scope, question=question, embed=embed)
+        note("answer_cache", _answer_cache_outcome(lookup))
+        if lookup.value is not None:
+            return lookup.value
 
-    context_blocks: list[str] = []
-    for i, c in enumerate(chunks, start=1):
-        title = c.title or "Untitled"
-        src = c.source_path or c.parent_id or "unknown"
-        # Bracket numbering enables easy citations in the generated answer, e.g. [1], [2].
-        context_blocks.append(f"[{i}] {title}\nSource: {src}\n{c.content}")
+    def run() -> tuple[str, list[RetrievedChunk]]:
+        retrieved = retrieve_chunks(settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+        with stage("pack"):
+            chunks = get_context_packer().pack(retrieved, question=question)
+        answer = _generate(settings=settings, question=question, chunks=chunks)
+        if cache is not None and not isinstance(retrieved, PartialResults):
+            cache.set(scope=scope, question=question, value=(answer, chunks), embedding=lookup.embedding)
+        return answer, chunks
+
+    key = partial(_answer_flight_key, settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+    answer, chunks = _coalesce(key, run)
+    return answer, list(chunks)
+
+
+def pack_for_deadline(
+    retrieved: list[RetrievedChunk], deadline: Deadline | None, *, question: str | None = None
+) -> tuple[list[RetrievedChunk], str | None]:
+    """
+    Pack `retrieved` for the prompt; with little time left before `deadline`, into a smaller token budget.
+
+    `question` enables context compression when it is configured (`app.context.SentenceCompressor`).
+
+    Returns `(chunks, degraded)`, where `degraded` is `"truncated_context"` when the smaller budget cut anything,
+    else `"partial_results"` when `retrieved` is missing federated Search shards (`app.federation`).
+    """
+
+    packer = get_context_packer()
+    chunks = packer.pack(retrieved, question=question)
+    partial = "partial_results" if isinstance(retrieved, PartialResults) else None
+    fraction = deadline.context_fraction() if deadline is not None else 1.0
+    if fraction >= 1.0:
+        return chunks, partial
+    # Re-fitting the packed chunks only trims the tail; merging/deduping already happened.
+    short = replace(packer, token_budget=max(1, int(packer.token_budget * fraction))).pack(chunks)
+    return short, "truncated_context" if short != chunks else partial
+
+
+async def aanswer_question(
+    *, settings: Settings, question: str, top_k: int, search_filter: SearchFilter | None = None
+) -> tuple[str, list[RetrievedChunk]]:
+    """
+    Async variant of `answer_question`.
+
+    Under a request deadline (`app.deadline`) the answer may be degraded: a truncated context, or only the
+    citations with an empty answer when generation cannot finish in time. Answers from results missing a
+    federated Search shard are reported as `partial_results` and not cached. The reason is left in the
+    deadline's `degraded` field. Raises `DeadlineExceeded` when retrieval itself misses its share.
+    """
+
+    await arefresh_generation()
+    cache = get_answer_cache()
+    if cache is not None:
+        scope = answer_cache_scope(settings=settings, top_k=top_k, search_filter=search_filter)
+        aembed = None
+        if settings.azure_openai_embed_deployment:
+            aembed = partial(_aembed_query, settings=settings, question=question)
+        lookup = await cache.alookup(scope=scope, question=question, aembed=aembed)
+        note("answer_cache", _answer_cache_outcome(lookup))
+        if lookup.value is not None:
+            return lookup.value
+
+    deadline = current_deadline()
+
+    async def run() -> tuple[str, list[RetrievedChunk], str | None]:
+        try:
+            retrieved = await within(
+                deadline.retrieval_budget() if deadline is not None else None,
+                aretrieve_chunks(settings=settings, question=question, top_k=top_k, search_filter=search_filter),
+            )
+        except TimeoutError:
+            raise DeadlineExceeded("retrieval did not finish within the request deadline") from None
+        with stage("pack"):
+            chunks, degraded = pack_for_deadline(retrieved, deadline, question=question)
+        try:
+            answer = await within(
+                deadline.remaining() if deadline is not None else None,
+                _agenerate(settings=settings, question=question, chunks=chunks),
+            )
+        except TimeoutError:
+            return "", chunks, "citations_only"
+        if cache is not None and degraded is None:
+            await cache.aset(scope=scope, question=question, value=(answer, chunks), embedding=lookup.embedding)
+        return answer, chunks, degraded
+
+    key = partial(_answer_flight_key, settings=settings, question=question, top_k=top_k, search_filter=search_filter)
+    answer, chunks, degraded = await _acoalesce(key, run)
+    if degraded is not None:
+        record_degraded(degraded)
+        if deadline is not None:
+            deadline.degraded = degraded
+    return answer, list(chunks)
 
-    context = "\n\n".join(context_blocks) if context_blocks else "(no matches)"
 
-    system = (
-        "You are a helpful assistant. Use the provided context to answer the user's question.\n"
-        "If the answer is not in the context, say you don't know and ask a follow-up question.\n"
-        "Cite sources by bracket number like [1], [2]."
+async def aprepare_session_turn(
+    *,
+    settings: Settings,
+    session_id: str | None,
+    question: str,
+    top_k: int,
+    search_filter: SearchFilter | None = None,
+) -> SessionTurn | None:
+    """
+    Prompt and context for the next turn of a session (`app.sessions`); None when sessions are disabled.
+
+    A `session_id` not issued by this process starts a new session; `turn.session.id` is the id to return.
+
+    Retrieves only when the context already sent does not cover `question`, or was retrieved under another
+    `search_filter`. Raises `DeadlineExceeded` when that retrieval misses its share of the request deadline.
+    """
+
+    manager = get_session_manager()
+    if manager is None:
+        return None
+    session = manager.get(session_id)
+    scope = (odata_filter(search_filter) if search_filter is not None else None) or ""
+    retrieved = None
+    if manager.needs_retrieval(session, question, scope):
+        deadline = current_deadline()
+        query = manager.retrieval_query(session, question)
+        try:
+            retrieved = await within(
+                deadline.retrieval_budget() if deadline is not None else None,
+                aretrieve_chunks(settings=settings, question=query, top_k=top_k, search_filter=search_filter),
+            )
+        except TimeoutError:
+            raise DeadlineExceeded("retrieval did not finish within the request deadline") from None
+    note("session", "reuse" if retrieved is None else "retrieve")
+    with stage("pack"):
+        return manager.prepare(
+            session,
+            question=question,
+            retrieved=retrieved,
+            packer=get_context_packer(),
+            system_prompt=SYSTEM_PROMPT,
+            scope=scope,
+        )
+
+
+async def aanswer_in_session(
+    *,
+    settings: Settings,
+    session_id: str | None,
+    question: str,
+    top_k: int,
+    search_filter: SearchFilter | None = None,
+) -> tuple[str, list[RetrievedChunk], str | None]:
+    """
+    `aanswer_question` for a follow-up in session `session_id`; falls back to it when sessions are disabled.
+
+    The answer cache and in-flight coalescing are bypassed: the answer depends on the conversation so far.
+    Returns the whole session context as chunks, since the answer may cite any of it, and the id of the
+    session (a fresh one when `session_id` was not issued here; None when sessions are disabled).
+    """
+
+    turn = await aprepare_session_turn(
+        settings=settings, session_id=session_id, question=question, top_k=top_k, search_filter=search_filter
     )
+    if turn is None:
+        answer, chunks = await aanswer_question(
+            settings=settings, question=question, top_k=top_k, search_filter=search_filter
+        )
+        return answer, chunks, None
+    deadline = current_deadline()
+    try:
+        answer = await within(
+            deadline.remaining() if deadline is not None else None,
+            _agenerate(settings=settings, question=question, chunks=turn.chunks, messages=turn.messages),
+        )
+    except TimeoutError:
+        record_degraded("citations_only")
+        if deadline is not None:
+            deadline.degraded = "citations_only"
+        return "", turn.chunks, turn.session.id
+    turn.commit(answer)
+    return answer, turn.chunks, turn.session.id
+
 
-    oai = get_openai_client()
-    completion = oai.chat.completions.create(
+async def astream_answer(
+    *,
+    settings: Settings,
+    question: str,
+    chunks: list[RetrievedChunk],
+    messages: list[dict[str, str]] | None = None,
+) -> AsyncIterator[str]:
+    """
+    Stream the answer for already-retrieved `chunks`, yielding text deltas as the model produces them.
+
+    Retrieval is deliberately not part of this call: the caller packs the `aretrieve_chunks` result with
+    `get_context_packer()`, sends it as citations right away, then forwards these deltas. Session turns pass
+    their prepared `messages` (`aprepare_session_turn`).
+    """
+
+    messages = messages or _build_messages(question=question, chunks=chunks)
+    record_generation(messages=messages, chunks=len(chunks))
+    oai = get_async_openai_client()
+    stream = await oai.chat.completions.create(
         model=settings.azure_openai_chat_deployment,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": f"Question:\n{question}\n\nContext:\n{context}"},
-        ],
+        messages=messages,
         temperature=0.2,
+        stream=True,
     )
 
-    answer = completion.choices[0].message.content or ""
-    return answer, chunks
-
+    async for event in stream:
+        # Azure sends a leading event with no choices (prompt filter results); skip anything without text.
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            yield delta
@@ -0,0 +1,206 @@
+"""
+Multi-turn chat sessions.
+
+Session ids are issued by the server: a request whose `session_id` was not issued here (or has expired or been
+evicted) starts a new session under a fresh, unguessable id, which the response returns. Later requests with
+that id continue the session instead of starting from scratch:
+  - retrieval reuse: when the context already sent covers the follow-up (at least
+    `SESSION_REUSE_COVERAGE` of its content words appear in it), no Search call is made
+  - delta retrieval: otherwise the follow-up is retrieved (with the previous question prepended, so
+    "what about its limits?" still finds the topic) and only chunks not sent before are packed, into
+    what is left of the context token budget; they continue the bracket numbering
+  - stable prompt prefix: the prompt is the system message followed by the session's earlier messages,
+    byte for byte, and then one new user message with the new context (if any) and the question. Each
+    turn therefore re-sends an identical prefix, which the model's prompt caching serves at a fraction of
+    the latency and input-token price
+
+When the budget is spent, the session reaches `SESSION_MAX_TURNS`, or a turn is scoped by a different
+search filter (`app.filters`) than the context was retrieved under, it rolls over: the next turn starts
+a fresh context and history (and a new prefix). Citations for a turn are the whole session context, so
+bracket numbers in any answer line up with them.
+
+Sessions live in a bounded in-process LRU (`SESSION_MAX_SESSIONS`, `SESSION_TTL_SECONDS`); with several
+workers, route a session to the same worker (or accept that a follow-up may land on a fresh session). If
+two turns of one session run concurrently, only the first to finish is recorded in the history.
+"""
+
+from __future__ import annotations
+
+import secrets
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .cache import LRUCache
+from .context import ContextPacker, content_words, format_block, get_tokenizer
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from .rag import RetrievedChunk
+
+
+@dataclass
+class Session:
+    """Conversation state; `messages` is everything after the system message, exactly as sent."""
+
+    id: str
+    chunks: list[RetrievedChunk] = field(default_factory=list)
+    messages: list[dict[str, str]] = field(default_factory=list)
+    seen: set[str] = field(default_factory=set)
+    vocabulary: set[str] = field(default_factory=set)
+    context_tokens: int = 0
+    turns: int = 0
+    last_question: str | None = None
+    # Search filter expression the context was retrieved under ("" = unscoped).
+    scope: str = ""
+    # Bumped on every recorded turn; a turn that started from an older version is not recorded.
+    version: int = 0
+
+    def coverage(self, question: str) -> float:
+        """Share of the question's content words present in the context already sent (0.0 when empty)."""
+
+        words = content_words(question)
+        if not self.chunks:
+            return 0.0
+        if not words:
+            return 1.0
+        return len(words & self.vocabulary) / len(words)
+
+    def size(self) -> int:
+        return sum(len(m["content"]) for m in self.messages)
+
+
+@dataclass
+class SessionTurn:
+    """A prepared turn: the prompt to send and the state to record once the answer is known."""
+
+    session: Session
+    question: str
+    messages: list[dict[str, str]]
+    chunks: list[RetrievedChunk]
+    new_chunks: list[RetrievedChunk]
+    new_tokens: int
+    reset: bool
+    version: int
+    scope: str = ""
+    store: LRUCache | None = None
+
+    def commit(self, answer: str) -> None:
+        """Append this turn (question, new context and answer) to the session history."""
+
+        session = self.session
+        if session.version != self.version:
+            return
+        if self.reset:
+            session.chunks, session.messages, session.seen, session.vocabulary = [], [], set(), set()
+            session.context_tokens = session.turns = 0
+        session.messages.extend([self.messages[-1], {"role": "assistant", "content": answer}])
+        session.chunks.extend(self.new_chunks)
+        session.seen.update(c.chunk_id for c in self.new_chunks)
+        for c in self.new_chunks:
+            session.vocabulary |= content_words(f"{c.title or ''} {c.content}")
+        session.context_tokens += self.new_tokens
+        session.turns += 1
+        session.last_question = self.question
+        session.scope = self.scope
+        session.version += 1
+        if self.store is not None:
+            # Re-set so the store re-weighs the session and refreshes its TTL.
+            self.store.set(session.id, session)
+
+
+def turn_message(*, question: str, new_chunks: list[RetrievedChunk], first_number: int) -> dict[str, str]:
+    """User message for one turn: context not sent before (numbered on from `first_number`), then the question."""
+
+    if not new_chunks:
+        return {"role": "user", "content": f"Question:\n{question}"}
+    blocks = "\n\n".join(format_block(i, c) for i, c in enumerate(new_chunks, start=first_number))
+    return {"role": "user", "content": f"Context:\n{blocks}\n\nQuestion:\n{question}"}
+
+
+class SessionManager:
+    """Session store plus the reuse/rollover policy; see the module docstring."""
+
+    def __init__(self, *, store: LRUCache, max_turns: int = 8, reuse_coverage: float = 0.8) -> None:
+        self.store = store
+        self.max_turns = max_turns
+        self.reuse_coverage = reuse_coverage
+
+    def get(self, session_id: str | None) -> Session:
+        """The session issued as `session_id`, else a new one; a client-chosen id never names a session."""
+
+        session = self.store.get(session_id) if session_id else None
+        return session or Session(id=secrets.token_urlsafe(24))
+
+    def rolls_over(self, session: Session, scope: str = "") -> bool:
+        return session.turns >= self.max_turns or (session.turns > 0 and session.scope != scope)
+
+    def needs_retrieval(self, session: Session, question: str, scope: str = "") -> bool:
+        return self.rolls_over(session, scope) or session.coverage(question) < self.reuse_coverage
+
+    def retrieval_query(self, session: Session, question: str) -> str:
+        return f"{session.last_question}\n{question}" if session.last_question else question
+
+    def prepare(
+        self,
+        session: Session,
+        *,
+        question: str,
+        retrieved: list[RetrievedChunk] | None,
+        packer: ContextPacker,
+        system_prompt: str,
+        scope: str = "",
+    ) -> SessionTurn:
+        """
+        Build the prompt for `question` on top of `session`.
+
+        `retrieved` is None when `needs_retrieval` said the context already sent is enough.
+        """
+
+        reset = self.rolls_over(session, scope)
+        new: list[RetrievedChunk] = []
+        if retrieved is not None:
+            fresh = retrieved if reset else [c for c in retrieved if c.chunk_id not in session.seen]
+            remaining = packer.token_budget - (0 if reset else session.context_tokens)
+            if fresh and remaining >= packer.min_block_tokens:
+                new = replace(packer, token_budget=remaining).pack(fresh, question=question)
+            if fresh and not new and not reset:
+                # Budget spent: start over with a fresh context rather than answer without the new chunks.
+                reset = True
+                new = packer.pack(retrieved, question=question)
+
+        base_chunks = [] if reset else session.chunks
+        base_messages = [] if reset else session.messages
+        tokenizer = packer.tokenizer or get_tokenizer(packer.encoding)
+        new_tokens = sum(tokenizer.count(format_block(i, c)) + 2 for i, c in enumerate(new, len(base_chunks) + 1))
+        message = turn_message(question=question, new_chunks=new, first_number=len(base_chunks) + 1)
+        return SessionTurn(
+            session=session,
+            question=question,
+            messages=[{"role": "system", "content": system_prompt}, *base_messages, message],
+            chunks=[*base_chunks, *new],
+            new_chunks=new,
+            new_tokens=new_tokens,
+            reset=reset,
+            version=session.version,
+            scope=scope,
+            store=self.store,
+        )
+
+
+@lru_cache
+def get_session_manager() -> SessionManager | None:
+    """Process-wide session manager, or None when `SESSION_MAX_SESSIONS=0` (the default; session ids are ignored)."""
+
+    settings = get_settings()
+    if settings.session_max_sessions == 0:
+        return None
+    store = LRUCache(
+        max_entries=settings.session_max_sessions,
+        ttl_seconds=settings.session_ttl_seconds,
+        max_bytes=settings.session_max_bytes,
+        weigh=Session.size,
+    )
+    return SessionManager(
+        store=store, max_turns=settings.session_max_turns, reuse_coverage=settings.session_reuse_coverage
+    )
@@ -7,20 +7,56 @@ This app is intentionally "12-factor": all runtime configuration comes from envi
 
 from __future__ import annotations
 
-from pydantic import Field
+from functools import lru_cache
+from typing import Literal
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class OpenAIDeployment(BaseModel):
+    """
+    One member of the Azure OpenAI deployment pool (`AZURE_OPENAI_DEPLOYMENTS`, a JSON list).
+
+    `tpm`/`rpm` are the deployment's quota; without them the router learns limits from the
+    `x-ratelimit-limit-*` response headers when the service sends them.
+    """
+
+    endpoint: str
+    deployment: str
+    kind: Literal["chat", "embeddings"] = "chat"
+    # Falls back to AZURE_OPENAI_API_KEY, then Azure AD auth.
+    api_key: str | None = None
+    tpm: int | None = Field(default=None, ge=1)
+    rpm: int | None = Field(default=None, ge=1)
+
+
+class SearchShard(BaseModel):
+    """
+    One index of a federated query (`AZURE_SEARCH_SHARDS`, a JSON list); it must have the `kb-index` schema.
+
+    `endpoint`/`api_key` fall back to AZURE_SEARCH_ENDPOINT/AZURE_SEARCH_API_KEY, `timeout_ms` to
+    SEARCH_SHARD_TIMEOUT_MS. `weight` scales the shard's contribution to the merged ranking.
+    """
+
+    index: str
+    endpoint: str | None = None
+    api_key: str | None = None
+    weight: float = Field(default=1.0, gt=0)
+    timeout_ms: float | None = Field(default=None, gt=0)
+
+
 class Settings(BaseSettings):
     """
     Strongly-typed configuration sourced from environment variables.
 
     Notes:
     - Values are read at instantiation time; do not create `Settings()` at import time.
+    - Instances are immutable; the app shares one snapshot (`get_settings`) until `reload_settings`.
     - `.env` is supported for local development only; in Azure, set env vars/secrets on the resource.
     """
 
-    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore", frozen=True)
 
     # Azure AI Search
     azure_search_endpoint: str = Field(alias="AZURE_SEARCH_ENDPOINT")
@@ -37,18 +73,177 @@ class Settings(BaseSettings):
     azure_openai_api_key: str | None = Field(default=None, alias="AZURE_OPENAI_API_KEY")
     azure_openai_embed_deployment: str | None = Field(default=None, alias="AZURE_OPENAI_EMBED_DEPLOYMENT")
 
+    # Deployment pool (possibly across regions): calls go to the least-loaded member with budget left and fail
+    # over on 429/5xx. A kind (chat/embeddings) without members uses the single endpoint/deployment above.
+    # When every member is saturated or cooling down, a call waits at most this long before failing.
+    azure_openai_deployments: list[OpenAIDeployment] = Field(default_factory=list, alias="AZURE_OPENAI_DEPLOYMENTS")
+    azure_openai_router_max_wait_seconds: float = Field(
+        default=10.0, ge=0, alias="AZURE_OPENAI_ROUTER_MAX_WAIT_SECONDS"
+    )
+
     # Retrieval mode:
     # - True: let Search vectorize query text using the index's configured vectorizer
     # - False: app embeds the query and sends the raw vector to Search
     use_search_vectorizer: bool = Field(default=True, alias="USE_SEARCH_VECTORIZER")
 
+    # Context packing between retrieval and generation: merge overlapping chunks of a document, drop
+    # near-duplicates (word-shingle Jaccard >= threshold), cap the context at a token budget.
+    context_token_budget: int = Field(default=6000, ge=1, alias="CONTEXT_TOKEN_BUDGET")
+    context_merge_overlaps: bool = Field(default=True, alias="CONTEXT_MERGE_OVERLAPS")
+    context_dedupe_threshold: float = Field(default=0.9, gt=0, le=1, alias="CONTEXT_DEDUPE_THRESHOLD")
+    context_tokenizer: str = Field(default="o200k_base", alias="CONTEXT_TOKENIZER")
+    # Extractive compression (app.context.SentenceCompressor): keep only the sentences that match the question,
+    # up to a per-chunk and (0: no limit besides the token budget) total character budget.
+    context_compression_enabled: bool = Field(default=False, alias="CONTEXT_COMPRESSION_ENABLED")
+    context_compression_chunk_chars: int = Field(default=600, ge=1, alias="CONTEXT_COMPRESSION_CHUNK_CHARS")
+    context_compression_total_chars: int = Field(default=0, ge=0, alias="CONTEXT_COMPRESSION_TOTAL_CHARS")
+
+    # Request deadlines (see `app.deadline`): default budget when the client sends none (unset: no deadline),
+    # share of the remaining budget retrieval may use, and the generation budget below which the context
+    # token budget shrinks proportionally.
+    request_timeout_ms: float | None = Field(default=None, gt=0, alias="REQUEST_TIMEOUT_MS")
+    deadline_retrieval_share: float = Field(default=0.3, gt=0, lt=1, alias="DEADLINE_RETRIEVAL_SHARE")
+    deadline_full_context_ms: float = Field(default=4000.0, ge=0, alias="DEADLINE_FULL_CONTEXT_MS")
+
+    # Hedged Search requests: send a duplicate once a call is slower than this percentile of recent ones.
+    search_hedge_enabled: bool = Field(default=False, alias="SEARCH_HEDGE_ENABLED")
+    search_hedge_percentile: float = Field(default=0.95, gt=0, lt=1, alias="SEARCH_HEDGE_PERCENTILE")
+    search_hedge_min_delay_ms: float = Field(default=20.0, ge=0, alias="SEARCH_HEDGE_MIN_DELAY_MS")
+
+    # Federated retrieval (see `app.federation`): query several indexes, possibly on several Search services,
+    # concurrently and merge the results (reciprocal-rank fusion or normalized scores). Empty = the single
+    # AZURE_SEARCH_INDEX above. A shard that has not answered within its timeout is left out of the merge.
+    azure_search_shards: list[SearchShard] = Field(default_factory=list, alias="AZURE_SEARCH_SHARDS")
+    search_shard_timeout_ms: float = Field(default=2000.0, gt=0, alias="SEARCH_SHARD_TIMEOUT_MS")
+    search_merge: Literal["rrf", "score"] = Field(default="rrf", alias="SEARCH_MERGE")
+    search_rrf_k: int = Field(default=60, ge=1, alias="SEARCH_RRF_K")
+
+    # Admission control (see `app.admission`): adaptive concurrency limit for the chat endpoints, with a bounded
+    # priority queue (interactive before batch) and 429 + Retry-After once the expected queue wait is too long.
+    admission_control_enabled: bool = Field(default=False, alias="ADMISSION_CONTROL_ENABLED")
+    admission_initial_limit: int = Field(default=32, ge=1, alias="ADMISSION_INITIAL_LIMIT")
+    admission_min_limit: int = Field(default=2, ge=1, alias="ADMISSION_MIN_LIMIT")
+    admission_max_limit: int = Field(default=256, ge=1, alias="ADMISSION_MAX_LIMIT")
+    admission_max_queue: int = Field(default=256, ge=0, alias="ADMISSION_MAX_QUEUE")
+    admission_max_queue_wait_ms: float = Field(default=2000.0, gt=0, alias="ADMISSION_MAX_QUEUE_WAIT_MS")
+    admission_batch_max_queue_wait_ms: float = Field(default=30000.0, gt=0, alias="ADMISSION_BATCH_MAX_QUEUE_WAIT_MS")
+    admission_latency_tolerance: float = Field(default=2.0, gt=1, alias="ADMISSION_LATENCY_TOLERANCE")
+
+    # Max concurrent questions per /chat/batch request.
+    batch_max_concurrency: int = Field(default=8, ge=1, alias="BATCH_MAX_CONCURRENCY")
+
+    # Shared secret for operational endpoints (e.g. POST /cache/invalidate); those endpoints are disabled when unset.
+    admin_api_key: str | None = Field(default=None, alias="ADMIN_API_KEY")
 
+    # Embedded retrieval backend: path to an `app.local_index` directory. When set, retrieve_chunks queries
+    # it in-process instead of Azure AI Search (query vectors need AZURE_OPENAI_EMBED_DEPLOYMENT, else BM25 only).
+    local_index_path: str | None = Field(default=None, alias="LOCAL_INDEX_PATH")
+    # Quantized (int8/binary) local indexes rescore this many times top_k candidates with the float32 originals.
+    local_index_oversampling: float = Field(default=4.0, ge=1.0, alias="LOCAL_INDEX_OVERSAMPLING")
+
+    # Cache storage for the answer/retrieval/embedding caches: "memory" (per process) or "sqlite" (one file
+    # shared by every worker process on the host, see app.shared_cache). The size/TTL settings apply to both.
+    cache_backend: Literal["memory", "sqlite"] = Field(default="memory", alias="CACHE_BACKEND")
+    cache_sqlite_path: str = Field(default="/tmp/rag-cache.sqlite3", alias="CACHE_SQLITE_PATH")
+
+    # Answer cache (in front of answer_question):
+    # - exact tier keyed on normalized question + top_k + deployment/index
+    # - semantic tier (requires AZURE_OPENAI_EMBED_DEPLOYMENT) when a cosine threshold is set
+    answer_cache_enabled: bool = Field(default=False, alias="ANSWER_CACHE_ENABLED")
+    answer_cache_max_entries: int = Field(default=1024, ge=1, alias="ANSWER_CACHE_MAX_ENTRIES")
+    answer_cache_max_bytes: int = Field(default=64 * 1024 * 1024, ge=1, alias="ANSWER_CACHE_MAX_BYTES")
+    answer_cache_ttl_seconds: float = Field(default=3600.0, gt=0, alias="ANSWER_CACHE_TTL_SECONDS")
+    answer_cache_semantic_threshold: float | None = Field(
+        default=None, gt=0, le=1, alias="ANSWER_CACHE_SEMANTIC_THRESHOLD"
+    )
+
+    # Precomputed answers for frequent questions (app.answer_index, built with `python -m app.answer_index build`),
+    # served by /chat for standalone, unfiltered requests with the top_k they were built for. A question matches
+    # on its normalized text, else (with AZURE_OPENAI_EMBED_DEPLOYMENT) the nearest stored question above the
+    # cosine threshold (0 disables that lookup). Entries citing documents an indexer run changed are recomputed
+    # in the background.
+    answer_index_path: str | None = Field(default=None, alias="ANSWER_INDEX_PATH")
+    answer_index_semantic_threshold: float = Field(default=0.95, ge=0, le=1, alias="ANSWER_INDEX_SEMANTIC_THRESHOLD")
+    answer_index_refresh_enabled: bool = Field(default=True, alias="ANSWER_INDEX_REFRESH_ENABLED")
+
+    # Multi-turn sessions (requests with a `session_id`, see app.sessions): bounded in-process store
+    # (0 sessions, the default, disables them), turns before a session starts a fresh context, and the share of a
+    # follow-up's content words the context already sent must contain for it to be answered without a new retrieval.
+    session_max_sessions: int = Field(default=0, ge=0, alias="SESSION_MAX_SESSIONS")
+    session_max_bytes: int = Field(default=64 * 1024 * 1024, ge=1, alias="SESSION_MAX_BYTES")
+    session_ttl_seconds: float = Field(default=1800.0, gt=0, alias="SESSION_TTL_SECONDS")
+    session_max_turns: int = Field(default=8, ge=1, alias="SESSION_MAX_TURNS")
+    session_reuse_coverage: float = Field(default=0.8, gt=0, le=1, alias="SESSION_REUSE_COVERAGE")
+
+    # Coalesce concurrent identical answer_question/retrieve_chunks calls into one upstream execution.
+    single_flight_enabled: bool = Field(default=True, alias="SINGLE_FLIGHT_ENABLED")
+
+    # Retrieval cache (retrieve_chunks results keyed on the Search query body)
+    retrieval_cache_enabled: bool = Field(default=False, alias="RETRIEVAL_CACHE_ENABLED")
+    retrieval_cache_max_entries: int = Field(default=4096, ge=1, alias="RETRIEVAL_CACHE_MAX_ENTRIES")
+    retrieval_cache_max_bytes: int = Field(default=128 * 1024 * 1024, ge=1, alias="RETRIEVAL_CACHE_MAX_BYTES")
+    retrieval_cache_ttl_seconds: float = Field(default=3600.0, gt=0, alias="RETRIEVAL_CACHE_TTL_SECONDS")
+
+    # Query embeddings (only used when USE_SEARCH_VECTORIZER=false or by the semantic answer cache):
+    # - cache size in vectors (0 disables)
+    # - micro-batching window for concurrent requests (0 disables) and max inputs per embeddings call
+    embedding_cache_max_entries: int = Field(default=2048, ge=0, alias="EMBEDDING_CACHE_MAX_ENTRIES")
+    embedding_batch_window_ms: float = Field(default=0.0, ge=0, alias="EMBEDDING_BATCH_WINDOW_MS")
+    embedding_batch_max_size: int = Field(default=64, ge=1, le=2048, alias="EMBEDDING_BATCH_MAX_SIZE")
+
+    # Telemetry: Prometheus histograms on GET /metrics, per-stage durations in a `Server-Timing` response
+    # header, and OpenTelemetry spans (needs opentelemetry-sdk + the OTLP exporter; configured via OTEL_* vars).
+    metrics_enabled: bool = Field(default=True, alias="METRICS_ENABLED")
+    server_timing_enabled: bool = Field(default=True, alias="SERVER_TIMING_ENABLED")
+    otel_tracing_enabled: bool = Field(default=False, alias="OTEL_TRACING_ENABLED")
+
+    # Indexer watcher: polls the indexer status and invalidates caches after each completed run.
+    # Polling needs an admin key (AZURE_SEARCH_API_KEY); set the interval to 0 to disable it.
+    azure_search_indexer: str = Field(default="kb-indexer", alias="AZURE_SEARCH_INDEXER")
+    indexer_poll_seconds: float = Field(default=60.0, ge=0, alias="INDEXER_POLL_SECONDS")
+
+    # Outbound HTTP (app.clients): one pool per process, shared by Search calls and the OpenAI clients. HTTP/2
+    # multiplexes concurrent requests over few connections; it needs the `h2` package (httpx[http2]) and falls
+    # back to HTTP/1.1 without it. `HTTP_TIMEOUT_SECONDS` bounds reads/writes; OpenAI calls keep the SDK's own.
+    http2_enabled: bool = Field(default=True, alias="HTTP2_ENABLED")
+    http_max_connections: int = Field(default=100, ge=1, alias="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(default=20, ge=0, alias="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    http_keepalive_expiry_seconds: float = Field(default=30.0, ge=0, alias="HTTP_KEEPALIVE_EXPIRY_SECONDS")
+    http_connect_timeout_seconds: float = Field(default=5.0, gt=0, alias="HTTP_CONNECT_TIMEOUT_SECONDS")
+    http_timeout_seconds: float = Field(default=30.0, gt=0, alias="HTTP_TIMEOUT_SECONDS")
+    http_pool_timeout_seconds: float = Field(default=5.0, gt=0, alias="HTTP_POOL_TIMEOUT_SECONDS")
+    # Retries of idempotent requests (GETs and Search queries) after connection errors and 429/502/503/504:
+    # exponential backoff with full jitter; a Retry-After beyond the max backoff, or the deadline, stops them.
+    http_retries: int = Field(default=2, ge=0, alias="HTTP_RETRIES")
+    http_retry_backoff_ms: float = Field(default=100.0, ge=0, alias="HTTP_RETRY_BACKOFF_MS")
+    http_retry_max_backoff_ms: float = Field(default=2000.0, ge=0, alias="HTTP_RETRY_MAX_BACKOFF_MS")
+
+    # Startup warmup (app.lifecycle): build clients and caches, acquire tokens and open connections before
+    # GET /healthz/ready reports ready. Each step is abandoned after the timeout.
+    warmup_enabled: bool = Field(default=True, alias="WARMUP_ENABLED")
+    warmup_timeout_seconds: float = Field(default=15.0, gt=0, alias="WARMUP_TIMEOUT_SECONDS")
+
+
+@lru_cache
 def get_settings() -> Settings:
     """
-    Small indirection to centralize settings creation.
+    Process-wide settings snapshot, read from the environment (and `.env`) on first use.
 
-    Tests can monkeypatch `app.main.get_settings` (or env vars) without needing a global singleton.
+    Tests can monkeypatch `app.main.get_settings`, or set env vars and clear the cache.
     """
 
     return Settings()
 
+
+def reload_settings() -> Settings:
+    """
+    Read the environment again and replace the snapshot.
+
+    The new values are validated first, so an invalid environment raises and leaves the current snapshot
+    in place. Components already built from the old snapshot keep it; see `app.lifecycle.reload`.
+    """
+
+    Settings()
+    get_settings.cache_clear()
+    return get_settings()
+
@@ -0,0 +1,395 @@
+"""
+Cross-process cache backend for multi-worker deployments (`CACHE_BACKEND=sqlite`).
+
+With `uvicorn --workers N` every process has its own in-memory caches, so hit rates drop by the worker
+count and memory is duplicated. `SQLiteCache` implements the `CacheBackend` protocol on a SQLite file
+shared by all workers on the host (`CACHE_SQLITE_PATH`; put it on local disk or tmpfs, not a network
+share):
+  - WAL journal mode: readers never block each other or the writer, and writes from several processes
+    are serialized by SQLite's file locks (`busy_timeout` waits out short contention)
+  - one table for every cache, partitioned by `namespace` (answer / retrieval / embedding); the entry
+    count and byte total per namespace are maintained by triggers, so bounds are checked without scans
+  - LRU eviction on `used_at`, bounded by `max_entries` and `max_bytes` (serialized value size); reads
+    refresh `used_at` at most once per `touch_seconds`, so a hot key costs one write per second, not
+    one per hit
+  - TTL expiry on wall-clock time (monotonic clocks are per process)
+  - the invalidation generation that every cache key embeds (`app.cache.index_generation`) is a row of
+    the `meta` table (`SharedGeneration`), so an invalidation in one worker is seen by all of them (within
+    a second: the value is cached in memory)
+
+Values are stored in a compact binary format (`encode_value` / `decode_value`) instead of pickle:
+float32 embeddings as raw little-endian bytes (decoded zero-copy into read-only arrays), and
+`RetrievedChunk` fields as length-prefixed UTF-8 with a presence byte for the optional ones.
+
+Every call is synchronous file I/O; the async request paths run them in a worker thread (`app.cache.aget`
+/ `aset`), so a slow disk or a held write lock does not stall the event loop. The cache is best effort:
+if the database is locked past the timeout or otherwise unusable, `get` reports a miss and `set` drops
+the value rather than failing the request.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from .cache import CacheStats
+from .rag import RetrievedChunk
+
+
+logger = logging.getLogger(__name__)
+
+_TAG_VECTOR = b"v"
+_TAG_CHUNKS = b"c"
+_TAG_ANSWER = b"a"
+
+_U32 = struct.Struct("<I")
+_F64 = struct.Struct("<d")
+_NONE = 0xFFFFFFFF
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, used_at);
+CREATE TABLE IF NOT EXISTS usage (
+    namespace TEXT PRIMARY KEY,
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE usage SET entries = entries + 1, bytes = bytes + new.size WHERE namespace = new.namespace;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE usage SET entries = entries - 1, bytes = bytes - old.size WHERE namespace = old.namespace;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+    UPDATE usage SET bytes = bytes + new.size - old.size WHERE namespace = new.namespace;
+END;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('generation', 0);
+"""
+
+
+def _connect(path: str, busy_timeout_ms: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _put_str(out: list[bytes], value: str | None) -> None:
+    if value is None:
+        out.append(_U32.pack(_NONE))
+        return
+    data = value.encode()
+    out.append(_U32.pack(len(data)))
+    out.append(data)
+
+
+def _put_chunks(out: list[bytes], chunks) -> None:
+    out.append(_U32.pack(len(chunks)))
+    for c in chunks:
+        _put_str(out, c.chunk_id)
+        _put_str(out, c.title)
+        _put_str(out, c.content)
+        _put_str(out, c.source_path)
+        _put_str(out, c.parent_id)
+        for score in (c.score, c.reranker_score):
+            if score is None:
+                out.append(b"\x00")
+            else:
+                out.append(b"\x01")
+                out.append(_F64.pack(score))
+
+
+def encode_value(value: Any) -> bytes:
+    """Serialize a cached value: an embedding, a sequence of chunks, or an `(answer, chunks)` pair."""
+
+    if isinstance(value, np.ndarray):
+        vec = np.ascontiguousarray(value, dtype="<f4").ravel()
+        return b"".join([_TAG_VECTOR, _U32.pack(vec.shape[0]), vec.tobytes()])
+    out: list[bytes] = []
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], str):
+        out.append(_TAG_ANSWER)
+        _put_str(out, value[0])
+        _put_chunks(out, value[1])
+    elif isinstance(value, list | tuple) and all(isinstance(c, RetrievedChunk) for c in value):
+        out.append(_TAG_CHUNKS)
+        _put_chunks(out, value)
+    else:
+        raise TypeError(f"cannot serialize {type(value).__name__} for the shared cache")
+    return b"".join(out)
+
+
+class _Reader:
+    def __init__(self, data: bytes, offset: int) -> None:
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def u32(self) -> int:
+        (n,) = _U32.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return n
+
+    def str(self) -> str | None:
+        n = self.u32()
+        if n == _NONE:
+            return None
+        text = str(self.data[self.offset : self.offset + n], "utf-8")
+        self.offset += n
+        return text
+
+    def score(self) -> float | None:
+        present = self.data[self.offset]
+        self.offset += 1
+        if not present:
+            return None
+        (x,) = _F64.unpack_from(self.data, self.offset)
+        self.offset += 8
+        return x
+
+    def chunks(self) -> list[RetrievedChunk]:
+        return [
+            RetrievedChunk(
+                chunk_id=self.str(),
+                title=self.str(),
+                content=self.str(),
+                source_path=self.str(),
+                parent_id=self.str(),
+                score=self.score(),
+                reranker_score=self.score(),
+            )
+            for _ in range(self.u32())
+        ]
+
+
+def decode_value(data: bytes) -> Any:
+    """Inverse of `encode_value`; embeddings come back as read-only float32 arrays over `data`."""
+
+    tag = data[:1]
+    if tag == _TAG_VECTOR:
+        (dim,) = _U32.unpack_from(data, 1)
+        return np.frombuffer(data, dtype="<f4", count=dim, offset=5)
+    reader = _Reader(data, 1)
+    if tag == _TAG_CHUNKS:
+        return tuple(reader.chunks())
+    if tag == _TAG_ANSWER:
+        answer = reader.str()
+        return answer, reader.chunks()
+    raise ValueError(f"unknown shared cache value tag {tag!r}")
+
+
+class SQLiteCache:
+    """`CacheBackend` over a SQLite file shared by the worker processes on a host; see the module docstring."""
+
+    # Reads and writes are file I/O that may wait out `busy_timeout_ms`: async callers run them in a thread.
+    blocking = True
+
+    def __init__(
+        self,
+        *,
+        path: str,
+        namespace: str,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+        max_bytes: int | None = None,
+        touch_seconds: float = 1.0,
+        busy_timeout_ms: int = 200,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.touch_seconds = touch_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self.stats = CacheStats()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross a fork: a worker forked from a parent that already opened one reconnects.
+        if self._conn is None or self._pid != os.getpid():
+            conn = _connect(self.path, self.busy_timeout_ms)
+            conn.execute("INSERT OR IGNORE INTO usage VALUES (?, 0, 0)", (self.namespace,))
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                row = self._connection().execute(
+                    "SELECT entries FROM usage WHERE namespace = ?", (self.namespace,)
+                ).fetchone()
+            except sqlite3.Error:
+                logger.warning("shared cache unavailable", exc_info=True)
+                return 0
+        return row[0] if row else 0
+
+    def get(self, key: str) -> Any | None:
+        now = self._clock()
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires_at, used_at FROM entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                ).fetchone()
+                if row is not None and row[1] is not None and row[1] <= now:
+                    conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                    row = None
+                elif row is not None and now - row[2] >= self.touch_seconds:
+                    conn.execute(
+                        "UPDATE entries SET used_at = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+                    )
+            except sqlite3.Error:
+                logger.warning("shared cache read failed", exc_info=True)
+                row = None
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        return decode_value(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        data = encode_value(value)
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            # Larger than the whole budget: caching it would just flush everything else.
+            return
+        now = self._clock()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            try:
+                conn = self._connection()
+                # IMMEDIATE: take the write lock upfront so the bound check and eviction see a stable total.
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(
+                        "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET "
+                        "value = excluded.value, size = excluded.size, expires_at = excluded.expires_at, "
+                        "used_at = excluded.used_at",
+                        (self.namespace, key, data, len(data), expires_at, now),
+                    )
+                    self._evict(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error:
+                logger.warning("shared cache write failed", exc_info=True)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        while True:
+            entries, size = conn.execute(
+                "SELECT entries, bytes FROM usage WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            excess = entries - self.max_entries
+            if self.max_bytes is not None and size > self.max_bytes:
+                excess = max(excess, 1)
+            if excess <= 0:
+                return
+            deleted = conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key IN "
+                "(SELECT key FROM entries WHERE namespace = ? ORDER BY used_at LIMIT ?)",
+                (self.namespace, self.namespace, excess),
+            ).rowcount
+            self.stats.evictions += deleted
+            if not deleted:
+                return
+
+    def clear(self) -> None:
+        with self._lock:
+            try:
+                self._connection().execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+            except sqlite3.Error:
+                logger.warning("shared cache clear failed", exc_info=True)
+
+
+class SharedGeneration:
+    """
+    The cache invalidation generation (`app.cache.index_generation`) kept in the shared database, so every
+    worker, including one started after an invalidation or a CLI process, builds keys with the same one.
+
+    The value read is kept for `ttl_seconds`, so building keys rarely touches the database; another worker's
+    invalidation is seen within that time (this process's own at once). If the database cannot be read, the
+    last generation read is used.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str,
+        ttl_seconds: float = 1.0,
+        busy_timeout_ms: int = 200,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._last = 0
+        self._expires_at = -math.inf
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn, self._pid = _connect(self.path, self.busy_timeout_ms), os.getpid()
+        return self._conn
+
+    def fresh(self) -> bool:
+        """True while `get` answers from memory."""
+
+        return self._clock() < self._expires_at
+
+    def get(self) -> int:
+        if self.fresh():
+            return self._last
+        with self._lock:
+            try:
+                (self._last,) = self._connection().execute(
+                    "SELECT value FROM meta WHERE name = 'generation'"
+                ).fetchone()
+            except sqlite3.Error:
+                logger.warning("shared cache generation unavailable", exc_info=True)
+            self._expires_at = self._clock() + self.ttl_seconds
+            return self._last
+
+    def bump(self) -> int:
+        """Start a new generation for every process sharing the database; returns it."""
+
+        with self._lock:
+            try:
+                (self._last,) = self._connection().execute(
+                    "UPDATE meta SET value = value + 1 WHERE name = 'generation' RETURNING value"
+                ).fetchone()
+            except sqlite3.Error:
+                logger.warning("shared cache generation bump failed", exc_info=True)
+            self._expires_at = self._clock() + self.ttl_seconds
+            return self._last
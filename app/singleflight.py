@@ -0,0 +1,135 @@
+"""
+In-flight request coalescing ("single flight").
+
+When many identical questions arrive at once, only the first caller for a key (the leader) runs the
+upstream work; concurrent callers with the same key (followers) wait for and share its outcome:
+  - the leader's return value, or
+  - the leader's exception, re-raised in every follower
+
+Nothing is kept after the call completes (that is the caches' job); a caller arriving afterwards starts
+a new flight.
+
+`SingleFlight.do` serves the sync code path (threads), `SingleFlight.ado` the async one. In the async
+path the work runs in its own task, so cancelling one waiter never cancels the work the others are
+waiting for; the task is only cancelled once every waiter is gone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, TypeVar
+
+from .settings import get_settings
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    value: Any = None
+    error: BaseException | None = None
+    # The leader died of something other than an Exception (KeyboardInterrupt, SystemExit, ...):
+    # followers retry on their own instead of inheriting it.
+    abandoned: bool = False
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls by key; see the module docstring."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._flights: dict[str, _Flight] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Run `fn()` once for all concurrent callers with `key`. Returns `(value, shared)`."""
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if not leader:
+                call.done.wait()
+                if call.abandoned:
+                    continue
+                if call.error is not None:
+                    raise call.error
+                return call.value, True
+
+            try:
+                call.value = fn()
+            except Exception as exc:
+                call.error = exc
+                raise
+            except BaseException:
+                call.abandoned = True
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.value, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Async `do`: await `fn()` once for all concurrent callers with `key`. Returns `(value, shared)`."""
+
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(key)
+        # A flight from another event loop (e.g. a finished `asyncio.run`) cannot be awaited here.
+        shared = flight is not None and flight.task.get_loop() is loop and not flight.task.done()
+        if not shared:
+            flight = _Flight(task=loop.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(key, task))
+
+        flight.waiters += 1
+        try:
+            # shield: a cancelled waiter must not cancel the work other waiters share.
+            value = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.cancelled() and not _current_task_cancelling():
+                # The work itself was cancelled (e.g. by a shutting-down client library) rather than this
+                # caller; callers see it as a failure, not as their own cancellation.
+                raise RuntimeError(f"coalesced call {key!r} was cancelled") from None
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to receive the result.
+                flight.task.cancel()
+                self._forget(key, flight.task)
+        return value, shared
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        flight = self._flights.get(key)
+        if flight is not None and flight.task is task:
+            del self._flights[key]
+
+
+def _current_task_cancelling() -> bool:
+    task = asyncio.current_task()
+    return task is not None and task.cancelling() > 0
+
+
+@lru_cache
+def get_single_flight() -> SingleFlight | None:
+    """Process-wide coalescer for the RAG entrypoints, or None when `SINGLE_FLIGHT_ENABLED` is off."""
+
+    if not get_settings().single_flight_enabled:
+        return None
+    return SingleFlight()
@@ -0,0 +1,360 @@
+"""
+Request telemetry: per-stage timers, Prometheus metrics, `Server-Timing` and optional OpenTelemetry spans.
+
+The RAG code marks its stages with `stage("search")`-style context managers. Each stage is timed once
+with `perf_counter` and the duration goes to:
+  - the `rag_stage_duration_seconds{stage=...}` histogram (when `METRICS_ENABLED`)
+  - the current request's `RequestTimings`, which `TelemetryMiddleware` renders as a `Server-Timing`
+    header (when `SERVER_TIMING_ENABLED`)
+  - an OpenTelemetry span (only when `OTEL_TRACING_ENABLED` and the SDK/exporter packages are installed)
+
+Stages: `queue` (waiting for an admission slot), `embed` (query vectorization), `search` (Search POST or
+local index), `retrieve` (all of retrieval, including cache lookups), `pack`, `generate` (chat completion;
+for streams, until the last delta), `first_token` (streams only), `serialize` (response body).
+
+Token usage, prompt size and context chunk count are recorded per completion, and calls made through
+the Azure OpenAI deployment pool are counted per member and outcome. Cache hit/miss counters
+are read from the caches' own stats at scrape time, so the hot path pays nothing extra for them.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .settings import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Duration of RAG pipeline stages.", ["stage"], buckets=_LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request duration until the response is complete.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS = Counter("rag_tokens", "Chat completion tokens reported by the service.", ["kind"])
+PROMPT_CHARS = Histogram(
+    "rag_prompt_chars",
+    "Size of the chat prompt (system + user messages) in characters.",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+CONTEXT_CHUNKS = Histogram(
+    "rag_context_chunks", "Context blocks sent to the model after packing.", buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50)
+)
+HEDGES = Counter("rag_search_hedges", "Duplicate Search requests sent, and how many of them won.", ["outcome"])
+SHARD_CALLS = Counter("rag_search_shard_calls", "Federated Search calls per shard.", ["shard", "outcome"])
+DEGRADED = Counter(
+    "rag_degraded_answers", "Answers cut short by the request deadline or missing Search shards.", ["reason"]
+)
+SHED = Counter("rag_admission_shed", "Requests rejected by admission control.", ["priority", "reason"])
+UPSTREAM_CALLS = Counter(
+    "aoai_router_calls", "Azure OpenAI calls made by the deployment router.", ["deployment", "outcome"]
+)
+HTTP_RETRIES = Counter("rag_http_retries", "Outbound HTTP requests retried, by cause.", ["client", "reason"])
+
+
+@dataclass
+class RequestTimings:
+    """Stage durations (seconds) and notes (e.g. cache outcomes) collected during one request."""
+
+    start: float = field(default_factory=time.perf_counter)
+    stages: dict[str, float] = field(default_factory=dict)
+    notes: dict[str, str] = field(default_factory=dict)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts += [f'{name};desc="{value}"' for name, value in self.notes.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+@dataclass(frozen=True)
+class Telemetry:
+    metrics_enabled: bool = True
+    server_timing_enabled: bool = True
+    tracer: Any = None
+    # Set when this process configured the OpenTelemetry SDK; flushed on shutdown.
+    tracer_provider: Any = None
+
+    def shutdown(self) -> None:
+        if self.tracer_provider is not None:
+            self.tracer_provider.shutdown()
+
+
+def _build_tracer() -> tuple[Any, Any]:
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "OTEL_TRACING_ENABLED is set but opentelemetry-sdk / opentelemetry-exporter-otlp-proto-http "
+            "are not installed; tracing disabled"
+        )
+        return None, None
+
+    # Endpoint, headers and service name come from the standard OTEL_* environment variables.
+    provider = TracerProvider(resource=Resource.create())
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("app"), provider
+
+
+@lru_cache
+def get_telemetry() -> Telemetry:
+    """Process-wide telemetry configuration from settings."""
+
+    settings = get_settings()
+    tracer, provider = _build_tracer() if settings.otel_tracing_enabled else (None, None)
+    return Telemetry(
+        metrics_enabled=settings.metrics_enabled,
+        server_timing_enabled=settings.server_timing_enabled,
+        tracer=tracer,
+        tracer_provider=provider,
+    )
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Record a stage timed by the caller (e.g. across the yields of a generator, where spans can't follow)."""
+
+    if get_telemetry().metrics_enabled:
+        STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as pipeline stage `name`."""
+
+    tracer = get_telemetry().tracer
+    span = tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+    start = time.perf_counter()
+    try:
+        with span:
+            yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def note(name: str, value: str) -> None:
+    """Attach a per-request annotation (shown in `Server-Timing` as `name;desc="value"`)."""
+
+    timings = _current.get()
+    if timings is not None:
+        timings.notes[name] = value
+    if get_telemetry().tracer is not None:
+        from opentelemetry import trace
+
+        trace.get_current_span().set_attribute(f"rag.{name}", value)
+
+
+def record_generation(*, messages: list[dict[str, str]], chunks: int, usage: Any = None) -> None:
+    """Prompt size, context chunk count and (when the response carries it) token usage of one completion."""
+
+    if not get_telemetry().metrics_enabled:
+        return
+    PROMPT_CHARS.observe(sum(len(m["content"]) for m in messages))
+    CONTEXT_CHUNKS.observe(chunks)
+    if usage is not None:
+        TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+        TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+        # Prompt tokens served from the service's prompt cache (a stable prefix, e.g. session turns).
+        details = getattr(usage, "prompt_tokens_details", None)
+        TOKENS.labels("cached_prompt").inc(getattr(details, "cached_tokens", 0) or 0)
+
+
+def record_hedge(outcome: str) -> None:
+    if get_telemetry().metrics_enabled:
+        HEDGES.labels(outcome).inc()
+
+
+def record_shard_call(shard: str, outcome: str) -> None:
+    """One federated Search call: `ok`, `timeout` (dropped from the merge) or `error`."""
+
+    if get_telemetry().metrics_enabled:
+        SHARD_CALLS.labels(shard, outcome).inc()
+
+
+def record_http_retry(client: str, reason: str) -> None:
+    """One retried outbound request; `reason` is the status code or the transport error's class name."""
+
+    if get_telemetry().metrics_enabled:
+        HTTP_RETRIES.labels(client, reason).inc()
+
+
+def record_degraded(reason: str) -> None:
+    """
+    An answer degraded to meet its deadline (`truncated_context` or `citations_only`), or built without
+    some federated Search shards (`partial_results`).
+    """
+
+    note("deadline", reason)
+    if get_telemetry().metrics_enabled:
+        DEGRADED.labels(reason).inc()
+
+
+def record_shed(priority: str, reason: str) -> None:
+    """A request shed by admission control (`wait`, `queue_full`, `evicted` or `timeout`)."""
+
+    note("admission", f"shed:{reason}")
+    if get_telemetry().metrics_enabled:
+        SHED.labels(priority, reason).inc()
+
+
+def record_upstream_call(deployment: str, outcome: str) -> None:
+    """One routed Azure OpenAI call: `ok`, `failover` (429/5xx/connection error) or `error`."""
+
+    if get_telemetry().metrics_enabled:
+        UPSTREAM_CALLS.labels(deployment, outcome).inc()
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware: one `RequestTimings` per HTTP request, a `Server-Timing` header on the response
+    and the `http_request_duration_seconds` histogram.
+
+    The timings object is also left in `scope["state"]["timings"]`, so an outer ASGI wrapper (the
+    benchmark suite) can read stages recorded after the headers went out, like streamed generation.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        telemetry = get_telemetry()
+        timings = RequestTimings()
+        scope.setdefault("state", {})["timings"] = timings
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if telemetry.server_timing_enabled:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        span = (
+            telemetry.tracer.start_as_current_span(f"{scope['method']} {scope['path']}")
+            if telemetry.tracer is not None
+            else nullcontext()
+        )
+        try:
+            with span:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if telemetry.metrics_enabled:
+                # Route templates, not raw paths, keep label cardinality bounded.
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(
+                    time.perf_counter() - timings.start
+                )
+
+
+class _CacheCollector:
+    """Exports the caches' hit/miss/eviction counters and sizes when `/metrics` is scraped."""
+
+    def describe(self):
+        # Registering must not build the caches (settings may not be available at import time).
+        return []
+
+    def collect(self):
+        from .cache import cache_stats
+        from .embeddings import get_embedding_cache
+
+        stats = cache_stats()
+        embeddings = get_embedding_cache()
+        if embeddings is not None:
+            stats["embedding"] = {**embeddings.stats.as_dict(), "entries": len(embeddings)}
+
+        events = CounterMetricFamily("rag_cache_events", "Cache lookups by outcome.", labels=["cache", "outcome"])
+        evictions = CounterMetricFamily("rag_cache_evictions", "Entries evicted for space.", labels=["cache"])
+        entries = GaugeMetricFamily("rag_cache_entries", "Entries currently cached.", labels=["cache"])
+        for name, s in stats.items():
+            events.add_metric([name, "hit"], s["hits"] - s["semantic_hits"])
+            events.add_metric([name, "semantic_hit"], s["semantic_hits"])
+            events.add_metric([name, "miss"], s["misses"])
+            evictions.add_metric([name], s["evictions"])
+            entries.add_metric([name], s["entries"])
+        yield from (events, evictions, entries)
+
+
+class _AdmissionCollector:
+    """Exports the admission controller's queue depth, in-flight count and current limit at scrape time."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        from .admission import get_admission_controller
+
+        controller = get_admission_controller()
+        if controller is None:
+            return
+        depth = GaugeMetricFamily("rag_admission_queue_depth", "Requests waiting for a slot.", labels=["priority"])
+        for priority, count in controller.queue_depth().items():
+            depth.add_metric([priority], count)
+        yield depth
+        yield GaugeMetricFamily("rag_admission_in_flight", "Requests holding a slot.", value=controller.in_flight)
+        yield GaugeMetricFamily("rag_admission_limit", "Current adaptive concurrency limit.", value=controller.limit)
+
+
+class _HttpPoolCollector:
+    """Exports the shared HTTP clients' pool utilization (connections by state, queued requests) at scrape time."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        from .clients import http_pool_stats
+
+        stats = http_pool_stats()
+        if not stats:
+            return
+        connections = GaugeMetricFamily(
+            "rag_http_pool_connections", "Pooled connections by state.", labels=["client", "state"]
+        )
+        waiting = GaugeMetricFamily("rag_http_pool_waiting", "Requests waiting for a connection.", labels=["client"])
+        for client, s in stats.items():
+            connections.add_metric([client, "active"], s["active"])
+            connections.add_metric([client, "idle"], s["idle"])
+            waiting.add_metric([client], s["waiting"])
+        yield from (connections, waiting)
+
+
+REGISTRY.register(_CacheCollector())
+REGISTRY.register(_AdmissionCollector())
+REGISTRY.register(_HttpPoolCollector())
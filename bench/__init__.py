@@ -0,0 +1,6 @@
+"""
+Benchmark/load-test suite for the API (`python -m bench --help`).
+
+`bench.fakes` provides local Search/OpenAI stand-ins with configurable latency, jitter, payload size and
+429 rates; `bench.loadtest` drives `app.main:app` against them and reports per-stage percentiles as JSON.
+"""
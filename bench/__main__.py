@@ -0,0 +1,185 @@
+"""
+CLI for the benchmark suite.
+
+  python -m bench run --concurrency 16 --requests 500 --out results.json
+  python -m bench run --rate 50 --arrival poisson --search latency_ms=40,jitter_ms=15 --chat rate_429=0.02
+  python -m bench compare base.json head.json --threshold 0.1
+  python -m bench hnsw --vectors export.jsonl --num-queries 500 --k 10 --target-recall 0.95 --out hnsw.json
+  python -m bench quantize --vectors export.jsonl --num-queries 500 --k 10 --oversampling 1,2,4,8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from . import hnsw, quantization
+from .fakes import ServiceSpec
+from .loadtest import LoadConfig, compare, dump, run_benchmark
+
+
+def _env_pair(text: str) -> tuple[str, str]:
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {text!r}")
+    return key, value
+
+
+def _ints(text: str) -> list[int]:
+    try:
+        return [int(v) for v in text.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got {text!r}") from None
+
+
+def _floats(text: str) -> list[float]:
+    try:
+        return [float(v) for v in text.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated numbers, got {text!r}") from None
+
+
+def _load_corpus_and_queries(args: argparse.Namespace):
+    corpus = hnsw.load_vectors(args.vectors, vector_field=args.vector_field)
+    if args.queries:
+        return corpus, hnsw.load_vectors(args.queries, vector_field=args.vector_field)
+    return hnsw.hold_out(corpus, args.num_queries, seed=args.seed)
+
+
+def _run_hnsw(args: argparse.Namespace) -> int:
+    try:
+        backend = hnsw.HnswlibBackend(threads=args.threads, seed=args.seed)
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    corpus, queries = _load_corpus_and_queries(args)
+    with open(args.index_json, encoding="utf-8") as f:
+        index_definition = json.load(f)
+    report = hnsw.tune(
+        corpus,
+        queries,
+        backend=backend,
+        index_definition=index_definition,
+        k=args.k,
+        target_recall=args.target_recall,
+        m_values=args.m,
+        ef_construction_values=args.ef_construction,
+        ef_search_values=args.ef_search,
+    )
+    dump(report, args.out)
+    return 0
+
+
+def _run_quantize(args: argparse.Namespace) -> int:
+    corpus, queries = _load_corpus_and_queries(args)
+    with open(args.index_json, encoding="utf-8") as f:
+        index_definition = json.load(f)
+    report = quantization.report(
+        corpus,
+        queries,
+        index_definition=index_definition,
+        k=args.k,
+        dtypes=args.dtypes,
+        oversampling=args.oversampling,
+        default_oversampling=args.default_oversampling,
+    )
+    dump(report, args.out)
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="benchmark /chat or /chat/stream against local fakes")
+    run.add_argument("--scenario", choices=["chat", "stream"], default="chat")
+    load = run.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, help="closed loop with N workers (default 8)")
+    load.add_argument("--rate", type=float, help="open loop at R requests/second")
+    run.add_argument("--arrival", choices=["constant", "poisson"], default="constant")
+    run.add_argument("--max-in-flight", type=int, default=1000, help="open loop: cap on outstanding requests")
+    run.add_argument("--requests", type=int, default=200)
+    run.add_argument("--warmup", type=int, default=10)
+    run.add_argument("--distinct-questions", type=int, default=100, help="lower values raise cache hit rates")
+    run.add_argument("--top-k", type=int, default=5)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--search", type=ServiceSpec.parse, default=ServiceSpec(latency_ms=30, jitter_ms=10))
+    run.add_argument("--chat", type=ServiceSpec.parse, default=ServiceSpec(latency_ms=300, jitter_ms=100))
+    run.add_argument("--embeddings", type=ServiceSpec.parse, default=ServiceSpec(latency_ms=20, jitter_ms=5))
+    run.add_argument(
+        "--env", type=_env_pair, action="append", default=[], help="app setting, e.g. RETRIEVAL_CACHE_ENABLED=true"
+    )
+    run.add_argument("--out", help="write the JSON result here as well as to stdout")
+
+    cmp = sub.add_parser("compare", help="compare two result files (exit 1 on regression)")
+    cmp.add_argument("base")
+    cmp.add_argument("head")
+    cmp.add_argument("--threshold", type=float, default=0.1, help="relative percentile increase flagged")
+
+    tune = sub.add_parser("hnsw", help="sweep HNSW parameters offline (recall@k vs latency; needs hnswlib)")
+    tune.add_argument("--vectors", required=True, help=".npy, JSONL export or local index directory")
+    tune.add_argument("--queries", help="query vectors (same formats); default: hold out --num-queries vectors")
+    tune.add_argument("--num-queries", type=int, default=200)
+    tune.add_argument("--vector-field", default="contentVector")
+    tune.add_argument("--k", type=int, default=10)
+    tune.add_argument("--target-recall", type=float, default=0.95)
+    tune.add_argument("--m", type=_ints, default=list(hnsw.DEFAULT_M))
+    tune.add_argument("--ef-construction", type=_ints, default=list(hnsw.DEFAULT_EF_CONSTRUCTION))
+    tune.add_argument("--ef-search", type=_ints, default=list(hnsw.DEFAULT_EF_SEARCH))
+    tune.add_argument("--index-json", default="search/index.json", help="index definition to take vectorSearch from")
+    tune.add_argument("--threads", type=int, default=0, help="build threads (default: all CPUs)")
+    tune.add_argument("--seed", type=int, default=0)
+    tune.add_argument("--out", help="write the JSON report here as well as to stdout")
+
+    quant = sub.add_parser("quantize", help="measure int8/binary vector quantization with rescoring offline")
+    quant.add_argument("--vectors", required=True, help=".npy, JSONL export or local index directory")
+    quant.add_argument("--queries", help="query vectors (same formats); default: hold out --num-queries vectors")
+    quant.add_argument("--num-queries", type=int, default=200)
+    quant.add_argument("--vector-field", default="contentVector")
+    quant.add_argument("--k", type=int, default=10)
+    quant.add_argument(
+        "--dtypes", type=lambda t: t.split(","), default=list(quantization.DEFAULT_DTYPES), help="e.g. float32,int8"
+    )
+    quant.add_argument("--oversampling", type=_floats, default=list(quantization.DEFAULT_OVERSAMPLING))
+    quant.add_argument("--default-oversampling", type=float, default=4.0, help="rescoring in the emitted config")
+    quant.add_argument("--index-json", default="search/index.json", help="index definition to take vectorSearch from")
+    quant.add_argument("--seed", type=int, default=0)
+    quant.add_argument("--out", help="write the JSON report here as well as to stdout")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "hnsw":
+        return _run_hnsw(args)
+    if args.command == "quantize":
+        return _run_quantize(args)
+
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.head, encoding="utf-8") as f:
+            head = json.load(f)
+        lines, regressed = compare(base, head, threshold=args.threshold)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    cfg = LoadConfig(
+        scenario=args.scenario,
+        requests=args.requests,
+        warmup=args.warmup,
+        concurrency=None if args.rate else (args.concurrency or 8),
+        rate=args.rate,
+        arrival=args.arrival,
+        max_in_flight=args.max_in_flight,
+        distinct_questions=args.distinct_questions,
+        top_k=args.top_k,
+        seed=args.seed,
+        env=dict(args.env),
+    )
+    result = run_benchmark(cfg, search=args.search, chat=args.chat, embeddings=args.embeddings)
+    dump(result, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
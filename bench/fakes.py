@@ -0,0 +1,258 @@
+"""
+Local stand-ins for the Azure AI Search and Azure OpenAI data planes.
+
+Each fake is a small FastAPI app served by uvicorn on a loopback port in a child process, so generating
+responses does not compete with the code under test for the GIL or the event loop. Behaviour is set per
+service with a `ServiceSpec`:
+
+  - `latency_ms` / `jitter_ms`: per-request delay, drawn from a normal distribution (clamped at 0)
+  - `rate_429`: fraction of requests answered with 429 + `retry-after-ms` (exercises client retries)
+  - payload knobs: Search result count and content size, embedding dimensions, completion length and
+    per-token delay (streamed completions send one event per word)
+
+Only the request/response shapes the app uses are implemented. `GET /_bench/stats` returns request and
+throttle counts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, fields
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+@dataclass
+class ServiceSpec:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_429: float = 0.0
+    retry_after_ms: int = 50
+    # Search
+    docs: int = 5
+    content_chars: int = 2000
+    # Embeddings
+    dim: int = 1536
+    # Chat completions
+    completion_words: int = 60
+    word_ms: float = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> ServiceSpec:
+        """Parse `latency_ms=40,jitter_ms=10,rate_429=0.01` (unknown keys are rejected)."""
+
+        spec = cls()
+        types = {f.name: f.type for f in fields(cls)}
+        for item in filter(None, (part.strip() for part in text.split(","))):
+            key, sep, value = item.partition("=")
+            if not sep or key not in types:
+                raise ValueError(f"invalid service option {item!r}; expected one of {sorted(types)}")
+            setattr(spec, key, int(value) if types[key] == "int" else float(value))
+        return spec
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Behaviour:
+    def __init__(self, spec: ServiceSpec, seed: int) -> None:
+        self.spec = spec
+        self.rng = random.Random(seed)
+        self.counts: Counter[str] = Counter()
+
+    async def delay(self) -> None:
+        seconds = max(0.0, self.rng.gauss(self.spec.latency_ms, self.spec.jitter_ms)) / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def throttle(self) -> Response | None:
+        self.counts["requests"] += 1
+        if self.spec.rate_429 and self.rng.random() < self.spec.rate_429:
+            self.counts["throttled"] += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                status_code=429,
+                headers={"retry-after-ms": str(self.spec.retry_after_ms)},
+            )
+        return None
+
+
+_LOREM = (
+    "the service retries throttled requests with backoff while the index keeps chunk vectors in memory "
+    "so that hybrid queries combine lexical and semantic ranking before answers are generated"
+).split()
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words: list[str] = []
+    size = 0
+    while size < chars:
+        word = rng.choice(_LOREM)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def search_app(spec: ServiceSpec, *, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    behaviour = _Behaviour(spec, seed)
+
+    @app.get("/_bench/stats")
+    async def stats() -> dict:
+        return {"search": dict(behaviour.counts)}
+    # Precomputed corpus: response building should cost like JSON serialization, not text generation.
+    corpus = [_text(behaviour.rng, spec.content_chars) for _ in range(max(spec.docs, 1) * 4)]
+
+    @app.post("/indexes/{index}/docs/search")
+    async def docs_search(index: str, request: Request) -> Response:
+        body = await request.json()
+        await behaviour.delay()
+        if throttled := behaviour.throttle():
+            return throttled
+        top = min(int(body.get("top", spec.docs)), spec.docs)
+        start = behaviour.rng.randrange(len(corpus))
+        value = [
+            {
+                "@search.score": 1.0 / (rank + 1),
+                "chunkId": f"chunk-{(start + rank) % len(corpus)}",
+                "parentId": f"doc-{((start + rank) % len(corpus)) // 4}",
+                "title": f"Document {((start + rank) % len(corpus)) // 4}",
+                "content": corpus[(start + rank) % len(corpus)],
+                "sourcePath": f"docs/doc-{((start + rank) % len(corpus)) // 4}.md",
+            }
+            for rank in range(top)
+        ]
+        return JSONResponse({"value": value})
+
+    return app
+
+
+def _usage(prompt_chars: int, completion_words: int = 0) -> dict:
+    prompt_tokens = max(1, prompt_chars // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_words,
+        "total_tokens": prompt_tokens + completion_words,
+    }
+
+
+def openai_app(chat: ServiceSpec, embeddings: ServiceSpec, *, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    chat_behaviour = _Behaviour(chat, seed)
+    embed_behaviour = _Behaviour(embeddings, seed + 1)
+
+    @app.get("/_bench/stats")
+    async def stats() -> dict:
+        return {"chat": dict(chat_behaviour.counts), "embeddings": dict(embed_behaviour.counts)}
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def create_embeddings(deployment: str, request: Request) -> Response:
+        body = await request.json()
+        await embed_behaviour.delay()
+        if throttled := embed_behaviour.throttle():
+            return throttled
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        rng = embed_behaviour.rng
+        data = [
+            {"object": "embedding", "index": i, "embedding": [rng.uniform(-1, 1) for _ in range(embeddings.dim)]}
+            for i in range(len(inputs))
+        ]
+        prompt_chars = sum(len(str(text)) for text in inputs)
+        return JSONResponse({"object": "list", "data": data, "model": deployment, "usage": _usage(prompt_chars)})
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def create_chat_completion(deployment: str, request: Request) -> Response:
+        body = await request.json()
+        await chat_behaviour.delay()
+        if throttled := chat_behaviour.throttle():
+            return throttled
+        words = [chat_behaviour.rng.choice(_LOREM) for _ in range(chat.completion_words)]
+        prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": deployment}
+
+        if body.get("stream"):
+
+            async def events():
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': []})}\n\n"
+                for i, word in enumerate(words):
+                    if chat.word_ms:
+                        await asyncio.sleep(chat.word_ms / 1000)
+                    choice = {"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}
+                    yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [choice]})}\n\n"
+                done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [done]})}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        if chat.word_ms:
+            await asyncio.sleep(chat.word_ms * len(words) / 1000)
+        message = {"role": "assistant", "content": " ".join(words)}
+        return JSONResponse(
+            {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": _usage(prompt_chars, len(words)),
+            }
+        )
+
+    return app
+
+
+def _serve(factory: Callable[..., FastAPI], args: tuple, kwargs: dict, conn) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    conn.send(sock.getsockname()[1])
+    conn.close()
+    config = uvicorn.Config(factory(*args, **kwargs), log_level="warning", lifespan="off", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class FakeServer:
+    """
+    Serve `factory(*args, **kwargs)` on `127.0.0.1:<free port>` from a child process.
+
+    Use as a context manager; `url` is set once the server accepts connections.
+    """
+
+    def __init__(self, factory: Callable[..., FastAPI], *args, **kwargs) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(target=_serve, args=(factory, args, kwargs, child_conn), daemon=True)
+        self.url = ""
+
+    def __enter__(self) -> FakeServer:
+        self._process.start()
+        if not self._conn.poll(30):
+            self._process.kill()
+            raise RuntimeError("fake server did not start")
+        self.url = f"http://127.0.0.1:{self._conn.recv()}"
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{self.url}/_bench/stats", timeout=1).raise_for_status()
+                return self
+            except httpx.HTTPError:
+                if not self._process.is_alive() or time.monotonic() > deadline:
+                    self._process.kill()
+                    raise RuntimeError(f"fake server on {self.url} did not start") from None
+                time.sleep(0.05)
+
+    def stats(self) -> dict:
+        return httpx.get(f"{self.url}/_bench/stats", timeout=5).json()
+
+    def __exit__(self, *exc_info) -> None:
+        self._process.terminate()
+        self._process.join(timeout=10)
@@ -0,0 +1,316 @@
+"""
+Offline HNSW parameter tuning for the `vectorSearch` block of `search/index.json`.
+
+Search builds its vector index with HNSW; `m` (links per node), `efConstruction` (candidate list while
+building) and `efSearch` (candidate list while querying) trade recall against query latency, build time
+and memory, and the right values depend on the corpus size and the embedding distribution. This harness
+measures that trade-off locally, on the real exported vectors, without any Azure resource:
+
+  1) load the corpus vectors (a `.npy` matrix, a JSONL export with a vector field, or a local index
+     directory built by `python -m app.local_index build`) and the query vectors (same formats; by
+     default, `--num-queries` corpus vectors are held out and used as queries)
+  2) compute the exact cosine top-k for every query with blocked NumPy matrix products (the ground truth)
+  3) for every (`m`, `efConstruction`) build an HNSW graph with a local ANN library (`hnswlib`, an optional
+     dependency: `pip install hnswlib`) and record build time, serialized index size and resident memory
+     growth; then for every `efSearch` run each query on its own, as the service would, and record
+     recall@k and per-query latency percentiles
+  4) recommend the setting with the lowest p95 latency among those reaching `--target-recall`, within
+     the ranges Search accepts (m 4-10, efConstruction and efSearch 100-1000), and emit the `vectorSearch`
+     block of `index.json` with those parameters
+
+hnswlib implements the same algorithm as Search, so the relative ordering of settings carries over; the
+absolute latencies do not (different hardware, no network hop, no replicas).
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import os
+import tempfile
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from .loadtest import summarize
+
+
+# Ranges Azure AI Search accepts for `hnswParameters`.
+AZURE_LIMITS = {"m": (4, 10), "efConstruction": (100, 1000), "efSearch": (100, 1000)}
+DEFAULT_M = (4, 6, 8, 10)
+DEFAULT_EF_CONSTRUCTION = (100, 200, 400)
+DEFAULT_EF_SEARCH = (100, 200, 400, 800)
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def load_vectors(path: str | Path, *, vector_field: str = "contentVector") -> np.ndarray:
+    """
+    Load a float32 (N, dim) matrix from a `.npy` file, a local index directory, or JSON lines.
+
+    JSON lines may be records with `vector_field` (or `vector`) or bare lists of numbers.
+    """
+
+    path = Path(path)
+    if path.is_dir():
+        from app.local_index import LocalIndex
+
+        return LocalIndex(path).vectors()
+    if path.suffix == ".npy":
+        return np.asarray(np.load(path, mmap_mode="r"), dtype=np.float32)
+    rows = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = record.get(vector_field, record.get("vector"))
+            rows.append(record)
+    if not rows:
+        raise ValueError(f"no vectors in {path}")
+    return np.asarray(rows, dtype=np.float32)
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, *, block_rows: int = 16384) -> np.ndarray:
+    """Exact cosine top-k corpus row ids for every query, best first: (Q, k) int64."""
+
+    q = unit_rows(queries)
+    k = min(k, len(corpus))
+    best_ids = np.empty((len(q), 0), dtype=np.int64)
+    best_scores = np.empty((len(q), 0), dtype=np.float32)
+    for start in range(0, len(corpus), block_rows):
+        block = unit_rows(corpus[start : start + block_rows])
+        scores = np.concatenate([best_scores, q @ block.T], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(block)), (len(q), len(block)))], 1)
+        if scores.shape[1] > k:
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores, ids = np.take_along_axis(scores, keep, 1), np.take_along_axis(ids, keep, 1)
+        best_scores, best_ids = scores, ids
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_ids, order, 1)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean share of each query's true top-k present in the returned top-k."""
+
+    hits = (found[:, :, None] == truth[:, None, :]).any(axis=2).sum()
+    return float(hits) / truth.size
+
+
+class AnnIndex(Protocol):
+    def set_ef(self, ef: int) -> None: ...
+
+    def query(self, vector: np.ndarray, k: int) -> np.ndarray: ...
+
+    def size_bytes(self) -> int: ...
+
+
+class AnnBackend(Protocol):
+    name: str
+
+    def build(self, corpus: np.ndarray, *, m: int, ef_construction: int) -> AnnIndex: ...
+
+
+class _HnswlibIndex:
+    def __init__(self, index) -> None:
+        self._index = index
+
+    def set_ef(self, ef: int) -> None:
+        self._index.set_ef(ef)
+
+    def query(self, vector: np.ndarray, k: int) -> np.ndarray:
+        labels, _ = self._index.knn_query(vector.reshape(1, -1), k=k, num_threads=1)
+        return labels[0]
+
+    def size_bytes(self) -> int:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            self._index.save_index(path)
+            return os.path.getsize(path)
+
+
+class HnswlibBackend:
+    """HNSW graphs from `hnswlib` (cosine space), built with `threads` threads."""
+
+    name = "hnswlib"
+
+    def __init__(self, *, threads: int = 0, seed: int = 0) -> None:
+        try:
+            import hnswlib
+        except ImportError:
+            raise RuntimeError("hnswlib is required for HNSW tuning: pip install hnswlib") from None
+        self._hnswlib = hnswlib
+        self.threads = threads or os.cpu_count() or 1
+        self.seed = seed
+
+    def build(self, corpus: np.ndarray, *, m: int, ef_construction: int) -> AnnIndex:
+        index = self._hnswlib.Index(space="cosine", dim=corpus.shape[1])
+        index.init_index(max_elements=len(corpus), M=m, ef_construction=ef_construction, random_seed=self.seed)
+        index.add_items(corpus, np.arange(len(corpus)), num_threads=self.threads)
+        return _HnswlibIndex(index)
+
+
+@dataclass
+class TuningResult:
+    m: int
+    ef_construction: int
+    ef_search: int
+    recall: float
+    latency: dict
+    build_seconds: float
+    index_bytes: int
+    build_rss_bytes: int | None
+
+    def within_azure_limits(self) -> bool:
+        values = {"m": self.m, "efConstruction": self.ef_construction, "efSearch": self.ef_search}
+        return all(lo <= values[name] <= hi for name, (lo, hi) in AZURE_LIMITS.items())
+
+
+def _rss_bytes() -> int | None:
+    """Resident set size of this process (Linux only)."""
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def sweep(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    backend: AnnBackend,
+    k: int = 10,
+    m_values: Sequence[int] = DEFAULT_M,
+    ef_construction_values: Sequence[int] = DEFAULT_EF_CONSTRUCTION,
+    ef_search_values: Sequence[int] = DEFAULT_EF_SEARCH,
+    truth: np.ndarray | None = None,
+) -> list[TuningResult]:
+    """Measure every parameter combination; one graph is built per (m, efConstruction)."""
+
+    corpus = unit_rows(corpus)
+    queries = unit_rows(queries)
+    if truth is None:
+        truth = exact_neighbors(corpus, queries, k)
+    k = truth.shape[1]
+    results = []
+    for m in m_values:
+        for ef_construction in ef_construction_values:
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            index = backend.build(corpus, m=m, ef_construction=ef_construction)
+            build_seconds = time.perf_counter() - start
+            rss_after = _rss_bytes()
+            rss = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            index_bytes = index.size_bytes()
+            for ef_search in ef_search_values:
+                # HNSW cannot return more than ef candidates.
+                index.set_ef(max(ef_search, k))
+                index.query(queries[0], k)
+                found = np.empty_like(truth)
+                latencies = []
+                for i, q in enumerate(queries):
+                    t = time.perf_counter()
+                    found[i] = index.query(q, k)
+                    latencies.append(time.perf_counter() - t)
+                results.append(
+                    TuningResult(
+                        m=m,
+                        ef_construction=ef_construction,
+                        ef_search=ef_search,
+                        recall=round(recall_at_k(found, truth), 4),
+                        latency=summarize(latencies),
+                        build_seconds=round(build_seconds, 3),
+                        index_bytes=index_bytes,
+                        build_rss_bytes=rss,
+                    )
+                )
+    return results
+
+
+def recommend(results: Sequence[TuningResult], *, target_recall: float = 0.95) -> TuningResult:
+    """
+    Lowest p95 latency among the settings Search accepts that reach `target_recall` (ties: smaller index,
+    faster build); the highest recall when none does.
+    """
+
+    allowed = [r for r in results if r.within_azure_limits()] or list(results)
+    if not allowed:
+        raise ValueError("no results to recommend from")
+    reaching = [r for r in allowed if r.recall >= target_recall]
+    if reaching:
+        return min(reaching, key=lambda r: (r.latency.get("p95_ms", 0.0), r.index_bytes, r.build_seconds))
+    return max(allowed, key=lambda r: (r.recall, -r.latency.get("p95_ms", 0.0)))
+
+
+def vector_search_block(index_definition: dict, result: TuningResult) -> dict:
+    """The `vectorSearch` block of `index_definition` with every HNSW algorithm set to `result`'s parameters."""
+
+    block = copy.deepcopy(index_definition["vectorSearch"])
+    for algorithm in block.get("algorithms", []):
+        if algorithm.get("kind") == "hnsw":
+            params = algorithm.setdefault("hnswParameters", {})
+            params.update({"m": result.m, "efConstruction": result.ef_construction, "efSearch": result.ef_search})
+            params.setdefault("metric", "cosine")
+    return block
+
+
+def hold_out(corpus: np.ndarray, count: int, *, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Split `count` random rows off `corpus` to use as queries: (corpus without them, queries)."""
+
+    if not 0 < count < len(corpus):
+        raise ValueError(f"cannot hold out {count} of {len(corpus)} vectors as queries")
+    picked = np.random.default_rng(seed).choice(len(corpus), size=count, replace=False)
+    keep = np.ones(len(corpus), dtype=bool)
+    keep[picked] = False
+    return corpus[keep], corpus[picked]
+
+
+def tune(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    backend: AnnBackend,
+    index_definition: dict,
+    k: int = 10,
+    target_recall: float = 0.95,
+    m_values: Sequence[int] = DEFAULT_M,
+    ef_construction_values: Sequence[int] = DEFAULT_EF_CONSTRUCTION,
+    ef_search_values: Sequence[int] = DEFAULT_EF_SEARCH,
+) -> dict:
+    """Run the sweep and return the report: every measurement, the recommendation and its `vectorSearch` block."""
+
+    start = time.perf_counter()
+    truth = exact_neighbors(corpus, queries, k)
+    truth_seconds = time.perf_counter() - start
+    results = sweep(
+        corpus,
+        queries,
+        backend=backend,
+        m_values=m_values,
+        ef_construction_values=ef_construction_values,
+        ef_search_values=ef_search_values,
+        truth=truth,
+    )
+    best = recommend(results, target_recall=target_recall)
+    return {
+        "backend": backend.name,
+        "corpus": {"vectors": int(len(corpus)), "dimensions": int(corpus.shape[1])},
+        "queries": int(len(queries)),
+        "k": int(truth.shape[1]),
+        "target_recall": target_recall,
+        "ground_truth_seconds": round(truth_seconds, 3),
+        "results": [asdict(r) for r in results],
+        "recommended": asdict(best),
+        "vectorSearch": vector_search_block(index_definition, best),
+    }
@@ -0,0 +1,274 @@
+"""
+Load generator for `app.main:app` against the fakes in `bench.fakes`.
+
+The app is driven in-process through `httpx.ASGITransport` (no socket between the load generator and the
+app), while its upstream calls go over real HTTP to the fake Search/OpenAI servers. Two load models:
+
+  - closed loop (`--concurrency N`): N workers each send the next request when the previous one finishes
+  - open loop (`--rate R`): requests start on a fixed schedule (or Poisson with `--arrival poisson`)
+    whatever the app's latency; latency is measured from the scheduled start, so queueing shows up in
+    the percentiles instead of silently lowering the offered load
+
+Per-request stage timings are the ones the app records itself (`app.telemetry`, the same numbers as the
+`Server-Timing` header and `/metrics`); `total` is the client-observed latency.
+
+Results are JSON (`--out`), tagged with the git commit, so runs can be compared with `python -m bench compare`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+
+STAGES = ("queue", "embed", "search", "retrieve", "pack", "generate", "first_token", "serialize")
+PERCENTILES = (50, 95, 99)
+
+_stage_times: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("bench_stages", default=None)
+
+
+@dataclass
+class LoadConfig:
+    scenario: str = "chat"  # "chat" (POST /chat) or "stream" (POST /chat/stream)
+    requests: int = 200
+    warmup: int = 10
+    concurrency: int | None = 8
+    rate: float | None = None
+    arrival: str = "constant"  # "constant" or "poisson" (open loop only)
+    max_in_flight: int = 1000
+    distinct_questions: int = 100
+    top_k: int = 5
+    seed: int = 0
+    env: dict[str, str] = field(default_factory=dict)
+
+
+def _collect_timings(app):
+    """ASGI wrapper copying the app's per-request stage timings (`app.telemetry`) into the current sample."""
+
+    async def wrapped(scope, receive, send) -> None:
+        await app(scope, receive, send)
+        stages = _stage_times.get()
+        timings = scope.get("state", {}).get("timings")
+        if stages is not None and timings is not None:
+            stages.update(timings.stages)
+
+    return wrapped
+
+
+def questions(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    topics = ["retry policy", "index schema", "vector search", "token budget", "quota", "deployment", "chunking"]
+    verbs = ["configure", "tune", "monitor", "debug", "scale", "secure"]
+    return [f"How do I {rng.choice(verbs)} the {rng.choice(topics)} for workload {i}?" for i in range(count)]
+
+
+@dataclass
+class _Sample:
+    ok: bool
+    status: int
+    total: float
+    stages: dict[str, float]
+
+
+async def _one_request(client: httpx.AsyncClient, cfg: LoadConfig, question: str, scheduled: float) -> _Sample:
+    stages: dict[str, float] = {}
+    token = _stage_times.set(stages)
+    path = "/chat" if cfg.scenario == "chat" else "/chat/stream"
+    try:
+        resp = await client.post(path, json={"question": question, "top_k": cfg.top_k})
+        # The streaming endpoint reports upstream failures in-band.
+        ok = resp.status_code == 200 and (cfg.scenario == "chat" or "event: error" not in resp.text)
+        status = resp.status_code
+    except Exception:
+        ok, status = False, 0
+    finally:
+        _stage_times.reset(token)
+    return _Sample(ok=ok, status=status, total=time.perf_counter() - scheduled, stages=stages)
+
+
+async def _closed_loop(client, cfg: LoadConfig, qs: list[str], n: int) -> list[_Sample]:
+    samples: list[_Sample] = []
+    counter = iter(range(n))
+
+    async def worker() -> None:
+        for i in counter:
+            samples.append(await _one_request(client, cfg, qs[i % len(qs)], time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(cfg.concurrency or 1)))
+    return samples
+
+
+async def _open_loop(client, cfg: LoadConfig, qs: list[str], n: int) -> list[_Sample]:
+    rng = random.Random(cfg.seed)
+    slots = asyncio.Semaphore(cfg.max_in_flight)
+    tasks: list[asyncio.Task] = []
+    start = time.perf_counter()
+    offset = 0.0
+
+    async def fire(i: int, scheduled: float) -> _Sample:
+        try:
+            return await _one_request(client, cfg, qs[i % len(qs)], scheduled)
+        finally:
+            slots.release()
+
+    for i in range(n):
+        scheduled = start + offset
+        if (wait := scheduled - time.perf_counter()) > 0:
+            await asyncio.sleep(wait)
+        await slots.acquire()
+        tasks.append(asyncio.create_task(fire(i, scheduled)))
+        offset += rng.expovariate(cfg.rate) if cfg.arrival == "poisson" else 1 / cfg.rate
+    return list(await asyncio.gather(*tasks))
+
+
+def summarize(values: list[float]) -> dict[str, float | int]:
+    """count/mean/max and p50/p95/p99 in milliseconds."""
+
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=np.float64) * 1000
+    summary: dict[str, float | int] = {"count": len(values), "mean_ms": round(float(arr.mean()), 3)}
+    for p, value in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 3)
+    summary["max_ms"] = round(float(arr.max()), 3)
+    return summary
+
+
+async def run_load(cfg: LoadConfig) -> dict:
+    """Drive the app with `cfg` and return the result document (without the run metadata)."""
+
+    from app.main import app
+
+    qs = questions(cfg.distinct_questions, cfg.seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    transport = httpx.ASGITransport(app=_collect_timings(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits, timeout=None) as client:
+        drive = _open_loop if cfg.rate else _closed_loop
+        if cfg.warmup:
+            await drive(client, cfg, qs, cfg.warmup)
+        started = time.perf_counter()
+        samples = await drive(client, cfg, qs, cfg.requests)
+        elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if s.ok]
+    by_stage: dict[str, list[float]] = defaultdict(list)
+    for s in ok:
+        by_stage["total"].append(s.total)
+        for stage, seconds in s.stages.items():
+            by_stage[stage].append(seconds)
+
+    return {
+        "requests": {
+            "sent": len(samples),
+            "ok": len(ok),
+            "errors": dict(Counter(str(s.status) for s in samples if not s.ok)),
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "stages": {stage: summarize(by_stage[stage]) for stage in ("total", *STAGES) if by_stage[stage]},
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip()
+
+
+def run_benchmark(cfg: LoadConfig, *, search, chat, embeddings) -> dict:
+    """Start the fakes, point the app at them, run the load and return the full result document."""
+
+    from .fakes import FakeServer, openai_app, search_app
+
+    with ExitStack() as stack:
+        search_server = stack.enter_context(FakeServer(search_app, search, seed=cfg.seed))
+        openai_server = stack.enter_context(FakeServer(openai_app, chat, embeddings, seed=cfg.seed))
+
+        env = {
+            "AZURE_SEARCH_ENDPOINT": search_server.url,
+            "AZURE_SEARCH_API_KEY": "bench",
+            "AZURE_OPENAI_ENDPOINT": openai_server.url,
+            "AZURE_OPENAI_API_KEY": "bench",
+            "INDEXER_POLL_SECONDS": "0",
+            **cfg.env,
+        }
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            _reset_app_factories()
+            result = asyncio.run(run_load(cfg))
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            _reset_app_factories()
+
+        upstream = {**search_server.stats(), **openai_server.stats()}
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": asdict(cfg),
+        "fakes": {"search": search.as_dict(), "chat": chat.as_dict(), "embeddings": embeddings.as_dict()},
+        "upstream_requests": upstream,
+        **result,
+    }
+
+
+def _reset_app_factories() -> None:
+    """Drop process-wide clients/caches so they are rebuilt from the current environment."""
+
+    from app.lifecycle import ALL_FACTORIES
+
+    for factory in ALL_FACTORIES:
+        factory.cache_clear()
+
+
+def compare(base: dict, head: dict, *, threshold: float) -> tuple[list[str], bool]:
+    """Table of percentile changes per stage; flags regressions above `threshold` (relative)."""
+
+    lines = [f"{'stage':<12} {'metric':<7} {'base':>10} {'head':>10} {'change':>8}"]
+    regressed = False
+    for stage in ("total", *STAGES):
+        b, h = base["stages"].get(stage), head["stages"].get(stage)
+        if not b or not h:
+            continue
+        for p in PERCENTILES:
+            key = f"p{p}_ms"
+            change = (h[key] - b[key]) / b[key] if b[key] else 0.0
+            flag = ""
+            if change > threshold:
+                flag, regressed = " !", True
+            lines.append(f"{stage:<12} {key:<7} {b[key]:>10.2f} {h[key]:>10.2f} {change:>+7.1%}{flag}")
+    tb, th = base["throughput_rps"], head["throughput_rps"]
+    lines.append(f"{'throughput':<12} {'rps':<7} {tb:>10.2f} {th:>10.2f} {(th - tb) / tb if tb else 0:>+7.1%}")
+    return lines, regressed
+
+
+def dump(result: dict, path: str | None) -> None:
+    text = json.dumps(result, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
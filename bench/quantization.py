@@ -0,0 +1,130 @@
+"""
+Offline measurement of vector quantization for the local index and the `compressions` block of
+`search/index.json`.
+
+Quantized vectors shrink what a vector scan reads: int8 codes are 4x smaller than float32, binary (sign
+bit) codes 32x. The price is recall, which rescoring buys back: the best `oversampling * k` candidates by
+code score are rescored with the float32 originals. This harness measures that trade-off on the real
+exported vectors:
+
+  1) load the corpus and query vectors (same formats as `bench.hnsw`; by default `--num-queries` corpus
+     vectors are held out as queries) and compute the exact cosine top-k
+  2) build a temporary `app.local_index` directory per dtype (float32, int8, binary), keeping the originals
+  3) for every oversampling factor run each query on its own and record recall@k, per-query latency
+     percentiles and the bytes a scan reads; oversampling 1 rescores only the k results themselves, so its
+     recall is that of the codes alone
+  4) emit the `vectorSearch` block with the matching `compressions` entry for each quantized dtype
+
+The local scan is exhaustive, so recall losses come from quantization only; on Search they add to HNSW's.
+"""
+
+from __future__ import annotations
+
+import tempfile
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+from app.local_index import LocalIndex, LocalIndexWriter, compressions_config
+
+from .hnsw import exact_neighbors, recall_at_k, unit_rows
+from .loadtest import summarize
+
+
+DEFAULT_DTYPES = ("float32", "int8", "binary")
+DEFAULT_OVERSAMPLING = (1, 2, 4, 8)
+
+
+@dataclass
+class QuantizationResult:
+    dtype: str
+    oversampling: float
+    recall: float
+    latency: dict
+    vector_bytes: int
+    compression_ratio: float
+
+
+def build_index(path: str | Path, corpus: np.ndarray, dtype: str) -> LocalIndex:
+    """A local index over `corpus` (rows are the documents, numbered by position)."""
+
+    with LocalIndexWriter(path, dim=corpus.shape[1], dtype=dtype) as writer:
+        for i, vector in enumerate(corpus):
+            writer.add({"chunkId": str(i), "content": ""}, vector)
+    return LocalIndex(path)
+
+
+def measure(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    k: int = 10,
+    dtypes: Sequence[str] = DEFAULT_DTYPES,
+    oversampling: Sequence[float] = DEFAULT_OVERSAMPLING,
+    truth: np.ndarray | None = None,
+) -> list[QuantizationResult]:
+    """Recall, latency and footprint of every dtype (and, for quantized ones, every oversampling factor)."""
+
+    corpus = unit_rows(corpus)
+    queries = unit_rows(queries)
+    if truth is None:
+        truth = exact_neighbors(corpus, queries, k)
+    k = truth.shape[1]
+    full_bytes = corpus.shape[0] * corpus.shape[1] * 4
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in dtypes:
+            index = build_index(Path(tmp) / dtype, corpus, dtype)
+            for factor in oversampling if dtype != "float32" else (1,):
+                index.oversampling = factor
+                index.vector_search(queries[0], k)
+                found = np.empty_like(truth)
+                latencies = []
+                for i, q in enumerate(queries):
+                    t = time.perf_counter()
+                    found[i] = index.vector_search(q, k)[0]
+                    latencies.append(time.perf_counter() - t)
+                results.append(
+                    QuantizationResult(
+                        dtype=dtype,
+                        oversampling=factor,
+                        recall=round(recall_at_k(found, truth), 4),
+                        latency=summarize(latencies),
+                        vector_bytes=index.vector_bytes(),
+                        compression_ratio=round(full_bytes / index.vector_bytes(), 2),
+                    )
+                )
+    return results
+
+
+def report(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    index_definition: dict,
+    k: int = 10,
+    dtypes: Sequence[str] = DEFAULT_DTYPES,
+    oversampling: Sequence[float] = DEFAULT_OVERSAMPLING,
+    default_oversampling: float = 4.0,
+) -> dict:
+    """
+    Run `measure` and return the report with, for each quantized dtype, the `vectorSearch` block whose
+    compression rescores with `default_oversampling`.
+    """
+
+    truth = exact_neighbors(corpus, queries, k)
+    results = measure(corpus, queries, dtypes=dtypes, oversampling=oversampling, truth=truth)
+    return {
+        "corpus": {"vectors": int(len(corpus)), "dimensions": int(corpus.shape[1])},
+        "queries": int(len(queries)),
+        "k": int(truth.shape[1]),
+        "results": [asdict(r) for r in results],
+        "vectorSearch": {
+            dtype: compressions_config(index_definition, dtype, oversampling=default_oversampling)
+            for dtype in dtypes
+            if dtype != "float32"
+        },
+    }
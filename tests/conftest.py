@@ -11,12 +11,20 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 
+@pytest.fixture(autouse=True)
+def _required_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Process-wide components (caches, clients) build their config from `get_settings()`.
+    monkeypatch.setenv("AZURE_SEARCH_ENDPOINT", "https://example.search.windows.net")
+    monkeypatch.setenv("AZURE_SEARCH_API_KEY", "search-key")
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+
+
 @pytest.fixture(autouse=True)
 def _clear_caches():
-    from app import clients
+    from app.lifecycle import ALL_FACTORIES
 
-    clients.get_httpx_client.cache_clear()
-    clients.get_openai_client.cache_clear()
+    for factory in ALL_FACTORIES:
+        factory.cache_clear()
     yield
-    clients.get_httpx_client.cache_clear()
-    clients.get_openai_client.cache_clear()
+    for factory in ALL_FACTORIES:
+        factory.cache_clear()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.admission import AdmissionController, Overloaded, get_admission_controller
+from app.main import app
+from app.openai_router import PoolExhausted
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _controller(**kwargs) -> AdmissionController:
+    kwargs.setdefault("clock", FakeClock())
+    return AdmissionController(**kwargs)
+
+
+def test_requests_queue_behind_the_limit_and_run_in_priority_order() -> None:
+    controller = _controller(initial_limit=1)
+    order = []
+
+    async def request(cls: str, name: str) -> None:
+        async with controller.admit(cls):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        first = await controller.acquire("interactive")
+        tasks = [
+            asyncio.create_task(request("batch", "b1")),
+            asyncio.create_task(request("interactive", "i1")),
+            asyncio.create_task(request("batch", "b2")),
+        ]
+        await asyncio.sleep(0)
+        assert controller.queue_depth() == {"interactive": 1, "batch": 2}
+        first.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert order == ["i1", "b1", "b2"]
+    assert controller.in_flight == 0 and controller.queue_depth() == {"interactive": 0, "batch": 0}
+
+
+def test_sheds_on_arrival_when_estimated_wait_is_too_long() -> None:
+    clock = FakeClock()
+    controller = _controller(initial_limit=1, max_limit=1, max_wait={"interactive": 0.5, "batch": 30.0}, clock=clock)
+
+    async def main():
+        # One completed request teaches the controller that a request takes ~1s.
+        permit = await controller.acquire()
+        clock.now += 1.0
+        permit.release()
+        await controller.acquire()
+        with pytest.raises(Overloaded) as exc:
+            await controller.acquire("interactive")
+        assert exc.value.reason == "wait" and exc.value.retry_after == pytest.approx(1.0)
+        # Batch requests tolerate a longer wait, so they are queued instead.
+        waiter = asyncio.create_task(controller.acquire("batch"))
+        await asyncio.sleep(0)
+        assert controller.queue_depth()["batch"] == 1
+        waiter.cancel()
+
+    asyncio.run(main())
+    assert controller.shed == {("interactive", "wait"): 1}
+
+
+def test_full_queue_evicts_batch_for_interactive() -> None:
+    controller = _controller(initial_limit=1, max_queue=1)
+
+    async def main():
+        await controller.acquire()
+        batch = asyncio.create_task(controller.acquire("batch"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(controller.acquire("interactive"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded, match="evicted"):
+            await batch
+        with pytest.raises(Overloaded, match="queue_full"):
+            await controller.acquire("interactive")
+        interactive.cancel()
+
+    asyncio.run(main())
+    assert controller.shed == {("batch", "evicted"): 1, ("interactive", "queue_full"): 1}
+
+
+def test_waiter_is_shed_after_its_maximum_wait() -> None:
+    controller = _controller(initial_limit=1, max_wait={"interactive": 0.05, "batch": 1.0})
+
+    async def main():
+        await controller.acquire()
+        with pytest.raises(Overloaded, match="timeout"):
+            await controller.acquire("interactive")
+        assert controller.queue_depth()["interactive"] == 0
+
+    asyncio.run(main())
+
+
+def test_limit_drops_on_throttling_and_grows_on_success() -> None:
+    clock = FakeClock()
+    controller = _controller(initial_limit=10, min_limit=2, clock=clock)
+
+    async def run(error: BaseException | None = None) -> None:
+        permit = await controller.acquire()
+        clock.now += 1.0
+        permit.release(error)
+
+    asyncio.run(run())
+    assert controller.limit == pytest.approx(10.1)
+
+    asyncio.run(run(PoolExhausted("all deployments throttled")))
+    assert controller.limit == pytest.approx(10.1 * 0.9)
+    # A second throttle within the same service time is the same congestion signal.
+    permit = asyncio.run(controller.acquire())
+    permit.release(PoolExhausted("all deployments throttled"))
+    assert controller.limit == pytest.approx(10.1 * 0.9)
+
+    # Non-throttle errors do not shrink the limit.
+    before = controller.limit
+    asyncio.run(run(ValueError("bad request")))
+    assert controller.limit > before
+
+
+def test_chat_endpoint_answers_429_with_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMISSION_CONTROL_ENABLED", "true")
+    monkeypatch.setenv("ADMISSION_MAX_QUEUE", "0")
+
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
+        return "hi", []
+
+    async def fake_aretrieve_chunks(*, settings, question: str, top_k: int, search_filter=None):
+        return []
+
+    async def fake_astream_answer(*, settings, question: str, chunks):
+        yield "hi"
+
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
+    monkeypatch.setattr("app.main.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr("app.main.astream_answer", fake_astream_answer)
+    client = TestClient(app)
+    controller = get_admission_controller()
+
+    assert client.post("/chat", json={"question": "hello"}).status_code == 200
+    assert client.post("/chat/stream", json={"question": "hello"}).status_code == 200
+    # The streaming slot is held for the whole body and handed back exactly once.
+    assert controller.in_flight == 0
+
+    controller.in_flight = int(controller.limit)
+    r = client.post("/chat", json={"question": "hello"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    assert "queue_full" in r.json()["detail"]
+    assert client.post("/chat/stream", json={"question": "hello"}).status_code == 429
+
+    # Batch items are shed individually and reported in-band.
+    r = client.post("/chat/batch", json={"items": [{"question": "hello"}]})
+    assert r.status_code == 200
+    assert "Overloaded" in r.json()["results"][0]["error"]
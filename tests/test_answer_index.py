@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import answer_index, rag
+from app.answer_index import AnswerEntry, AnswerIndex, answer_index_scope, load_questions, write_answer_index
+from app.indexer_watch import IndexerWatcher, start_indexer_watcher
+from app.local_index import LocalIndexWriter
+from app.main import app
+from app.rag import RetrievedChunk, afetch_parent_versions
+from app.settings import get_settings
+
+
+def _chunk(parent: str) -> RetrievedChunk:
+    return RetrievedChunk(chunk_id=f"{parent}-c1", title=parent.upper(), content="", source_path=None, parent_id=parent)
+
+
+def _entry(question: str, parent: str, answer: str | None = None) -> AnswerEntry:
+    return AnswerEntry(question=question, answer=answer or f"about {parent}", chunks=[_chunk(parent)])
+
+
+def test_load_questions_ranks_by_frequency(tmp_path: Path) -> None:
+    log = tmp_path / "asked.txt"
+    log.write_text("How do I reset my password?\nquota?\n\nhow do I reset my  password\nQuota\nquota!\nVPN\n")
+    assert load_questions(log) == [("quota?", 3), ("How do I reset my password?", 2), ("VPN", 1)]
+    assert load_questions(log, limit=1) == [("quota?", 3)]
+
+    ranked = tmp_path / "ranked.jsonl"
+    ranked.write_text("\n".join(json.dumps(r) for r in [{"question": "a", "count": 2}, {"question": "b", "count": 5}]))
+    assert load_questions(ranked) == [("b", 5), ("a", 2)]
+
+
+def test_chat_serves_exact_and_neighbor_matches(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("ANSWER_INDEX_PATH", str(tmp_path))
+    monkeypatch.setenv("AZURE_OPENAI_EMBED_DEPLOYMENT", "embed")
+    write_answer_index(
+        tmp_path,
+        [_entry("What is the quota?", "p1"), _entry("How do I reset my password?", "p2")],
+        scope=answer_index_scope(get_settings()),
+        top_k=5,
+        parents={"p1": "v1", "p2": "v1"},
+        vectors=np.array([[1.0, 0.0], [0.0, 1.0]]),
+        embed_model="embed",
+    )
+    embeddings = {"quota limits": [0.99, 0.1], "something else": [0.6, 0.6]}
+    answered = []
+
+    async def fake_aembed_question(*, settings, question):
+        return np.asarray(embeddings[question], dtype=np.float32)
+
+    async def fake_aanswer_question(*, settings, question, top_k, search_filter=None):
+        answered.append(question)
+        return "generated", []
+
+    monkeypatch.setattr(answer_index, "aembed_question", fake_aembed_question)
+    monkeypatch.setattr("app.main.aanswer_question", fake_aanswer_question)
+    client = TestClient(app)
+
+    def ask(question: str, **extra) -> dict:
+        r = client.post("/chat", json={"question": question, **extra})
+        assert r.status_code == 200
+        return r.json()
+
+    body = ask("what is the QUOTA")
+    assert body["answer"] == "about p1"
+    assert body["citations"] == [{"chunk_id": "p1-c1", "title": "P1", "source_path": None, "parent_id": "p1"}]
+    assert ask("quota limits")["answer"] == "about p1"
+    # Below the threshold, or asked with another top_k or a filter: the regular pipeline answers.
+    assert ask("something else")["answer"] == "generated"
+    assert ask("What is the quota?", top_k=3)["answer"] == "generated"
+    assert ask("What is the quota?", filter={"parent_ids": ["p2"]})["answer"] == "generated"
+    assert answered == ["something else", "What is the quota?", "What is the quota?"]
+
+    batch = client.post("/chat/batch", json={"items": [{"question": "How do I reset my password"}]}).json()
+    assert batch["results"][0]["answer"] == "about p2" and answered[-1] == "What is the quota?"
+    stats = client.get("/cache/stats").json()["answer_index"]
+    assert stats == {"hits": 3, "misses": 1, "semantic_hits": 1, "evictions": 0, "entries": 2}
+
+
+def test_index_built_after_startup_is_served(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(answer_index, "META_CHECK_SECONDS", 0.0)
+    path = tmp_path / "answers"
+    monkeypatch.setenv("ANSWER_INDEX_PATH", str(path))
+    settings = get_settings()
+
+    index = answer_index.get_answer_index()
+    assert index is not None and len(index) == 0
+    assert asyncio.run(answer_index.alookup_answer(settings=settings, question="What is the quota?", top_k=5)) is None
+    assert asyncio.run(answer_index.arefresh(settings=settings, path=path)) == 0
+    assert not path.exists()
+
+    scope = answer_index_scope(settings)
+    write_answer_index(path, [_entry("What is the quota?", "p1")], scope=scope, top_k=5, parents={"p1": "v1"})
+    answer = asyncio.run(answer_index.alookup_answer(settings=settings, question="What is the quota?", top_k=5))
+    assert answer[0] == "about p1" and answer_index.get_answer_index() is index and len(index) == 1
+
+
+def test_refresh_recomputes_only_answers_citing_changed_documents(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(answer_index, "META_CHECK_SECONDS", 0.0)
+    versions = {"p1": "v1", "p2": "v1", "p3": "v1"}
+    cites = {"quota?": "p1", "password?": "p2", "vpn?": "p1"}
+    answered, failing = [], set()
+
+    async def fake_versions(*, settings, parent_ids):
+        return {p: versions[p] for p in parent_ids if p in versions}
+
+    async def fake_aanswer_question(*, settings, question, top_k, search_filter=None):
+        answered.append(question)
+        if question in failing:
+            raise RuntimeError("upstream down")
+        return f"{question} ({versions[cites[question]]})", [_chunk(cites[question])]
+
+    monkeypatch.setattr(answer_index, "afetch_parent_versions", fake_versions)
+    monkeypatch.setattr(answer_index, "aanswer_question", fake_aanswer_question)
+    settings = get_settings()
+    questions = [("quota?", 9), ("password?", 5), ("vpn?", 2)]
+
+    assert asyncio.run(answer_index.abuild(settings=settings, path=tmp_path, questions=questions, top_k=5)) == 3
+    reader = AnswerIndex(tmp_path)
+    assert reader.meta["parents"] == {"p1": "v1", "p2": "v1"}
+    assert asyncio.run(answer_index.arefresh(settings=settings, path=tmp_path)) == 0
+
+    answered.clear()
+    versions["p1"] = "v2"
+    cites["vpn?"] = "p3"
+    failing.add("quota?")
+    assert asyncio.run(answer_index.arefresh(settings=settings, path=tmp_path)) == 1
+    assert sorted(answered) == ["quota?", "vpn?"]
+    # A reader opened earlier follows the new generation; the failed entry is kept out of service.
+    assert reader.find("VPN").answer == "vpn? (v1)" and reader.find("vpn").chunks[0].parent_id == "p3"
+    assert reader.find("quota") is None and reader.find("password").answer == "password? (v1)"
+    assert reader.meta["parents"] == {"p1": "v2", "p2": "v1", "p3": "v1"}
+    assert {e.count for e in reader.entries()} == {9, 5, 2}
+
+    # The next refresh retries it, although its documents did not change again; old generations are removed.
+    answered.clear()
+    failing.clear()
+    assert asyncio.run(answer_index.arefresh(settings=settings, path=tmp_path)) == 1
+    assert answered == ["quota?"] and reader.find("quota").answer == "quota? (v2)"
+    assert sorted(p.name for p in tmp_path.glob("keys-*.bin")) == ["keys-4.bin", "keys-5.bin"]
+
+
+def test_indexer_run_starts_a_refresh(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("ANSWER_INDEX_PATH", str(tmp_path))
+    monkeypatch.setenv("INDEXER_POLL_SECONDS", "0.01")
+    runs = iter(["t1", "t2"])
+    refreshed = []
+
+    async def fetch_status(self):
+        end_time = next(runs, "t2")
+        return {"lastResult": {"status": "success", "endTime": end_time, "itemsProcessed": 1}}
+
+    async def fake_arefresh(*, settings, path):
+        refreshed.append(path)
+        return 2
+
+    monkeypatch.setattr(IndexerWatcher, "fetch_status", fetch_status)
+    monkeypatch.setattr(answer_index, "arefresh", fake_arefresh)
+    job = answer_index.get_answer_index_job()
+
+    async def watch() -> None:
+        watcher = start_indexer_watcher(get_settings())
+        deadline = time.monotonic() + 5
+        while not refreshed and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        watcher.cancel()
+        await job._task
+
+    asyncio.run(watch())
+    assert refreshed == [str(tmp_path)] and job.last_recomputed == 2 and not job.running
+
+
+def test_parent_versions_page_through_search(monkeypatch: pytest.MonkeyPatch) -> None:
+    index = {
+        "p1": [("p1-a", "alpha"), ("p1-b", "beta"), ("p1-c", "gamma")],
+        "p2": [("p2-a", "delta")],
+    }
+    bodies = []
+
+    class FakeAsyncHttp:
+        async def post(self, url, headers, json):
+            bodies.append(json)
+            docs = [
+                {"chunkId": chunk_id, "parentId": parent, "content": content}
+                for parent in sorted(index)
+                if parent in json["filter"]
+                for chunk_id, content in index[parent]
+            ]
+            page = docs[json["skip"] : json["skip"] + json["top"]]
+            return httpx.Response(200, json={"value": page}, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttp())
+    monkeypatch.setattr("app.rag.SEARCH_PAGE_SIZE", 2)
+    settings = get_settings()
+
+    first = asyncio.run(afetch_parent_versions(settings=settings, parent_ids=["p2", "p1", "gone", "p1"]))
+    assert set(first) == {"p1", "p2"}
+    assert [b["skip"] for b in bodies] == [0, 2, 4]
+    assert bodies[0]["filter"] == "search.in(parentId, 'gone,p1,p2', ',')" and bodies[0]["orderby"] == "chunkId"
+
+    index["p1"][1] = ("p1-b", "beta, edited")
+    second = asyncio.run(afetch_parent_versions(settings=settings, parent_ids=["p1", "p2"]))
+    assert second["p1"] != first["p1"] and second["p2"] == first["p2"]
+
+
+def test_parent_versions_from_the_local_index(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    docs = [("p1", "p1-b", "beta"), ("p2", "p2-a", "delta"), ("p1", "p1-a", "alpha"), ("p3", "p3-a", "other")]
+    with LocalIndexWriter(tmp_path, dim=2) as writer:
+        for parent, chunk_id, content in docs:
+            writer.add({"chunkId": chunk_id, "parentId": parent, "content": content}, [1.0, 0.0])
+    monkeypatch.setenv("LOCAL_INDEX_PATH", str(tmp_path))
+
+    versions = asyncio.run(afetch_parent_versions(settings=get_settings(), parent_ids=["p1", "p2", "gone"]))
+    assert set(versions) == {"p1", "p2"}
+    # Chunk order does not matter: the fingerprint is the one Search results give.
+    assert versions["p1"] == rag._parent_version([("p1-a", "alpha"), ("p1-b", "beta")])
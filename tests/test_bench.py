@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.local_index import LocalIndexWriter
+from bench import hnsw
+from bench.__main__ import main as bench_main
+from bench.fakes import ServiceSpec
+from bench.loadtest import LoadConfig, compare, run_benchmark, summarize
+
+
+def test_service_spec_parse() -> None:
+    spec = ServiceSpec.parse("latency_ms=40, jitter_ms=10,rate_429=0.05,docs=3")
+
+    assert (spec.latency_ms, spec.jitter_ms, spec.rate_429, spec.docs) == (40.0, 10.0, 0.05, 3)
+    assert isinstance(spec.docs, int)
+    with pytest.raises(ValueError):
+        ServiceSpec.parse("latency=40")
+
+
+def test_summarize_percentiles() -> None:
+    summary = summarize([i / 1000 for i in range(1, 101)])
+
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == pytest.approx(50.5)
+    assert summary["p99_ms"] == pytest.approx(99.01)
+    assert summary["max_ms"] == 100.0
+    assert summarize([]) == {"count": 0}
+
+
+def test_compare_flags_regressions() -> None:
+    def result(p95: float, rps: float) -> dict:
+        return {"stages": {"total": {"p50_ms": 10.0, "p95_ms": p95, "p99_ms": 30.0}}, "throughput_rps": rps}
+
+    lines, regressed = compare(result(20.0, 100.0), result(21.0, 100.0), threshold=0.1)
+    assert not regressed
+    lines, regressed = compare(result(20.0, 100.0), result(30.0, 90.0), threshold=0.1)
+    assert regressed
+    assert any(line.startswith("total") and "p95_ms" in line and line.endswith("!") for line in lines)
+
+
+@pytest.mark.parametrize("scenario", ["chat", "stream"])
+def test_run_benchmark_against_fakes(scenario: str) -> None:
+    cfg = LoadConfig(
+        scenario=scenario,
+        requests=12,
+        warmup=2,
+        concurrency=3,
+        distinct_questions=4,
+        # Upstream calls are counted exactly: no coalescing of concurrent identical questions.
+        env={
+            "USE_SEARCH_VECTORIZER": "false",
+            "AZURE_OPENAI_EMBED_DEPLOYMENT": "embed",
+            "SINGLE_FLIGHT_ENABLED": "false",
+        },
+    )
+    result = run_benchmark(
+        cfg,
+        search=ServiceSpec(docs=3, content_chars=200),
+        chat=ServiceSpec(completion_words=5, rate_429=0.05, retry_after_ms=1),
+        embeddings=ServiceSpec(dim=8),
+    )
+
+    assert result["requests"] == {"sent": 12, "ok": 12, "errors": {}}
+    assert result["upstream_requests"]["search"]["requests"] == 14
+    # Query embeddings are cached, so each distinct question is embedded once.
+    assert result["upstream_requests"]["embeddings"]["requests"] == 4
+    expected = {"total", "embed", "search", "retrieve", "pack", "generate"}
+    expected |= {"first_token"} if scenario == "stream" else {"serialize"}
+    assert set(result["stages"]) == expected
+    # Only embedding cache misses (questions not seen during warmup) have an embed stage.
+    assert result["stages"]["embed"]["count"] == 2
+    assert all(s["count"] == 12 for name, s in result["stages"].items() if name != "embed")
+
+
+def test_exact_neighbors_match_brute_force_across_blocks() -> None:
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(300, 16)).astype(np.float32)
+    queries = rng.normal(size=(20, 16)).astype(np.float32)
+
+    truth = hnsw.exact_neighbors(corpus, queries, 5, block_rows=64)
+
+    scores = hnsw.unit_rows(queries) @ hnsw.unit_rows(corpus).T
+    assert truth.tolist() == np.argsort(-scores, axis=1)[:, :5].tolist()
+    assert hnsw.recall_at_k(truth, truth) == 1.0
+    assert hnsw.recall_at_k(np.where(np.arange(5) < 4, truth, -1), truth) == pytest.approx(0.8)
+
+
+class _FakeAnnBackend:
+    """Exact search that returns only `min(1, ef / 400)` of the true neighbors, slower for larger ef."""
+
+    name = "fake"
+    built = 0
+
+    def build(self, corpus: np.ndarray, *, m: int, ef_construction: int):
+        self.built += 1
+
+        class Index:
+            ef = 10
+
+            def set_ef(self, ef: int) -> None:
+                self.ef = ef
+
+            def query(self, vector: np.ndarray, k: int) -> np.ndarray:
+                time.sleep(self.ef * 2e-6)
+                ids = hnsw.exact_neighbors(corpus, vector.reshape(1, -1), k)[0]
+                keep = round(k * min(1.0, self.ef / 400))
+                return np.where(np.arange(k) < keep, ids, -1)
+
+            def size_bytes(self) -> int:
+                return corpus.nbytes + len(corpus) * m * 8
+
+        return Index()
+
+
+def test_tune_recommends_the_fastest_setting_reaching_target_recall() -> None:
+    corpus, queries = hnsw.hold_out(np.random.default_rng(1).normal(size=(200, 8)), 10)
+    assert corpus.shape == (190, 8) and queries.shape == (10, 8)
+    backend = _FakeAnnBackend()
+    definition = json.loads((Path(__file__).resolve().parents[1] / "search" / "index.json").read_text())
+
+    report = hnsw.tune(
+        corpus,
+        queries,
+        backend=backend,
+        index_definition=definition,
+        k=10,
+        m_values=[4, 8],
+        ef_construction_values=[200],
+        ef_search_values=[100, 400, 800],
+    )
+
+    assert backend.built == 2 and len(report["results"]) == 6
+    by_ef = {r["ef_search"]: r["recall"] for r in report["results"] if r["m"] == 4}
+    assert by_ef == {100: 0.2, 400: 1.0, 800: 1.0}
+    assert report["recommended"]["ef_search"] == 400
+    params = report["vectorSearch"]["algorithms"][0]["hnswParameters"]
+    assert params == {"m": report["recommended"]["m"], "efConstruction": 200, "efSearch": 400, "metric": "cosine"}
+    assert report["vectorSearch"]["vectorizers"] == definition["vectorSearch"]["vectorizers"]
+
+
+def test_recommend_stays_within_search_limits() -> None:
+    def result(m: int, ef_search: int, recall: float, p95: float) -> hnsw.TuningResult:
+        return hnsw.TuningResult(m, 400, ef_search, recall, {"p95_ms": p95}, 1.0, 1000 * m, None)
+
+    results = [result(16, 100, 0.99, 0.1), result(8, 200, 0.97, 0.3), result(4, 200, 0.96, 0.2)]
+    assert hnsw.recommend(results, target_recall=0.95) == results[2]
+    # None reaches the target: the best recall wins.
+    assert hnsw.recommend(results, target_recall=0.999) == results[1]
+
+
+def test_vectors_load_from_npy_jsonl_and_local_index(tmp_path: Path) -> None:
+    vectors = np.eye(3, dtype=np.float32)
+    np.save(tmp_path / "v.npy", vectors)
+    (tmp_path / "v.jsonl").write_text(
+        "\n".join(json.dumps({"chunkId": f"c{i}", "contentVector": v.tolist()}) for i, v in enumerate(vectors))
+    )
+    with LocalIndexWriter(tmp_path / "index", dim=3) as writer:
+        for i, v in enumerate(vectors):
+            writer.add({"chunkId": f"c{i}", "content": "x"}, v * 2)
+
+    for name in ("v.npy", "v.jsonl", "index"):
+        np.testing.assert_allclose(hnsw.load_vectors(tmp_path / name), vectors)
+
+
+def test_hnsw_cli_with_hnswlib(tmp_path: Path) -> None:
+    pytest.importorskip("hnswlib")
+    np.save(tmp_path / "v.npy", np.random.default_rng(0).normal(size=(500, 16)).astype(np.float32))
+    out = tmp_path / "report.json"
+
+    args = ["hnsw", "--vectors", str(tmp_path / "v.npy"), "--num-queries", "20", "--m", "4,8"]
+    args += ["--ef-construction", "100", "--ef-search", "100,200", "--out", str(out)]
+    assert bench_main(args) == 0
+
+    report = json.loads(out.read_text())
+    assert len(report["results"]) == 4
+    assert all(0 < r["recall"] <= 1 and r["index_bytes"] > 0 for r in report["results"])
+
+
+def test_quantize_cli_reports_recall_and_footprint(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(50, 32))
+    np.save(tmp_path / "v.npy", (centers[rng.integers(0, 50, 600)] + rng.normal(scale=0.3, size=(600, 32))))
+    out = tmp_path / "report.json"
+
+    args = ["quantize", "--vectors", str(tmp_path / "v.npy"), "--num-queries", "20", "--k", "5"]
+    assert bench_main(args + ["--oversampling", "1,8", "--out", str(out)]) == 0
+
+    report = json.loads(out.read_text())
+    results = {(r["dtype"], r["oversampling"]): r for r in report["results"]}
+    assert sorted(results) == [("binary", 1), ("binary", 8), ("float32", 1), ("int8", 1), ("int8", 8)]
+    assert results["float32", 1]["recall"] == 1.0 and results["float32", 1]["compression_ratio"] == 1.0
+    assert results["binary", 1]["compression_ratio"] == 32.0
+    assert results["binary", 8]["recall"] > results["binary", 1]["recall"]
+    assert results["int8", 8]["recall"] == 1.0
+    assert report["vectorSearch"]["binary"]["compressions"][0]["rescoringOptions"]["defaultOversampling"] == 4.0
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app import cache
+from app.cache import AnswerCache, LRUCache, normalize_question
+from app.rag import RetrievedChunk
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    c = LRUCache(max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.stats.evictions == 1
+
+
+def test_lru_cache_expires_entries_after_ttl() -> None:
+    clock = FakeClock()
+    c = LRUCache(max_entries=10, ttl_seconds=5, clock=clock)
+    c.set("a", 1)
+    clock.now = 4.9
+    assert c.get("a") == 1
+    clock.now = 5.0
+    assert c.get("a") is None
+    assert len(c) == 0
+
+
+def test_lru_cache_respects_byte_budget() -> None:
+    c = LRUCache(max_entries=10, max_bytes=10, weigh=len)
+    c.set("a", "xxxx")
+    c.set("b", "yyyy")
+    c.set("c", "zzzz")
+    assert c.get("a") is None
+    assert c.get("b") == "yyyy"
+
+    c.set("huge", "x" * 11)
+    assert c.get("huge") is None
+    assert c.get("c") == "zzzz"
+
+
+def test_normalize_question() -> None:
+    assert normalize_question("  What   is\tRAG?? ") == "what is rag"
+    assert normalize_question("ＲＡＧ") == "rag"
+
+
+def _value(answer: str) -> tuple[str, list[RetrievedChunk]]:
+    return answer, [RetrievedChunk(chunk_id="c1", title=None, content="x", source_path=None, parent_id=None)]
+
+
+def test_answer_cache_exact_tier_is_scoped() -> None:
+    ac = AnswerCache(backend=LRUCache(max_entries=10))
+    ac.set(scope="s1", question="What is RAG?", value=_value("a1"))
+
+    assert ac.lookup(scope="s1", question="what is rag").value == _value("a1")
+    assert ac.lookup(scope="s2", question="what is rag").value is None
+    assert ac.stats.hits == 1
+    assert ac.stats.misses == 1
+
+
+def test_answer_cache_semantic_tier_matches_close_embeddings() -> None:
+    ac = AnswerCache(backend=LRUCache(max_entries=10), semantic_threshold=0.95)
+    ac.set(scope="s", question="how do I reset my password", value=_value("a"), embedding=np.array([1.0, 0.0]))
+
+    calls = []
+
+    def embed_close():
+        calls.append(1)
+        return [0.99, 0.05]
+
+    hit = ac.lookup(scope="s", question="password reset steps", embed=embed_close)
+    assert hit.value == _value("a")
+    assert ac.stats.semantic_hits == 1
+
+    miss = ac.lookup(scope="s", question="billing address", embed=lambda: [0.0, 1.0])
+    assert miss.value is None
+    assert miss.embedding is not None
+
+    # Exact hits never pay for an embedding.
+    calls.clear()
+    assert ac.lookup(scope="s", question="How do I reset my password?", embed=embed_close).value == _value("a")
+    assert calls == []
+
+
+def test_answer_cache_invalidate_clears_both_tiers() -> None:
+    ac = AnswerCache(backend=LRUCache(max_entries=10), semantic_threshold=0.9)
+    ac.set(scope="s", question="q", value=_value("a"), embedding=np.array([1.0, 0.0]))
+    ac.invalidate()
+
+    assert ac.lookup(scope="s", question="q", embed=lambda: [1.0, 0.0]).value is None
+
+
+def test_get_answer_cache_disabled_by_default() -> None:
+    assert cache.get_answer_cache() is None
+    assert cache.cache_stats() == {}
+
+
+def test_get_answer_cache_from_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.setenv("ANSWER_CACHE_MAX_ENTRIES", "3")
+    monkeypatch.setenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.9")
+
+    ac = cache.get_answer_cache()
+    assert ac is not None
+    assert ac.backend.max_entries == 3
+    assert ac.semantic is not None and ac.semantic.threshold == 0.9
+
+    ac.set(scope="s", question="q", value=_value("a"))
+    cache.invalidate_caches()
+    assert cache.cache_stats()["answer"]["entries"] == 0
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 from types import SimpleNamespace
 
+import httpx
 import pytest
+from prometheus_client import REGISTRY
 
 from app import clients
+from app.deadline import Deadline, deadline_scope
 
 
 def _set_required_env(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -69,3 +73,155 @@ def test_get_openai_client_uses_defaultazurecredential_when_no_key(monkeypatch:
     assert "azure_ad_token_provider" in created
     assert "api_key" not in created
 
+
+
+def test_get_async_httpx_client_is_cached() -> None:
+    c1 = clients.get_async_httpx_client()
+    c2 = clients.get_async_httpx_client()
+    assert isinstance(c1, httpx.AsyncClient)
+    assert c1 is c2
+
+
+def test_get_async_openai_client_uses_api_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    _set_required_env(monkeypatch)
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "openai-key")
+
+    created = {}
+
+    class DummyAsyncAzureOpenAI:
+        def __init__(self, **kwargs):
+            created.update(kwargs)
+
+    monkeypatch.setattr(clients, "AsyncAzureOpenAI", DummyAsyncAzureOpenAI)
+
+    oai = clients.get_async_openai_client()
+    assert isinstance(oai, DummyAsyncAzureOpenAI)
+    assert oai is clients.get_async_openai_client()
+    assert created["api_key"] == "openai-key"
+    # OpenAI traffic goes through the shared pool.
+    assert created["http_client"] is clients.get_async_httpx_client()
+    assert "azure_ad_token_provider" not in created
+
+
+def test_get_async_openai_client_uses_async_credential_when_no_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    _set_required_env(monkeypatch)
+    monkeypatch.delenv("AZURE_OPENAI_API_KEY", raising=False)
+
+    created = {}
+
+    class DummyAsyncAzureOpenAI:
+        def __init__(self, **kwargs):
+            created.update(kwargs)
+
+    class DummyCredential:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+    def dummy_token_provider(cred, scope: str):
+        assert isinstance(cred, DummyCredential)
+        assert scope == "https://cognitiveservices.azure.com/.default"
+        return lambda: "token"
+
+    monkeypatch.setattr(clients, "AsyncAzureOpenAI", DummyAsyncAzureOpenAI)
+    monkeypatch.setattr(clients, "AsyncDefaultAzureCredential", DummyCredential)
+    monkeypatch.setattr(clients, "get_async_bearer_token_provider", dummy_token_provider)
+
+    clients.get_async_openai_client()
+    assert "azure_ad_token_provider" in created
+    assert "api_key" not in created
+
+
+def _flaky(*outcomes):
+    """Mock handler returning (or raising) `outcomes` in turn, then 200s; records the requests."""
+
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.method, request.url.path))
+        outcome = outcomes[len(seen) - 1] if len(seen) <= len(outcomes) else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, tuple):
+            return httpx.Response(outcome[0], headers=outcome[1])
+        return httpx.Response(outcome)
+
+    return handler, seen
+
+
+def _retry_count(reason: str) -> float:
+    return REGISTRY.get_sample_value("rag_http_retries_total", {"client": "test", "reason": reason}) or 0.0
+
+
+def test_retry_transport_retries_idempotent_requests_only() -> None:
+    policy = clients.RetryPolicy(retries=2, backoff_base=0.0, backoff_max=1.0)
+
+    def client(handler) -> httpx.Client:
+        return httpx.Client(transport=clients.RetryTransport(httpx.MockTransport(handler), policy, "test"))
+
+    before = _retry_count("503")
+    handler, seen = _flaky(503, 503)
+    search = "https://s.search.windows.net/indexes/kb-index/docs/search"
+    assert client(handler).post(search, json={}).status_code == 200
+    assert len(seen) == 3 and _retry_count("503") == before + 2
+
+    # Retries are bounded.
+    handler, seen = _flaky(503, 503, 503, 503)
+    assert client(handler).post(search, json={}).status_code == 503 and len(seen) == 3
+
+    # Chat completions are not idempotent (the SDK and the deployment router retry them).
+    handler, seen = _flaky(503)
+    assert client(handler).post("https://o.openai.azure.com/openai/chat/completions", json={}).status_code == 503
+    assert len(seen) == 1
+
+    handler, seen = _flaky(httpx.ConnectError("reset"))
+    assert client(handler).get("https://s.search.windows.net/indexers/kb-indexer/status").status_code == 200
+    assert len(seen) == 2
+
+    # A Retry-After beyond the max backoff is not waited for.
+    handler, seen = _flaky((429, {"Retry-After": "30"}))
+    assert client(handler).post(search, json={}).status_code == 429 and len(seen) == 1
+
+
+def test_retry_backoff_has_full_jitter_and_respects_the_deadline() -> None:
+    policy = clients.RetryPolicy(retries=5, backoff_base=0.1, backoff_max=0.5)
+
+    delays = [policy.backoff(3) for _ in range(200)]
+    assert all(0 <= d <= 0.5 for d in delays) and len(set(delays)) > 100
+    assert policy.backoff(5) is None
+    assert policy.backoff(0, httpx.Response(429, headers={"Retry-After": "0.4"})) >= 0.4
+
+    with deadline_scope(Deadline(expires_at=0.0)):
+        assert policy.backoff(0) is None
+
+
+def test_async_retry_transport(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HTTP_RETRY_BACKOFF_MS", "0")
+    handler, seen = _flaky(httpx.ReadError("closed"), 502)
+
+    async def run() -> int:
+        policy = clients.RetryPolicy.from_settings(clients.get_settings())
+        transport = clients.AsyncRetryTransport(httpx.MockTransport(handler), policy, "test")
+        async with httpx.AsyncClient(transport=transport) as client:
+            r = await client.post("https://s.search.windows.net/indexes/kb-index/docs/search", json={})
+            return r.status_code
+
+    assert asyncio.run(run()) == 200 and len(seen) == 3
+
+
+def test_shared_clients_use_pool_settings_and_close_at_shutdown(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("HTTP_CONNECT_TIMEOUT_SECONDS", "1.5")
+    sync_client = clients.get_httpx_client()
+    async_client = clients.get_async_httpx_client()
+
+    assert sync_client.timeout.connect == 1.5 and sync_client.timeout.read == 30.0
+    assert async_client._transport.transport._pool._max_connections == 7
+    assert clients.http_pool_stats() == {
+        "sync": {"active": 0, "idle": 0, "waiting": 0},
+        "async": {"active": 0, "idle": 0, "waiting": 0},
+    }
+
+    asyncio.run(clients.aclose_clients())
+    assert sync_client.is_closed and async_client.is_closed
+    assert clients.get_httpx_client() is not sync_client
+
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import random
+import string
+import time
+
+from app.context import ByteEstimateTokenizer, ContextPacker, SentenceCompressor, _merge_text, _overlap, sentence_spans
+from app.rag import RetrievedChunk
+
+
+class WordTokenizer:
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return " ".join(text.split()[:max_tokens])
+
+
+def _chunk(chunk_id: str, content: str, parent_id: str | None = "p1") -> RetrievedChunk:
+    return RetrievedChunk(chunk_id=chunk_id, title="Doc", content=content, source_path=None, parent_id=parent_id)
+
+
+DOC = " ".join(f"word{i}" for i in range(400))
+
+
+def test_overlap_finds_longest_suffix_prefix() -> None:
+    assert _overlap("abcdefgh", "efghijkl", min_overlap=2) == 4
+    assert _overlap("abcdefgh", "xyz", min_overlap=2) == 0
+    assert _overlap("aaaa", "aaab", min_overlap=2) == 3
+    assert _merge_text("abcdefgh", "efghijkl", min_overlap=2) == "abcdefghijkl"
+    assert _merge_text("efghijkl", "abcdefgh", min_overlap=2) == "abcdefghijkl"
+    assert _merge_text("abcdefgh", "cdef", min_overlap=2) == "abcdefgh"
+
+
+def test_pack_merges_overlapping_pages_of_same_parent() -> None:
+    # Three pages with overlap, returned out of document order; a bridge page joins the outer two.
+    pages = [DOC[0:1200], DOC[900:2200], DOC[1900:]]
+    chunks = [_chunk("c3", pages[2]), _chunk("c1", pages[0]), _chunk("other", "unrelated text", parent_id="p2")]
+    chunks.append(_chunk("c2", pages[1]))
+
+    packed = ContextPacker(token_budget=100_000).pack(chunks)
+
+    assert [c.chunk_id for c in packed] == ["c3", "other"]
+    assert packed[0].content == DOC
+    assert packed[1].content == "unrelated text"
+
+
+def test_pack_keeps_non_adjacent_pages_separate() -> None:
+    packed = ContextPacker(token_budget=100_000).pack([_chunk("a", DOC[:500]), _chunk("b", DOC[1500:2000])])
+    assert [c.chunk_id for c in packed] == ["a", "b"]
+
+
+def test_pack_drops_near_duplicates_across_parents() -> None:
+    text = " ".join(f"w{i}" for i in range(100))
+    near = text + " trailing"
+    packed = ContextPacker(token_budget=100_000).pack(
+        [_chunk("a", text, parent_id="p1"), _chunk("b", near, parent_id="p2"), _chunk("c", "different", "p3")]
+    )
+    assert [c.chunk_id for c in packed] == ["a", "c"]
+
+
+def test_pack_fits_token_budget_in_rank_order_and_truncates_last_block() -> None:
+    chunks = [_chunk(f"c{i}", f"c{i} " + " ".join(["tok"] * 100), parent_id=f"p{i}") for i in range(3)]
+
+    packer = ContextPacker(token_budget=180, dedupe_threshold=1.0, min_block_tokens=10, tokenizer=WordTokenizer())
+    packed = packer.pack(chunks)
+
+    # Each block costs 4 header words + 2 separator tokens + 101 content words:
+    # c0 fits (107), c1 is cut to the remaining 180 - 107 - 6 = 67 tokens, c2 is dropped.
+    assert [c.chunk_id for c in packed] == ["c0", "c1"]
+    assert packed[0].content == chunks[0].content
+    assert WordTokenizer().count(packed[1].content) == 67
+
+
+def test_pack_skips_tokenizer_when_everything_fits() -> None:
+    class ExplodingTokenizer:
+        def count(self, text: str) -> int:
+            raise AssertionError("should not tokenize")
+
+        def truncate(self, text: str, max_tokens: int) -> str:
+            raise AssertionError("should not tokenize")
+
+    chunks = [_chunk("a", "short", parent_id="p1"), _chunk("b", "also short", parent_id="p2")]
+    assert ContextPacker(token_budget=1000, tokenizer=ExplodingTokenizer()).pack(chunks) == chunks
+
+
+def test_byte_estimate_tokenizer() -> None:
+    tok = ByteEstimateTokenizer()
+    assert tok.count("abcdefgh") == 2
+    assert tok.count("abcdefghi") == 3
+    assert tok.truncate("abcdefghij", 2) == "abcdefgh"
+
+
+FILLER = [
+    "The portal shows a summary page after sign-in.",
+    "Teams often bookmark the dashboard for quick access.",
+    "Release notes are published every second Tuesday.",
+    "Support tickets are triaged within one business day.",
+]
+
+
+def test_sentence_spans_keep_list_numbering() -> None:
+    text = "Steps:\n1. Open the portal.\n2) Select the index. Then save it!\nDone"
+    assert [text[a:b] for a, b in sentence_spans(text)] == [
+        "Steps:",
+        "1. Open the portal.",
+        "2) Select the index.",
+        "Then save it!",
+        "Done",
+    ]
+
+
+def test_compressor_keeps_matching_sentences_in_order() -> None:
+    content = " ".join(
+        [
+            FILLER[0],
+            "The embedding deployment has a quota of 240k tokens per minute.",
+            FILLER[1],
+            FILLER[2],
+            "Raise the quota for a deployment in the portal under Quotas.",
+            FILLER[3],
+        ]
+    )
+    short = _chunk("c2", "Quota is per region.")
+    compressor = SentenceCompressor(max_chunk_chars=150)
+
+    chunks = [_chunk("c1", content), short, _chunk("c3", " ".join(FILLER))]
+
+    out = compressor.compress(chunks, "What is the deployment quota?")
+
+    assert [c.chunk_id for c in out] == ["c1", "c2", "c3"]
+    assert out[0].content == (
+        "The embedding deployment has a quota of 240k tokens per minute. … "
+        "Raise the quota for a deployment in the portal under Quotas."
+    )
+    assert out[1] is short
+    # No match at all: the block still keeps one sentence, so its citation number survives.
+    assert out[2].content == FILLER[0]
+
+    tight = SentenceCompressor(max_chunk_chars=150, max_total_chars=100).compress(chunks[:1], "deployment quota")
+    assert tight[0].content == "The embedding deployment has a quota of 240k tokens per minute."
+
+
+def test_compress_matches_words_that_casefold_differently() -> None:
+    content = " ".join([*FILLER, "The Straßenbahn depot is next to the main station.", *FILLER])
+
+    out = SentenceCompressor(max_chunk_chars=60).compress([_chunk("c1", content)], "Which STRAßENBAHN?")
+    assert out[0].content == "The Straßenbahn depot is next to the main station."
+
+
+def test_pack_compresses_only_with_a_question() -> None:
+    content = " ".join([*FILLER, "Indexers run every hour on a schedule.", *FILLER])
+    packer = ContextPacker(token_budget=10_000, compressor=SentenceCompressor(max_chunk_chars=60))
+    chunk = _chunk("c1", content)
+
+    assert packer.pack([chunk]) == [chunk]
+    assert packer.pack([chunk], question="How often do indexers run?")[0].content == (
+        "Indexers run every hour on a schedule."
+    )
+
+
+def test_compressor_is_cheap_for_top_k_50() -> None:
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(2000)]
+    chunks = [
+        _chunk(f"c{i}", ". ".join(" ".join(rng.choices(words, k=12)) for _ in range(25))[:2000], parent_id=f"p{i}")
+        for i in range(50)
+    ]
+    compressor = SentenceCompressor()
+    question = " ".join(rng.choices(words, k=10))
+
+    compressor.compress(chunks, question)
+    start = time.perf_counter()
+    out = compressor.compress(chunks, question)
+    elapsed = time.perf_counter() - start
+
+    assert len(out) == 50 and all(len(c.content) <= 2000 for c in out)
+    assert sum(len(c.content) for c in out) < sum(len(c.content) for c in chunks) / 2
+    # A few milliseconds in practice; the bound leaves room for slow CI machines.
+    assert elapsed < 0.1
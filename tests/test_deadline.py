@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import deadline as deadline_module
+from app.context import ByteEstimateTokenizer, ContextPacker
+from app.deadline import Deadline, DeadlineExceeded, DeadlinePolicy, deadline_scope, get_deadline_policy
+from app.main import app
+from app.rag import RetrievedChunk, aanswer_question, pack_for_deadline
+
+
+def _chunk(i: int, content: str | None = None) -> RetrievedChunk:
+    content = content or " ".join(f"w{i}x{j}" for j in range(100))
+    return RetrievedChunk(chunk_id=f"c{i}", parent_id=f"p{i}", title=f"T{i}", content=content, source_path="s")
+
+
+def _settings():
+    return SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_openai_chat_deployment="chat",
+        azure_openai_embed_deployment=None,
+    )
+
+
+def _fake_openai(monkeypatch: pytest.MonkeyPatch, *, delay: float, content: str = "answer") -> None:
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            await asyncio.sleep(delay)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(
+        "app.rag.get_async_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    )
+
+
+def _fake_retrieval(monkeypatch: pytest.MonkeyPatch, *, delay: float, chunks: list[RetrievedChunk]) -> None:
+    async def fake_aretrieve_chunks(*, settings, question, top_k, search_filter=None):
+        await asyncio.sleep(delay)
+        return chunks
+
+    monkeypatch.setattr("app.rag.aretrieve_chunks", fake_aretrieve_chunks)
+
+
+def test_policy_defaults_and_overrides(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert DeadlinePolicy().start() is None
+    d = DeadlinePolicy(retrieval_share=0.25).start(2000)
+    assert 1.9 < d.remaining() <= 2.0
+    assert d.retrieval_budget() == pytest.approx(d.remaining() * 0.25, rel=0.01)
+
+    monkeypatch.setenv("REQUEST_TIMEOUT_MS", "1500")
+    monkeypatch.setenv("DEADLINE_FULL_CONTEXT_MS", "3000")
+    policy = get_deadline_policy()
+    assert policy.default_timeout_seconds == 1.5
+    assert policy.full_context_seconds == 3.0
+    assert policy.start(100).remaining() <= 0.1
+
+
+def test_pack_for_deadline_shrinks_context_when_time_is_short(monkeypatch: pytest.MonkeyPatch) -> None:
+    packer = ContextPacker(token_budget=1000, tokenizer=ByteEstimateTokenizer())
+    monkeypatch.setattr("app.rag.get_context_packer", lambda: packer)
+    chunks = [_chunk(i) for i in range(5)]
+
+    roomy = Deadline(expires_at=time.monotonic() + 10, full_context_seconds=4.0)
+    assert pack_for_deadline(chunks, roomy) == (chunks, None)
+    assert pack_for_deadline(chunks, None) == (chunks, None)
+
+    tight = Deadline(expires_at=time.monotonic() + 1, full_context_seconds=4.0)
+    packed, degraded = pack_for_deadline(chunks, tight)
+    assert degraded == "truncated_context"
+    assert 0 < len(packed) < len(chunks)
+
+
+def test_slow_generation_degrades_to_citations_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.setattr("app.rag.get_context_packer", lambda: ContextPacker(token_budget=10_000))
+    _fake_retrieval(monkeypatch, delay=0, chunks=[_chunk(1)])
+    _fake_openai(monkeypatch, delay=5)
+
+    async def main():
+        d = Deadline(expires_at=time.monotonic() + 0.1)
+        with deadline_scope(d):
+            answer, chunks = await aanswer_question(settings=_settings(), question="q", top_k=3)
+        return d, answer, chunks
+
+    d, answer, chunks = asyncio.run(main())
+
+    assert (answer, [c.chunk_id for c in chunks], d.degraded) == ("", ["c1"], "citations_only")
+    # The degraded answer is not cached: the next call without a deadline generates for real.
+    _fake_openai(monkeypatch, delay=0, content="full answer")
+    answer, _chunks = asyncio.run(aanswer_question(settings=_settings(), question="q", top_k=3))
+    assert answer == "full answer"
+
+
+def test_slow_retrieval_raises_deadline_exceeded(monkeypatch: pytest.MonkeyPatch) -> None:
+    _fake_retrieval(monkeypatch, delay=5, chunks=[])
+    _fake_openai(monkeypatch, delay=0)
+
+    async def main():
+        with deadline_scope(Deadline(expires_at=time.monotonic() + 0.2, retrieval_share=0.25)):
+            await aanswer_question(settings=_settings(), question="q", top_k=3)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    # Retrieval only got its share of the budget.
+    assert time.monotonic() - start < 0.15
+
+
+def test_chat_endpoint_applies_timeout_and_reports_degraded(monkeypatch: pytest.MonkeyPatch) -> None:
+    seen = []
+
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
+        d = deadline_module.current_deadline()
+        seen.append(d)
+        if question == "slow":
+            raise DeadlineExceeded("retrieval did not finish within the request deadline")
+        if d is not None:
+            d.degraded = "citations_only"
+            return "", [_chunk(1)]
+        return "hi", [_chunk(1)]
+
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
+    client = TestClient(app)
+
+    r = client.post("/chat", json={"question": "hello"})
+    assert seen[-1] is None
+    assert "degraded" not in r.json()
+
+    r = client.post("/chat", json={"question": "hello"}, headers={"X-Request-Timeout-Ms": "800"})
+    assert 0 < seen[-1].remaining() <= 0.8
+    assert r.json()["degraded"] == "citations_only"
+    assert r.json()["citations"][0]["chunk_id"] == "c1"
+
+    # The body field wins over the header.
+    client.post("/chat", json={"question": "hello", "timeout_ms": 50_000}, headers={"X-Request-Timeout-Ms": "800"})
+    assert seen[-1].remaining() > 40
+
+    assert client.post("/chat", json={"question": "slow", "timeout_ms": 10}).status_code == 504
+    assert client.post("/chat", json={"question": "hello"}, headers={"X-Request-Timeout-Ms": "0"}).status_code == 422
+
+
+def test_chat_stream_truncates_answer_at_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def fake_aretrieve_chunks(*, settings, question: str, top_k: int, search_filter=None):
+        return [_chunk(1, "short")]
+
+    async def slow_astream_answer(*, settings, question: str, chunks):
+        yield "first "
+        await asyncio.sleep(5)
+        yield "never"
+
+    monkeypatch.setattr("app.main.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr("app.main.astream_answer", slow_astream_answer)
+
+    r = TestClient(app).post("/chat/stream", json={"question": "hello", "timeout_ms": 200})
+
+    frames = [frame.split("\n")[0].removeprefix("event: ") for frame in r.text.strip().split("\n\n")]
+    assert frames == ["citations", "delta", "degraded", "done"]
+    assert '"truncated_answer"' in r.text
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import embeddings
+from app.embeddings import AsyncEmbeddingBatcher, as_float32
+from app.settings import reload_settings
+
+
+def test_as_float32_is_compact_and_read_only() -> None:
+    vec = as_float32([0.5, 0.25])
+    assert vec.dtype == np.float32
+    assert vec.flags.c_contiguous
+    with pytest.raises(ValueError):
+        vec[0] = 1.0
+
+
+def test_batcher_coalesces_concurrent_requests_and_dedupes() -> None:
+    calls = []
+
+    async def create(model: str, texts: list[str]):
+        calls.append((model, texts))
+        return [as_float32([float(len(t)), 1.0]) for t in texts]
+
+    batcher = AsyncEmbeddingBatcher(window_seconds=0.01, max_batch_size=16, create=create)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.embed(model="emb", text="a"),
+            batcher.embed(model="emb", text="bbb"),
+            batcher.embed(model="emb", text="a"),
+        )
+
+    a1, b, a2 = asyncio.run(run())
+    assert calls == [("emb", ["a", "bbb"])]
+    assert a1 is a2
+    assert b.tolist() == [3.0, 1.0]
+
+
+def test_batcher_flushes_when_full() -> None:
+    calls = []
+
+    async def create(model: str, texts: list[str]):
+        calls.append(texts)
+        return [as_float32([0.0]) for _ in texts]
+
+    # A window this long would time the test out if the size trigger did not fire.
+    batcher = AsyncEmbeddingBatcher(window_seconds=60, max_batch_size=2, create=create)
+
+    async def run():
+        await asyncio.gather(batcher.embed(model="m", text="x"), batcher.embed(model="m", text="y"))
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert calls == [["x", "y"]]
+
+
+def test_batcher_propagates_errors_and_tolerates_cancellation() -> None:
+    async def create(model: str, texts: list[str]):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("429")
+
+    batcher = AsyncEmbeddingBatcher(window_seconds=0.001, max_batch_size=16, create=create)
+
+    async def run():
+        cancelled = asyncio.ensure_future(batcher.embed(model="m", text="x"))
+        waiting = asyncio.ensure_future(batcher.embed(model="m", text="y"))
+        await asyncio.sleep(0.005)
+        cancelled.cancel()
+        with pytest.raises(RuntimeError, match="429"):
+            await waiting
+
+    asyncio.run(run())
+
+
+def test_default_create_orders_results_by_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeEmbeddings:
+        async def create(self, *, model: str, input: list[str]):
+            return SimpleNamespace(
+                data=[SimpleNamespace(index=1, embedding=[2.0]), SimpleNamespace(index=0, embedding=[1.0])]
+            )
+
+    monkeypatch.setattr(embeddings, "get_async_openai_client", lambda: SimpleNamespace(embeddings=FakeEmbeddings()))
+
+    vectors = asyncio.run(embeddings._create_embeddings("m", ["a", "b"]))
+    assert [v.tolist() for v in vectors] == [[1.0], [2.0]]
+
+
+def test_factories_follow_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert embeddings.get_embedding_cache() is not None
+    assert embeddings.get_embedding_batcher() is None
+
+    embeddings.get_embedding_cache.cache_clear()
+    embeddings.get_embedding_batcher.cache_clear()
+    monkeypatch.setenv("EMBEDDING_CACHE_MAX_ENTRIES", "0")
+    monkeypatch.setenv("EMBEDDING_BATCH_WINDOW_MS", "5")
+    reload_settings()
+
+    assert embeddings.get_embedding_cache() is None
+    assert embeddings.get_embedding_batcher().window_seconds == 0.005
+
+
+def test_aprefetch_embeddings_fills_cache_in_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+
+    async def fake_create(model: str, texts: list[str]):
+        calls.append(texts)
+        return [as_float32([1.0]) for _ in texts]
+
+    monkeypatch.setattr(embeddings, "_create_embeddings", fake_create)
+
+    texts = ["a", "b", "A", "c"]
+    assert asyncio.run(embeddings.aprefetch_embeddings(model="m", texts=texts, max_batch_size=2)) == 3
+    assert calls == [["a", "b"], ["c"]]
+    assert asyncio.run(embeddings.aprefetch_embeddings(model="m", texts=texts, max_batch_size=2)) == 0
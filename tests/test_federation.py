@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.federation import (
+    PartialResults,
+    SearchFederation,
+    Shard,
+    ShardsUnavailable,
+    get_search_federation,
+    rrf_merge,
+    score_merge,
+)
+from app.rag import RetrievedChunk, aretrieve_chunks, pack_for_deadline, retrieve_chunks
+
+
+def _chunk(chunk_id: str, score: float | None = None, reranker_score: float | None = None) -> RetrievedChunk:
+    return RetrievedChunk(
+        chunk_id=chunk_id,
+        title=None,
+        content=chunk_id,
+        source_path=None,
+        parent_id=None,
+        score=score,
+        reranker_score=reranker_score,
+    )
+
+
+def _ids(chunks) -> list[str]:
+    return [c.chunk_id for c in chunks]
+
+
+def _federation(*timeouts: float, **kwargs) -> SearchFederation:
+    shards = [Shard(name=f"s{i}", url=f"https://s{i}", api_key="k", timeout=t) for i, t in enumerate(timeouts)]
+    return SearchFederation(shards, **kwargs)
+
+
+SETTINGS = SimpleNamespace(
+    use_search_vectorizer=True,
+    azure_search_endpoint="https://example.search.windows.net",
+    azure_search_index="kb-index",
+    azure_search_api_version="2025-09-01",
+    azure_search_api_key="search-key",
+    azure_search_vector_field="contentVector",
+    azure_search_vectorizer="openai-vectorizer",
+    azure_openai_embed_deployment=None,
+)
+
+
+def test_rrf_merge_dedupes_by_chunk_id_and_trims_to_top_k() -> None:
+    a = [_chunk("x"), _chunk("y"), _chunk("z")]
+    b = [_chunk("y"), _chunk("w")]
+
+    merged = rrf_merge([a, b], top_k=3, k=60)
+
+    # "y" is ranked in both lists, so it beats "x", ranked first in only one.
+    assert _ids(merged) == ["y", "x", "w"]
+    assert merged[0].score == pytest.approx(1 / 62 + 1 / 61)
+    # Weights shift the balance between lists.
+    assert _ids(rrf_merge([a, b], top_k=2, k=60, weights=[1.0, 0.01])) == ["x", "y"]
+
+
+def test_score_merge_normalizes_each_list() -> None:
+    # Raw scores are on different scales; the reranker score wins over the search score when present.
+    a = [_chunk("a1", score=40.0), _chunk("a2", score=20.0), _chunk("a3", score=10.0)]
+    b = [_chunk("b1", score=0.1, reranker_score=3.0), _chunk("b2", score=0.9, reranker_score=1.0)]
+
+    merged = score_merge([a, b], top_k=4)
+
+    assert _ids(merged) == ["a1", "b1", "a2", "a3"]
+    assert merged[0].score == pytest.approx(1.0) and merged[2].score == pytest.approx(1 / 3)
+    assert score_merge([[_chunk("only", score=5.0)], []], top_k=1)[0].score == 1.0
+
+
+def test_slow_and_failing_shards_are_dropped_from_the_merge() -> None:
+    federation = _federation(1.0, 0.05, 1.0)
+
+    async def search(shard: Shard) -> list[RetrievedChunk]:
+        if shard.name == "s1":
+            await asyncio.sleep(5)
+        await asyncio.sleep(0.01)
+        return [_chunk(f"{shard.name}-c1"), _chunk("shared")]
+
+    start = time.perf_counter()
+    merged = asyncio.run(federation.asearch(search, top_k=10))
+    assert time.perf_counter() - start < 1.0
+    assert isinstance(merged, PartialResults) and merged.dropped == ("s1",)
+    assert _ids(merged) == ["shared", "s0-c1", "s2-c1"]
+
+    async def broken(shard: Shard) -> list[RetrievedChunk]:
+        if shard.name != "s2":
+            raise httpx.ConnectError("down")
+        return [_chunk("c")]
+
+    partial = asyncio.run(federation.asearch(broken, top_k=10))
+    assert _ids(partial) == ["c"] and partial.dropped == ("s0", "s1")
+
+    async def down(shard: Shard) -> list[RetrievedChunk]:
+        raise httpx.ConnectError("down")
+
+    with pytest.raises(ShardsUnavailable, match="s0, s1, s2"):
+        asyncio.run(federation.asearch(down, top_k=10))
+
+
+def test_sync_fan_out_runs_shards_concurrently() -> None:
+    federation = _federation(1.0, 1.0, 0.05)
+
+    def search(shard: Shard) -> list[RetrievedChunk]:
+        time.sleep(0.5 if shard.name == "s2" else 0.1)
+        return [_chunk(shard.name)]
+
+    start = time.perf_counter()
+    merged = federation.search(search, top_k=10)
+    # Two 0.1s shards in parallel; the slow one is abandoned at its 0.05s timeout.
+    assert time.perf_counter() - start < 0.3
+    assert _ids(merged) == ["s0", "s1"] and merged.dropped == ("s2",)
+
+    assert not isinstance(federation.search(lambda shard: [_chunk("c")], top_k=1), PartialResults)
+
+
+def test_retrieval_fans_out_to_configured_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    monkeypatch.setenv(
+        "AZURE_SEARCH_SHARDS",
+        json.dumps(
+            [
+                {"index": "kb-billing"},
+                {"index": "kb-storage", "endpoint": "https://other.search.windows.net", "api_key": "other-key"},
+                {"index": "kb-slow", "timeout_ms": 50},
+            ]
+        ),
+    )
+    federation = get_search_federation()
+    assert [s.name for s in federation.shards] == ["kb-billing", "other.search.windows.net/kb-storage", "kb-slow"]
+    assert federation.shards[0].timeout == 2.0
+
+    calls = []
+
+    class FakeAsyncHttp:
+        async def post(self, url, headers, json):
+            calls.append((url, headers["api-key"]))
+            if "kb-slow" in url:
+                await asyncio.sleep(5)
+            index = url.split("/indexes/")[1].split("/")[0]
+            payload = {"value": [{"chunkId": f"{index}-1", "content": "C"}, {"chunkId": "shared", "content": "S"}]}
+            return httpx.Response(200, json=payload, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttp())
+
+    chunks = asyncio.run(aretrieve_chunks(settings=SETTINGS, question="q", top_k=2))
+
+    assert _ids(chunks) == ["shared", "kb-billing-1"]
+    assert chunks.dropped == ("kb-slow",)
+    assert calls[:2] == [
+        ("https://example.search.windows.net/indexes/kb-billing/docs/search?api-version=2025-09-01", "search-key"),
+        ("https://other.search.windows.net/indexes/kb-storage/docs/search?api-version=2025-09-01", "other-key"),
+    ]
+    # Partial results are not cached, and an answer built from them says so.
+    asyncio.run(aretrieve_chunks(settings=SETTINGS, question="q", top_k=2))
+    assert len(calls) == 6
+    assert pack_for_deadline(chunks, None)[1] == "partial_results"
+
+
+def test_sync_retrieval_fans_out_with_shard_timeouts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("AZURE_SEARCH_SHARDS", json.dumps([{"index": "a"}, {"index": "b", "timeout_ms": 500}]))
+    timeouts = {}
+
+    class FakeHttp:
+        def post(self, url, *, headers, json, timeout):
+            index = url.split("/indexes/")[1].split("/")[0]
+            timeouts[index] = timeout
+            payload = {"value": [{"chunkId": f"{index}-{i}", "content": "C"} for i in range(json["top"])]}
+            return httpx.Response(200, json=payload, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr("app.rag.get_httpx_client", lambda: FakeHttp())
+
+    chunks = retrieve_chunks(settings=SETTINGS, question="q", top_k=3)
+
+    assert _ids(chunks) == ["a-0", "b-0", "a-1"]
+    assert not isinstance(chunks, PartialResults)
+    assert timeouts == {"a": 2.0, "b": 0.5}
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.filters import SearchFilter, odata_filter
+from app.main import app
+from app.rag import RetrievedChunk, aanswer_in_session, aretrieve_chunks
+
+
+SETTINGS = SimpleNamespace(
+    use_search_vectorizer=True,
+    azure_search_endpoint="https://example.search.windows.net",
+    azure_search_index="kb-index",
+    azure_search_api_version="2025-09-01",
+    azure_search_api_key="search-key",
+    azure_search_vector_field="contentVector",
+    azure_search_vectorizer="openai-vectorizer",
+    azure_openai_embed_deployment=None,
+    azure_openai_chat_deployment="chat",
+)
+
+
+def test_filters_translate_to_odata() -> None:
+    scoped = SearchFilter(source_path_prefixes=["docs/billing/", "docs/o'brien"], parent_ids=["p2", "p1"])
+    assert odata_filter(scoped) == (
+        "search.in(parentId, 'p1,p2', ',') and "
+        "((sourcePath ge 'docs/billing/' and sourcePath lt 'docs/billing0') or "
+        "(sourcePath ge 'docs/o''brien' and sourcePath lt 'docs/o''brieo'))"
+    )
+    # The delimiter never occurs in a value; with no free delimiter, values are compared one by one.
+    assert odata_filter(SearchFilter(parent_ids=["a,b", "c"])) == "search.in(parentId, 'a,b|c', '|')"
+    assert odata_filter(SearchFilter(parent_ids=[",|;~^"])) == "(parentId eq ',|;~^')"
+    assert odata_filter(SearchFilter(source_path_prefixes=["x"])) == "(sourcePath ge 'x' and sourcePath lt 'y')"
+    assert odata_filter(SearchFilter()) is None
+
+
+def test_filters_are_normalized_and_memoized() -> None:
+    a = SearchFilter(parent_ids=[" p2", "p1", "p2"])
+    b = SearchFilter(parent_ids=["p1", "p2"])
+    assert a == b and hash(a) == hash(b)
+
+    odata_filter.cache_clear()
+    odata_filter(a)
+    odata_filter(b)
+    assert odata_filter.cache_info().hits == 1
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"parent_ids": [""]},
+        {"parent_ids": ["p\n1"]},
+        {"parent_ids": ["p"] * 1001},
+        {"source_path_prefixes": ["x" * 1025]},
+        {"sourcePath": ["docs/"]},
+    ],
+)
+def test_invalid_filters_are_rejected(payload: dict) -> None:
+    with pytest.raises(ValidationError):
+        SearchFilter.model_validate(payload)
+    r = TestClient(app).post("/chat", json={"question": "q", "filter": payload})
+    assert r.status_code == 422
+
+
+def test_scoped_query_sends_prefilter_and_is_cached_per_filter(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    bodies = []
+
+    class FakeAsyncHttp:
+        async def post(self, url, headers, json):
+            bodies.append(json)
+            return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"value": []})
+
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttp())
+    billing = SearchFilter(source_path_prefixes=["docs/billing/"])
+
+    for search_filter in (billing, None, SearchFilter(source_path_prefixes=["docs/billing/"]), None):
+        asyncio.run(aretrieve_chunks(settings=SETTINGS, question="q", top_k=3, search_filter=search_filter))
+
+    assert len(bodies) == 2
+    assert bodies[0]["filter"] == "(sourcePath ge 'docs/billing/' and sourcePath lt 'docs/billing0')"
+    assert bodies[0]["vectorFilterMode"] == "preFilter"
+    assert "filter" not in bodies[1] and "vectorFilterMode" not in bodies[1]
+
+
+def test_session_retrieves_again_when_the_filter_changes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SESSION_MAX_SESSIONS", "10")
+    searches = []
+
+    async def fake_aretrieve_chunks(*, settings, question, top_k, search_filter=None):
+        searches.append(search_filter)
+        return [RetrievedChunk(chunk_id="c1", title="T", content="Quota is 240k", source_path=None, parent_id="p")]
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="a"))])
+
+    monkeypatch.setattr("app.rag.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr(
+        "app.rag.get_async_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    )
+    storage = SearchFilter(parent_ids=["p"])
+
+    session_id = "new"
+
+    def ask(search_filter: SearchFilter | None) -> None:
+        nonlocal session_id
+        answer = aanswer_in_session(
+            settings=SETTINGS, session_id=session_id, question="quota?", top_k=3, search_filter=search_filter
+        )
+        _answer, _chunks, session_id = asyncio.run(answer)
+
+    ask(storage)
+    ask(storage)
+    ask(None)
+    # The second turn is covered by the context already sent; the third is scoped differently.
+    assert searches == [storage, None]
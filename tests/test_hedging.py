@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.hedging import Hedger, LatencyTracker, get_search_hedger
+from app.rag import aretrieve_chunks
+
+
+def _warm(hedger: Hedger, seconds: float, n: int = 20) -> None:
+    for _ in range(n):
+        hedger.tracker.add(seconds)
+
+
+def test_latency_tracker_percentile() -> None:
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.add(i / 100)
+    assert tracker.percentile(0.95) is None
+    for i in range(9, 100):
+        tracker.add(i / 100)
+    assert tracker.percentile(0.95) == pytest.approx(0.95)
+    assert tracker.percentile(0.5) == pytest.approx(0.5)
+
+
+def test_no_hedge_without_history_or_when_fast() -> None:
+    hedger = Hedger(min_delay=0.01)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "ok"
+
+    assert asyncio.run(hedger.run(call)) == "ok"
+    _warm(hedger, 0.05)
+    assert hedger.delay() == 0.05
+    assert asyncio.run(hedger.run(call)) == "ok"
+    assert len(calls) == 2
+
+
+def test_slow_call_is_hedged_and_loser_cancelled() -> None:
+    hedger = Hedger()
+    _warm(hedger, 0.01)
+    attempts = []
+    cancelled = []
+
+    async def call():
+        attempt = len(attempts)
+        attempts.append(attempt)
+        try:
+            # The first attempt hit a slow replica; the duplicate is fast.
+            await asyncio.sleep(5 if attempt == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return attempt
+
+    async def main():
+        result = await hedger.run(call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == 1
+    assert attempts == [0, 1]
+    assert cancelled == [0]
+
+
+def test_hedged_call_fails_only_when_every_attempt_fails() -> None:
+    hedger = Hedger()
+    _warm(hedger, 0.01)
+    attempts = []
+
+    async def flaky():
+        attempt = len(attempts)
+        attempts.append(attempt)
+        await asyncio.sleep(0.05)
+        if attempt == 0:
+            raise RuntimeError("replica failed")
+        await asyncio.sleep(0.02)
+        return "second"
+
+    assert asyncio.run(hedger.run(flaky)) == "second"
+
+    async def broken():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        asyncio.run(hedger.run(broken))
+
+
+def test_latency_is_measured_from_the_first_attempt_whatever_the_outcome() -> None:
+    hedger = Hedger(tracker=LatencyTracker(min_samples=1))
+    hedger.tracker.add(0.05)
+    attempts = []
+
+    async def slow_first():
+        attempts.append(1)
+        await asyncio.sleep(5 if len(attempts) == 1 else 0.05)
+        return "ok"
+
+    assert asyncio.run(hedger.run(slow_first)) == "ok"
+    # The hedge took 0.05s, but the caller waited for the hedge delay as well.
+    assert hedger.tracker._samples[-1] >= 0.1
+
+    async def failing():
+        await asyncio.sleep(0.2)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedger.run(failing))
+    assert hedger.tracker._samples[-1] >= 0.2
+
+    async def abandoned():
+        await asyncio.wait_for(hedger.run(lambda: asyncio.sleep(5)), 0.3)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(abandoned())
+    assert len(hedger.tracker._samples) == 4 and hedger.tracker._samples[-1] >= 0.3
+
+
+def test_error_before_hedge_delay_is_not_retried() -> None:
+    hedger = Hedger()
+    _warm(hedger, 1.0)
+    attempts = []
+
+    async def fail():
+        attempts.append(1)
+        raise ValueError("bad query")
+
+    with pytest.raises(ValueError):
+        asyncio.run(hedger.run(fail))
+    assert attempts == [1]
+
+
+def test_aretrieve_chunks_hedges_slow_search(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SEARCH_HEDGE_ENABLED", "true")
+    monkeypatch.setenv("SEARCH_HEDGE_MIN_DELAY_MS", "0")
+    _warm(get_search_hedger(), 0.01)
+    posts = []
+
+    class FakeAsyncHttp:
+        async def post(self, url, headers, json):
+            posts.append(json)
+            await asyncio.sleep(5 if len(posts) == 1 else 0)
+            payload = {"value": [{"chunkId": "c1", "parentId": "p1", "title": "T", "content": "C"}]}
+            return httpx.Response(200, json=payload, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttp())
+    settings = SimpleNamespace(
+        use_search_vectorizer=True,
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="k",
+        azure_search_vector_field="contentVector",
+        azure_search_vectorizer="openai-vectorizer",
+        azure_openai_embed_deployment=None,
+    )
+
+    chunks = asyncio.run(aretrieve_chunks(settings=settings, question="q", top_k=3))
+
+    assert [c.chunk_id for c in chunks] == ["c1"]
+    assert len(posts) == 2 and posts[0] == posts[1]
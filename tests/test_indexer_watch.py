@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.indexer_watch import IndexerWatcher, start_indexer_watcher
+
+
+def _settings(**overrides):
+    values = dict(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_indexer="kb-indexer",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="admin-key",
+        answer_cache_enabled=False,
+        retrieval_cache_enabled=True,
+        answer_index_path=None,
+        answer_index_refresh_enabled=True,
+        indexer_poll_seconds=60.0,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class ScriptedWatcher(IndexerWatcher):
+    def __init__(self, statuses: list[dict], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._statuses = iter(statuses)
+
+    async def fetch_status(self) -> dict:
+        return next(self._statuses)
+
+
+def _status(end_time: str | None, *, status: str = "success", items: int = 3) -> dict:
+    if end_time is None:
+        return {"status": "running", "lastResult": {"status": "inProgress", "startTime": "t0"}}
+    return {"status": "running", "lastResult": {"status": status, "endTime": end_time, "itemsProcessed": items}}
+
+
+def test_watcher_invalidates_once_per_completed_run() -> None:
+    calls = []
+    watcher = ScriptedWatcher(
+        [
+            _status("t1"),  # baseline at startup
+            _status("t1"),
+            _status(None),  # next run in progress
+            _status("t2"),
+            _status("t2"),
+            _status("t3", items=0),  # no-op run: nothing to invalidate
+            _status("t4", status="transientFailure", items=0),
+        ],
+        settings=_settings(),
+        interval_seconds=0,
+        on_new_run=lambda: calls.append(1),
+    )
+
+    async def poll_all():
+        return [await watcher.poll_once() for _ in range(7)]
+
+    assert asyncio.run(poll_all()) == [False, False, False, True, False, True, True]
+    assert len(calls) == 2
+    assert watcher.last_version == "t4"
+
+
+def test_watcher_fetch_status_url(monkeypatch: pytest.MonkeyPatch) -> None:
+    seen = {}
+
+    class FakeAsyncHttp:
+        async def get(self, url, *, headers=None):
+            seen["url"] = url
+            seen["headers"] = headers
+            return SimpleNamespace(raise_for_status=lambda: None, json=lambda: _status("t1"))
+
+    monkeypatch.setattr("app.indexer_watch.get_async_httpx_client", lambda: FakeAsyncHttp())
+
+    watcher = IndexerWatcher(settings=_settings(), interval_seconds=1)
+    assert asyncio.run(watcher.fetch_status())["lastResult"]["endTime"] == "t1"
+    assert seen["url"] == "https://example.search.windows.net/indexers/kb-indexer/status?api-version=2025-09-01"
+    assert seen["headers"] == {"api-key": "admin-key"}
+
+
+def test_start_indexer_watcher_only_when_caches_enabled() -> None:
+    assert start_indexer_watcher(_settings(retrieval_cache_enabled=False)) is None
+    assert start_indexer_watcher(_settings(indexer_poll_seconds=0)) is None
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app import ingest
+from app.ingest import (
+    MAX_PAGE_LENGTH,
+    PAGE_OVERLAP_LENGTH,
+    IngestState,
+    Ingestor,
+    apply_results,
+    plan_ingest,
+    split_pages,
+)
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _settings(**overrides):
+    values = dict(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="admin-key",
+        azure_openai_embed_deployment="embed",
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class RecordingIngestor(Ingestor):
+    def __init__(self, *, reject: set[str] = frozenset(), **kwargs) -> None:
+        super().__init__(settings=_settings(), **kwargs)
+        self.embedded: list[str] = []
+        self.pushed: list[dict] = []
+        self.reject = reject
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(t))] for t in texts]
+
+    async def push(self, documents: list[dict]) -> set[str]:
+        self.pushed.extend(documents)
+        return {d["chunkId"] for d in documents if d["chunkId"] in self.reject}
+
+
+def _run(root: Path, state: IngestState, ingestor: RecordingIngestor) -> set[str]:
+    plan = plan_ingest(root, state)
+    failed = asyncio.run(ingestor.run(plan))
+    apply_results(state, plan, failed)
+    return failed
+
+
+def test_split_settings_match_skillset() -> None:
+    skillset = json.loads((PROJECT_ROOT / "search" / "skillset.json").read_text(encoding="utf-8"))
+    split = next(s for s in skillset["skills"] if s["@odata.type"].endswith("SplitSkill"))
+    assert (split["maximumPageLength"], split["pageOverlapLength"]) == (MAX_PAGE_LENGTH, PAGE_OVERLAP_LENGTH)
+
+
+def test_split_pages_bounds_and_overlap() -> None:
+    text = " ".join(f"Sentence number {i} is here." for i in range(400))
+    pages = split_pages(text)
+
+    assert len(pages) > 1
+    assert all(len(p) <= MAX_PAGE_LENGTH for p in pages)
+    for prev, nxt in zip(pages, pages[1:]):
+        # Each page starts inside the previous one and on a word boundary.
+        assert nxt.split(" ", 1)[0] in prev.split()
+        assert nxt[:40] in prev
+    assert pages[0].startswith("Sentence number 0") and pages[-1].endswith("399 is here.")
+    assert split_pages("  short  ") == ["short"]
+    assert split_pages("   ") == []
+
+
+def test_reingest_only_pushes_changed_chunks(tmp_path: Path) -> None:
+    (tmp_path / "a.md").write_text("alpha " * 10, encoding="utf-8")
+    (tmp_path / "b.txt").write_text("bravo " * 10, encoding="utf-8")
+    (tmp_path / ".hidden.md").write_text("ignored", encoding="utf-8")
+    state = IngestState(index="kb-index", embed_deployment="embed")
+
+    first = RecordingIngestor()
+    assert _run(tmp_path, state, first) == set()
+    assert sorted(first.embedded) == [("alpha " * 10).strip(), ("bravo " * 10).strip()]
+    assert {d["sourcePath"] for d in first.pushed} == {"a.md", "b.txt"}
+    assert all(d["@search.action"] == "mergeOrUpload" for d in first.pushed)
+
+    # Nothing changed: nothing is embedded or pushed.
+    second = RecordingIngestor()
+    _run(tmp_path, state, second)
+    assert second.embedded == [] and second.pushed == []
+    assert second.report.files_unchanged == 2
+
+    old_key = state.files["a.md"]["chunks"][0]
+    (tmp_path / "a.md").write_text("changed text", encoding="utf-8")
+    (tmp_path / "b.txt").unlink()
+    b_keys = state.files["b.txt"]["chunks"]
+
+    third = RecordingIngestor()
+    _run(tmp_path, state, third)
+    assert third.embedded == ["changed text"]
+    deletes = sorted(d["chunkId"] for d in third.pushed if d["@search.action"] == "delete")
+    assert deletes == sorted([old_key, *b_keys])
+    assert set(state.files) == {"a.md"}
+    assert third.report.chunks_uploaded == 1 and third.report.chunks_deleted == 2
+
+
+def test_failed_file_is_retried_next_run(tmp_path: Path) -> None:
+    (tmp_path / "a.md").write_text("alpha", encoding="utf-8")
+    state = IngestState(index="kb-index", embed_deployment="embed")
+    key = plan_ingest(tmp_path, state).upserts[0].key
+
+    failing = RecordingIngestor(reject={key})
+    assert _run(tmp_path, state, failing) == {key}
+    assert failing.report.chunks_failed == 1
+    assert "a.md" not in state.files
+
+    retry = RecordingIngestor()
+    _run(tmp_path, state, retry)
+    assert retry.embedded == ["alpha"]
+    assert state.files["a.md"]["chunks"] == [key]
+
+
+def test_state_round_trip_and_target_change(tmp_path: Path) -> None:
+    path = tmp_path / "state.json"
+    state = IngestState(index="kb-index", embed_deployment="embed", files={"a.md": {"sha256": "x", "chunks": ["k"]}})
+    state.save(path)
+
+    assert IngestState.load(path, index="kb-index", embed_deployment="embed").files == state.files
+    assert IngestState.load(path, index="kb-index", embed_deployment="other").files == {}
+
+
+def test_push_retries_throttled_items(monkeypatch: pytest.MonkeyPatch) -> None:
+    bodies = []
+    request = httpx.Request("POST", "https://example.search.windows.net/indexes/kb-index/docs/index")
+    responses = iter(
+        [
+            httpx.Response(503, headers={"retry-after": "0"}, request=request),
+            httpx.Response(
+                207,
+                json={
+                    "value": [
+                        {"key": "a", "status": True, "statusCode": 200},
+                        {"key": "b", "status": False, "statusCode": 429},
+                        {"key": "c", "status": False, "statusCode": 400, "errorMessage": "bad"},
+                    ]
+                },
+                request=request,
+            ),
+            httpx.Response(200, json={"value": [{"key": "b", "status": True, "statusCode": 200}]}, request=request),
+        ]
+    )
+
+    class FakeHttp:
+        async def post(self, url, headers, json):
+            bodies.append([d["chunkId"] for d in json["value"]])
+            return next(responses)
+
+    monkeypatch.setattr(ingest, "get_async_httpx_client", lambda: FakeHttp())
+    monkeypatch.setattr(ingest.random, "uniform", lambda a, b: 0)
+
+    ingestor = Ingestor(settings=_settings())
+    failed = asyncio.run(ingestor.push([{"chunkId": k} for k in "abc"]))
+
+    assert failed == {"c"}
+    assert bodies == [["a", "b", "c"], ["a", "b", "c"], ["b"]]
+
+
+def test_embed_honours_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
+    sleeps = []
+    calls = []
+
+    class FakeEmbeddings:
+        async def create(self, *, model, input):
+            calls.append(list(input))
+            if len(calls) == 1:
+                response = httpx.Response(
+                    429, headers={"retry-after-ms": "1500"}, request=httpx.Request("POST", "https://x")
+                )
+                raise openai.RateLimitError("slow down", response=response, body=None)
+            data = [SimpleNamespace(index=i, embedding=[0.5, float(i)]) for i in reversed(range(len(input)))]
+            return SimpleNamespace(data=data)
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(ingest, "get_async_openai_client", lambda: SimpleNamespace(embeddings=FakeEmbeddings()))
+    monkeypatch.setattr(ingest.asyncio, "sleep", fake_sleep)
+
+    vectors = asyncio.run(Ingestor(settings=_settings()).embed(["x", "y"]))
+
+    assert vectors == [[0.5, 0.0], [0.5, 1.0]]
+    assert sleeps == [1.5]
+    assert len(calls) == 2
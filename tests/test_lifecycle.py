@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import inspect
+import json
+import pkgutil
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app import cache, clients, context, lifecycle
+from app.main import app
+from app.rag import awarm_search
+from app.settings import get_settings, reload_settings
+
+
+def test_readiness_waits_for_warmup_and_reports_failed_steps(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def slow_openai(settings) -> None:
+        await asyncio.sleep(0.3)
+
+    async def search_down(settings) -> None:
+        raise httpx.ConnectError("down")
+
+    monkeypatch.setattr(lifecycle, "_warm_openai", slow_openai)
+    monkeypatch.setattr(lifecycle, "awarm_search", search_down)
+
+    with TestClient(app) as client:
+        # Liveness does not wait for the warmup.
+        assert client.get("/healthz").json() == {"status": "ok"}
+        r = client.get("/healthz/ready")
+        assert r.status_code == 503 and r.json()["status"] == "warming"
+
+        deadline = time.monotonic() + 5
+        while client.get("/healthz/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        status = client.get("/healthz/ready").json()
+
+    # Steps run concurrently, and a failed one does not keep the replica out of rotation.
+    assert status["status"] == "ready" and status["seconds"] < 1.0
+    steps = {s["name"]: s for s in status["steps"]}
+    assert steps["components"]["ok"] and steps["openai"]["ok"]
+    assert not steps["search"]["ok"] and "ConnectError" in steps["search"]["error"]
+    # The components step built the process-wide factories.
+    assert cache.get_retrieval_cache.cache_info().currsize == 1
+
+
+def test_warmup_steps_are_bounded_by_the_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("WARMUP_TIMEOUT_SECONDS", "0.05")
+
+    async def hang(settings) -> None:
+        await asyncio.sleep(10)
+
+    warmup = lifecycle.Warmup()
+    monkeypatch.setattr(warmup, "step_functions", lambda: {"hang": hang})
+    start = time.perf_counter()
+    asyncio.run(warmup.run(get_settings()))
+
+    assert time.perf_counter() - start < 1.0
+    assert warmup.ready and warmup.steps[0].ok is False and "TimeoutError" in warmup.steps[0].error
+
+
+def test_component_warmup_loads_the_tokenizer(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CONTEXT_TOKENIZER", "cl100k_base")
+    loaded = []
+    monkeypatch.setattr(context, "get_tokenizer", lambda name: loaded.append(name))
+
+    asyncio.run(lifecycle._warm_components(get_settings()))
+
+    assert loaded == ["cl100k_base"]
+
+
+def test_warm_up_primes_openai_endpoints_and_every_search_shard(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("AZURE_SEARCH_SHARDS", json.dumps([{"index": "a"}, {"index": "b"}]))
+    listed, posts = [], []
+
+    class FakeModels:
+        async def list(self):
+            listed.append(True)
+
+    class FakeAsyncHttp:
+        async def post(self, url, headers, json):
+            posts.append((url.split("/indexes/")[1].split("/")[0], json))
+            return httpx.Response(200, json={"value": []}, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(clients, "get_async_openai_client", lambda: SimpleNamespace(models=FakeModels()))
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttp())
+
+    asyncio.run(lifecycle._warm_openai(get_settings()))
+    asyncio.run(awarm_search(get_settings()))
+
+    assert listed == [True]
+    assert posts == [(index, {"search": "*", "top": 1, "select": "chunkId"}) for index in ("a", "b")]
+
+
+def test_settings_are_an_immutable_snapshot_until_reloaded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "false")
+    settings = get_settings()
+    assert get_settings() is settings
+    with pytest.raises(ValidationError):
+        settings.retrieval_cache_enabled = True
+
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    assert get_settings() is settings and cache.get_retrieval_cache() is None
+
+    monkeypatch.setenv("BATCH_MAX_CONCURRENCY", "0")
+    with pytest.raises(ValidationError):
+        reload_settings()
+    assert get_settings() is settings
+
+    monkeypatch.setenv("BATCH_MAX_CONCURRENCY", "4")
+    assert lifecycle.reload().retrieval_cache_enabled is True
+    assert cache.get_retrieval_cache() is not None
+
+
+def test_reload_endpoint_requires_the_admin_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_KEY", "admin")
+    monkeypatch.setattr(lifecycle.Warmup, "start", lambda self, settings: None)
+    client = TestClient(app)
+
+    assert client.post("/settings/reload").status_code == 403
+    monkeypatch.setenv("METRICS_ENABLED", "maybe")
+    assert client.post("/settings/reload", headers={"api-key": "admin"}).status_code == 422
+
+    monkeypatch.setenv("METRICS_ENABLED", "false")
+    assert client.post("/settings/reload", headers={"api-key": "admin"}).status_code == 204
+    assert get_settings().metrics_enabled is False
+
+
+def test_factory_registry_lists_every_process_wide_factory() -> None:
+    factories = set()
+    for info in pkgutil.iter_modules(importlib.import_module("app").__path__):
+        module = importlib.import_module(f"app.{info.name}")
+        for name, value in vars(module).items():
+            if name.startswith("get_") and hasattr(value, "cache_clear") and value.__module__ == module.__name__:
+                if not inspect.signature(value).parameters:
+                    factories.add(value)
+
+    assert factories == set(lifecycle.ALL_FACTORIES)
+    assert not set(lifecycle.RELOADABLE_FACTORIES) & set(lifecycle.STATEFUL_FACTORIES)
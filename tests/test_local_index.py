@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import local_index
+from app.filters import SearchFilter
+from app.local_index import LocalIndex, LocalIndexWriter, compressions_config, quantize_binary, quantize_int8
+from app.rag import aretrieve_chunks, retrieve_chunks
+
+
+DOCS = [
+    ({"chunkId": "c0", "parentId": "p0", "title": "Billing", "content": "Update your billing address"}, [1, 0, 0]),
+    ({"chunkId": "c1", "parentId": "p1", "title": "Passwords", "content": "Reset a forgotten password"}, [0, 1, 0]),
+    ({"chunkId": "c2", "parentId": "p1", "title": "Passwords", "content": "Password rules and expiry"}, [0, 0.9, 0.1]),
+    ({"chunkId": "c3", "parentId": "p2", "title": "Shipping", "content": "Delivery times by region"}, [0, 0, 1]),
+]
+
+
+def _build(path, dtype: str = "float32") -> LocalIndex:
+    with LocalIndexWriter(path, dim=3, dtype=dtype) as writer:
+        for doc, vec in DOCS:
+            writer.add(doc, vec)
+    return LocalIndex(path, vector_block_rows=2)
+
+
+def _build_vectors(path, vectors: np.ndarray, dtype: str, keep_originals: bool = True):
+    with LocalIndexWriter(path, dim=vectors.shape[1], dtype=dtype, keep_originals=keep_originals) as writer:
+        for i, vec in enumerate(vectors):
+            writer.add({"chunkId": f"c{i}", "content": ""}, vec)
+    return path
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8", "binary"])
+def test_vector_search_is_exact_cosine_across_blocks(tmp_path, dtype: str) -> None:
+    index = _build(tmp_path, dtype)
+    ids, scores = index.vector_search(np.array([0, 2, 0.1]), k=2)
+    assert ids.tolist() == [1, 2]
+    assert scores[0] == pytest.approx(0.9988, abs=0.01)
+
+
+def test_bm25_search_ranks_matching_terms(tmp_path) -> None:
+    index = _build(tmp_path)
+    ids, scores = index.bm25_search("password reset", k=10)
+    assert ids.tolist() == [1, 2]
+    assert scores[0] > scores[1] > 0
+    assert index.bm25_search("nonexistent", k=10)[0].tolist() == []
+
+
+def test_hybrid_search_returns_search_shaped_payload(tmp_path) -> None:
+    index = _build(tmp_path)
+    payload = index.search(question="delivery region", vector=np.array([0.0, 0.0, 1.0]), top_k=2)
+
+    top = payload["value"][0]
+    assert top["chunkId"] == "c3"
+    assert top["sourcePath"] is None
+    # Ranked first by both BM25 and vector search.
+    assert top["@search.score"] == pytest.approx(2 / 61)
+    assert len(payload["value"]) == 2
+
+
+def test_index_files_are_memory_mapped(tmp_path) -> None:
+    index = _build(tmp_path)
+    assert isinstance(index._vectors, np.memmap)
+    assert isinstance(index._postings_docs, np.memmap)
+    assert json.loads((tmp_path / "meta.json").read_text())["count"] == 4
+
+
+def test_quantize_int8_round_trips() -> None:
+    vectors = np.random.default_rng(0).normal(size=(5, 16)).astype(np.float32)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8
+    np.testing.assert_allclose(codes * scales[:, None], vectors, atol=float(scales.max()))
+
+
+def test_quantized_indexes_rescore_with_the_originals(tmp_path) -> None:
+    # Clustered, like real embeddings: every vector has a handful of close neighbours.
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(200, 64))
+    vectors = (centers[rng.integers(0, 200, 2000)] + rng.normal(scale=0.4, size=(2000, 64))).astype(np.float32)
+    queries = vectors[:20] + rng.normal(scale=0.1, size=(20, 64)).astype(np.float32)
+    exact = LocalIndex(_build_vectors(tmp_path / "f32", vectors, "float32"))
+
+    def recall(index: LocalIndex) -> float:
+        hits = 0
+        for q in queries:
+            truth = set(exact.vector_search(q, k=5)[0].tolist())
+            hits += len(truth & set(index.vector_search(q, k=5)[0].tolist()))
+        return hits / (5 * len(queries))
+
+    for dtype, ratio in (("int8", 4), ("binary", 32)):
+        rescored = LocalIndex(_build_vectors(tmp_path / dtype, vectors, dtype), oversampling=4)
+        codes_only = LocalIndex(_build_vectors(tmp_path / f"{dtype}-raw", vectors, dtype, keep_originals=False))
+        assert exact.vector_bytes() / codes_only.vector_bytes() >= ratio * 0.9
+        assert rescored.vector_bytes() == codes_only.vector_bytes()
+        # Rescoring recovers what the codes alone lose, and its scores are exact cosines.
+        assert recall(rescored) >= max(0.95, recall(codes_only))
+        ids, scores = rescored.vector_search(queries[0], k=3)
+        np.testing.assert_allclose(scores, exact.vectors()[ids] @ (queries[0] / np.linalg.norm(queries[0])), atol=1e-5)
+    assert quantize_binary(np.array([[0.5, -1, 0, 2, 1, 1, 1, 1, -3]])).tolist() == [[0b10011111, 0]]
+    with pytest.raises(ValueError, match="without originals"):
+        LocalIndex(tmp_path / "binary-raw").vectors()
+
+
+def test_compressions_config_references_every_profile(tmp_path, capsys) -> None:
+    definition = json.loads(open("search/index.json", encoding="utf-8").read())
+
+    block = compressions_config(definition, "binary", oversampling=8)
+
+    assert block["compressions"] == [
+        {
+            "name": "binary-compression",
+            "kind": "binaryQuantization",
+            "rescoringOptions": {
+                "enableRescoring": True,
+                "defaultOversampling": 8,
+                "rescoreStorageMethod": "preserveOriginals",
+            },
+        }
+    ]
+    assert {p["compression"] for p in block["profiles"]} == {"binary-compression"}
+    assert "compressions" not in definition["vectorSearch"]
+
+    local_index.main(["compressions", "--kind", "int8"])
+    printed = json.loads(capsys.readouterr().out)["vectorSearch"]["compressions"][0]
+    assert printed["scalarQuantizationParameters"] == {"quantizedDataType": "int8"}
+
+
+def test_build_cli_from_jsonl(tmp_path) -> None:
+    source = tmp_path / "export.jsonl"
+    source.write_text("\n".join(json.dumps({**doc, "contentVector": vec}) for doc, vec in DOCS), encoding="utf-8")
+
+    local_index.main(["build", str(source), str(tmp_path / "idx"), "--dtype", "int8"])
+    index = LocalIndex(tmp_path / "idx")
+    assert len(index) == 4
+    assert index.document(3)["chunkId"] == "c3"
+
+
+def test_retrieve_chunks_uses_local_index_when_configured(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    _build(tmp_path)
+    monkeypatch.setenv("LOCAL_INDEX_PATH", str(tmp_path))
+
+    def no_http():
+        raise AssertionError("Search must not be called")
+
+    monkeypatch.setattr("app.rag.get_httpx_client", no_http)
+    monkeypatch.setattr("app.rag.get_async_httpx_client", no_http)
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_vector_field="contentVector",
+        azure_search_vectorizer="openai-vectorizer",
+        use_search_vectorizer=True,
+        azure_openai_embed_deployment=None,
+    )
+    sync_results = retrieve_chunks(settings=settings, question="billing address", top_k=1)
+    async_results = asyncio.run(aretrieve_chunks(settings=settings, question="billing address", top_k=1))
+
+    assert [c.chunk_id for c in sync_results] == ["c0"]
+    assert sync_results == async_results
+    assert sync_results[0].parent_id == "p0"
+
+
+def test_search_filter_pre_filters_both_sides(tmp_path) -> None:
+    index = _build(tmp_path)
+    scoped = SearchFilter(parent_ids=["p1"])
+
+    vector = np.array([0.0, 0.0, 1.0])
+    payload = index.search(question="delivery password", vector=vector, top_k=4, search_filter=scoped)
+
+    # c3 is the best match on both sides but outside the scope; the results are all from p1, not a cut-down top-k.
+    assert [d["chunkId"] for d in payload["value"]] == ["c1", "c2"]
+    assert index.filter_mask(scoped).tolist() == [False, True, True, False]
+    assert index.filter_mask(SearchFilter(parent_ids=["p1"])) is index.filter_mask(scoped)
+
+
+def test_filter_masks_come_from_the_field_columns(tmp_path) -> None:
+    paths = ["docs/a/x.md", "docs/ab.md", "docs/b/y.md", None, "docs/é/z.md", "other/a.md"]
+    with LocalIndexWriter(tmp_path / "idx", dim=2) as writer:
+        for i, path in enumerate(paths):
+            writer.add({"chunkId": f"c{i}", "parentId": f"p{i // 2}", "content": "x", "sourcePath": path}, [1, 0])
+    index = LocalIndex(tmp_path / "idx")
+    filters = [
+        SearchFilter(source_path_prefixes=["docs/a"]),
+        SearchFilter(source_path_prefixes=["docs/a/", "docs/é"]),
+        SearchFilter(source_path_prefixes=["docs/"], parent_ids=["p0", "p2", "missing"]),
+        SearchFilter(parent_ids=["p1"]),
+        SearchFilter(source_path_prefixes=["zzz"]),
+    ]
+    expected = [[f.matches(index.document(i)) for i in range(len(paths))] for f in filters]
+
+    # Computed from the stored documents, as for an index written before the columns existed.
+    scanned = LocalIndex(tmp_path / "idx")
+    scanned._has_fields = False
+    for f, want in zip(filters, expected):
+        assert index.filter_mask(f).tolist() == want
+        assert scanned.filter_mask(f).tolist() == want
+    assert index.filter_mask(filters[1]).tolist() == [True, False, False, False, True, False]
+    assert index.parent_rows(["p1", "p9"]).tolist() == [2, 3]
+    assert scanned.parent_rows(["p1", "p9"]).tolist() == [2, 3]
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from types import SimpleNamespace
 
 from fastapi.testclient import TestClient
@@ -18,7 +19,7 @@ def test_healthz() -> None:
 def test_chat_returns_answer_and_citations(monkeypatch) -> None:
     monkeypatch.setattr("app.main.get_settings", lambda: SimpleNamespace())
 
-    def fake_answer_question(*, settings, question: str, top_k: int):
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
         assert question == "hello"
         assert top_k == 5
         return (
@@ -34,7 +35,7 @@ def test_chat_returns_answer_and_citations(monkeypatch) -> None:
             ],
         )
 
-    monkeypatch.setattr("app.main.answer_question", fake_answer_question)
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
 
     client = TestClient(app)
     r = client.post("/chat", json={"question": "hello", "top_k": 5})
@@ -51,3 +52,123 @@ def test_chat_validation_errors() -> None:
     assert client.post("/chat", json={"question": "ok", "top_k": 0}).status_code == 422
     assert client.post("/chat", json={"question": "ok", "top_k": 51}).status_code == 422
 
+
+
+def _parse_sse(body: str) -> list[tuple[str, object]]:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_sends_citations_then_deltas(monkeypatch) -> None:
+    monkeypatch.setattr("app.main.get_settings", lambda: SimpleNamespace())
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="Doc", content="content", source_path="blob://doc")]
+
+    async def fake_aretrieve_chunks(*, settings, question: str, top_k: int, search_filter=None):
+        return chunks
+
+    async def fake_astream_answer(*, settings, question: str, chunks):
+        yield "hi "
+        yield "there"
+
+    monkeypatch.setattr("app.main.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr("app.main.astream_answer", fake_astream_answer)
+
+    client = TestClient(app)
+    r = client.post("/chat/stream", json={"question": "hello"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert _parse_sse(r.text) == [
+        ("citations", [{"chunk_id": "c1", "title": "Doc", "source_path": "blob://doc", "parent_id": "p1"}]),
+        ("delta", {"text": "hi "}),
+        ("delta", {"text": "there"}),
+        ("done", {}),
+    ]
+
+
+def test_chat_stream_reports_generation_errors_in_band(monkeypatch) -> None:
+    monkeypatch.setattr("app.main.get_settings", lambda: SimpleNamespace())
+
+    async def fake_aretrieve_chunks(*, settings, question: str, top_k: int, search_filter=None):
+        return []
+
+    async def failing_astream_answer(*, settings, question: str, chunks):
+        yield "partial"
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("app.main.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr("app.main.astream_answer", failing_astream_answer)
+
+    client = TestClient(app)
+    events = _parse_sse(client.post("/chat/stream", json={"question": "hello"}).text)
+    assert [e for e, _ in events] == ["citations", "delta", "error", "done"]
+
+
+def test_cache_stats_and_invalidate(monkeypatch) -> None:
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.setenv("ADMIN_API_KEY", "admin")
+
+    client = TestClient(app)
+    r = client.get("/cache/stats")
+    assert r.status_code == 200
+    assert r.json()["answer"]["hits"] == 0
+
+    assert client.post("/cache/invalidate").status_code == 403
+    assert client.post("/cache/invalidate", headers={"api-key": "wrong"}).status_code == 403
+    assert client.post("/cache/invalidate", headers={"api-key": "admin"}).status_code == 204
+
+
+def test_cache_invalidate_disabled_without_admin_key(monkeypatch) -> None:
+    monkeypatch.delenv("ADMIN_API_KEY", raising=False)
+    client = TestClient(app)
+    assert client.post("/cache/invalidate", headers={"api-key": ""}).status_code == 403
+
+
+def test_chat_batch_dedupes_and_reports_per_item_errors(monkeypatch) -> None:
+    calls = []
+
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
+        calls.append(question)
+        if question == "bad":
+            raise RuntimeError("upstream 500")
+        return (
+            f"answer to {question}",
+            [RetrievedChunk(chunk_id="c1", parent_id="p1", title="Doc", content="x", source_path=None)],
+        )
+
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
+
+    client = TestClient(app)
+    items = [{"question": "one"}, {"question": "bad"}, {"question": "One?"}, {"question": "two", "top_k": 2}]
+    r = client.post("/chat/batch", json={"items": items})
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [item["index"] for item in results] == [0, 1, 2, 3]
+    assert results[0]["answer"] == results[2]["answer"] == "answer to one"
+    assert results[0]["citations"][0]["chunk_id"] == "c1"
+    assert results[1]["answer"] is None
+    assert results[1]["error"] == "RuntimeError: upstream 500"
+    assert results[3]["answer"] == "answer to two"
+    assert sorted(calls) == ["bad", "one", "two"]
+
+
+def test_chat_batch_streams_ndjson(monkeypatch) -> None:
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
+        return question.upper(), []
+
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
+
+    client = TestClient(app)
+    r = client.post("/chat/batch", json={"items": [{"question": "a"}, {"question": "b"}], "stream": True})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted((line["index"], line["answer"]) for line in lines) == [(0, "A"), (1, "B")]
+
+
+def test_chat_batch_validation() -> None:
+    client = TestClient(app)
+    assert client.post("/chat/batch", json={"items": []}).status_code == 422
+    assert client.post("/chat/batch", json={"items": [{"question": ""}]}).status_code == 422
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app import clients
+from app.openai_router import (
+    AsyncOpenAIRouter,
+    DeploymentPool,
+    OpenAIRouter,
+    PoolExhausted,
+    PoolMember,
+    estimate_tokens,
+    get_deployment_pool,
+)
+from app.settings import OpenAIDeployment
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _member(name: str, *, tpm: int | None = None, rpm: int | None = None, kind: str = "chat") -> PoolMember:
+    member = PoolMember.from_config(
+        OpenAIDeployment(endpoint=f"https://{name}.openai.azure.com", deployment="gpt", kind=kind, tpm=tpm, rpm=rpm)
+    )
+    member.tokens.updated = member.requests.updated = 1000.0
+    return member
+
+
+def _error(cls, status: int, headers: dict[str, str] | None = None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://x"))
+    return cls("upstream failed", response=response, body=None)
+
+
+class FakeResource:
+    """`client.chat.completions` / `client.embeddings` stand-in serving scripted outcomes."""
+
+    def __init__(self, outcomes: list) -> None:
+        self.outcomes = outcomes
+        self.calls: list[dict] = []
+        self.with_raw_response = self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        headers, result = outcome
+        return SimpleNamespace(headers=headers, parse=lambda: result)
+
+
+class AsyncFakeResource(FakeResource):
+    async def create(self, **kwargs):
+        return FakeResource.create(self, **kwargs)
+
+
+def _client(resource: FakeResource):
+    return SimpleNamespace(chat=SimpleNamespace(completions=resource), embeddings=resource)
+
+
+def _ok(total_tokens: int = 10, headers: dict[str, str] | None = None):
+    return headers or {}, SimpleNamespace(usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+def test_estimate_tokens() -> None:
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 400}]
+    assert estimate_tokens("chat", {"messages": messages, "max_tokens": 50}) == 250
+    assert estimate_tokens("chat", {"messages": messages}) == 200 + 1024
+    assert estimate_tokens("embeddings", {"input": ["a" * 40, "b" * 40]}) == 20
+    assert estimate_tokens("embeddings", {"input": ""}) == 1
+
+
+def test_acquire_prefers_least_loaded_member_and_waits_when_saturated() -> None:
+    clock = FakeClock()
+    a, b = _member("a", tpm=6000), _member("b", tpm=6000)
+    pool = DeploymentPool([a, b], clock=clock)
+
+    first, _ = pool.acquire("chat", 3000)
+    second, _ = pool.acquire("chat", 1000)
+    assert (first, second) == (a, b)
+    # a: 3000 left, b: 5000 left.
+    third, _ = pool.acquire("chat", 4000)
+    assert third is b
+
+    member, wait = pool.acquire("chat", 4000)
+    assert member is None
+    # a refills 100 tokens/s and needs 1000 more.
+    assert wait == pytest.approx(10.0)
+    clock.now += 10
+    assert pool.acquire("chat", 4000)[0] is a
+    assert pool.acquire("embeddings", 1) == (None, float("inf"))
+
+
+def test_response_headers_and_usage_update_the_budget() -> None:
+    clock = FakeClock()
+    member = _member("a", tpm=10000)
+    pool = DeploymentPool([member], clock=clock)
+
+    pool.acquire("chat", 2000)
+    pool.succeeded(member, 2000, headers={}, used=500)
+    assert member.tokens.level == pytest.approx(9500)
+    assert member.in_flight == 0
+
+    # Another client shares the deployment: the service's count wins over our estimate.
+    pool.acquire("chat", 2000)
+    pool.succeeded(member, 2000, headers={"x-ratelimit-remaining-tokens": "1200"}, used=500)
+    assert member.tokens.level == 1200
+
+    unknown = _member("b")
+    pool = DeploymentPool([unknown], clock=clock)
+    pool.acquire("chat", 100)
+    pool.succeeded(
+        unknown,
+        100,
+        headers={"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "3"},
+        used=None,
+    )
+    assert unknown.requests.per_minute == 60 and unknown.requests.level == 3
+
+
+def test_router_fails_over_on_429_and_cools_the_member_down() -> None:
+    clock = FakeClock()
+    a, b = _member("a", tpm=100000), _member("b", tpm=50000)
+    pool = DeploymentPool([a, b], clock=clock)
+    throttled = FakeResource([_error(openai.RateLimitError, 429, {"retry-after-ms": "3000"}), _ok()])
+    healthy = FakeResource([_ok(), _ok()])
+    router = OpenAIRouter(pool, {a.name: _client(throttled), b.name: _client(healthy)}, max_wait=0)
+
+    router.chat.completions.create(model="chat", messages=[{"role": "user", "content": "hi"}])
+
+    assert len(throttled.calls) == 1 and len(healthy.calls) == 1
+    assert healthy.calls[0]["model"] == "gpt"
+    assert a.cooldown_until == clock.now + 3
+    assert (a.in_flight, b.in_flight) == (0, 0)
+
+    # a stays out of rotation until the cooldown ends, even though it has more budget left.
+    router.chat.completions.create(model="chat", messages=[])
+    assert len(healthy.calls) == 2
+    clock.now += 3
+    router.chat.completions.create(model="chat", messages=[])
+    assert len(throttled.calls) == 2
+
+
+def test_router_raises_last_error_when_every_member_fails() -> None:
+    a, b = _member("a"), _member("b")
+    pool = DeploymentPool([a, b], clock=FakeClock())
+    router = OpenAIRouter(
+        pool,
+        {
+            a.name: _client(FakeResource([_error(openai.InternalServerError, 503)])),
+            b.name: _client(FakeResource([_error(openai.InternalServerError, 500)])),
+        },
+        max_wait=0,
+    )
+
+    with pytest.raises(openai.InternalServerError) as exc_info:
+        router.chat.completions.create(model="chat", messages=[])
+    assert exc_info.value.status_code == 500
+    # No retry-after: exponential backoff starting at 1s.
+    assert a.cooldown_until == 1001.0 and a.failures == 1
+
+
+def test_retry_after_zero_still_cools_the_member_down(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = FakeClock()
+    monkeypatch.setattr("app.openai_router.time.sleep", lambda seconds: setattr(clock, "now", clock.now + seconds))
+    a = _member("a")
+    pool = DeploymentPool([a], clock=clock)
+    throttled = FakeResource([_error(openai.RateLimitError, 429, {"retry-after": "0"}) for _ in range(10)])
+    router = OpenAIRouter(pool, {a.name: _client(throttled)}, max_wait=2)
+
+    with pytest.raises(openai.RateLimitError):
+        router.chat.completions.create(model="chat", messages=[])
+    # Backoff (1s, then 2s: past max_wait) instead of calling the member again right away.
+    assert len(throttled.calls) == 2 and a.failures == 2 and clock.now == 1001.0
+
+
+def test_router_stops_failing_over_after_max_wait() -> None:
+    clock = FakeClock()
+    a, b = _member("a", tpm=100000), _member("b", tpm=50000)
+    pool = DeploymentPool([a, b], clock=clock)
+
+    class SlowResource(FakeResource):
+        def create(self, **kwargs):
+            clock.now += 3
+            return super().create(**kwargs)
+
+    slow = SlowResource([_error(openai.InternalServerError, 503)])
+    healthy = FakeResource([_ok()])
+    router = OpenAIRouter(pool, {a.name: _client(slow), b.name: _client(healthy)}, max_wait=2)
+
+    with pytest.raises(openai.InternalServerError):
+        router.chat.completions.create(model="chat", messages=[])
+    assert len(slow.calls) == 1 and healthy.calls == []
+
+
+def test_router_does_not_fail_over_on_client_errors() -> None:
+    a, b = _member("a", tpm=10000), _member("b", tpm=10000)
+    pool = DeploymentPool([a, b], clock=FakeClock())
+    rejected = FakeResource([_error(openai.BadRequestError, 400)])
+    other = FakeResource([])
+    router = OpenAIRouter(pool, {a.name: _client(rejected), b.name: _client(other)}, max_wait=0)
+
+    with pytest.raises(openai.BadRequestError):
+        router.chat.completions.create(model="chat", messages=[], max_tokens=100)
+    assert other.calls == []
+    assert a.tokens.level == 10000 and a.in_flight == 0 and a.cooldown_until == 0
+
+
+def test_async_router_waits_for_budget_then_gives_up() -> None:
+    member = _member("a", rpm=600, kind="embeddings")
+    pool = DeploymentPool([member])
+    member.tokens.updated = member.requests.updated = pool.clock()
+    resource = AsyncFakeResource([_ok(), _ok()])
+    router = AsyncOpenAIRouter(pool, {member.name: _client(resource)}, max_wait=0.5)
+
+    async def main():
+        member.requests.level = 0
+        # 10 requests/s: the next slot is 0.1s away, within max_wait.
+        await router.embeddings.create(model="emb", input=["q"])
+        member.cooldown_until = pool.clock() + 60
+        with pytest.raises(PoolExhausted):
+            await router.embeddings.create(model="emb", input=["q"])
+
+    asyncio.run(main())
+    assert len(resource.calls) == 1
+
+
+def test_get_openai_client_builds_router_from_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "default-key")
+    monkeypatch.setenv("AZURE_OPENAI_EMBED_DEPLOYMENT", "embed")
+    monkeypatch.setenv(
+        "AZURE_OPENAI_DEPLOYMENTS",
+        json.dumps(
+            [
+                {"endpoint": "https://east.openai.azure.com", "deployment": "gpt-east", "tpm": 30000},
+                {"endpoint": "https://west.openai.azure.com", "deployment": "gpt-west", "api_key": "west-key"},
+            ]
+        ),
+    )
+    created = []
+
+    class DummyAzureOpenAI:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+    monkeypatch.setattr(clients, "AzureOpenAI", DummyAzureOpenAI)
+
+    router = clients.get_openai_client()
+
+    assert isinstance(router, OpenAIRouter)
+    assert router.pool is get_deployment_pool()
+    kinds = [(m.kind, m.deployment, m.api_key) for m in router.pool.members]
+    assert kinds == [
+        ("chat", "gpt-east", "default-key"),
+        ("chat", "gpt-west", "west-key"),
+        # No embeddings member configured: the single-deployment settings fill in.
+        ("embeddings", "embed", "default-key"),
+    ]
+    # One client per endpoint + key, without SDK retries (the router fails over instead).
+    assert [c["azure_endpoint"] for c in created] == [
+        "https://east.openai.azure.com",
+        "https://west.openai.azure.com",
+        "https://example.openai.azure.com/",
+    ]
+    assert all(c["max_retries"] == 0 for c in created)
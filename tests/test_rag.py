@@ -1,10 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 from types import SimpleNamespace
 
+import numpy as np
 import pytest
 
-from app.rag import RetrievedChunk, answer_question, retrieve_chunks
+from app.rag import (
+    RetrievedChunk,
+    aanswer_question,
+    answer_question,
+    aretrieve_chunks,
+    astream_answer,
+    retrieve_chunks,
+)
 
 
 class FakeResponse:
@@ -33,6 +42,11 @@ class FakeHttpClient:
         return FakeResponse(self._payload)
 
 
+class FakeAsyncHttpClient(FakeHttpClient):
+    async def post(self, url, *, headers=None, json=None):
+        return super().post(url, headers=headers, json=json)
+
+
 def test_retrieve_chunks_uses_search_vectorizer(monkeypatch: pytest.MonkeyPatch) -> None:
     payload = {
         "value": [
@@ -126,7 +140,8 @@ def test_retrieve_chunks_embeds_query_when_not_using_search_vectorizer(monkeypat
     assert calls == {"model": "embeddings", "input": "q"}
     vq = fake_http.last_json["vectorQueries"][0]
     assert vq["kind"] == "vector"
-    assert vq["vector"] == [0.1, 0.2, 0.3]
+    # Query embeddings are kept as float32, the precision Search stores for Collection(Edm.Single).
+    assert vq["vector"] == np.float32([0.1, 0.2, 0.3]).tolist()
     assert vq["k"] == 2
     assert vq["fields"] == "contentVector"
 
@@ -148,7 +163,7 @@ def test_answer_question_formats_context_and_returns_citations(monkeypatch: pyte
             source_path=None,
         ),
     ]
-    monkeypatch.setattr("app.rag.retrieve_chunks", lambda *, settings, question, top_k: chunks)
+    monkeypatch.setattr("app.rag.retrieve_chunks", lambda *, settings, question, top_k, search_filter=None: chunks)
 
     called = {}
 
@@ -167,7 +182,11 @@ def test_answer_question_formats_context_and_returns_citations(monkeypatch: pyte
 
     monkeypatch.setattr("app.rag.get_openai_client", lambda: FakeOAI())
 
-    settings = SimpleNamespace(azure_openai_chat_deployment="chat")
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_openai_chat_deployment="chat",
+    )
     answer, got_chunks = answer_question(settings=settings, question="q", top_k=2)
 
     assert answer == "answer"
@@ -181,3 +200,214 @@ def test_answer_question_formats_context_and_returns_citations(monkeypatch: pyte
     assert "[2] Untitled" in user_msg
     assert "C2" in user_msg
 
+
+
+def test_aretrieve_chunks_matches_sync_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    payload = {"value": [{"chunkId": "c1", "parentId": "p1", "title": "Doc 1", "content": "hello"}]}
+    fake_http = FakeAsyncHttpClient(payload)
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: fake_http)
+
+    calls = {}
+
+    class FakeEmbeddings:
+        async def create(self, *, model: str, input: str):
+            calls["model"] = model
+            calls["input"] = input
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.25])])
+
+    class FakeOAI:
+        embeddings = FakeEmbeddings()
+
+    monkeypatch.setattr("app.rag.get_async_openai_client", lambda: FakeOAI())
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="search-key",
+        azure_search_vector_field="contentVector",
+        azure_search_vectorizer="openai-vectorizer",
+        use_search_vectorizer=False,
+        azure_openai_embed_deployment="embeddings",
+    )
+
+    results = asyncio.run(aretrieve_chunks(settings=settings, question="q", top_k=4))
+
+    assert [r.chunk_id for r in results] == ["c1"]
+    assert calls == {"model": "embeddings", "input": "q"}
+    assert fake_http.last_headers["api-key"] == "search-key"
+    assert fake_http.last_json["top"] == 4
+    vq = fake_http.last_json["vectorQueries"][0]
+    assert vq == {"kind": "vector", "vector": [0.5, 0.25], "k": 4, "fields": "contentVector"}
+
+
+def test_aanswer_question_uses_async_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="T1", content="C1", source_path="blob://doc1")]
+
+    async def fake_aretrieve_chunks(*, settings, question, top_k, search_filter=None):
+        return chunks
+
+    monkeypatch.setattr("app.rag.aretrieve_chunks", fake_aretrieve_chunks)
+
+    called = {}
+
+    class FakeChatCompletions:
+        async def create(self, *, model: str, messages, temperature: float):
+            called["model"] = model
+            called["messages"] = messages
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="async answer"))])
+
+    class FakeChat:
+        completions = FakeChatCompletions()
+
+    class FakeOAI:
+        chat = FakeChat()
+
+    monkeypatch.setattr("app.rag.get_async_openai_client", lambda: FakeOAI())
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_openai_chat_deployment="chat",
+    )
+    answer, got_chunks = asyncio.run(aanswer_question(settings=settings, question="q", top_k=1))
+
+    assert answer == "async answer"
+    assert got_chunks == chunks
+    assert called["model"] == "chat"
+    user_msg = next(m for m in called["messages"] if m["role"] == "user")["content"]
+    assert "[1] T1" in user_msg
+
+
+def test_astream_answer_yields_text_deltas(monkeypatch: pytest.MonkeyPatch) -> None:
+    def event(content):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    async def fake_stream():
+        yield SimpleNamespace(choices=[])
+        yield event("Hel")
+        yield event(None)
+        yield event("lo [1]")
+
+    called = {}
+
+    class FakeChatCompletions:
+        async def create(self, *, model: str, messages, temperature: float, stream: bool):
+            called["stream"] = stream
+            called["messages"] = messages
+            return fake_stream()
+
+    class FakeOAI:
+        chat = SimpleNamespace(completions=FakeChatCompletions())
+
+    monkeypatch.setattr("app.rag.get_async_openai_client", lambda: FakeOAI())
+
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="T1", content="C1", source_path=None)]
+
+    settings = SimpleNamespace(azure_openai_chat_deployment="chat")
+
+    async def collect():
+        return [d async for d in astream_answer(settings=settings, question="q", chunks=chunks)]
+
+    assert asyncio.run(collect()) == ["Hel", "lo [1]"]
+    assert called["stream"] is True
+    assert "[1] T1" in called["messages"][1]["content"]
+
+
+def test_answer_question_serves_repeated_questions_from_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="T1", content="C1", source_path=None)]
+    retrievals = []
+
+    def fake_retrieve_chunks(*, settings, question, top_k, search_filter=None):
+        retrievals.append(question)
+        return chunks
+
+    monkeypatch.setattr("app.rag.retrieve_chunks", fake_retrieve_chunks)
+
+    class FakeChatCompletions:
+        def create(self, *, model: str, messages, temperature: float):
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="answer"))])
+
+    class FakeOAI:
+        chat = SimpleNamespace(completions=FakeChatCompletions())
+
+    monkeypatch.setattr("app.rag.get_openai_client", lambda: FakeOAI())
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_openai_chat_deployment="chat",
+        azure_openai_embed_deployment=None,
+    )
+    first = answer_question(settings=settings, question="What is X?", top_k=2)
+    second = answer_question(settings=settings, question="what is x", top_k=2)
+    answer_question(settings=settings, question="what is x", top_k=3)
+
+    assert first == second == ("answer", chunks)
+    assert retrievals == ["What is X?", "what is x"]
+
+
+def test_retrieve_chunks_uses_retrieval_cache_until_invalidated(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.cache import invalidate_caches
+
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    payload = {"value": [{"chunkId": "c1", "parentId": "p1", "title": "Doc 1", "content": "hello"}]}
+    posts = []
+
+    class CountingHttpClient(FakeHttpClient):
+        def post(self, url, *, headers=None, json=None):
+            posts.append(json["search"])
+            return super().post(url, headers=headers, json=json)
+
+    monkeypatch.setattr("app.rag.get_httpx_client", lambda: CountingHttpClient(payload))
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="search-key",
+        azure_search_vector_field="contentVector",
+        azure_search_vectorizer="openai-vectorizer",
+        use_search_vectorizer=True,
+        azure_openai_embed_deployment=None,
+    )
+
+    first = retrieve_chunks(settings=settings, question="What is this?", top_k=3)
+    second = retrieve_chunks(settings=settings, question="what is this", top_k=3)
+    retrieve_chunks(settings=settings, question="what is this", top_k=4)
+    assert first == second
+    assert posts == ["What is this?", "what is this"]
+
+    invalidate_caches()
+    retrieve_chunks(settings=settings, question="what is this", top_k=3)
+    assert len(posts) == 3
+
+
+def test_query_embeddings_are_cached_across_sync_and_async_paths(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.rag.get_httpx_client", lambda: FakeHttpClient({"value": []}))
+    monkeypatch.setattr("app.rag.get_async_httpx_client", lambda: FakeAsyncHttpClient({"value": []}))
+
+    calls = []
+
+    class FakeEmbeddings:
+        def create(self, *, model: str, input: str):
+            calls.append(input)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.25])])
+
+    monkeypatch.setattr("app.rag.get_openai_client", lambda: SimpleNamespace(embeddings=FakeEmbeddings()))
+
+    settings = SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_search_api_version="2025-09-01",
+        azure_search_api_key="search-key",
+        azure_search_vector_field="contentVector",
+        azure_search_vectorizer="openai-vectorizer",
+        use_search_vectorizer=False,
+        azure_openai_embed_deployment="embeddings",
+    )
+
+    retrieve_chunks(settings=settings, question="Same question?", top_k=2)
+    asyncio.run(aretrieve_chunks(settings=settings, question="same question", top_k=2))
+    assert calls == ["Same question?"]
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import LRUCache
+from app.context import ByteEstimateTokenizer, ContextPacker
+from app.main import app
+from app.rag import SYSTEM_PROMPT, RetrievedChunk, aanswer_in_session
+from app.sessions import Session, SessionManager, get_session_manager
+
+
+def _chunk(i: int, content: str) -> RetrievedChunk:
+    return RetrievedChunk(chunk_id=f"c{i}", parent_id=f"p{i}", title=f"T{i}", content=content, source_path="s")
+
+
+CORPUS = {
+    "quota": [_chunk(1, "The embedding quota is 240k tokens per minute per deployment.")],
+    "retry": [
+        _chunk(1, "The embedding quota is 240k tokens per minute per deployment."),
+        _chunk(2, "Clients retry throttled calls with exponential backoff and honor retry-after."),
+    ],
+}
+
+
+def _packer(budget: int = 10_000) -> ContextPacker:
+    return ContextPacker(token_budget=budget, tokenizer=ByteEstimateTokenizer(), min_block_tokens=1)
+
+
+def _manager(**kwargs) -> SessionManager:
+    return SessionManager(store=LRUCache(max_entries=10), **kwargs)
+
+
+def _fake_pipeline(monkeypatch: pytest.MonkeyPatch, packer: ContextPacker) -> tuple[list[str], list[list[dict]]]:
+    searches: list[str] = []
+    prompts: list[list[dict]] = []
+
+    async def fake_aretrieve_chunks(*, settings, question: str, top_k: int, search_filter=None):
+        searches.append(question)
+        return CORPUS["retry" if "retr" in question else "quota"]
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            prompts.append(kwargs["messages"])
+            text = f"answer {len(prompts)}"
+            if kwargs.get("stream"):
+                return _stream(text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    async def _stream(text: str):
+        for part in text.split(" "):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part + " "))])
+
+    monkeypatch.setattr("app.rag.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr("app.rag.get_context_packer", lambda: packer)
+    monkeypatch.setattr(
+        "app.rag.get_async_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    )
+    return searches, prompts
+
+
+@pytest.fixture(autouse=True)
+def _sessions_enabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SESSION_MAX_SESSIONS", "10")
+
+
+def _ask(question: str, session_id: str | None = "new") -> tuple[str, list[RetrievedChunk], str | None]:
+    settings = SimpleNamespace(azure_openai_chat_deployment="chat")
+    return asyncio.run(aanswer_in_session(settings=settings, session_id=session_id, question=question, top_k=5))
+
+
+def test_coverage_counts_content_words() -> None:
+    session = Session(id="s", chunks=[_chunk(1, "x")], vocabulary={"embedding", "quota", "deployment"})
+    assert session.coverage("What is the embedding quota?") == 1.0
+    assert session.coverage("How do retries work for the embedding deployment?") == pytest.approx(2 / 4)
+    assert Session(id="empty").coverage("What is the embedding quota?") == 0.0
+
+
+def test_follow_ups_reuse_context_and_keep_a_stable_prompt_prefix(monkeypatch: pytest.MonkeyPatch) -> None:
+    searches, prompts = _fake_pipeline(monkeypatch, _packer())
+
+    answer, chunks, session_id = _ask("What is the embedding quota?")
+    assert answer == "answer 1" and [c.chunk_id for c in chunks] == ["c1"]
+
+    # Covered by the context already sent: no Search call, no new context.
+    answer, chunks, again = _ask("Is the quota per deployment?", session_id)
+    assert again == session_id and len(searches) == 1
+    assert prompts[1][-1] == {"role": "user", "content": "Question:\nIs the quota per deployment?"}
+
+    # Not covered: retrieve (with the previous question for context) and send only the new chunk, numbered on.
+    answer, chunks, _ = _ask("How do retries work?", session_id)
+    assert searches[-1] == "Is the quota per deployment?\nHow do retries work?"
+    assert [c.chunk_id for c in chunks] == ["c1", "c2"]
+    assert prompts[2][-1]["content"].startswith("Context:\n[2] T2")
+    assert "[1]" not in prompts[2][-1]["content"]
+
+    # Every prompt starts with the previous prompt plus its answer, byte for byte.
+    for before, after in zip(prompts, prompts[1:]):
+        assert after[0] == {"role": "system", "content": SYSTEM_PROMPT}
+        assert after[: len(before)] == before
+        assert after[len(before)]["role"] == "assistant"
+
+    # Other sessions start from scratch.
+    _ask("What is the embedding quota?")
+    assert prompts[-1][1]["content"].startswith("Context:\n[1] T1")
+    assert len(prompts[-1]) == 2
+
+
+def test_session_ids_are_issued_by_the_server(monkeypatch: pytest.MonkeyPatch) -> None:
+    searches, prompts = _fake_pipeline(monkeypatch, _packer())
+    _answer, _chunks, issued = _ask("What is the embedding quota?", session_id="alice")
+
+    # A client-chosen id never names a session: it starts a new one under an unguessable id.
+    assert issued != "alice" and len(issued) >= 32
+    _ask("Is the quota per deployment?", session_id="alice")
+    assert len(prompts[-1]) == 2 and len(searches) == 2
+    assert _ask("Is the quota per deployment?", session_id=issued)[2] == issued
+    assert len(prompts[-1]) == 4 and len(searches) == 2
+
+
+def test_sessions_are_opt_in(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("SESSION_MAX_SESSIONS")
+    assert get_session_manager() is None
+
+
+def test_session_rolls_over_after_max_turns_or_when_budget_is_spent() -> None:
+    manager = _manager(max_turns=2)
+    packer = _packer()
+    session = manager.get("s")
+    for question in ("embedding quota?", "quota per deployment?"):
+        retrieved = CORPUS["quota"] if manager.needs_retrieval(session, question) else None
+        turn = manager.prepare(session, question=question, retrieved=retrieved, packer=packer, system_prompt="sys")
+        turn.commit("ok")
+    assert session.turns == 2 and len(session.messages) == 4
+
+    assert manager.needs_retrieval(session, "quota per deployment?")
+    turn = manager.prepare(session, question="again?", retrieved=CORPUS["quota"], packer=packer, system_prompt="sys")
+    assert turn.reset and len(turn.messages) == 2 and [c.chunk_id for c in turn.chunks] == ["c1"]
+    turn.commit("ok")
+    assert session.turns == 1 and len(session.messages) == 2
+
+    tight = _packer(budget=20)
+    session = manager.get("tight")
+    manager.prepare(session, question="q", retrieved=CORPUS["quota"], packer=tight, system_prompt="sys").commit("a")
+    turn = manager.prepare(session, question="retries?", retrieved=CORPUS["retry"], packer=tight, system_prompt="sys")
+    assert turn.reset and [c.chunk_id for c in turn.chunks] == ["c1"]
+
+
+def test_concurrent_turns_record_only_the_first() -> None:
+    manager = _manager()
+    session = manager.get("s")
+    first = manager.prepare(session, question="q1", retrieved=CORPUS["quota"], packer=_packer(), system_prompt="s")
+    second = manager.prepare(session, question="q2", retrieved=CORPUS["quota"], packer=_packer(), system_prompt="s")
+    first.commit("a1")
+    second.commit("a2")
+    assert [m["content"] for m in session.messages if m["role"] == "assistant"] == ["a1"]
+    assert manager.get(session.id) is session
+
+
+def test_chat_endpoint_continues_sessions(monkeypatch: pytest.MonkeyPatch) -> None:
+    searches, prompts = _fake_pipeline(monkeypatch, _packer())
+    client = TestClient(app)
+
+    r = client.post("/chat", json={"question": "What is the embedding quota?", "session_id": "new"})
+    assert r.json()["answer"] == "answer 1"
+    session_id = r.json()["session_id"]
+    r = client.post("/chat/stream", json={"question": "How do retries work?", "session_id": session_id})
+    assert r.text.startswith(f'event: session\ndata: {{"session_id": "{session_id}"}}')
+    assert '"chunk_id": "c2"' in r.text
+    r = client.post("/chat", json={"question": "Do clients honor retry-after for the quota?", "session_id": session_id})
+
+    assert r.json()["session_id"] == session_id and len(searches) == 2
+    assert [c["chunk_id"] for c in r.json()["citations"]] == ["c1", "c2"]
+    assert prompts[-1][:3] == prompts[0] + [{"role": "assistant", "content": "answer 1"}]
+    # The streamed answer was recorded in full.
+    assert prompts[-1][4] == {"role": "assistant", "content": "answer 2 "}
+    assert client.post("/chat", json={"question": "q", "session_id": ""}).status_code == 422
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app import cache, embeddings
+from app.rag import RetrievedChunk
+from app.settings import get_settings
+from app.shared_cache import SharedGeneration, SQLiteCache, decode_value, encode_value
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _chunk(i: int, **kwargs) -> RetrievedChunk:
+    return RetrievedChunk(
+        chunk_id=f"c{i}", title=f"T{i}", content=f"content {i} é", source_path=None, parent_id=f"p{i}", **kwargs
+    )
+
+
+def _cache(tmp_path: Path, **kwargs) -> SQLiteCache:
+    kwargs.setdefault("namespace", "retrieval")
+    kwargs.setdefault("max_entries", 10)
+    return SQLiteCache(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_values_round_trip_in_compact_binary_form() -> None:
+    vector = np.arange(1536, dtype=np.float32) / 7
+    data = encode_value(vector)
+    assert len(data) == 1 + 4 + 1536 * 4
+    decoded = decode_value(data)
+    assert decoded.dtype == np.float32 and not decoded.flags.writeable
+    np.testing.assert_array_equal(decoded, vector)
+
+    chunks = (_chunk(1, score=1.5), _chunk(2, reranker_score=3.25))
+    assert decode_value(encode_value(chunks)) == chunks
+    assert decode_value(encode_value(("answer [1]", list(chunks)))) == ("answer [1]", list(chunks))
+
+    with pytest.raises(TypeError):
+        encode_value({"not": "cacheable"})
+
+
+def test_lru_eviction_by_entries_and_bytes(tmp_path: Path) -> None:
+    clock = FakeClock()
+    c = _cache(tmp_path, max_entries=2, clock=clock, touch_seconds=0)
+    c.set("a", (_chunk(1),))
+    clock.now += 1
+    c.set("b", (_chunk(2),))
+    clock.now += 1
+    assert c.get("a") is not None  # touch: "b" is now least recently used
+    clock.now += 1
+    c.set("c", (_chunk(3),))
+    assert c.get("b") is None
+    assert c.get("a") is not None and c.get("c") is not None
+    assert len(c) == 2 and c.stats.evictions == 1
+
+    size = len(encode_value((_chunk(1),)))
+    small = _cache(tmp_path, namespace="small", max_entries=100, max_bytes=2 * size, clock=clock)
+    for i in range(3):
+        clock.now += 1
+        small.set(f"k{i}", (_chunk(i),))
+    assert [small.get(f"k{i}") is not None for i in range(3)] == [False, True, True]
+    # Namespaces are bounded independently.
+    assert len(c) == 2
+
+
+def test_ttl_expiry_and_clear(tmp_path: Path) -> None:
+    clock = FakeClock()
+    c = _cache(tmp_path, ttl_seconds=5, clock=clock)
+    c.set("k", (_chunk(1),))
+    clock.now += 4
+    assert c.get("k") is not None
+    clock.now += 2
+    assert c.get("k") is None
+    assert len(c) == 0
+
+    c.set("k", (_chunk(1),))
+    c.clear()
+    assert c.get("k") is None
+    assert c.stats.hits == 1 and c.stats.misses == 2
+
+
+def test_entries_are_shared_between_processes(tmp_path: Path) -> None:
+    path = tmp_path / "cache.sqlite3"
+    c = SQLiteCache(path=str(path), namespace="embedding", max_entries=10)
+    c.set("mine", np.ones(4, dtype=np.float32))
+
+    script = f"""
+import numpy as np
+from app.shared_cache import SQLiteCache
+c = SQLiteCache(path={str(path)!r}, namespace="embedding", max_entries=10)
+assert list(c.get("mine")) == [1.0] * 4
+c.set("theirs", np.full(4, 2.0, dtype=np.float32))
+"""
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=Path(__file__).resolve().parents[1])
+
+    assert list(c.get("theirs")) == [2.0] * 4
+    assert len(c) == 2
+
+
+def test_cache_backend_setting_selects_the_shared_backend(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("CACHE_SQLITE_PATH", str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+
+    answers = cache.get_answer_cache()
+    assert isinstance(answers.backend, SQLiteCache)
+    assert isinstance(cache.get_retrieval_cache(), SQLiteCache)
+    assert isinstance(embeddings.get_embedding_cache(), SQLiteCache)
+
+    answers.set(scope="s", question="What is X?", value=("X is Y.", [_chunk(1)]))
+    assert answers.lookup(scope="s", question="what is x").value == ("X is Y.", [_chunk(1)])
+    cache.invalidate_caches()
+    assert len(answers.backend) == 0
+    assert cache.cache_stats()["answer"]["entries"] == 0
+
+
+def test_invalidation_generation_is_shared_between_processes(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("CACHE_SQLITE_PATH", str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    settings = get_settings()
+    answers = cache.get_answer_cache()
+    # Read the generation on every key, not from memory (see the next test).
+    cache.get_shared_generation().ttl_seconds = 0
+    before = cache.answer_cache_scope(settings=settings, top_k=5)
+
+    script = """
+from app import cache
+from app.rag import RetrievedChunk
+from app.settings import get_settings
+cache.invalidate_caches()
+chunk = RetrievedChunk(chunk_id="c2", title="T2", content="new", source_path=None, parent_id="p2")
+scope = cache.answer_cache_scope(settings=get_settings(), top_k=5)
+cache.get_answer_cache().set(scope=scope, question="What is Z?", value=("Z is new.", [chunk]))
+"""
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=Path(__file__).resolve().parents[1])
+
+    # A request that started before the other process invalidated stores its result under the old generation.
+    answers.set(scope=before, question="What is X?", value=("X is stale.", [_chunk(1)]))
+    after = cache.answer_cache_scope(settings=settings, top_k=5)
+    assert after != before
+    assert answers.lookup(scope=after, question="What is X?").value is None
+    assert answers.lookup(scope=after, question="what is z").value[0] == "Z is new."
+
+
+def test_shared_generation_is_cached_for_its_ttl(tmp_path: Path) -> None:
+    clock = FakeClock()
+    path = str(tmp_path / "shared.sqlite3")
+    mine = SharedGeneration(path=path, ttl_seconds=1.0, clock=clock)
+    theirs = SharedGeneration(path=path, ttl_seconds=1.0, clock=clock)
+    assert mine.get() == theirs.get() == 0
+
+    assert theirs.bump() == 1 and theirs.get() == 1
+    # Another process's invalidation shows once the cached value expires.
+    assert mine.fresh() and mine.get() == 0
+    clock.now += 1
+    assert not mine.fresh() and mine.get() == 1
+
+
+def test_async_paths_do_shared_cache_io_off_the_event_loop(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    c = _cache(tmp_path)
+    threads = []
+    get, set_ = c.get, c.set
+    monkeypatch.setattr(c, "get", lambda key: threads.append(threading.current_thread()) or get(key))
+    monkeypatch.setattr(c, "set", lambda key, value: threads.append(threading.current_thread()) or set_(key, value))
+
+    async def main():
+        await cache.aset(c, "k", (_chunk(1),))
+        return await cache.aget(c, "k")
+
+    assert asyncio.run(main()) == (_chunk(1),)
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from app.rag import RetrievedChunk, aanswer_question, answer_question
+from app.singleflight import SingleFlight
+
+
+def test_sync_callers_share_one_call() -> None:
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(flight.do, "k", work)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "k", work) for _ in range(4)]
+        # Followers block on the in-flight call until the leader is released.
+        threading.Timer(0.05, release.set).start()
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert calls == [1]
+    assert results == [("value", False)] + [("value", True)] * 4
+    # After completion, the next call runs again.
+    assert flight.do("k", lambda: "again") == ("again", False)
+
+
+def test_sync_error_propagates_and_key_is_released() -> None:
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_async_callers_share_one_call() -> None:
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", work) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert results[0] == ("value", False)
+    assert results[1:] == [("value", True)] * 9
+    assert flight._flights == {}
+
+
+def test_async_error_propagates_to_every_waiter() -> None:
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len({id(r) for r in results}) == 1
+
+
+def test_async_cancelled_waiter_does_not_cancel_shared_work() -> None:
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await release.wait()
+        return "value"
+
+    async def main():
+        first = asyncio.create_task(flight.ado("k", work))
+        second = asyncio.create_task(flight.ado("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("value", True)
+    assert calls == [1]
+
+
+def test_async_work_is_cancelled_when_every_waiter_leaves() -> None:
+    flight = SingleFlight()
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "late"
+
+    async def fast():
+        return "fresh"
+
+    async def main():
+        waiter = asyncio.create_task(flight.ado("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The abandoned flight is forgotten immediately; a new caller starts fresh work.
+        result = await flight.ado("k", fast)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == ("fresh", False)
+    assert cancelled == [1]
+
+
+def _settings():
+    return SimpleNamespace(
+        azure_search_endpoint="https://example.search.windows.net",
+        azure_search_index="kb-index",
+        azure_openai_chat_deployment="chat",
+    )
+
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_aanswer_question_coalesces_identical_questions(monkeypatch: pytest.MonkeyPatch) -> None:
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="T1", content="C1", source_path="s")]
+    calls = {"retrieve": 0, "generate": 0}
+
+    async def fake_aretrieve_chunks(*, settings, question, top_k, search_filter=None):
+        calls["retrieve"] += 1
+        await asyncio.sleep(0.01)
+        return chunks
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            calls["generate"] += 1
+            await asyncio.sleep(0.01)
+            return _completion("shared answer")
+
+    monkeypatch.setattr("app.rag.aretrieve_chunks", fake_aretrieve_chunks)
+    monkeypatch.setattr(
+        "app.rag.get_async_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    )
+
+    async def main():
+        questions = ["What is X?", "what is x", "  WHAT IS X?  ", "What is Y?"]
+        return await asyncio.gather(*(aanswer_question(settings=_settings(), question=q, top_k=3) for q in questions))
+
+    results = asyncio.run(main())
+
+    assert [answer for answer, _chunks in results] == ["shared answer"] * 4
+    assert calls == {"retrieve": 2, "generate": 2}
+    # Every caller gets its own list.
+    assert results[0][1] == results[1][1] and results[0][1] is not results[1][1]
+
+
+def test_answer_question_coalesces_across_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    chunks = [RetrievedChunk(chunk_id="c1", parent_id="p1", title="T1", content="C1", source_path="s")]
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fake_retrieve_chunks(*, settings, question, top_k, search_filter=None):
+        calls.append(question)
+        entered.set()
+        release.wait(5)
+        return chunks
+
+    class FakeCompletions:
+        def create(self, **kwargs):
+            return _completion("answer")
+
+    monkeypatch.setattr("app.rag.retrieve_chunks", fake_retrieve_chunks)
+    monkeypatch.setattr(
+        "app.rag.get_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    )
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(answer_question, settings=_settings(), question="What is X?", top_k=3)]
+        entered.wait(5)
+        futures += [pool.submit(answer_question, settings=_settings(), question="what is x", top_k=3) for _ in range(2)]
+        # Followers are blocked on the in-flight call until the leader is released.
+        threading.Timer(0.05, release.set).start()
+        results = [f.result(5) for f in futures]
+
+    assert calls == ["What is X?"]
+    assert [answer for answer, _chunks in results] == ["answer"] * 3
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app import telemetry
+from app.main import app
+from app.rag import RetrievedChunk
+from app.settings import reload_settings
+from app.telemetry import RequestTimings, Telemetry, note, record_generation, stage
+
+
+def _sample(name: str, labels: dict[str, str] | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def _server_timing(header: str) -> dict[str, str]:
+    entries = {}
+    for part in header.split(", "):
+        name, _, params = part.partition(";")
+        entries[name] = params
+    return entries
+
+
+def test_stage_records_histogram_and_request_timings() -> None:
+    before = _sample("rag_stage_duration_seconds_count", {"stage": "search"})
+    timings = RequestTimings()
+    token = telemetry._current.set(timings)
+    try:
+        with stage("search"):
+            pass
+        with stage("search"):
+            pass
+        note("retrieval_cache", "miss")
+    finally:
+        telemetry._current.reset(token)
+
+    assert _sample("rag_stage_duration_seconds_count", {"stage": "search"}) == before + 2
+    assert set(timings.stages) == {"search"}
+    header = _server_timing(timings.server_timing())
+    assert header["search"].startswith("dur=")
+    assert header["retrieval_cache"] == 'desc="miss"'
+    assert "total" in header
+
+
+def test_stage_outside_a_request_only_updates_metrics() -> None:
+    before = _sample("rag_stage_duration_seconds_count", {"stage": "pack"})
+    with stage("pack"):
+        pass
+    assert _sample("rag_stage_duration_seconds_count", {"stage": "pack"}) == before + 1
+
+
+def test_record_generation_counts_tokens_and_prompt_size() -> None:
+    prompt_before = _sample("rag_tokens_total", {"kind": "prompt"})
+    completion_before = _sample("rag_tokens_total", {"kind": "completion"})
+    chars_before = _sample("rag_prompt_chars_sum")
+
+    record_generation(
+        messages=[{"role": "system", "content": "abc"}, {"role": "user", "content": "defg"}],
+        chunks=3,
+        usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30),
+    )
+
+    assert _sample("rag_tokens_total", {"kind": "prompt"}) == prompt_before + 120
+    assert _sample("rag_tokens_total", {"kind": "completion"}) == completion_before + 30
+    assert _sample("rag_prompt_chars_sum") == chars_before + 7
+
+
+def test_chat_response_has_server_timing(monkeypatch) -> None:
+    monkeypatch.setattr("app.main.get_settings", lambda: SimpleNamespace())
+
+    async def fake_answer_question(*, settings, question: str, top_k: int, search_filter=None):
+        with stage("retrieve"):
+            note("answer_cache", "miss")
+        with stage("generate"):
+            pass
+        return "hi", [RetrievedChunk(chunk_id="c1", parent_id="p1", title="Doc", content="x", source_path="s")]
+
+    monkeypatch.setattr("app.main.aanswer_question", fake_answer_question)
+
+    r = TestClient(app).post("/chat", json={"question": "hello"})
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/json"
+    entries = _server_timing(r.headers["server-timing"])
+    assert {"retrieve", "generate", "serialize", "answer_cache", "total"} <= set(entries)
+    assert entries["answer_cache"] == 'desc="miss"'
+
+
+def test_server_timing_can_be_disabled(monkeypatch) -> None:
+    monkeypatch.setenv("SERVER_TIMING_ENABLED", "false")
+    r = TestClient(app).get("/healthz")
+    assert "server-timing" not in r.headers
+
+
+def test_metrics_endpoint(monkeypatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    client = TestClient(app)
+    client.get("/healthz")
+
+    r = client.get("/metrics")
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/healthz",status="200"}' in r.text
+    assert 'rag_cache_events_total{cache="retrieval",outcome="miss"}' in r.text
+
+    monkeypatch.setenv("METRICS_ENABLED", "false")
+    reload_settings()
+    telemetry.get_telemetry.cache_clear()
+    assert client.get("/metrics").status_code == 404
+
+
+def test_tracing_without_sdk_is_disabled(monkeypatch) -> None:
+    monkeypatch.setenv("OTEL_TRACING_ENABLED", "true")
+    monkeypatch.setattr(telemetry, "_build_tracer", lambda: (None, None))
+    assert telemetry.get_telemetry().tracer is None
+
+
+def test_stage_emits_spans(monkeypatch) -> None:
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(telemetry, "get_telemetry", lambda: Telemetry(tracer=provider.get_tracer("test")))
+
+    with stage("retrieve"):
+        with stage("search"):
+            note("retrieval_cache", "miss")
+
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert spans["search"].parent.span_id == spans["retrieve"].context.span_id
+    assert spans["search"].attributes["rag.retrieval_cache"] == "miss"